@@ -0,0 +1,59 @@
+import os
+
+from src.utils.confidence import DEFAULT_LEVEL
+from src.utils.copy_terms import CopyStats, TermMemo
+from src.utils.logging_utils import start_span, end_span, log_event
+from src.utils.report_writer import ReportWriter, report_filename
+
+
+class CopyAgent:
+    """Words and phrases of ``creative_message`` that go with higher or lower CTR (see src/utils/copy_terms.py)."""
+
+    def __init__(self, output_dir: str = "reports", fmt: str = "json", compact: bool = False,
+                 column: str = "creative_message", ngram: int = 2, features: int = 1 << 22,
+                 min_impressions: float = 10000, top: int = 2, memo=None, confidence_level: float = DEFAULT_LEVEL):
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.compact = compact
+        self.column = column
+        self.ngram = ngram
+        self.features = features
+        self.min_impressions = min_impressions
+        self.top = top
+        self.memo_path = memo
+        self.confidence_level = confidence_level
+        self._memo = None
+
+    @property
+    def path(self):
+        return os.path.join(self.output_dir, report_filename("copy", self.fmt))
+
+    @property
+    def memo(self) -> TermMemo:
+        if self._memo is None:
+            self._memo = TermMemo(self.memo_path, ngram=self.ngram)
+        return self._memo
+
+    def new_state(self) -> CopyStats:
+        return CopyStats(message_column=self.column)
+
+    def generate(self, df, messages=None, trace_id=None, parent_span=None, write=False):
+        return self.generate_from_state(self.new_state().update(df, messages), trace_id=trace_id,
+                                        parent_span=parent_span, write=write)
+
+    def generate_from_state(self, state: CopyStats, trace_id=None, parent_span=None, write=False):
+        span = start_span("copy.analyze", trace_id=trace_id, parent_span_id=parent_span, agent="CopyAgent")
+
+        copy = state.lift(self.memo, n_features=self.features, min_impressions=self.min_impressions,
+                          level=self.confidence_level, top=self.top)
+        if write:
+            self.write_file(copy)
+
+        log_event("copy.analyzed", {**copy["stats"], "campaigns": len(copy["campaigns"])}, trace_id=trace_id,
+                  parent_span_id=span["span_id"], agent="CopyAgent")
+        end_span(span)
+        return copy
+
+    def write_file(self, copy):
+        with ReportWriter(self.path, "terms", fmt=self.fmt, compact=self.compact) as w:
+            w.extend(copy.get("terms", []))
@@ -1,65 +1,152 @@
-import json
 import os
+from typing import Optional
+
+import numpy as np
+
 from src.utils.logging_utils import start_span, end_span, log_event
+from src.utils.rules import RuleSet, compile_template, creative_rules
+from src.utils.report_writer import ReportWriter, report_filename
+
+
+# fields that creative rules and templates may use, besides campaign, series, comment and ctr_drop
+VALIDATION_FIELDS = {"mean_ctr": 0.0, "mean_roas": None, "total_impressions": 0, "confidence": 0.0}
+TREND_FIELDS = ("ctr_change", "ctr_previous", "ctr_current", "ctr_p_value", "ctr_slope", "roas_change")
+# copy terms of the hypothesis' campaign with the best/worst account-wide CTR lift (see CopyAgent)
+PHRASE_FIELDS = ("best_phrase_lift", "worst_phrase_lift")
+TEXT_FIELDS = ("campaign", "series", "comment", "best_phrase", "worst_phrase")
+FIELDS = set(VALIDATION_FIELDS) | set(TREND_FIELDS) | set(PHRASE_FIELDS) | set(TEXT_FIELDS) | {"ctr_drop"}
 
 
 class CreativeAgent:
-    def run(self, validated_insights: dict, trace_id=None, parent_span=None):
+    def __init__(self, output_dir: str = "reports", fmt: str = "json", compact: bool = False,
+                 rules: Optional[RuleSet] = None):
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.compact = compact
+        # creative rules from config (see src/utils/rules.py); every match adds its templates
+        self.rules = rules if rules is not None else creative_rules()
+        self._compiled = None
+
+    @property
+    def path(self):
+        return os.path.join(self.output_dir, report_filename("creatives", self.fmt))
+
+    def run(self, validated_insights: dict, trace_id=None, parent_span=None, copy=None):
+        return self.generate(validated_insights, trace_id=trace_id, parent_span=parent_span, write=True, copy=copy)
+
+    def generate(self, validated_insights: dict, trace_id=None, parent_span=None, write=False, copy=None):
         span = start_span("creatives.generate", trace_id=trace_id, parent_span_id=parent_span, agent="CreativeAgent")
         span_id = span["span_id"]
 
         results = []
-
-        for h in validated_insights.get("hypotheses", []):
-            seg = h.get("segment_filter", {})
-            val = h.get("validation", {})
-
-            campaign = seg.get("campaign_name", "Unknown Campaign")
-            comment = val.get("comment", "")
-            ctr = val.get("mean_ctr", 0)
-            roas = val.get("mean_roas", None)
-            impressions = val.get("total_impressions", 0)
-
-            ideas = []
-
-            if comment == "low_ctr":
-                ideas.append(
-                    f"Improve initial hook for **{campaign}**. CTR={ctr:.4f}. Use bolder product visuals, clearer contrast background, and a tighter 1-line benefit message."
-                )
-                ideas.append(
-                    f"Test a short motion-first variant for **{campaign}**. High impressions ({impressions}) but weak CTR suggests creative fatigue."
-                )
-
-            if comment == "low_clicks":
-                ideas.append(
-                    f"Clicks are extremely low on **{campaign}**. Add a stronger CTA ('Swipe for comfort'), simplify visual clutter, and highlight a single product benefit."
-                )
-
-            if roas is not None and roas < 1.0:
-                ideas.append(
-                    f"ROAS is weak ({roas:.2f}) for **{campaign}**. Try value-focused creatives — price reveal, limited time drop style, or bundle messaging."
-                )
-
-            if not ideas:
-                continue
-
-            results.append({
-                "id": h.get("id"),
-                "campaign": campaign,
-                "issues": comment,
-                "creative_recommendations": ideas,
-                "confidence": val.get("confidence", 0.0)
-            })
+        writer = self._writer() if write else None
+        try:
+            for item in self._iter_creatives(validated_insights, copy):
+                results.append(item)
+                if writer is not None:
+                    writer.add(item)
+        except BaseException:
+            if writer is not None:
+                writer.abort()
+            raise
+        if writer is not None:
+            writer.close()
 
         out = {"creatives": results}
 
-        os.makedirs("reports", exist_ok=True)
-        file_path = os.path.join("reports", "creatives.json")
-
-        with open(file_path, "w", encoding="utf-8") as f:
-            json.dump(out, f, indent=2)
-
         log_event("creatives.generated", {"count": len(results)}, trace_id=trace_id, parent_span_id=span_id, agent="CreativeAgent")
         end_span(span)
 
         return out
+
+    @staticmethod
+    def _fields(items: list, copy: Optional[dict] = None):
+        """``field(key, rows)``: one template field for the hypotheses at ``rows`` (NaN where a number is missing)."""
+        vals = [h.get("validation", {}) or {} for h in items]
+        phrases = (copy or {}).get("campaigns", {})
+
+        def phrase(i, key):
+            campaign = (items[i].get("segment_filter") or {}).get("campaign_name")
+            cited = (phrases.get(campaign) or {}).get(key) or [{}]
+            return cited[0]
+
+        def field(key, rows):
+            if key == "campaign":
+                return [(items[i].get("segment_filter") or {}).get("campaign_name", "Unknown Campaign") for i in rows]
+            if key == "series":
+                return [" / ".join(str(v) for v in (items[i].get("segment_filter") or {}).values()) for i in rows]
+            if key == "comment":
+                return [vals[i].get("comment", "") for i in rows]
+            if key in ("best_phrase", "worst_phrase"):
+                return [phrase(i, key.split("_")[0]).get("term", "") for i in rows]
+            if key in VALIDATION_FIELDS:
+                default = VALIDATION_FIELDS[key]
+                values = [vals[i].get(key, default) for i in rows]
+            elif key in TREND_FIELDS:
+                values = [(items[i].get("trend") or {}).get(key) for i in rows]
+            elif key in PHRASE_FIELDS:
+                values = [phrase(i, key.split("_")[0]).get("ctr_lift") for i in rows]
+            elif key == "ctr_drop":
+                return [-v for v in field("ctr_change", rows)]
+            else:
+                raise KeyError(key)
+            return [np.nan if v is None else v for v in values]
+        return field
+
+    def _templates(self):
+        if self._compiled is None:
+            compiled = []
+            for r in self.rules.rules:
+                texts = [compile_template(t) for t in r.get("templates", [])]
+                for _, fields in texts:
+                    unknown = [f for f in fields if f not in FIELDS]
+                    if unknown:
+                        raise ValueError(f"creative rule {r['name']!r} uses unknown field {unknown[0]!r}")
+                compiled.append(texts)
+            self._compiled = compiled
+        return self._compiled
+
+    def _iter_creatives(self, validated_insights: dict, copy: Optional[dict] = None):
+        items = validated_insights.get("hypotheses", []) + validated_insights.get("trends", [])
+        if not items:
+            return
+        templates = self._templates()
+        field = self._fields(items, copy)
+        everyone = range(len(items))
+
+        # conditions run column-wise over all hypotheses ...
+        table = {key: np.array(field(key, everyone), dtype=object if key in TEXT_FIELDS else "float64")
+                 for key in self.rules.columns}
+        masks = self.rules.masks(table)
+
+        # ... and each template is formatted column-wise for the hypotheses its rule matched
+        ideas = {}
+        for rule, mask in enumerate(masks):
+            rows = np.flatnonzero(mask).tolist()
+            if not rows:
+                continue
+            for text, keys in templates[rule]:
+                if keys:
+                    texts = [text.format(*v) for v in zip(*(field(k, rows) for k in keys))]
+                else:
+                    texts = [text] * len(rows)
+                for i, idea in zip(rows, texts):
+                    ideas.setdefault(i, []).append(idea)
+
+        rows = sorted(ideas)
+        for i, campaign, comment in zip(rows, field("campaign", rows), field("comment", rows)):
+            h = items[i]
+            yield {
+                "id": h.get("id"),
+                "campaign": campaign,
+                "issues": comment,
+                "creative_recommendations": ideas[i],
+                "confidence": (h.get("validation") or {}).get("confidence", 0.0)
+            }
+
+    def _writer(self):
+        return ReportWriter(self.path, "creatives", fmt=self.fmt, compact=self.compact)
+
+    def write_file(self, creatives: dict):
+        with self._writer() as w:
+            w.extend(creatives.get("creatives", []))
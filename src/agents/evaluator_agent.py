@@ -1,112 +1,180 @@
+import numpy as np
 import pandas as pd
-from typing import Dict, Any, Optional, List
-from src.utils.logging_utils import start_span, end_span, log_event
+from typing import Dict, Any, Optional, List, Union
+from src.utils.logging_utils import start_span, end_span, log_event, event_enabled
+from src.utils.confidence import (
+    AGGREGATE_FIELDS, DEFAULT_LEVEL, aggregate_table, interval_columns, nan_to_none, segment_confidence,
+)
+from src.utils.rules import RuleSet, comment_rules
+from src.utils.segment_index import SegmentIndex
 
 
-class EvaluatorAgent:
-    def _compute_validation(self, df_seg: pd.DataFrame) -> Dict[str, Any]:
-        if df_seg is None or df_seg.empty:
-            return {
-                "sample_size": 0,
-                "total_impressions": 0,
-                "mean_ctr": 0.0,
-                "mean_roas": None,
-                "confidence": 0.0,
-                "comment": "no_data",
-            }
-
-        impressions = df_seg.get("impressions", pd.Series([0]))
-        clicks = df_seg.get("clicks", pd.Series([0]))
-        spend = df_seg.get("spend", pd.Series([0.0]))
-        revenue = df_seg.get("revenue", pd.Series([0.0]))
-
-        total_impressions = int(impressions.sum())
-        total_clicks = int(clicks.sum())
-        total_spend = float(spend.sum())
-        total_revenue = float(revenue.sum())
-
-        mean_ctr = (total_clicks / total_impressions) if total_impressions > 0 else 0.0
-        mean_roas = (total_revenue / total_spend) if total_spend > 0 else None
+# validation comment for TrendAgent hypotheses, by trend status
+TREND_COMMENTS = {"fatigue": "creative_fatigue", "improving": "improving_trend"}
+NO_INTERVALS = {"ctr_ci": None, "ctr_p_value": None, "roas_ci": None, "roas_p_value": None}
 
-        comment = "ok"
-        confidence = 0.8
-
-        if total_impressions < 1000:
-            comment = "small_sample"
-            confidence = 0.4
-        if mean_ctr < 0.01 and total_impressions >= 1000:
-            comment = "low_ctr"
-        if total_clicks == 0 and total_impressions > 0:
-            comment = "low_clicks"
 
+class EvaluatorAgent:
+    def __init__(self, confidence_level: float = DEFAULT_LEVEL, rules: Optional[RuleSet] = None, workers: int = 1,
+                 shard_size: int = 5000):
+        self.confidence_level = confidence_level
+        # comment rules from config (see src/utils/rules.py); the first match names the segment
+        self.rules = rules if rules is not None else comment_rules()
+        # with workers > 1, more than one shard of segments against a SegmentIndex is aggregated
+        # by worker processes over shared memory (see src/utils/shared_index.py)
+        self.workers = workers
+        self.shard_size = shard_size
+
+    @staticmethod
+    def _empty_validation(comment: str) -> Dict[str, Any]:
         return {
-            "sample_size": len(df_seg),
-            "total_impressions": total_impressions,
-            "mean_ctr": mean_ctr,
-            "mean_roas": mean_roas,
-            "confidence": confidence,
+            "sample_size": 0,
+            "total_impressions": 0,
+            "mean_ctr": 0.0,
+            "mean_roas": None,
+            "confidence": 0.0,
             "comment": comment,
+            **NO_INTERVALS,
         }
 
+    def _validations(self, aggs: List[Dict[str, Any]], baseline: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Point estimates, comment and intervals for non-empty aggregates, computed column-wise."""
+        table = aggregate_table(aggs)
+        cols = dict(zip(AGGREGATE_FIELDS, table))
+        impressions, clicks = np.trunc(cols["impressions"]), np.trunc(cols["clicks"])
+        spend, revenue = cols["spend"], cols["revenue"]
+
+        mean_ctr = np.zeros(len(aggs))
+        np.divide(clicks, impressions, out=mean_ctr, where=impressions > 0)
+        mean_roas = np.full(len(aggs), np.nan)
+        np.divide(revenue, spend, out=mean_roas, where=spend > 0)
+        stats = segment_confidence(*table, baseline, self.confidence_level)
+        comment = self.rules.classify({
+            "impressions": impressions, "clicks": clicks, "spend": spend, "revenue": revenue,
+            "sample_size": cols["sample_size"], "mean_ctr": mean_ctr, "mean_roas": mean_roas,
+            "confidence": stats["confidence"], "ctr_p_value": stats["ctr_p"], "roas_p_value": stats["roas_p"],
+        })
+        intervals = interval_columns(stats)
+
+        return [
+            {
+                "sample_size": agg["sample_size"],
+                "total_impressions": imp,
+                "mean_ctr": ctr,
+                "mean_roas": roas,
+                "confidence": conf,
+                "comment": note,
+                "ctr_ci": ctr_ci,
+                "ctr_p_value": ctr_p,
+                "roas_ci": roas_ci,
+                "roas_p_value": roas_p,
+            }
+            for agg, imp, ctr, roas, note, conf, ctr_ci, ctr_p, roas_ci, roas_p in zip(
+                aggs, impressions.astype(np.int64).tolist(), mean_ctr.tolist(), nan_to_none(mean_roas),
+                comment.tolist(), *intervals.values(),
+            )
+        ]
+
+    def validate_segments(self, segments: List[Dict[str, Any]], index) -> List[Dict[str, Any]]:
+        """Validation blocks for many ``segment_filter``s against a prepared index.
+
+        Aggregates come from the index (grouped per column set for a
+        ``SegmentIndex``, see ``aggregate_many``); point estimates, intervals and
+        significance against the index's account totals are then computed for
+        all of them at once.
+        """
+        results: List[Optional[Dict[str, Any]]] = [None] * len(segments)
+        candidates = []
+        for i, seg in enumerate(segments):
+            if not seg:
+                results[i] = self._empty_validation("no_segment")
+            elif index.missing_columns(seg):
+                results[i] = self._empty_validation("segment_not_found")
+            else:
+                candidates.append(i)
+        found, aggs = [], []
+        for i, agg in zip(candidates, self._aggregates([segments[i] for i in candidates], index)):
+            if not agg or agg.get("sample_size", 0) == 0:
+                results[i] = self._empty_validation("no_data")
+            else:
+                found.append(i)
+                aggs.append(agg)
+        if aggs:
+            for i, agg, val in zip(found, aggs, self._validations(aggs, index.totals())):
+                if "approximate" in agg:
+                    # sketch figures or sample-estimate error bounds (ApproxAggregates)
+                    val["approximate"] = agg["approximate"]
+                results[i] = val
+        return results
+
+    def _aggregates(self, segments: List[Dict[str, Any]], index) -> List[Dict[str, Any]]:
+        if self.workers > 1 and isinstance(index, SegmentIndex) and len(segments) > self.shard_size:
+            from src.utils.shared_index import SharedSegmentIndex
+
+            with SharedSegmentIndex(index, workers=self.workers, shard_size=self.shard_size) as shared:
+                return shared.aggregate_many(segments)
+        if isinstance(index, SegmentIndex):
+            return index.aggregate_many(segments)
+        return [index.aggregate(seg) for seg in segments]
+
+    def validate_segment(self, seg: Dict[str, Any], index) -> Dict[str, Any]:
+        """Validation block for one ``segment_filter`` against a prepared index."""
+        return self.validate_segments([seg], index)[0]
+
     def evaluate(
         self,
         df: pd.DataFrame,
         insights: Dict[str, Any],
         trace_id: Optional[str] = None,
-        parent_span: Optional[dict] = None,
+        parent_span: Union[dict, str, None] = None,
+        index: Optional[SegmentIndex] = None,
+        trends: Optional[Dict[str, Any]] = None,
     ) -> Dict[str, Any]:
 
         span = start_span(
             "insights.evaluate",
             trace_id=trace_id,
-            parent_span_id=(parent_span or {}).get("span_id") if isinstance(parent_span, dict) else None,
+            parent_span_id=parent_span,
             agent="EvaluatorAgent",
         )
 
-        results = []
+        if index is None:
+            index = SegmentIndex(df)
 
-        for h in insights.get("hypotheses", []):
-            seg = h.get("segment_filter", {}) or {}
+        hypotheses = insights.get("hypotheses", [])
+        trend_hypotheses = (trends or {}).get("hypotheses", [])
+        segments = [h.get("segment_filter", {}) or {} for h in hypotheses + trend_hypotheses]
+        validations = self.validate_segments(segments, index)
 
-            if not seg:
-                val = {
-                    "sample_size": 0,
-                    "total_impressions": 0,
-                    "mean_ctr": 0.0,
-                    "mean_roas": None,
-                    "confidence": 0.0,
-                    "comment": "no_segment",
-                }
-            else:
-                df_seg = df.copy()
-                missing = [c for c in seg.keys() if c not in df_seg.columns]
-
-                if missing:
-                    val = {
-                        "sample_size": 0,
-                        "total_impressions": 0,
-                        "mean_ctr": 0.0,
-                        "mean_roas": None,
-                        "confidence": 0.0,
-                        "comment": "segment_not_found",
-                    }
-                else:
-                    for col, value in seg.items():
-                        df_seg = df_seg[df_seg[col] == value]
-
-                    val = self._compute_validation(df_seg)
-
-            results.append(
-                {
-                    "id": h.get("id"),
-                    "segment_filter": seg,
-                    "validation": val,
-                }
-            )
+        results = [
+            {
+                "id": h.get("id"),
+                "segment_filter": seg,
+                "validation": val,
+            }
+            for h, seg, val in zip(hypotheses, segments, validations)
+        ]
+        trend_results = []
+        for h, seg, val in zip(trend_hypotheses, segments[len(hypotheses):], validations[len(hypotheses):]):
+            # the window comparison is the evidence here; the totals only size the segment
+            status = h.get("trend", {}).get("status")
+            if status in TREND_COMMENTS:
+                val["comment"] = TREND_COMMENTS[status]
+            trend_results.append({"id": h.get("id"), "kind": "trend", "segment_filter": seg,
+                                  "trend": h.get("trend", {}), "validation": val})
+
+        if event_enabled("insights.segment.validated", span["trace_id"]):
+            # one debug event per hypothesis; dropped unless logging.level is debug (and the trace is sampled)
+            for r in results + trend_results:
+                val = r["validation"]
+                log_event("insights.segment.validated",
+                          {"id": r["id"], "segment_filter": r["segment_filter"], "sample_size": val.get("sample_size"),
+                           "comment": val.get("comment")},
+                          trace_id=span["trace_id"], parent_span_id=span["span_id"], agent="EvaluatorAgent")
 
         log_event(
             "insights.evaluated",
-            {"count": len(results)},
+            {"count": len(results), "trends": len(trend_results)},
             trace_id=(span or {}).get("trace_id"),
             parent_span_id=(span or {}).get("span_id"),
             agent="EvaluatorAgent",
@@ -115,8 +183,12 @@ class EvaluatorAgent:
         end_span(span)
 
         # IMPORTANT: Return dict EXACTLY as tests expect
-        return {"hypotheses": results}
-
-    def run(self, df, insights, trace_id=None, parent_span=None):
-        evaluated = self.evaluate(df, insights, trace_id=trace_id, parent_span=parent_span)
+        out = {"hypotheses": results}
+        if trends is not None:
+            out["trends"] = trend_results
+        return out
+
+    def run(self, df, insights, trace_id=None, parent_span=None, index=None, trends=None):
+        evaluated = self.evaluate(df, insights, trace_id=trace_id, parent_span=parent_span, index=index,
+                                  trends=trends)
         return evaluated
@@ -1,60 +1,185 @@
 import os
-import json
-import pandas as pd
+from typing import Optional
+
+import numpy as np
+
 from src.utils.logging_utils import start_span, end_span, log_event
+from src.utils.aggregates import SegmentAggregates
+from src.utils.confidence import (
+    AGGREGATE_FIELDS, DEFAULT_LEVEL, MOMENT_COLUMNS, aggregate_table, confidence_fields, segment_confidence,
+)
+from src.utils.cube import compute_cube
+from src.utils.report_writer import ReportWriter, report_filename
+from src.utils.rules import RuleSet, comment_rules
+from src.utils.segment_index import SegmentIndex
+
+
+def pooled_ratios(clicks, impressions, spend, revenue):
+    """Pooled CTR (clicks/impressions) and ROAS (revenue/spend) per segment.
+
+    These are the estimators ``segment_confidence`` builds its intervals and
+    tests for, so a reported mean always lies inside its own interval; the
+    rules classify on the same arrays. CTR is 0.0 without impressions, ROAS
+    NaN without spend (reported as 0.0).
+    """
+    mean_ctr = np.zeros(len(clicks))
+    np.divide(clicks, impressions, out=mean_ctr, where=impressions > 0)
+    mean_roas = np.full(len(clicks), np.nan)
+    np.divide(revenue, spend, out=mean_roas, where=spend > 0)
+    return mean_ctr, mean_roas
 
 
 class InsightAgent:
-    def run(self, df, trace_id=None, parent_span=None):
-        return self.generate(df, trace_id=trace_id, parent_span=parent_span)
+    def __init__(self, output_dir: str = "reports", fmt: str = "json", compact: bool = False,
+                 confidence_level: float = DEFAULT_LEVEL, rules: Optional[RuleSet] = None):
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.compact = compact
+        self.confidence_level = confidence_level
+        self.rules = rules if rules is not None else comment_rules()
 
-    def generate(self, df, trace_id=None, parent_span=None):
+    @property
+    def path(self):
+        return os.path.join(self.output_dir, report_filename("insights", self.fmt))
+
+    def run(self, df, trace_id=None, parent_span=None, write=True):
+        return self.generate(df, trace_id=trace_id, parent_span=parent_span, write=write)
+
+    def generate(self, df, trace_id=None, parent_span=None, write=True):
         span = start_span("insights.generate", trace_id=trace_id, parent_span_id=parent_span, agent="InsightAgent")
         span_id = span["span_id"]
 
         if df.empty:
             insights = {"hypotheses": []}
-            self._write_file(insights)
+            if write:
+                self.write_file(insights)
             log_event("insights.generate.success", {"count": 0}, trace_id=trace_id, parent_span_id=span_id, agent="InsightAgent")
             end_span(span)
             return insights
 
-        needed = ["campaign_name", "impressions", "clicks", "spend", "revenue"]
-        cols = [c for c in needed if c in df.columns]
-        df = df[cols].copy()
+        aggs = SegmentAggregates.from_frame(df, dims=("campaign_name",))
+        hypotheses = self._collect(self._iter_hypotheses(aggs), write)
+        insights = {"hypotheses": hypotheses}
+
+        log_event("insights.generate.success", {"count": len(hypotheses)}, trace_id=trace_id, parent_span_id=span_id, agent="InsightAgent")
+        end_span(span)
+        return insights
+
+    def generate_from_aggregates(self, aggs: SegmentAggregates, trace_id=None, parent_span=None, write=True):
+        """Same output as ``generate`` but from pre-built (e.g. streamed) segment aggregates.
+
+        ``ApproxAggregates`` work too; their hypotheses also carry an ``approximate`` block.
+        """
+        span = start_span("insights.generate", trace_id=trace_id, parent_span_id=parent_span, agent="InsightAgent")
+        span_id = span["span_id"]
+
+        insights = {"hypotheses": self._collect(self._iter_hypotheses(aggs), write)}
 
-        df["ctr"] = df["clicks"] / df["impressions"].replace(0, pd.NA)
-        df["roas"] = df["revenue"].replace(0, pd.NA) / df["spend"].replace(0, pd.NA)
+        log_event("insights.generate.success", {"count": len(insights["hypotheses"]), "mode": "aggregates"},
+                  trace_id=trace_id, parent_span_id=span_id, agent="InsightAgent")
+        end_span(span)
+        return insights
+
+    def generate_cube(self, df, dimensions, max_depth=2, min_impressions=0, trace_id=None, parent_span=None,
+                      write=True):
+        """Hypotheses for every dimension combination up to ``max_depth`` with iceberg pruning."""
+        span = start_span("insights.generate", trace_id=trace_id, parent_span_id=parent_span, agent="InsightAgent")
+        span_id = span["span_id"]
 
-        groups = df.groupby("campaign_name")
-        hypotheses = []
+        segments = compute_cube(df, dimensions, max_depth=max_depth, min_impressions=min_impressions)
+        hypotheses = self._collect(self._iter_cube_hypotheses(segments, SegmentIndex(df).totals()), write)
+        insights = {"hypotheses": hypotheses}
+
+        log_event("insights.generate.success",
+                  {"count": len(hypotheses), "mode": "cube", "dimensions": list(dimensions), "max_depth": max_depth},
+                  trace_id=trace_id, parent_span_id=span_id, agent="InsightAgent")
+        end_span(span)
+        return insights
 
-        for campaign, g in groups:
-            mean_ctr = float(g["ctr"].mean()) if g["ctr"].notna().any() else 0.0
-            mean_roas = float(g["roas"].mean()) if g["roas"].notna().any() else 0.0
-            total_imp = int(g["impressions"].sum())
+    def _iter_cube_hypotheses(self, segments, baseline):
+        def col(name):
+            return np.fromiter((s[name] for s in segments), dtype="float64", count=len(segments))
 
-            hypotheses.append({
-                "id": f"hyp_{campaign}",
-                "segment_filter": {"campaign_name": campaign},
+        totals = [col("total_clicks"), col("total_impressions"), col("total_spend"), col("total_revenue")]
+        stats = segment_confidence(*totals, *(col(c) for c in MOMENT_COLUMNS), col("sample_size"), baseline,
+                                   self.confidence_level)
+        ctr, roas = pooled_ratios(*totals)
+        comments = self._comments(*totals, col("sample_size"), ctr, roas, stats)
+        for seg, intervals, comment, mean_ctr, mean_roas in zip(segments, confidence_fields(stats), comments,
+                                                                ctr.tolist(), np.nan_to_num(roas).tolist()):
+            yield {
+                "id": "hyp_" + "|".join(f"{k}={v}" for k, v in seg["segment_filter"].items()),
+                "segment_filter": seg["segment_filter"],
                 "validation": {
-                    "sample_size": len(g),
-                    "total_impressions": total_imp,
+                    "sample_size": seg["sample_size"],
+                    "total_impressions": seg["total_impressions"],
                     "mean_ctr": mean_ctr,
                     "mean_roas": mean_roas,
-                    "confidence": 0.8,
-                    "comment": "low_ctr" if mean_ctr < 0.01 else "ok"
+                    "confidence": intervals.pop("confidence"),
+                    "comment": comment,
+                    **intervals,
                 }
-            })
+            }
 
-        insights = {"hypotheses": hypotheses}
-        self._write_file(insights)
+    def _comments(self, clicks, impressions, spend, revenue, sample_size, mean_ctr, mean_roas, stats):
+        """Comment per segment from the configured rules, in one vectorized pass.
 
-        log_event("insights.generate.success", {"count": len(hypotheses)}, trace_id=trace_id, parent_span_id=span_id, agent="InsightAgent")
-        end_span(span)
-        return insights
+        ``mean_ctr``/``mean_roas`` are the ``pooled_ratios`` the report shows.
+        """
+        return self.rules.classify({
+            "impressions": impressions, "clicks": clicks, "spend": spend, "revenue": revenue,
+            "sample_size": sample_size, "mean_ctr": mean_ctr, "mean_roas": mean_roas,
+            "confidence": stats["confidence"], "ctr_p_value": stats["ctr_p"], "roas_p_value": stats["roas_p"],
+        }).tolist()
+
+    def _iter_hypotheses(self, aggs: SegmentAggregates):
+        keys = aggs.sorted_keys()
+        summaries = [aggs.summary(key) for key in keys]
+        fields, comments, ctr, roas = [], [], [], []
+        if keys:
+            table = aggregate_table(summaries)
+            stats = segment_confidence(*table, aggs.totals(), self.confidence_level)
+            cols = dict(zip(AGGREGATE_FIELDS, table))
+            fields = confidence_fields(stats)
+            totals = [cols["clicks"], cols["impressions"], cols["spend"], cols["revenue"]]
+            ctr, roas = pooled_ratios(*totals)
+            comments = self._comments(*totals, cols["sample_size"], ctr, roas, stats)
+            ctr, roas = ctr.tolist(), np.nan_to_num(roas).tolist()
+        for key, s, intervals, comment, mean_ctr, mean_roas in zip(keys, summaries, fields, comments, ctr, roas):
+            seg = dict(zip(aggs.dims, key))
+
+            validation = {
+                "sample_size": s["sample_size"],
+                "total_impressions": int(s["impressions"]),
+                "mean_ctr": mean_ctr,
+                "mean_roas": mean_roas,
+                "confidence": intervals.pop("confidence"),
+                "comment": comment,
+                **intervals,
+            }
+            if "approximate" in s:
+                # sketch figures with their error bounds (ApproxAggregates)
+                validation["approximate"] = s["approximate"]
+            yield {
+                "id": "hyp_" + "|".join(str(v) for v in key),
+                "segment_filter": seg,
+                "validation": validation,
+            }
+
+    def _writer(self):
+        return ReportWriter(self.path, "hypotheses", fmt=self.fmt, compact=self.compact)
+
+    def _collect(self, hypotheses, write):
+        """Materialize ``hypotheses``; with ``write`` each one is also streamed to the report as it is built."""
+        if not write:
+            return list(hypotheses)
+        out = []
+        with self._writer() as w:
+            for h in hypotheses:
+                out.append(h)
+                w.add(h)
+        return out
 
-    def _write_file(self, insights):
-        os.makedirs("reports", exist_ok=True)
-        with open("reports/insights.json", "w", encoding="utf-8") as f:
-            json.dump(insights, f, indent=2)
+    def write_file(self, insights):
+        with self._writer() as w:
+            w.extend(insights.get("hypotheses", []))
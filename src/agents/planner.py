@@ -1,23 +1,83 @@
-from src.utils.logging_utils import start_span, end_span
+import os
+
+from src.utils.logging_utils import start_span, end_span, log_event
+from src.utils.report_writer import report_filename
+
+# how the dataset reaches the analysis stages
+MODES = ("in_memory", "streaming", "incremental", "approximate")
+
+
+def pipeline_mode(cfg) -> str:
+    """Mode the config asks for: sketched, chunked streaming, partition-cached incremental, or in memory."""
+    if (cfg.get("analysis", {}).get("approximate") or {}).get("enabled"):
+        return "approximate"
+    if cfg.get("data", {}).get("chunksize"):
+        return "streaming"
+    if cfg.get("cache", {}).get("enabled"):
+        return "incremental"
+    return "in_memory"
+
 
 class PlannerAgent:
-    def __init__(self):
-        pass
-
-    def generate_plan(self):
-        steps = [
-            "load_dataset",
-            "validate_schema",
-            "generate_insights",
-            "evaluate_insights",
-            "generate_creatives",
-            "generate_report",
+    def __init__(self, output_dir: str = "reports", fmt: str = "json"):
+        self.output_dir = output_dir
+        self.fmt = fmt
+
+    def generate_plan(self, mode: str = "in_memory"):
+        """Stage graph for ``mode``: each stage names the values it consumes and produces.
+
+        ``steps`` keeps the flat, dependency-ordered list of stage names;
+        ``stages`` carries the graph (inputs/outputs), the files a stage
+        writes (``artifacts``) and which outputs are small enough to persist
+        between runs (``persist``).
+        """
+        if mode not in MODES:
+            raise ValueError(f"Unknown pipeline mode {mode!r}; expected one of {MODES}")
+
+        def out(name):
+            return os.path.join(self.output_dir, name)
+
+        if mode == "in_memory":
+            stages = [
+                {"name": "load_dataset", "inputs": [], "outputs": ["raw"]},
+                {"name": "validate_schema", "inputs": ["raw"], "outputs": ["dataset"]},
+                {"name": "detect_trends", "inputs": ["dataset"], "outputs": ["trends"], "persist": ["trends"]},
+                {"name": "analyze_copy", "inputs": ["dataset"], "outputs": ["copy"], "persist": ["copy"]},
+            ]
+        else:
+            # chunked/partitioned/sketched loading validates as it goes and yields segment aggregates,
+            # plus the daily per-series totals of the trailing trend horizon and per-message totals
+            stages = [
+                {"name": "aggregate_dataset", "inputs": [], "outputs": ["dataset", "trend_state", "copy_state"],
+                 "persist": ["dataset", "trend_state", "copy_state"]},
+                {"name": "detect_trends", "inputs": ["trend_state"], "outputs": ["trends"], "persist": ["trends"]},
+                {"name": "analyze_copy", "inputs": ["copy_state"], "outputs": ["copy"], "persist": ["copy"]},
+            ]
+
+        stages += [
+            {"name": "generate_insights", "inputs": ["dataset"], "outputs": ["insights"], "persist": ["insights"]},
+            {"name": "write_insights", "inputs": ["insights"], "outputs": [],
+             "artifacts": [out(report_filename("insights", self.fmt))]},
+            {"name": "write_trends", "inputs": ["trends"], "outputs": [],
+             "artifacts": [out(report_filename("trends", self.fmt))]},
+            {"name": "write_copy", "inputs": ["copy"], "outputs": [],
+             "artifacts": [out(report_filename("copy", self.fmt))]},
+            {"name": "evaluate_insights", "inputs": ["dataset", "insights", "trends"], "outputs": ["evaluated"],
+             "persist": ["evaluated"]},
+            {"name": "generate_creatives", "inputs": ["evaluated", "copy"], "outputs": ["creatives"],
+             "persist": ["creatives"]},
+            {"name": "write_creatives", "inputs": ["creatives"], "outputs": [],
+             "artifacts": [out(report_filename("creatives", self.fmt))]},
+            {"name": "generate_report", "inputs": ["evaluated", "creatives"], "outputs": ["summary"],
+             "artifacts": [out("report.md")], "persist": ["summary"]},
         ]
-        return {"steps": steps}
+        return {"mode": mode, "steps": [s["name"] for s in stages], "stages": stages}
 
-    def run(self, trace_id=None, parent_span=None):
+    def run(self, trace_id=None, parent_span=None, mode: str = "in_memory"):
         span = start_span("planner.run", trace_id=trace_id, parent_span_id=parent_span, agent="PlannerAgent")
-        plan = self.generate_plan()
+        plan = self.generate_plan(mode)
+        log_event("planner.plan", {"mode": mode, "steps": plan["steps"]}, trace_id=span["trace_id"],
+                  parent_span_id=span["span_id"], agent="PlannerAgent")
         end_span(span)
         return plan
 
@@ -4,11 +4,15 @@ from src.utils.logging_utils import start_span, end_span, log_event
 
 
 class ReportAgent:
+    def __init__(self, output_dir: str = "reports"):
+        self.output_dir = output_dir
+
     def run(self, insights, creatives, trace_id=None, parent_span=None):
         span = start_span("report.run", trace_id=trace_id, parent_span_id=parent_span, agent="ReportAgent")
         span_id = span["span_id"]
 
         hypotheses = insights.get("hypotheses", [])
+        trends = insights.get("trends", [])
         creative_items = creatives.get("creatives", [])
 
         summary = {
@@ -16,16 +20,20 @@ class ReportAgent:
             "total_creatives": len(creative_items),
             "valid": sum(1 for h in hypotheses if "validation" in h),
             "invalid": sum(1 for h in hypotheses if "validation" not in h),
+            "trend_hypotheses": len(trends),
+            "fatigued_series": sum(1 for h in trends if h.get("trend", {}).get("status") == "fatigue"),
         }
 
-        os.makedirs("reports", exist_ok=True)
+        os.makedirs(self.output_dir, exist_ok=True)
 
-        report_md_path = os.path.join("reports", "report.md")
+        report_md_path = os.path.join(self.output_dir, "report.md")
         with open(report_md_path, "w", encoding="utf-8") as f:
             f.write("# Performance Insights Report\n\n")
             f.write(f"Total hypotheses: {summary['total_hypotheses']}\n\n")
             f.write(f"Valid hypotheses: {summary['valid']}\n\n")
             f.write(f"Invalid hypotheses: {summary['invalid']}\n\n")
+            f.write(f"Trend hypotheses: {summary['trend_hypotheses']} "
+                    f"({summary['fatigued_series']} showing creative fatigue)\n\n")
             f.write(f"Creative recommendations generated: {summary['total_creatives']}\n\n")
 
         log_event(
@@ -0,0 +1,59 @@
+import os
+from collections import Counter
+
+from src.utils.confidence import DEFAULT_LEVEL
+from src.utils.logging_utils import start_span, end_span, log_event
+from src.utils.report_writer import ReportWriter, report_filename
+from src.utils.timeseries import DEFAULT_KEYS, TrendState
+
+
+class TrendAgent:
+    """Fatigue/trend hypotheses from daily rolling windows per campaign x adset x creative series."""
+
+    def __init__(self, output_dir: str = "reports", fmt: str = "json", compact: bool = False,
+                 keys=DEFAULT_KEYS, date_column: str = "date", window_days: int = 7, slope_days: int = 28,
+                 min_change: float = 0.2, min_impressions: float = 1000, confidence_level: float = DEFAULT_LEVEL):
+        self.output_dir = output_dir
+        self.fmt = fmt
+        self.compact = compact
+        self.keys = tuple(keys)
+        self.date_column = date_column
+        self.window_days = window_days
+        self.slope_days = slope_days
+        self.min_change = min_change
+        self.min_impressions = min_impressions
+        self.confidence_level = confidence_level
+
+    @property
+    def path(self):
+        return os.path.join(self.output_dir, report_filename("trends", self.fmt))
+
+    def new_state(self) -> TrendState:
+        return TrendState(self.keys, self.date_column, self.window_days, self.slope_days)
+
+    def run(self, df, trace_id=None, parent_span=None, write=True):
+        return self.generate(df, trace_id=trace_id, parent_span=parent_span, write=write)
+
+    def generate(self, df, trace_id=None, parent_span=None, write=False):
+        return self.generate_from_state(self.new_state().update(df), trace_id=trace_id, parent_span=parent_span,
+                                        write=write)
+
+    def generate_from_state(self, state: TrendState, trace_id=None, parent_span=None, write=False):
+        span = start_span("trends.detect", trace_id=trace_id, parent_span_id=parent_span, agent="TrendAgent")
+
+        hypotheses = state.hypotheses(level=self.confidence_level, min_change=self.min_change,
+                                      min_impressions=self.min_impressions)
+        trends = {"hypotheses": hypotheses}
+        if write:
+            self.write_file(trends)
+
+        counts = Counter(h["trend"]["status"] for h in hypotheses)
+        log_event("trends.detected",
+                  {"series": len(state.labels), "flagged": len(hypotheses), **counts, "as_of": state.as_of_date},
+                  trace_id=trace_id, parent_span_id=span["span_id"], agent="TrendAgent")
+        end_span(span)
+        return trends
+
+    def write_file(self, trends):
+        with ReportWriter(self.path, "hypotheses", fmt=self.fmt, compact=self.compact) as w:
+            w.extend(trends.get("hypotheses", []))
@@ -0,0 +1,199 @@
+"""Batch entry point: run load -> validate -> insights -> evaluate over many exports.
+
+    python -m src.batch "data/exports/*.csv" --workers 8
+
+Each input file (CSV, Parquet or SQLite, read through the configured data
+source with ``data.query`` pushed down) is processed in its own worker
+process with its own trace.
+Per-file reports go to ``<output>/files/<name>/`` and the workers'
+per-campaign aggregates are merged into one cross-account rollup in
+``<output>/rollup/``. A failing file is recorded in the rollup summary and
+does not stop the others.
+"""
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional
+
+from src.utils.logging_utils import start_span, end_span, log_event, flush_events, configure_logging
+from src.utils.config_utils import load_config
+from src.utils.aggregates import SegmentAggregates
+from src.utils.compact import needed_columns
+from src.utils.data_source import FORMATS, config_query, source_from_config
+from src.utils.data_utils import iter_dataset, load_dataset
+from src.utils.dimensions import DimensionDictionary, canonicalize_dimensions
+from src.utils.rules import comment_rules
+from src.agents.insight_agent import InsightAgent
+from src.agents.evaluator_agent import EvaluatorAgent
+
+
+def resolve_inputs(spec: str) -> List[str]:
+    """Expand a directory (every data file inside, by extension) or a glob pattern to a sorted file list."""
+    if os.path.isdir(spec):
+        return sorted(p for p in glob.glob(os.path.join(spec, "*"))
+                      if os.path.isfile(p) and os.path.splitext(p)[1].lower() in FORMATS)
+    return sorted(p for p in glob.glob(spec) if os.path.isfile(p))
+
+
+def _file_key(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0]
+
+
+def _agents(cfg: Dict[str, Any], output_dir: str):
+    """Insight and evaluator agents with the confidence level, rules and evaluation settings of ``cfg``."""
+    analysis = cfg.get("analysis", {})
+    level = analysis.get("confidence_level", 0.95)
+    eval_cfg = analysis.get("evaluation") or {}
+    rules = comment_rules(cfg)
+    return (InsightAgent(output_dir=output_dir, confidence_level=level, rules=rules),
+            EvaluatorAgent(confidence_level=level, rules=rules, workers=eval_cfg.get("workers", 1),
+                           shard_size=eval_cfg.get("shard_size", 5000)))
+
+
+def process_file(path: str, output_dir: str, chunksize: Optional[int] = None,
+                 cfg: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Worker: run the per-file pipeline and return its summary and campaign aggregates."""
+    from src.schema.validator import validate_schema
+
+    cfg = cfg if cfg is not None else load_config()
+    t0 = time.perf_counter()
+    span = start_span("batch.file", agent="BatchWorker")
+    trace_id = span["trace_id"]
+    result = {"file": path, "trace_id": trace_id, "pid": os.getpid()}
+    try:
+        source, columns, query = source_from_config(cfg, path=path), needed_columns(cfg), config_query(cfg)
+        if chunksize:
+            chunks = iter_dataset(chunksize, columns=columns, source=source, **query)
+        else:
+            chunks = [load_dataset(retries=1, columns=columns, source=source, **query)]
+        canonicalize = cfg.get("data", {}).get("canonicalize", True)
+        # a fresh dictionary per file: pool workers are reused, and labels must not depend on earlier files
+        dimensions = DimensionDictionary()
+        aggs = SegmentAggregates(dims=("campaign_name",))
+        for chunk in chunks:
+            chunk = validate_schema(chunk)
+            aggs.update(canonicalize_dimensions(chunk, dictionary=dimensions)[0] if canonicalize else chunk)
+        log_event("data.load.success", {"file": path, "rows": aggs.rows}, trace_id=trace_id,
+                  parent_span_id=span["span_id"], agent="BatchWorker")
+
+        insight_agent, evaluator = _agents(cfg, os.path.join(output_dir, "files", _file_key(path)))
+        insights = insight_agent.generate_from_aggregates(aggs, trace_id=trace_id, parent_span=span["span_id"])
+        evaluated = evaluator.run(None, insights, trace_id=trace_id, parent_span=span, index=aggs)
+
+        result.update({
+            "ok": True,
+            "rows": aggs.rows,
+            "hypotheses": len(evaluated["hypotheses"]),
+            "low_ctr": sum(1 for h in evaluated["hypotheses"] if h["validation"]["comment"] == "low_ctr"),
+            "aggregates": aggs,
+        })
+    except Exception as e:
+        log_event("batch.file.error", {"file": path, "error": repr(e)}, trace_id=trace_id,
+                  parent_span_id=span["span_id"], agent="BatchWorker")
+        result.update({"ok": False, "error": repr(e)})
+    finally:
+        result["seconds"] = round(time.perf_counter() - t0, 4)
+        end_span(span)
+        flush_events()
+    return result
+
+
+def _write_rollup_report(path: str, results: List[Dict[str, Any]], evaluated: Dict[str, Any], seconds: float):
+    ok = [r for r in results if r.get("ok")]
+    failed = [r for r in results if not r.get("ok")]
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("# Cross-Account Rollup Report\n\n")
+        f.write(f"Files processed: {len(ok)} ok, {len(failed)} failed\n\n")
+        f.write(f"Total rows: {sum(r['rows'] for r in ok)}\n\n")
+        f.write(f"Rollup hypotheses: {len(evaluated['hypotheses'])}\n\n")
+        f.write(f"Wall-clock seconds: {seconds:.2f}\n\n")
+        f.write("| file | status | rows | hypotheses | low_ctr | seconds | trace_id |\n")
+        f.write("|---|---|---|---|---|---|---|\n")
+        for r in results:
+            status = "ok" if r.get("ok") else f"failed: {r.get('error', '')}"
+            f.write(
+                f"| {r['file']} | {status} | {r.get('rows', '')} | {r.get('hypotheses', '')} | "
+                f"{r.get('low_ctr', '')} | {r.get('seconds', '')} | {r.get('trace_id', '')} |\n"
+            )
+
+
+def run_batch(files: List[str], output_dir: str = "reports/batch", workers: Optional[int] = None,
+              chunksize: Optional[int] = None, cfg: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Fan ``files`` out over a process pool and merge the results into one rollup."""
+    cfg = cfg if cfg is not None else load_config()
+    t0 = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    root = start_span("batch.run", agent="Batch")
+    trace_id = root["trace_id"]
+    log_event("batch.plan", {"files": len(files), "workers": workers}, trace_id=trace_id,
+              parent_span_id=root["span_id"], agent="Batch")
+    flush_events()
+
+    results: List[Dict[str, Any]] = []
+    rollup = SegmentAggregates(dims=("campaign_name",))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(process_file, f, output_dir, chunksize, cfg): f for f in files}
+        for fut in as_completed(futures):
+            try:
+                r = fut.result()
+            except Exception as e:
+                # the worker process itself died (e.g. OOM); isolate to this file
+                r = {"file": futures[fut], "ok": False, "error": repr(e)}
+            results.append(r)
+    results.sort(key=lambda r: r["file"])
+    canonicalize = cfg.get("data", {}).get("canonicalize", True)
+    labels = DimensionDictionary()
+    for r in results:
+        aggs = r.pop("aggregates", None)
+        if aggs is not None:
+            # each worker labels a campaign with its own first spelling; in file order, the first file's wins
+            rollup.merge(aggs.relabel(labels.label) if canonicalize else aggs)
+
+    rollup_dir = os.path.join(output_dir, "rollup")
+    insight_agent, evaluator = _agents(cfg, rollup_dir)
+    insights = insight_agent.generate_from_aggregates(rollup, trace_id=trace_id, parent_span=root["span_id"])
+    evaluated = evaluator.run(None, insights, trace_id=trace_id, parent_span=root, index=rollup)
+
+    seconds = time.perf_counter() - t0
+    with open(os.path.join(rollup_dir, "files.json"), "w", encoding="utf-8") as f:
+        json.dump({"files": results}, f, indent=2)
+    _write_rollup_report(os.path.join(rollup_dir, "rollup.md"), results, evaluated, seconds)
+
+    summary = {
+        "files": len(files),
+        "ok": sum(1 for r in results if r.get("ok")),
+        "failed": sum(1 for r in results if not r.get("ok")),
+        "segments": len(rollup.groups),
+        "seconds": round(seconds, 4),
+    }
+    log_event("batch.completed", summary, trace_id=trace_id, parent_span_id=root["span_id"], agent="Batch")
+    end_span(root)
+    flush_events()
+    return {"summary": summary, "files": results, "evaluated": evaluated}
+
+
+def main(argv=None):
+    cfg = load_config()
+    ap = argparse.ArgumentParser(description="Run the pipeline over many ad-account exports in parallel.")
+    ap.add_argument("inputs", help="directory of exports (CSV, Parquet, SQLite) or a glob pattern")
+    ap.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    ap.add_argument("--output", default=os.path.join(cfg.get("reports", {}).get("output_dir", "reports"), "batch"))
+    ap.add_argument("--chunksize", type=int, default=cfg.get("data", {}).get("chunksize") or None)
+    args = ap.parse_args(argv)
+
+    log_cfg = cfg.get("logging", {})
+    configure_logging(
+        log_path=os.path.join(log_cfg.get("log_dir", "logs"), log_cfg.get("jsonl_file", "events.log.jsonl")),
+        echo=log_cfg.get("echo", True),
+    )
+    files = resolve_inputs(args.inputs)
+    if not files:
+        raise SystemExit(f"No input files matched {args.inputs!r}")
+    return run_batch(files, output_dir=args.output, workers=args.workers, chunksize=args.chunksize, cfg=cfg)
+
+
+if __name__ == "__main__":
+    main()
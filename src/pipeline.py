@@ -0,0 +1,346 @@
+"""The analysis pipeline: stage implementations bound to the planner's graph, and their execution.
+
+``src.run`` is the command line around this module and imports it only for
+the subcommands that load data.
+"""
+import hashlib
+import json
+import os
+
+from src.utils.logging_utils import log_event, flush_events, span
+from src.utils.rules import comment_rules, creative_rules
+from src.utils.aggregates import SegmentAggregates
+from src.utils.approx_aggregates import ApproxAggregates
+from src.utils.compact import (
+    DEFAULT_MEMORY_BUDGET_MB, compact_frame, frame_bytes, lazy_column, needed_columns, plan_memory,
+)
+from src.utils.data_source import config_query, source_from_config
+from src.utils.data_utils import load_dataset
+from src.utils.dimensions import DimensionDictionary, canonicalize_dimensions
+from src.schema.dataset_schema import DIMENSION_COLUMNS
+from src.utils.dag import DagExecutor, Stage
+from src.utils.segment_index import SegmentIndex
+from src.agents.planner import PlannerAgent, pipeline_mode
+from src.agents.insight_agent import InsightAgent
+from src.agents.evaluator_agent import EvaluatorAgent
+from src.agents.trend_agent import TrendAgent
+from src.agents.copy_agent import CopyAgent
+from src.agents.creative_agent import CreativeAgent
+from src.agents.report_agent import ReportAgent
+
+
+def _canonicalize(df, dimensions, stats_out=None):
+    df, stats = canonicalize_dimensions(df, dictionary=dimensions)
+    if stats_out is None:
+        log_event("dimensions.canonicalized", {"columns": stats})
+    else:
+        for col, s in stats.items():
+            acc = stats_out.setdefault(col, {"raw": 0, "canonical": 0})
+            acc["raw"] = max(acc["raw"], s["raw"])
+            acc["canonical"] = max(acc["canonical"], s["canonical"])
+    return df
+
+
+# spans and events below nest under the current span (the stage's, see DagExecutor) without explicit ids
+
+def _load_stage(source, columns, query):
+    with span("data.load", agent="Pipeline"):
+        return load_dataset(source=source, columns=columns, **query)
+
+
+def _validate_stage(df, dimensions, canonicalize=True):
+    from src.schema.validator import validate_schema
+
+    with span("schema.validate"):
+        df = validate_schema(df)
+        if canonicalize:
+            df = _canonicalize(df, dimensions)
+        df = compact_frame(df)
+        log_event("data.compact", {"rows": len(df), "bytes_per_row": round(frame_bytes(df) / max(len(df), 1), 1)})
+    return df
+
+
+def _stream_aggregates(source, columns, query, chunksize, dimensions, canonicalize=True, trend_state=None,
+                       copy_state=None, aggs=None, mode="streaming"):
+    # LOAD + VALIDATE chunk by chunk; only per-segment aggregates (or sketches) stay in memory
+    from src.schema.validator import validate_schema
+
+    with span("data.stream", agent="Pipeline"):
+        aggs = aggs if aggs is not None else SegmentAggregates(dims=("campaign_name",))
+        rows = chunks = 0
+        dim_stats = {}
+        for chunk in source.read(columns, chunksize=chunksize, **query):
+            chunk = validate_schema(chunk)
+            if canonicalize:
+                chunk = _canonicalize(chunk, dimensions, stats_out=dim_stats)
+            aggs.update(chunk)
+            if trend_state is not None:
+                trend_state.update(chunk)
+            if copy_state is not None:
+                copy_state.update(chunk)
+            rows += len(chunk)
+            chunks += 1
+        log_event("data.load.success",
+                  {"rows": rows, "chunks": chunks, "segments": len(aggs.groups), "mode": mode})
+        if dim_stats:
+            # per-chunk maxima; the run's dictionary holds the exact canonical totals
+            log_event("dimensions.canonicalized", {"columns": dim_stats, "mode": mode})
+    return aggs
+
+
+def _incremental_aggregates(source, columns, query, cfg, dimensions, trend_state=None, copy_state=None):
+    from src.schema.validator import validate_schema
+    from src.utils.result_store import ResultStore, config_hash, incremental_aggregates
+
+    df = _load_stage(source, columns, query)
+
+    # VALIDATE + AGGREGATE only new or changed date partitions
+    cache_cfg = cfg.get("cache", {})
+    store = ResultStore(cache_cfg.get("dir", ".cache/results"), config_hash(cfg))
+    canonicalize = cfg.get("data", {}).get("canonicalize", True)
+
+    def canonical_validate(part):
+        return canonicalize_dimensions(validate_schema(part), dictionary=dimensions)[0]
+
+    validate = canonical_validate if canonicalize else validate_schema
+    with span("data.aggregate", agent="Pipeline"):
+        if canonicalize:
+            # label keys by their first spelling in file order, as an in-memory run does, not in partition order
+            canonicalize_dimensions(df[[c for c in df.columns if c in DIMENSION_COLUMNS]].copy(), dictionary=dimensions)
+        aggs = incremental_aggregates(
+            df,
+            store,
+            dims=("campaign_name",),
+            partition_column=cache_cfg.get("partition_column", "date"),
+            validate=validate,
+            label=dimensions.label if canonicalize else None,
+        )
+        if trend_state is not None:
+            # only the trailing trend horizon is validated again, however long the history
+            trend_state.update(validate(trend_state.recent(df).copy()))
+        if copy_state is not None:
+            # message totals are not partitioned: the whole history is validated once more, the text read lazily
+            valid = validate(df.copy())
+            copy_state.update(valid, _messages(valid, copy_state.message_column, source))
+    return aggs
+
+
+def _messages(df, column, source):
+    """``column`` of the validated ``df``, read from ``source`` if it was not loaded (None if the source lacks it)."""
+    if column in df.columns:
+        return df[column]
+    if column not in source.columns():
+        return None
+    return lazy_column(df, column)
+
+
+def _source(cfg, df_path, mode):
+    """The configured data source; in-memory modes keep a CSV's parsed columns in ``data.frame_cache``.
+
+    Streamed modes read the file chunk by chunk instead, since the cache is written from one full parse.
+    """
+    cache = mode in ("in_memory", "incremental") and bool(cfg.get("data", {}).get("frame_cache", True))
+    return source_from_config(cfg, path=df_path, cache=cache)
+
+
+def fit_memory_budget(cfg, df_path):
+    """Switch an in-memory run to chunked streaming if the dataset would not fit ``data.memory_budget_mb``."""
+    data_cfg = cfg.setdefault("data", {})
+    budget_mb = data_cfg.get("memory_budget_mb", DEFAULT_MEMORY_BUDGET_MB)
+    if pipeline_mode(cfg) != "in_memory" or not budget_mb or not os.path.exists(df_path):
+        return
+    if _source(cfg, df_path, "in_memory").fmt != "csv":
+        return
+    plan = plan_memory(cfg, df_path)
+    log_event("data.memory", plan, agent="Pipeline")
+    if plan["mode"] == "streaming":
+        data_cfg["chunksize"] = plan["chunksize"]
+
+
+def build_stages(plan, cfg, df_path, output_dir="reports", wrap=None):
+    """Bind the planner's stage graph to the functions that implement each stage.
+
+    The agents' spans nest under the current span when the stages run (see ``DagExecutor``).
+    """
+    data_cfg = cfg.get("data", {})
+    analysis = cfg.get("analysis", {})
+    reports_cfg = cfg.get("reports", {})
+    canonicalize = data_cfg.get("canonicalize", True)
+    # labels dimension values for this run only, so they never depend on what an earlier run in the process saw
+    dimensions = DimensionDictionary()
+    # the data source reads only the columns the enabled stages use and the rows of data.query
+    source, columns, query = _source(cfg, df_path, plan["mode"]), needed_columns(cfg), config_query(cfg)
+    fmt, compact = reports_cfg.get("format", "json"), bool(reports_cfg.get("compact", False))
+    level = analysis.get("confidence_level", 0.95)
+    comments = comment_rules(cfg)
+    insights_agent = InsightAgent(output_dir=output_dir, fmt=fmt, compact=compact, confidence_level=level,
+                                  rules=comments)
+    creative_agent = CreativeAgent(output_dir=output_dir, fmt=fmt, compact=compact, rules=creative_rules(cfg))
+    eval_cfg = analysis.get("evaluation") or {}
+    trends_cfg = analysis.get("trends") or {}
+    trend_agent = TrendAgent(
+        output_dir=output_dir, fmt=fmt, compact=compact, confidence_level=level,
+        **{k: trends_cfg[k] for k in ("keys", "date_column", "window_days", "slope_days", "min_change",
+                                      "min_impressions") if k in trends_cfg},
+    )
+
+    copy_cfg = analysis.get("copy") or {}
+    copy_enabled = copy_cfg.get("enabled", True)
+    copy_agent = CopyAgent(
+        output_dir=output_dir, fmt=fmt, compact=compact, confidence_level=level,
+        **{k: copy_cfg[k] for k in ("column", "ngram", "features", "min_impressions", "top", "memo")
+           if k in copy_cfg},
+    )
+
+    approx_cfg = analysis.get("approximate") or {}
+
+    def aggregate_dataset():
+        state = trend_agent.new_state()
+        copy_state = copy_agent.new_state() if copy_enabled else None
+        if plan["mode"] in ("streaming", "approximate"):
+            # chunks carry the message text; in-memory frames read it lazily
+            with_text = copy_enabled and copy_agent.column in source.columns()
+            chunk_columns = columns + [copy_agent.column] if with_text else columns
+            sketches, chunksize = None, data_cfg.get("chunksize")
+            if plan["mode"] == "approximate":
+                sketches = ApproxAggregates(confidence_level=level, dimensions=dimensions, **{
+                    k: approx_cfg[k] for k in ("distinct", "heavy_key", "top", "sample_rows", "quantiles", "kll_k",
+                                               "hll_precision", "cm_width", "cm_depth") if k in approx_cfg})
+                # distinct counts may be over text columns (creative_message) that needed_columns leaves out
+                chunk_columns = chunk_columns + [c for c in sketches.distinct
+                                                 if c not in chunk_columns and c in source.columns()]
+                chunksize = chunksize or approx_cfg.get("chunksize", 500000)
+            aggs = _stream_aggregates(source, chunk_columns, query, int(chunksize), dimensions,
+                                      canonicalize=canonicalize, trend_state=state,
+                                      copy_state=copy_state if with_text else None, aggs=sketches, mode=plan["mode"])
+        else:
+            aggs = _incremental_aggregates(source, columns, query, cfg, dimensions, trend_state=state,
+                                           copy_state=copy_state)
+        return {"dataset": aggs, "trend_state": state, "copy_state": copy_state}
+
+    def detect_trends(dataset=None, trend_state=None):
+        if not trends_cfg.get("enabled", True):
+            return {"hypotheses": []}
+        if trend_state is None:
+            trend_state = trend_agent.new_state().update(dataset)
+        return trend_agent.generate_from_state(trend_state)
+
+    def analyze_copy(dataset=None, copy_state=None):
+        if not copy_enabled:
+            return {"terms": [], "campaigns": {}}
+        if copy_state is None:
+            copy_state = copy_agent.new_state().update(dataset, _messages(dataset, copy_agent.column, source))
+        return copy_agent.generate_from_state(copy_state)
+
+    def generate_insights(dataset):
+        if isinstance(dataset, (SegmentAggregates, ApproxAggregates)):
+            return insights_agent.generate_from_aggregates(dataset, write=False)
+        cube = analysis.get("cube") or {}
+        if cube.get("enabled"):
+            return insights_agent.generate_cube(
+                dataset,
+                cube.get("dimensions", ["campaign_name"]),
+                max_depth=cube.get("max_depth", 2),
+                min_impressions=analysis.get("min_impressions", 0),
+                write=False,
+            )
+        return insights_agent.generate(dataset, write=False)
+
+    def evaluate_insights(dataset, insights, trends):
+        evaluator = EvaluatorAgent(confidence_level=level, rules=comments, workers=eval_cfg.get("workers", 1),
+                                   shard_size=eval_cfg.get("shard_size", 5000))
+        if isinstance(dataset, (SegmentAggregates, ApproxAggregates)):
+            return evaluator.run(None, insights, index=dataset, trends=trends)
+        return evaluator.run(dataset, insights, index=SegmentIndex(dataset, dimensions=dimensions), trends=trends)
+
+    impls = {
+        "load_dataset": lambda: _load_stage(source, columns, query),
+        "validate_schema": lambda raw: _validate_stage(raw, dimensions, canonicalize=canonicalize),
+        "aggregate_dataset": aggregate_dataset,
+        "detect_trends": detect_trends,
+        "write_trends": trend_agent.write_file,
+        "analyze_copy": analyze_copy,
+        "write_copy": copy_agent.write_file,
+        "generate_insights": generate_insights,
+        "write_insights": insights_agent.write_file,
+        "evaluate_insights": evaluate_insights,
+        "generate_creatives": lambda evaluated, copy: creative_agent.generate(evaluated, copy=copy),
+        "write_creatives": creative_agent.write_file,
+        "generate_report": lambda evaluated, creatives: ReportAgent(output_dir=output_dir).run(
+            evaluated, creatives),
+    }
+
+    stages = []
+    for spec in plan["stages"]:
+        fn = impls[spec["name"]]
+        if wrap is not None:
+            fn = wrap(spec["name"], fn)
+        stages.append(Stage(
+            spec["name"],
+            fn,
+            inputs=spec.get("inputs", []),
+            outputs=spec.get("outputs", []),
+            sources=[df_path] if not spec.get("inputs") else [],
+            artifacts=spec.get("artifacts", []),
+            persist=spec.get("persist", []),
+        ))
+    return stages
+
+
+def stage_salt(cfg):
+    # everything except logging/pipeline settings can change stage results
+    relevant = {k: v for k, v in cfg.items() if k not in ("logging", "pipeline")}
+    return hashlib.sha1(json.dumps(relevant, sort_keys=True, default=str).encode("utf-8")).hexdigest()[:16]
+
+
+def select_stages(plan, targets):
+    """``plan`` reduced to the stages named in ``targets`` and the stages they depend on."""
+    producers = {o: s["name"] for s in plan["stages"] for o in s.get("outputs", [])}
+    by_name = {s["name"]: s for s in plan["stages"]}
+    unknown = [t for t in targets if t not in by_name]
+    if unknown:
+        raise ValueError(f"Unknown stage {unknown[0]!r}; expected one of {plan['steps']}")
+    keep, todo = set(), list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in keep:
+            keep.add(name)
+            todo += [producers[i] for i in by_name[name].get("inputs", []) if i in producers]
+    stages = [s for s in plan["stages"] if s["name"] in keep]
+    return {**plan, "steps": [s["name"] for s in stages], "stages": stages}
+
+
+def execute(cfg, df_path, targets=None, force=False, profiler=None):
+    """Plan and run the stage graph (only what ``targets`` need, if given) under one trace."""
+    pipe_cfg = cfg.get("pipeline", {})
+    output_dir = cfg.get("reports", {}).get("output_dir", "reports")
+    profiling = profiler is not None and profiler.enabled
+
+    with span("pipeline.start", agent="Pipeline"):
+        # 1. PLAN
+        fit_memory_budget(cfg, df_path)
+        planner = PlannerAgent(output_dir=output_dir, fmt=cfg.get("reports", {}).get("format", "json"))
+        plan = planner.run(mode=pipeline_mode(cfg))
+        if targets:
+            plan = select_stages(plan, targets)
+
+        # 2-7. EXECUTE the stage graph; independent stages overlap, unchanged ones are skipped
+
+        def wrap(name, fn):
+            def staged(*a, **kw):
+                with profiler.stage(name):
+                    return fn(*a, **kw)
+            return staged
+
+        stages = build_stages(plan, cfg, df_path, output_dir=output_dir, wrap=wrap if profiling else None)
+        executor = DagExecutor(
+            stages,
+            store_dir=pipe_cfg.get("state_dir", ".cache/plan") if pipe_cfg.get("skip_unchanged", True) else None,
+            workers=1 if profiling else pipe_cfg.get("workers", 4),
+            salt=stage_salt(cfg),
+        )
+        results = executor.run(force=force)
+
+    # CLOSE PIPELINE
+    flush_events()
+    return results
@@ -1,54 +1,179 @@
-import pandas as pd
+"""Command line of the marketing analytics pipeline.
+
+    python -m src.run plan                 # stage graph for the configured mode, as JSON
+    python -m src.run validate --days 7    # load + validate only; row counts as JSON
+    python -m src.run insights             # just the stages behind the insights report
+    python -m src.run run --force          # the whole pipeline (also: python -m src.run [--force ...])
+    python -m src.run trace show latest    # span tree of a past run (see tools/trace.py)
+
+Each subcommand imports only what it uses: ``plan`` needs neither pandas
+nor the agents, so it starts in a fraction of the time of a full run.
+"""
+import argparse
+import datetime
+import json
 import os
+import sys
+
+from src.utils.config_utils import load_config
+
+COMMANDS = ("plan", "validate", "insights", "run", "trace")
+
+
+def _apply_query_args(cfg, args):
+    """Fold --start/--end/--days/--where into ``data.query`` (so they also key the stage cache)."""
+    query = dict(cfg.setdefault("data", {}).get("query") or {})
+    if args.end:
+        query["end"] = args.end
+    if args.days:
+        end = datetime.date.fromisoformat(str(query["end"])[:10]) if query.get("end") else datetime.date.today()
+        query["end"] = end.isoformat()
+        query["start"] = (end - datetime.timedelta(days=args.days - 1)).isoformat()
+    if args.start:
+        query["start"] = args.start
+    where = dict(query.get("where") or {})
+    for item in args.where:
+        column, sep, values = item.partition("=")
+        if not sep or not column:
+            raise SystemExit(f"--where expects COLUMN=V1,V2, got {item!r}")
+        where[column.strip()] = [v.strip() for v in values.split(",") if v.strip()]
+    if where:
+        query["where"] = where
+    cfg["data"]["query"] = query
+
+
+def _data_path(cfg):
+    return cfg.get("data", {}).get("path") or os.path.join("data", "synthetic_fb_ads_undergarments.csv")
+
+
+def _configure_logging(cfg, echo=None):
+    from src.utils.logging_utils import configure_logging
+
+    log_cfg = cfg.get("logging", {})
+    configure_logging(
+        log_path=os.path.join(log_cfg.get("log_dir", "logs"), log_cfg.get("jsonl_file", "events.log.jsonl")),
+        echo=log_cfg.get("echo", True) if echo is None else echo,
+        batch_size=log_cfg.get("batch_size"),
+        flush_interval=log_cfg.get("flush_interval"),
+        rotate_bytes=int(log_cfg.get("rotate_mb", 64) * (1 << 20)),
+        rotate_seconds=log_cfg.get("rotate_seconds"),
+        backups=log_cfg.get("backups"),
+        compress=log_cfg.get("compress"),
+        index=log_cfg.get("index"),
+        level=log_cfg.get("level"),
+        levels=log_cfg.get("levels"),
+        sample_rate=log_cfg.get("sample_rate"),
+    )
+
+
+def cmd_plan(cfg, args):
+    from src.agents.planner import PlannerAgent, pipeline_mode
+
+    if args.check_memory:
+        # estimating the load needs pandas; without it the mode is the configured one
+        from src.pipeline import fit_memory_budget
+
+        _configure_logging(cfg, echo=False)
+        fit_memory_budget(cfg, _data_path(cfg))
+    planner = PlannerAgent(output_dir=cfg.get("reports", {}).get("output_dir", "reports"),
+                           fmt=cfg.get("reports", {}).get("format", "json"))
+    plan = planner.generate_plan(pipeline_mode(cfg))
+    print(json.dumps(plan, indent=2))
+    return plan
+
+
+def cmd_validate(cfg, args):
+    from src.pipeline import _load_stage, _validate_stage
+    from src.utils.compact import needed_columns, frame_bytes
+    from src.utils.data_source import config_query, source_from_config
+    from src.utils.dimensions import DimensionDictionary
+    from src.utils.logging_utils import flush_events, span
+
+    _configure_logging(cfg, echo=False)
+    with span("validate.start", agent="Pipeline") as root:
+        source = source_from_config(cfg, path=_data_path(cfg))
+        raw = _load_stage(source, needed_columns(cfg), config_query(cfg))
+        loaded = len(raw)
+        df = _validate_stage(raw, DimensionDictionary(), canonicalize=cfg.get("data", {}).get("canonicalize", True))
+    flush_events()
+    summary = {"path": source.path, "rows": loaded, "valid": len(df), "quarantined": loaded - len(df),
+               "columns": list(df.columns), "bytes_per_row": round(frame_bytes(df) / max(len(df), 1), 1),
+               "trace_id": (root or {}).get("trace_id")}
+    print(json.dumps(summary, indent=2))
+    return summary
+
+
+def _execute(cfg, args, targets=None):
+    from src.pipeline import execute
+    from src.utils.profiling import PipelineProfiler
+
+    _configure_logging(cfg)
+    profile = getattr(args, "profile", False)
+    profiler = PipelineProfiler(enabled=profile, trace_memory=not getattr(args, "no_tracemalloc", False),
+                                cprofile_path=getattr(args, "profile_out", None)).start()
+    results = execute(cfg, _data_path(cfg), targets=targets, force=args.force, profiler=profiler)
+    if profile:
+        dumped = profiler.stop()
+        print(profiler.table())
+        if dumped:
+            print(f"slowest stage: {profiler.slowest['stage']} ({profiler.slowest['seconds']:.3f}s), "
+                  f"cProfile stats written to {dumped}")
+    return results
 
-from src.utils.logging_utils import start_span, end_span, log_event
-from src.agents.planner import PlannerAgent
-from src.agents.insight_agent import InsightAgent
-from src.agents.evaluator_agent import EvaluatorAgent
-from src.agents.creative_agent import CreativeAgent
-from src.agents.report_agent import ReportAgent
 
+def cmd_insights(cfg, args):
+    return _execute(cfg, args, targets=["write_insights"])
 
-def main():
-    root = start_span("pipeline.start", agent="Pipeline")
-    trace_id = root["trace_id"]
 
-    # 1. PLAN
-    planner = PlannerAgent()
-    steps = planner.run(trace_id=trace_id, parent_span=root["span_id"])
+def cmd_run(cfg, args):
+    return _execute(cfg, args)
 
-    # 2. LOAD DATA
-    data_span = start_span("data.load", trace_id=trace_id, parent_span_id=root["span_id"], agent="Pipeline")
 
-    df_path = os.path.join("data", "synthetic_fb_ads_undergarments.csv")
-    df = pd.read_csv(df_path)
-    log_event("data.load.success", {"rows": len(df)}, trace_id=trace_id, parent_span_id=data_span["span_id"])
-    end_span(data_span)
+def _parser():
+    ap = argparse.ArgumentParser(description="Run the marketing analytics pipeline.")
+    sub = ap.add_subparsers(dest="command", required=True)
 
-    # 3. VALIDATE SCHEMA
-    schema_span = start_span("schema.validate", trace_id=trace_id, parent_span_id=root["span_id"])
-    from src.schema.validator import validate_schema
-    validate_schema(df)
-    end_span(schema_span)
+    query = argparse.ArgumentParser(add_help=False)
+    query.add_argument("--start", help="only rows dated on or after this day (overrides data.query.start)")
+    query.add_argument("--end", help="only rows dated on or before this day (overrides data.query.end)")
+    query.add_argument("--days", type=int, help="only the last N days up to --end (default: today)")
+    query.add_argument("--where", action="append", default=[], metavar="COLUMN=V1,V2",
+                       help="only rows whose COLUMN is one of the values; repeatable")
+    force = argparse.ArgumentParser(add_help=False)
+    force.add_argument("--force", action="store_true", help="run every stage even if its inputs are unchanged")
 
-    # 4. GENERATE INSIGHTS
-    insights_agent = InsightAgent()
-    insights = insights_agent.run(df, trace_id=trace_id, parent_span=root["span_id"])
+    p_plan = sub.add_parser("plan", parents=[query], help="print the stage graph for the configured mode")
+    p_plan.add_argument("--check-memory", action="store_true",
+                        help="estimate the load first; may switch to streaming (data.memory_budget_mb)")
+    sub.add_parser("validate", parents=[query], help="load and validate the dataset, print row counts")
+    sub.add_parser("insights", parents=[query, force], help="run only the stages behind the insights report")
+    p_run = sub.add_parser("run", parents=[query, force], help="run the whole pipeline (the default)")
+    p_run.add_argument("--profile", action="store_true",
+                       help="print a per-stage timing/memory table and dump a cProfile of the slowest stage "
+                            "(stages then run one at a time)")
+    p_run.add_argument("--profile-out", default=os.path.join("logs", "profile_slowest.prof"),
+                       help="where --profile writes the cProfile stats of the slowest stage")
+    p_run.add_argument("--no-tracemalloc", action="store_true", help="with --profile, skip memory tracing")
+    p_trace = sub.add_parser("trace", add_help=False, help="look up past runs in the event log (tools/trace.py)")
+    p_trace.add_argument("args", nargs=argparse.REMAINDER)
+    return ap
 
-    # 5. EVALUATE INSIGHTS
-    evaluator = EvaluatorAgent()
-    evaluated = evaluator.run(df, insights, trace_id=trace_id, parent_span=root["span_id"])
 
-    # 6. GENERATE CREATIVES
-    creative_agent = CreativeAgent()
-    creatives = creative_agent.run(evaluated, trace_id=trace_id, parent_span=root["span_id"])
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if not argv or (argv[0] not in COMMANDS and argv[0] not in ("-h", "--help")):
+        # flags alone keep meaning a full run
+        argv.insert(0, "run")
+    args = _parser().parse_args(argv)
+    if args.command == "trace":
+        from tools.trace import main as trace_main
 
-    # 7. GENERATE REPORT
-    report_agent = ReportAgent()
-    report = report_agent.run(evaluated, creatives, trace_id=trace_id, parent_span=root["span_id"])
+        return trace_main(args.args)
 
-    # CLOSE PIPELINE
-    end_span(root)
+    cfg = load_config()
+    _apply_query_args(cfg, args)
+    return {"plan": cmd_plan, "validate": cmd_validate, "insights": cmd_insights, "run": cmd_run}[args.command](
+        cfg, args)
 
 
 if __name__ == "__main__":
@@ -27,3 +27,17 @@ CRITICAL_COLUMNS = [
     "spend",
     "revenue",
 ]
+
+DIMENSION_COLUMNS = [
+    "campaign_name",
+    "adset_name",
+    "creative_type",
+    "audience_type",
+    "platform",
+    "country",
+]
+
+# free text, not needed by the analysis stages; loaded on demand
+TEXT_COLUMNS = [
+    "creative_message",
+]
@@ -1,5 +1,10 @@
+import numpy as np
 import pandas as pd
 
+from src.schema.dataset_schema import EXPECTED_SCHEMA, CRITICAL_COLUMNS
+from src.utils.data_utils import write_dead_letter
+from src.utils.logging_utils import log_event
+
 
 REQUIRED_COLUMNS = [
     "campaign_name",
@@ -13,22 +18,123 @@ REQUIRED_COLUMNS = [
     "revenue",
 ]
 
+NUMERIC_COLUMNS = ["impressions", "clicks", "spend", "revenue"]
+
+
+def _coerce_numeric(df: pd.DataFrame, bad: dict) -> dict:
+    """Coerce metric columns in bulk and flag values that are present but unparseable.
+
+    Missing values keep their historical meaning (0); only values that were
+    supplied and could not be parsed are treated as bad rows. The original
+    columns are returned so quarantined rows can be written as received.
+    """
+    original = {}
+    for col in NUMERIC_COLUMNS:
+        raw = df[col]
+        original[col] = raw
+        num = pd.to_numeric(raw, errors="coerce")
+        unparseable = num.isna().to_numpy() & raw.notna().to_numpy()
+        if unparseable.any():
+            bad[f"non_numeric_{col}"] = unparseable
+        df[col] = num.fillna(0).to_numpy(dtype="float64")
+    return original
+
+
+def _check_ranges(df: pd.DataFrame, bad: dict) -> None:
+    impressions = df["impressions"].to_numpy()
+    clicks = df["clicks"].to_numpy()
+
+    for col in NUMERIC_COLUMNS:
+        values = df[col].to_numpy()
+        non_finite = ~np.isfinite(values)
+        if non_finite.any():
+            bad[f"non_finite_{col}"] = non_finite
+        negative = values < 0
+        if negative.any():
+            bad[f"negative_{col}"] = negative
+
+    over = clicks > impressions
+    if over.any():
+        bad["clicks_gt_impressions"] = over
+
+    for col in ("impressions", "clicks"):
+        values = df[col].to_numpy()
+        fractional = np.isfinite(values) & (values != np.floor(values))
+        if fractional.any():
+            bad[f"non_integer_{col}"] = fractional
+
+    for col in CRITICAL_COLUMNS:
+        if col in NUMERIC_COLUMNS:
+            continue
+        missing = df[col].isna().to_numpy()
+        if missing.any():
+            bad[f"missing_{col}"] = missing
+
+
+def _apply_dtypes(df: pd.DataFrame) -> None:
+    for col in NUMERIC_COLUMNS:
+        expected = EXPECTED_SCHEMA.get(col)
+        if expected and str(df[col].dtype) != expected:
+            df[col] = df[col].astype(expected)
+
 
-def validate_schema(df: pd.DataFrame) -> None:
+def _derive_metrics(df: pd.DataFrame) -> None:
+    impressions = df["impressions"].to_numpy(dtype="float64")
+    clicks = df["clicks"].to_numpy(dtype="float64")
+    spend = df["spend"].to_numpy(dtype="float64")
+    revenue = df["revenue"].to_numpy(dtype="float64")
+
+    ctr = np.zeros(len(df), dtype="float64")
+    np.divide(clicks, impressions, out=ctr, where=impressions > 0)
+    roas = np.zeros(len(df), dtype="float64")
+    np.divide(revenue, spend, out=roas, where=spend > 0)
+
+    df["ctr"] = ctr
+    df["roas"] = roas
+
+
+def _quarantine(df: pd.DataFrame, bad: dict, original: dict) -> None:
+    mask = np.zeros(len(df), dtype=bool)
+    for m in bad.values():
+        mask |= m
+    if not mask.any():
+        return
+
+    rows = df.loc[mask].copy()
+    for col, raw in original.items():
+        rows[col] = raw.to_numpy()[mask]
+    reasons = {name: int(m.sum()) for name, m in bad.items()}
+    path = write_dead_letter(
+        "schema_quarantine",
+        {
+            "reasons": reasons,
+            "count": int(mask.sum()),
+            "rows": rows.to_dict(orient="records"),
+        },
+    )
+    log_event("schema.quarantine", {"count": int(mask.sum()), "reasons": reasons, "path": path}, agent="Validator")
+    df.drop(index=rows.index, inplace=True)
+
+
+def validate_schema(df: pd.DataFrame) -> pd.DataFrame:
+    """Validate and clean ``df`` in place using whole-column operations.
+
+    Metric columns are coerced to numbers, range and dtype checks are applied,
+    rows that fail any check are written in one batch to the dead-letter
+    directory and dropped, and ``ctr``/``roas`` are derived. The same frame is
+    returned for convenience.
+    """
     missing = [c for c in REQUIRED_COLUMNS if c not in df.columns]
     if missing:
         raise ValueError(f"Missing required columns: {missing}")
 
-    numeric_cols = ["impressions", "clicks", "spend", "revenue"]
-    for col in numeric_cols:
-        df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0)
+    if not df.index.is_unique:
+        df.reset_index(drop=True, inplace=True)
 
-    df["ctr"] = df.apply(
-        lambda r: (r["clicks"] / r["impressions"]) if r["impressions"] > 0 else 0,
-        axis=1,
-    )
-
-    df["roas"] = df.apply(
-        lambda r: (r["revenue"] / r["spend"]) if r["spend"] > 0 else 0,
-        axis=1,
-    )
+    bad = {}
+    original = _coerce_numeric(df, bad)
+    _check_ranges(df, bad)
+    _quarantine(df, bad, original)
+    _apply_dtypes(df)
+    _derive_metrics(df)
+    return df
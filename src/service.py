@@ -0,0 +1,300 @@
+"""Resident analytics service: load and index the dataset once, answer segment queries over HTTP.
+
+    python -m src.service --port 8765
+
+Endpoints (JSON in, JSON out):
+
+    GET  /health
+    GET  /stats                      result-cache and dataset statistics
+    GET  /evaluate?campaign_name=..&platform=..
+    POST /evaluate   {"segment_filter": {...}}
+    GET  /segments?dimension=campaign_name&metric=mean_roas&order=bottom&limit=10&min_impressions=1000
+    POST /creatives  {"segment_filters": [{...}, ...], "write": false}
+    POST /reload                     re-read and re-index the dataset
+
+Validation is the same as ``EvaluatorAgent``; responses are cached as
+encoded bytes in a bounded LRU keyed by endpoint and canonical parameters.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlsplit
+
+from src.utils.logging_utils import start_span, end_span, log_event, configure_logging, flush_events
+from src.utils.config_utils import load_config
+from src.utils.aggregates import SegmentAggregates
+from src.utils.compact import compact_frame
+from src.utils.data_source import config_query, source_from_config
+from src.utils.data_utils import load_dataset
+from src.utils.confidence import DEFAULT_LEVEL
+from src.utils.dimensions import DimensionDictionary, canonicalize_dimensions
+from src.utils.lru import LRUCache
+from src.utils.rules import comment_rules, creative_rules
+from src.utils.segment_index import SegmentIndex
+from src.schema.dataset_schema import DIMENSION_COLUMNS
+from src.agents.evaluator_agent import EvaluatorAgent
+from src.agents.creative_agent import CreativeAgent
+
+SORT_METRICS = ("mean_ctr", "mean_roas", "total_impressions", "sample_size")
+
+
+class ServiceError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class _Loaded:
+    """One load of the dataset: the frame, its index and the rankings computed from them.
+
+    ``load`` swaps the whole object, so a request that took it before a reload
+    keeps answering from one consistent dataset.
+    """
+
+    def __init__(self, df, index, generation: int):
+        self.df, self.index, self.generation = df, index, generation
+        self.rankings: Dict[str, List[Dict[str, Any]]] = {}
+
+
+class AnalyticsService:
+    """Dataset, index and agents kept warm for repeated queries."""
+
+    def __init__(self, df_path: str, cfg: Dict[str, Any] = None, cache_entries: int = 4096,
+                 cache_bytes: int = 32 << 20, output_dir: str = "reports"):
+        self.cfg = cfg or {}
+        self.df_path = df_path
+        self.output_dir = output_dir
+        self.cache = LRUCache(max_entries=cache_entries, max_bytes=cache_bytes)
+        self.evaluator = EvaluatorAgent(
+            confidence_level=self.cfg.get("analysis", {}).get("confidence_level", DEFAULT_LEVEL),
+            rules=comment_rules(self.cfg))
+        self.creative_rules = creative_rules(self.cfg)
+        self._loaded: Optional[_Loaded] = None
+        self._lock = threading.Lock()
+        self.load()
+
+    @property
+    def df(self):
+        return self._loaded.df
+
+    @property
+    def index(self):
+        return self._loaded.index
+
+    def snapshot(self) -> _Loaded:
+        """The current load; pass it to the query methods so one request never mixes two datasets."""
+        with self._lock:
+            return self._loaded
+
+    def load(self):
+        from src.schema.validator import REQUIRED_COLUMNS, validate_schema
+
+        span = start_span("service.load", agent="AnalyticsService")
+        t0 = time.perf_counter()
+        # queries may filter on any dimension, so all of them are kept
+        source = source_from_config(self.cfg, path=self.df_path)
+        df = validate_schema(load_dataset(source=source, columns=REQUIRED_COLUMNS + DIMENSION_COLUMNS,
+                                          trace_id=span["trace_id"], parent_span_id=span["span_id"],
+                                          **config_query(self.cfg)))
+        # a dictionary per load, so spellings of datasets replaced by /reload do not pile up
+        dimensions = DimensionDictionary()
+        if self.cfg.get("data", {}).get("canonicalize", True):
+            df, _ = canonicalize_dimensions(df, dictionary=dimensions)
+        df = compact_frame(df)
+        # the LRU in front of the index bounds memory; the index itself must not memoize every query
+        index = SegmentIndex(df, memoize=False, dimensions=dimensions).warm(
+            [c for c in DIMENSION_COLUMNS if c in df.columns])
+        with self._lock:
+            self._loaded = _Loaded(df, index, self._loaded.generation + 1 if self._loaded else 0)
+            self.cache.clear()
+        self.loaded_at = time.time()
+        log_event("service.loaded", {"rows": len(df), "seconds": round(time.perf_counter() - t0, 4)},
+                  trace_id=span["trace_id"], parent_span_id=span["span_id"], agent="AnalyticsService")
+        end_span(span)
+
+    def evaluate(self, segment_filter: Dict[str, Any], snapshot: Optional[_Loaded] = None) -> Dict[str, Any]:
+        if not isinstance(segment_filter, dict) or not segment_filter:
+            raise ServiceError(400, "segment_filter must be a non-empty object")
+        index = (snapshot or self.snapshot()).index
+        # same validation as EvaluatorAgent.evaluate, without a span per query
+        return {"segment_filter": segment_filter,
+                "validation": self.evaluator.validate_segment(segment_filter, index)}
+
+    def _ranking(self, dimension: str, snapshot: Optional[_Loaded] = None) -> List[Dict[str, Any]]:
+        loaded = snapshot or self.snapshot()
+        ranking = loaded.rankings.get(dimension)
+        if ranking is None:
+            if dimension not in loaded.index.columns:
+                raise ServiceError(400, f"unknown dimension {dimension!r}")
+            aggs = SegmentAggregates.from_frame(loaded.df, dims=(dimension,))
+            segs = [{dimension: key[0]} for key in aggs.sorted_keys()]
+            vals = self.evaluator.validate_segments(segs, aggs)
+            ranking = [{"segment_filter": seg, "validation": val} for seg, val in zip(segs, vals)]
+            # kept with the load it was computed from; a reload in the meantime starts from empty rankings
+            loaded.rankings[dimension] = ranking
+        return ranking
+
+    def segments(self, dimension: str = "campaign_name", metric: str = "mean_roas", order: str = "top",
+                 limit: int = 10, min_impressions: float = 0,
+                 snapshot: Optional[_Loaded] = None) -> List[Dict[str, Any]]:
+        if metric not in SORT_METRICS:
+            raise ServiceError(400, f"metric must be one of {SORT_METRICS}")
+        if order not in ("top", "bottom"):
+            raise ServiceError(400, "order must be 'top' or 'bottom'")
+        rows = [r for r in self._ranking(dimension, snapshot) if r["validation"]["total_impressions"] >= min_impressions
+                and r["validation"][metric] is not None]
+        rows.sort(key=lambda r: r["validation"][metric], reverse=(order == "top"))
+        return rows[:max(0, int(limit))]
+
+    def creatives(self, segment_filters: Optional[List[Dict[str, Any]]] = None, write: bool = False,
+                  snapshot: Optional[_Loaded] = None) -> Dict[str, Any]:
+        snapshot = snapshot or self.snapshot()
+        if segment_filters is None:
+            hypotheses = [dict(r, id="hyp_" + str(r["segment_filter"]["campaign_name"]))
+                          for r in self._ranking("campaign_name", snapshot)]
+        else:
+            hypotheses = [dict(self.evaluate(seg, snapshot), id="hyp_" + "|".join(map(str, seg.values())))
+                          for seg in segment_filters]
+        agent = CreativeAgent(output_dir=self.output_dir, rules=self.creative_rules)
+        return agent.generate({"hypotheses": hypotheses}, write=write)
+
+    def stats(self) -> Dict[str, Any]:
+        loaded = self.snapshot()
+        return {"rows": len(loaded.df), "generation": loaded.generation, "loaded_at": self.loaded_at,
+                "source": self.df_path, "cache": self.cache.stats()}
+
+    def handle(self, method: str, path: str, params: Dict[str, Any]) -> Tuple[bytes, bool]:
+        """Encoded JSON response for a request, and whether it came from the cache."""
+        snapshot = self.snapshot()
+        cacheable = path in ("/evaluate", "/segments") or (path == "/creatives" and not params.get("write"))
+        key = (path, json.dumps(params, sort_keys=True, default=str)) if cacheable else None
+        if key is not None:
+            body = self.cache.get(key)
+            if body is not None:
+                return body, True
+
+        if path == "/health":
+            result = {"status": "ok"}
+        elif path == "/stats":
+            result = self.stats()
+        elif path == "/evaluate":
+            result = self.evaluate(params.get("segment_filter", params), snapshot)
+        elif path == "/segments":
+            result = {"segments": self.segments(
+                dimension=params.get("dimension", "campaign_name"),
+                metric=params.get("metric", "mean_roas"),
+                order=params.get("order", "top"),
+                limit=int(params.get("limit", 10)),
+                min_impressions=float(params.get("min_impressions", 0)),
+                snapshot=snapshot,
+            )}
+        elif path == "/creatives":
+            result = self.creatives(params.get("segment_filters"), write=bool(params.get("write")), snapshot=snapshot)
+        elif path == "/reload" and method == "POST":
+            self.load()
+            result = {"status": "reloaded", "rows": len(self.df)}
+        else:
+            raise ServiceError(404, f"no route for {method} {path}")
+
+        body = json.dumps(result, default=str).encode("utf-8")
+        if key is not None:
+            with self._lock:
+                # a reload since the snapshot cleared the cache; an answer from the old dataset must not refill it
+                if self._loaded is snapshot:
+                    self.cache.put(key, body)
+        return body, False
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so clients can reuse connections
+    disable_nagle_algorithm = True  # headers and body go out as separate writes; don't wait on delayed ACKs
+    service: AnalyticsService = None
+
+    def _send(self, status: int, body: bytes, cached: bool = False):
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("X-Cache", "hit" if cached else "miss")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _dispatch(self, method: str, params: Dict[str, Any]):
+        try:
+            body, cached = self.service.handle(method, urlsplit(self.path).path, params)
+        except ServiceError as exc:
+            self._send(exc.status, json.dumps({"error": str(exc)}).encode("utf-8"))
+        except (ValueError, TypeError) as exc:
+            self._send(400, json.dumps({"error": str(exc)}).encode("utf-8"))
+        else:
+            self._send(200, body, cached)
+
+    def do_GET(self):
+        self._dispatch("GET", dict(parse_qsl(urlsplit(self.path).query)))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b"{}"
+        try:
+            params = json.loads(raw or b"{}")
+        except ValueError:
+            self._send(400, b'{"error": "body must be JSON"}')
+            return
+        if not isinstance(params, dict):
+            self._send(400, b'{"error": "body must be a JSON object"}')
+            return
+        self._dispatch("POST", params)
+
+    def log_message(self, format, *args):  # request lines would flood the console
+        pass
+
+
+def make_server(service: AnalyticsService, host: str = "127.0.0.1", port: int = 8765) -> ThreadingHTTPServer:
+    handler = type("Handler", (_Handler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main(argv=None):
+    cfg = load_config()
+    svc_cfg = cfg.get("service", {})
+    ap = argparse.ArgumentParser(description="Serve segment queries over a warm, indexed dataset.")
+    ap.add_argument("--host", default=svc_cfg.get("host", "127.0.0.1"))
+    ap.add_argument("--port", type=int, default=svc_cfg.get("port", 8765))
+    ap.add_argument("--data", default=cfg.get("data", {}).get("path", "data/synthetic_fb_ads_undergarments.csv"))
+    ap.add_argument("--cache-entries", type=int, default=svc_cfg.get("cache_entries", 4096))
+    ap.add_argument("--cache-mb", type=float, default=svc_cfg.get("cache_mb", 32))
+    args = ap.parse_args(argv)
+
+    log_cfg = cfg.get("logging", {})
+    configure_logging(
+        log_path=os.path.join(log_cfg.get("log_dir", "logs"), log_cfg.get("jsonl_file", "events.log.jsonl")),
+        echo=log_cfg.get("echo", True),
+        rotate_bytes=int(log_cfg.get("rotate_mb", 64) * (1 << 20)),
+        rotate_seconds=log_cfg.get("rotate_seconds"),
+        backups=log_cfg.get("backups"),
+        compress=log_cfg.get("compress"),
+        index=log_cfg.get("index"),
+    )
+    service = AnalyticsService(args.data, cfg, cache_entries=args.cache_entries,
+                               cache_bytes=int(args.cache_mb * (1 << 20)),
+                               output_dir=cfg.get("reports", {}).get("output_dir", "reports"))
+    server = make_server(service, args.host, args.port)
+    log_event("service.listening", {"host": args.host, "port": server.server_address[1]}, agent="AnalyticsService")
+    flush_events()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        log_event("service.stopped", service.stats(), agent="AnalyticsService")
+        flush_events()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,272 @@
+import math
+from typing import Any, Callable, Dict, Iterable, List, Sequence
+
+import numpy as np
+import pandas as pd
+
+from src.utils.confidence import MOMENT_COLUMNS, row_moments
+
+
+SUM_COLUMNS = ["impressions", "clicks", "spend", "revenue"]
+RATIO_COLUMNS = ["ctr", "roas"]
+
+
+def _exact_terms(values) -> List[float]:
+    """Expand ``values`` into a few floats whose exact sum equals the exact sum of ``values``.
+
+    ``math.fsum`` of the returned terms is the correctly rounded total, and
+    concatenating the terms of two partitions gives the terms of their union,
+    so partial sums merge without depending on chunk boundaries.
+    """
+    arr = np.asarray(values, dtype="float64")
+    if not np.isfinite(arr).all():
+        return [float(np.sum(arr))]
+    return _expand(arr.tolist())
+
+
+def _expand(vals: List[float]) -> List[float]:
+    """``_exact_terms`` for a list of finite floats (consumed)."""
+    terms = []
+    while True:
+        t = math.fsum(vals)
+        if t == 0.0:
+            return terms
+        terms.append(t)
+        vals.append(-t)
+
+
+def _merge_terms(a: List[float], b: List[float]) -> List[float]:
+    if not a:
+        return list(b)
+    if not b:
+        return list(a)
+    merged = a + b
+    if all(map(math.isfinite, merged)):
+        return _expand(merged)
+    return _exact_terms(merged)
+
+
+def _total(terms: List[float]) -> float:
+    if not terms:
+        return 0.0
+    if len(terms) == 1:
+        return terms[0]
+    try:
+        return math.fsum(terms)
+    except (ValueError, OverflowError):
+        return float(np.sum(terms))
+
+
+def _ratio(num: np.ndarray, den: np.ndarray) -> np.ndarray:
+    out = np.full(len(num), np.nan)
+    np.divide(num, den, out=out, where=(den != 0) & ~np.isnan(den))
+    return out
+
+
+def row_ratios(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Per-row ctr/roas as used for hypothesis means.
+
+    Zero impressions/spend and zero revenue leave the ratio undefined (NaN),
+    so those rows do not count towards the mean.
+    """
+    def col(name):
+        if name not in df.columns:
+            return np.full(len(df), np.nan)
+        return pd.to_numeric(df[name], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+
+    impressions, clicks = col("impressions"), col("clicks")
+    spend, revenue = col("spend"), col("revenue")
+    revenue = np.where(revenue == 0, np.nan, revenue)
+    return {"ctr": _ratio(clicks, impressions), "roas": _ratio(revenue, spend)}
+
+
+def segment_codes(df: pd.DataFrame, dims: Sequence[str]):
+    """Per-row segment codes over ``dims`` (-1 where a key is missing) and each code's key tuple."""
+    keys = df[list(dims)]
+    valid = keys.notna().all(axis=1).to_numpy()
+    if len(dims) == 1:
+        codes, uniques = pd.factorize(keys.iloc[:, 0])
+        uniques = [(u,) for u in uniques.tolist()]
+    else:
+        codes, uniques = pd.factorize(pd.MultiIndex.from_frame(keys))
+        uniques = [tuple(u) for u in uniques]
+    codes = np.where(valid, codes, -1)
+    return codes, uniques
+
+
+class SegmentAggregates:
+    """Mergeable partial aggregates per segment.
+
+    For each distinct combination of ``dims`` values this keeps the row count,
+    sums of impressions/clicks/spend/revenue, and the sum and count of the
+    per-row ctr/roas ratios so their means can still be computed. Chunks are
+    folded in with ``update`` and partitions combined with ``merge``; memory is
+    bounded by the number of segments, not rows.
+
+    Sums are kept as exact float expansions (see ``_exact_terms``), so results
+    do not depend on how the input was chunked. The object also answers
+    ``missing_columns``/``aggregate`` like ``SegmentIndex`` and can be passed to
+    ``EvaluatorAgent.evaluate`` in its place.
+    """
+
+    def __init__(self, dims: Sequence[str] = ("campaign_name",)):
+        self.dims = tuple(dims)
+        self.groups: Dict[tuple, Dict[str, Any]] = {}
+        self.rows = 0
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, dims: Sequence[str] = ("campaign_name",)) -> "SegmentAggregates":
+        aggs = cls(dims)
+        aggs.update(df)
+        return aggs
+
+    @classmethod
+    def from_chunks(cls, chunks: Iterable[pd.DataFrame],
+                    dims: Sequence[str] = ("campaign_name",)) -> "SegmentAggregates":
+        aggs = cls(dims)
+        for chunk in chunks:
+            aggs.update(chunk)
+        return aggs
+
+    @staticmethod
+    def _empty_group() -> Dict[str, Any]:
+        g = {"rows": 0}
+        for c in SUM_COLUMNS + MOMENT_COLUMNS:
+            g[c] = []
+        for c in RATIO_COLUMNS:
+            g[f"{c}_sum"] = []
+            g[f"{c}_count"] = 0
+        return g
+
+    def _encode(self, df: pd.DataFrame):
+        return segment_codes(df, self.dims)
+
+    def update(self, df: pd.DataFrame) -> "SegmentAggregates":
+        """Fold one chunk of rows into the aggregates."""
+        if df is None or df.empty:
+            return self
+        codes, uniques = self._encode(df)
+        keep = codes >= 0
+        positions = np.flatnonzero(keep)[np.argsort(codes[keep], kind="stable")]
+        counts = np.bincount(codes[keep], minlength=len(uniques))
+        bounds = np.concatenate(([0], np.cumsum(counts)))
+
+        columns = {}
+        for c in SUM_COLUMNS:
+            if c in df.columns:
+                v = pd.to_numeric(df[c], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+                columns[c] = np.nan_to_num(v[positions], nan=0.0, posinf=np.inf, neginf=-np.inf)
+        if all(c in columns for c in SUM_COLUMNS):
+            columns.update(row_moments(columns))
+        sorted_codes = codes[positions]
+        ratios = row_ratios(df)
+        ratio_counts = {}
+        for c in RATIO_COLUMNS:
+            v = ratios[c][positions]
+            present = ~np.isnan(v)
+            ratio_counts[c] = np.bincount(sorted_codes[present], minlength=len(uniques))
+            columns[f"{c}_sum"] = np.where(present, v, 0.0)
+
+        # convert each column once; per-group slices of a list are cheap to expand
+        lists = {name: values.tolist() if np.isfinite(values).all() else None for name, values in columns.items()}
+        for i, key in enumerate(uniques):
+            a, b = int(bounds[i]), int(bounds[i + 1])
+            if a == b:
+                continue
+            g = self.groups.get(key)
+            if g is None:
+                g = self.groups[key] = self._empty_group()
+            g["rows"] += b - a
+            for name, values in columns.items():
+                vals = lists[name]
+                terms = _expand(vals[a:b]) if vals is not None else _exact_terms(values[a:b])
+                g[name] = _merge_terms(g[name], terms)
+            for c in RATIO_COLUMNS:
+                g[f"{c}_count"] += int(ratio_counts[c][i])
+
+        self.rows += int(keep.sum())
+        return self
+
+    def _merge_group(self, key: tuple, og: Dict[str, Any]) -> None:
+        g = self.groups.get(key)
+        if g is None:
+            g = self.groups[key] = self._empty_group()
+        g["rows"] += og["rows"]
+        for c in SUM_COLUMNS + MOMENT_COLUMNS:
+            g[c] = _merge_terms(g[c], og[c])
+        for c in RATIO_COLUMNS:
+            g[f"{c}_sum"] = _merge_terms(g[f"{c}_sum"], og[f"{c}_sum"])
+            g[f"{c}_count"] += og[f"{c}_count"]
+
+    def merge(self, other: "SegmentAggregates") -> "SegmentAggregates":
+        """Fold another partition's aggregates (same ``dims``) into this one."""
+        if other.dims != self.dims:
+            raise ValueError(f"Cannot merge aggregates over {other.dims} into {self.dims}")
+        for key, og in other.groups.items():
+            self._merge_group(key, og)
+        self.rows += other.rows
+        return self
+
+    def relabel(self, label: Callable[[str, Any], Any]) -> "SegmentAggregates":
+        """Copy with every key value replaced by ``label(dim, value)``; groups that end up on one key merge.
+
+        Use ``DimensionDictionary.label`` to align aggregates canonicalized by another dictionary.
+        """
+        out = SegmentAggregates(self.dims)
+        for key, g in self.groups.items():
+            out._merge_group(tuple(label(d, v) for d, v in zip(self.dims, key)), g)
+        out.rows = self.rows
+        return out
+
+    def sorted_keys(self) -> List[tuple]:
+        try:
+            return sorted(self.groups)
+        except TypeError:
+            return list(self.groups)
+
+    def summary(self, key: tuple) -> Dict[str, Any]:
+        """Totals and ratio means for one segment."""
+        g = self.groups[key]
+        out = {"sample_size": g["rows"]}
+        for c in SUM_COLUMNS + MOMENT_COLUMNS:
+            out[c] = _total(g[c])
+        for c in RATIO_COLUMNS:
+            n = g[f"{c}_count"]
+            out[f"mean_{c}"] = _total(g[f"{c}_sum"]) / n if n else None
+        return out
+
+    # --- SegmentIndex-compatible interface used by EvaluatorAgent ---
+
+    def missing_columns(self, segment_filter: Dict[str, Any]) -> List[str]:
+        return [c for c in segment_filter.keys() if c not in self.dims]
+
+    def aggregate(self, segment_filter: Dict[str, Any]) -> Dict[str, Any]:
+        if set(segment_filter) == set(self.dims):
+            key = tuple(segment_filter[d] for d in self.dims)
+            try:
+                matches = [key] if key in self.groups else []
+            except TypeError:
+                matches = []
+        else:
+            pos = [self.dims.index(c) for c in segment_filter]
+            want = list(segment_filter.values())
+            matches = [k for k in self.groups if all(k[p] == w for p, w in zip(pos, want))]
+
+        return self._combine(matches)
+
+    def totals(self) -> Dict[str, Any]:
+        """Totals over every segment (the account baseline)."""
+        return self._combine(list(self.groups))
+
+    def _combine(self, keys: List[tuple]) -> Dict[str, Any]:
+        agg: Dict[str, Any] = {"sample_size": 0}
+        terms = {c: [] for c in SUM_COLUMNS + MOMENT_COLUMNS}
+        for key in keys:
+            g = self.groups[key]
+            agg["sample_size"] += g["rows"]
+            for c in terms:
+                terms[c].extend(g[c])
+        # fsum over the concatenated expansions is already the correctly rounded total
+        for c in terms:
+            agg[c] = _total(terms[c])
+        return agg
@@ -0,0 +1,357 @@
+"""Approximate per-segment aggregates in fixed memory, for exploratory passes over very long histories.
+
+``ApproxAggregates`` folds chunks like ``SegmentAggregates`` but keeps plain
+float totals (one ``np.bincount`` per column instead of exact expansions)
+and, per segment, mergeable sketches of what totals cannot answer:
+
+- KLL quantiles of the per-row CTR and ROAS,
+- HyperLogLog distinct counts of ``distinct`` columns (adsets, creatives),
+- the heaviest ``heavy_key`` values by impressions, counted in one shared
+  count-min sketch,
+- a stratified sample: the ``sample_rows`` rows of each segment with the
+  smallest row hash (bottom-k), so chunks and processes sample the same rows
+  and merging keeps the smallest of both.
+
+Filters on columns other than ``dims`` are estimated from the sample, each
+stratum scaled to its row count. Every approximate figure carries its error
+bound. State grows with the number of segments, never with the rows.
+"""
+from typing import Any, Dict, Iterable, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+from src.schema.dataset_schema import TEXT_COLUMNS
+from src.utils.aggregates import RATIO_COLUMNS, SUM_COLUMNS, row_ratios, segment_codes
+from src.utils.confidence import DEFAULT_LEVEL, MOMENT_COLUMNS, row_moments, z_score
+from src.utils.dimensions import DIMENSIONS, DimensionDictionary
+from src.utils.sketches import CountMinSketch, HyperLogLog, KLLSketch, hash64
+
+# mixes a segment hash with a value hash into one count-min key
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+def _metrics(df: pd.DataFrame) -> Dict[str, np.ndarray]:
+    """Per-row sum and moment columns (NaN as 0) of the metric columns ``df`` has."""
+    out = {}
+    for c in SUM_COLUMNS:
+        if c in df.columns:
+            v = pd.to_numeric(df[c], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+            out[c] = np.nan_to_num(v, nan=0.0, posinf=np.inf, neginf=-np.inf)
+    if all(c in out for c in SUM_COLUMNS):
+        out.update(row_moments(out))
+    return out
+
+
+class ApproxAggregates:
+    """Segment totals plus quantile, distinct-count, heavy-hitter and sample sketches (see module doc).
+
+    Answers ``sorted_keys``/``summary`` like ``SegmentAggregates`` (for
+    ``InsightAgent.generate_from_aggregates``) and ``missing_columns``/
+    ``aggregate``/``totals`` like ``SegmentIndex`` (for ``EvaluatorAgent``);
+    approximate figures go under an ``approximate`` key.
+    """
+
+    def __init__(self, dims: Sequence[str] = ("campaign_name",), distinct: Sequence[str] = ("adset_name",),
+                 heavy_key: Optional[str] = "adset_name", top: int = 3, sample_rows: int = 1000,
+                 quantiles: Sequence[float] = (0.1, 0.5, 0.9), kll_k: int = 200, hll_precision: int = 12,
+                 cm_width: int = 2048, cm_depth: int = 5, confidence_level: float = DEFAULT_LEVEL,
+                 dimensions: Optional[DimensionDictionary] = None):
+        for q in quantiles:
+            if not 0.0 <= q <= 1.0:
+                raise ValueError(f"quantiles must be within [0, 1], got {q!r}")
+        self.dims = tuple(dims)
+        self.distinct = tuple(distinct)
+        self.heavy_key = heavy_key
+        self.top = int(top)
+        self.sample_rows = max(1, int(sample_rows))
+        self.quantiles = tuple(quantiles)
+        self.kll_k = kll_k
+        self.hll_precision = hll_precision
+        self.confidence_level = confidence_level
+        # the dictionary that canonicalized the folded chunks; resolves raw spellings in sample filters
+        self.dimensions = dimensions if dimensions is not None else DIMENSIONS
+        self.groups: Dict[tuple, Dict[str, Any]] = {}
+        self.rows = 0
+        self.heavy = CountMinSketch(cm_width, cm_depth)
+        # bottom-k sample of every segment; _stratum indexes self._keys
+        self.sample: Optional[pd.DataFrame] = None
+        self._keys: List[tuple] = []
+        self._ids: Dict[tuple, int] = {}
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, **kwargs) -> "ApproxAggregates":
+        return cls(**kwargs).update(df)
+
+    @classmethod
+    def from_chunks(cls, chunks: Iterable[pd.DataFrame], **kwargs) -> "ApproxAggregates":
+        aggs = cls(**kwargs)
+        for chunk in chunks:
+            aggs.update(chunk)
+        return aggs
+
+    def _group(self, key: tuple) -> Dict[str, Any]:
+        g = self.groups.get(key)
+        if g is None:
+            g = self.groups[key] = {"rows": 0, **dict.fromkeys(SUM_COLUMNS + MOMENT_COLUMNS, 0.0)}
+            for c in RATIO_COLUMNS:
+                g[f"{c}_sum"] = 0.0
+                g[f"{c}_count"] = 0
+            g["quantiles"] = {c: KLLSketch(self.kll_k) for c in RATIO_COLUMNS}
+            g["distinct"] = {c: HyperLogLog(self.hll_precision) for c in self.distinct}
+            g["heavy"] = {}
+            self._ids[key] = len(self._keys)
+            self._keys.append(key)
+        return g
+
+    @staticmethod
+    def _key_hashes(keys: List[tuple]) -> np.ndarray:
+        return hash64(np.array(["\x1f".join(map(str, k)) for k in keys], dtype=object))
+
+    # --- folding ---
+
+    def update(self, df: pd.DataFrame) -> "ApproxAggregates":
+        """Fold one chunk of rows into the totals and sketches."""
+        if df is None or df.empty:
+            return self
+        codes, uniques = segment_codes(df, self.dims)
+        keep = codes >= 0
+        if not keep.any():
+            return self
+        n = len(uniques)
+        valid = codes[keep]
+        positions = np.flatnonzero(keep)[np.argsort(valid, kind="stable")]
+        bounds = np.concatenate(([0], np.cumsum(np.bincount(valid, minlength=n))))
+
+        metrics = _metrics(df)
+        sums = {c: np.bincount(valid, v[keep], minlength=n) for c, v in metrics.items()}
+        ratios = row_ratios(df)
+        for c in RATIO_COLUMNS:
+            present = keep & ~np.isnan(ratios[c])
+            sums[f"{c}_sum"] = np.bincount(codes[present], ratios[c][present], minlength=n)
+            sums[f"{c}_count"] = np.bincount(codes[present], minlength=n)
+        ordered = {c: ratios[c][positions] for c in RATIO_COLUMNS}
+        hashed = {}
+        for col in self.distinct:
+            if col in df.columns:
+                present = df[col].notna().to_numpy()[positions]
+                hashed[col] = (hash64(df[col])[positions], present)
+
+        for i, key in enumerate(uniques):
+            a, b = int(bounds[i]), int(bounds[i + 1])
+            if a == b:
+                continue
+            g = self._group(key)
+            g["rows"] += b - a
+            for name, values in sums.items():
+                g[name] += values[i].item()
+            for c in RATIO_COLUMNS:
+                g["quantiles"][c].update(ordered[c][a:b])
+            for col, (hashes, present) in hashed.items():
+                g["distinct"][col].add(hashes[a:b][present[a:b]])
+
+        self._update_heavy(df, codes, keep, uniques, metrics.get("impressions"))
+        self._update_sample(df, codes, keep, uniques)
+        self.rows += int(keep.sum())
+        return self
+
+    def _update_heavy(self, df, codes, keep, uniques, impressions):
+        if self.heavy_key is None or self.heavy_key not in df.columns or impressions is None:
+            return
+        col = df[self.heavy_key]
+        ok = keep & col.notna().to_numpy()
+        if not ok.any():
+            return
+        pairs = self._key_hashes(uniques)[codes[ok]] * _MIX ^ hash64(col)[ok]
+        self.heavy.add(pairs, impressions[ok])
+        # candidates: each segment's heaviest values in this chunk, re-ranked by the sketch
+        local = pd.DataFrame({"code": codes[ok], "value": col[ok].to_numpy(), "w": impressions[ok]})
+        local = local.groupby(["code", "value"], observed=True, sort=False)["w"].sum()
+        local = local.sort_values(ascending=False, kind="stable").groupby(level=0, sort=False).head(4 * self.top)
+        touched = set()
+        for code, value in local.index:
+            key = uniques[code]
+            self.groups[key]["heavy"].setdefault(value, None)
+            touched.add(key)
+        for key in touched:
+            self._trim_heavy(key)
+
+    def _heavy_estimates(self, key: tuple, values: List[Any]) -> np.ndarray:
+        pairs = self._key_hashes([key]) * _MIX ^ hash64(np.array(values, dtype=object))
+        return self.heavy.estimate(pairs)
+
+    def _trim_heavy(self, key: tuple):
+        g = self.groups[key]
+        values = list(g["heavy"])
+        if len(values) > 4 * self.top:
+            est = self._heavy_estimates(key, values)
+            order = np.argsort(-est, kind="stable")[:4 * self.top]
+            g["heavy"] = dict.fromkeys(values[i] for i in sorted(order))
+
+    def _update_sample(self, df, codes, keep, uniques):
+        columns = [c for c in df.columns if c not in TEXT_COLUMNS]
+        rows = np.flatnonzero(keep)
+        ids = np.array([self._ids[k] for k in uniques], dtype=np.int64)
+        strata = ids[codes[rows]]
+        priority = pd.util.hash_pandas_object(df[columns], index=False).to_numpy()[rows]
+        # each stratum's smallest priorities in this chunk, before touching the held sample
+        order = np.lexsort((priority, strata))
+        first = np.unique(strata[order], return_index=True)
+        rank = np.arange(len(order)) - first[1][np.searchsorted(first[0], strata[order])]
+        pick = order[rank < self.sample_rows]
+        part = df.iloc[rows[pick]][columns].reset_index(drop=True)
+        part["_stratum"] = strata[pick]
+        part["_priority"] = priority[pick]
+        self._add_sample(part)
+
+    def _add_sample(self, part: pd.DataFrame):
+        frame = part if self.sample is None else pd.concat([self.sample, part], ignore_index=True)
+        frame = frame.sort_values(["_stratum", "_priority"], kind="stable")
+        self.sample = frame[frame.groupby("_stratum").cumcount().to_numpy() < self.sample_rows].reset_index(drop=True)
+
+    def merge(self, other: "ApproxAggregates") -> "ApproxAggregates":
+        """Fold another partition's aggregates (same parameters) into this one."""
+        if (other.dims, other.distinct, other.heavy_key) != (self.dims, self.distinct, self.heavy_key):
+            raise ValueError(f"Cannot merge approximate aggregates over {other.dims} into {self.dims}")
+        for key, og in other.groups.items():
+            g = self._group(key)
+            for name, value in og.items():
+                if name == "quantiles":
+                    for c, sketch in value.items():
+                        g[name][c].merge(sketch)
+                elif name == "distinct":
+                    for c, sketch in value.items():
+                        g[name][c].merge(sketch)
+                elif name == "heavy":
+                    g[name].update(value)
+                else:
+                    g[name] += value
+        self.heavy.merge(other.heavy)
+        for key in other.groups:
+            self._trim_heavy(key)
+        if other.sample is not None:
+            remap = np.array([self._ids[k] for k in other._keys], dtype=np.int64)
+            part = other.sample.copy()
+            part["_stratum"] = remap[part["_stratum"].to_numpy()]
+            self._add_sample(part)
+        self.rows += other.rows
+        return self
+
+    # --- answers ---
+
+    def sorted_keys(self) -> List[tuple]:
+        try:
+            return sorted(self.groups)
+        except TypeError:
+            return list(self.groups)
+
+    def sketches(self, key: tuple) -> Dict[str, Any]:
+        """Quantiles, distinct counts and heaviest ``heavy_key`` values of one segment, each with its error bound."""
+        g = self.groups[key]
+        z = z_score(self.confidence_level)
+        out = {}
+        for c in RATIO_COLUMNS:
+            sketch = g["quantiles"][c]
+            names = [f"p{q * 100:g}" for q in self.quantiles]
+            out[f"{c}_quantiles"] = {**dict(zip(names, sketch.quantiles(self.quantiles))),
+                                     "rank_error": round(sketch.rank_error, 4)}
+        out["distinct"] = {}
+        for col, sketch in g["distinct"].items():
+            est = sketch.estimate()
+            out["distinct"][col] = {"estimate": round(est, 1), "error": round(z * sketch.relative_error * est, 1)}
+        if self.heavy_key is not None and g["heavy"]:
+            values = list(g["heavy"])
+            est = self._heavy_estimates(key, values)
+            order = np.argsort(-est, kind="stable")[:self.top]
+            error = round(self.heavy.error, 1)
+            out[f"top_{self.heavy_key}"] = [{self.heavy_key: values[i], "impressions": float(est[i]), "error": error}
+                                            for i in order]
+        return out
+
+    def summary(self, key: tuple) -> Dict[str, Any]:
+        """Totals and ratio means for one segment, with its sketches under ``approximate``."""
+        g = self.groups[key]
+        out = {"sample_size": g["rows"]}
+        for c in SUM_COLUMNS + MOMENT_COLUMNS:
+            out[c] = g[c]
+        for c in RATIO_COLUMNS:
+            n = g[f"{c}_count"]
+            out[f"mean_{c}"] = g[f"{c}_sum"] / n if n else None
+        out["approximate"] = self.sketches(key)
+        return out
+
+    def missing_columns(self, segment_filter: Dict[str, Any]) -> List[str]:
+        sampled = self.sample.columns if self.sample is not None else ()
+        return [c for c in segment_filter if c not in self.dims and c not in sampled]
+
+    def aggregate(self, segment_filter: Dict[str, Any]) -> Dict[str, Any]:
+        """Totals of the rows matching ``segment_filter``: exact over ``dims``, estimated from the sample otherwise."""
+        if not set(segment_filter) <= set(self.dims):
+            return self._estimate(segment_filter)
+        pos = [self.dims.index(c) for c in segment_filter]
+        want = list(segment_filter.values())
+        matches = [k for k in self.groups if all(k[p] == w for p, w in zip(pos, want))]
+        agg = self._combine(matches)
+        if len(matches) == 1:
+            agg["approximate"] = self.sketches(matches[0])
+        return agg
+
+    def totals(self) -> Dict[str, Any]:
+        """Totals over every segment (the account baseline)."""
+        return self._combine(list(self.groups))
+
+    def _combine(self, keys: List[tuple]) -> Dict[str, Any]:
+        agg: Dict[str, Any] = {"sample_size": sum(self.groups[k]["rows"] for k in keys)}
+        for c in SUM_COLUMNS + MOMENT_COLUMNS:
+            agg[c] = float(sum(self.groups[k][c] for k in keys))
+        return agg
+
+    def _matches(self, segment_filter: Dict[str, Any]) -> np.ndarray:
+        match = np.ones(len(self.sample), dtype=bool)
+        for col, value in segment_filter.items():
+            values = self.sample[col]
+            try:
+                hit = (values == value).to_numpy(dtype=bool, na_value=False)
+                if not hit.any():
+                    # filters written against raw spellings still hit canonicalized columns
+                    canon = self.dimensions.canonical(col, value)
+                    if canon is not None:
+                        hit = (values == canon).to_numpy(dtype=bool, na_value=False)
+            except (TypeError, ValueError):
+                hit = np.zeros(len(values), dtype=bool)
+            match &= hit
+        return match
+
+    def _estimate(self, segment_filter: Dict[str, Any]) -> Dict[str, Any]:
+        """Stratified estimate: each stratum's sample mean times its row count, with a z-scaled standard error."""
+        keys = SUM_COLUMNS + MOMENT_COLUMNS
+        if self.sample is None or self.sample.empty:
+            return {"sample_size": 0, **dict.fromkeys(keys, 0)}
+        match = self._matches(segment_filter)
+        strata = self.sample["_stratum"].to_numpy()
+        size = np.array([self.groups[k]["rows"] for k in self._keys], dtype="float64")
+        n = np.bincount(strata, minlength=len(size)).astype("float64")
+        seen = n > 0
+        fpc = np.zeros(len(size))
+        np.divide(size - n, size, out=fpc, where=seen)
+        z = z_score(self.confidence_level)
+
+        columns = {"sample_size": np.ones(len(strata)), **_metrics(self.sample)}
+        agg: Dict[str, Any] = {}
+        bounds = {}
+        for name, x in columns.items():
+            y = np.where(match, x, 0.0)
+            s1 = np.bincount(strata, y, minlength=len(size))
+            s2 = np.bincount(strata, y * y, minlength=len(size))
+            mean = np.zeros(len(size))
+            np.divide(s1, n, out=mean, where=seen)
+            var = np.zeros(len(size))
+            np.divide(s2 - n * mean * mean, n - 1, out=var, where=n > 1)
+            spread = np.zeros(len(size))
+            np.divide(size * size * fpc * np.maximum(var, 0.0), n, out=spread, where=seen)
+            agg[name] = float(np.sum(size * mean))
+            bounds[name] = round(float(z * np.sqrt(spread.sum())), 4)
+        agg["sample_size"] = int(round(agg["sample_size"]))
+        agg["approximate"] = {"sampled_rows": int(match.sum()),
+                              "error_bounds": {k: bounds[k] for k in ["sample_size"] + SUM_COLUMNS}}
+        return agg
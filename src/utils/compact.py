@@ -0,0 +1,130 @@
+"""Compact in-memory representation of the ad dataset, and a memory budget.
+
+Only the columns the enabled stages read are loaded (``needed_columns``):
+label columns (dimensions, dates) come from the data source as categoricals
+and, after validation, ``compact_frame`` downcasts integer metrics and stores float
+metrics as float32 where that is exact. Free text (``creative_message``) is
+left out of the frame; ``lazy_column`` reads it on demand for the rows that
+survived validation.
+
+``plan_memory`` estimates the compact frame from a sample of the file and
+switches the pipeline to chunked streaming when it would exceed
+``data.memory_budget_mb``.
+"""
+import io
+import itertools
+import os
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+from src.schema.dataset_schema import TEXT_COLUMNS
+from src.schema.validator import NUMERIC_COLUMNS, REQUIRED_COLUMNS
+from src.utils.aggregates import SUM_COLUMNS
+from src.utils.confidence import MOMENT_COLUMNS
+from src.utils.data_source import CSVSource, open_source
+from src.utils.timeseries import DEFAULT_KEYS
+
+# float64 working copies per row on top of the frame: validation coerces the
+# metrics, the segment index keeps metrics and moments as one matrix
+WORKING_BYTES_PER_ROW = 8 * (len(NUMERIC_COLUMNS) + len(SUM_COLUMNS) + len(MOMENT_COLUMNS))
+# data.memory_budget_mb when the config does not set it
+DEFAULT_MEMORY_BUDGET_MB = 2048
+
+
+def needed_columns(cfg: Dict[str, Any]) -> List[str]:
+    """Source columns read by the stages ``cfg`` enables."""
+    analysis = cfg.get("analysis", {}) or {}
+    columns = list(REQUIRED_COLUMNS)
+    trends = analysis.get("trends") or {}
+    if trends.get("enabled", True):
+        columns += list(trends.get("keys", DEFAULT_KEYS)) + [trends.get("date_column", "date")]
+    cube = analysis.get("cube") or {}
+    if cube.get("enabled"):
+        columns += list(cube.get("dimensions", ["campaign_name"]))
+    approx = analysis.get("approximate") or {}
+    if approx.get("enabled"):
+        columns += list(approx.get("distinct", ["adset_name"]))
+        if approx.get("heavy_key", "adset_name"):
+            columns.append(approx.get("heavy_key", "adset_name"))
+    cache = cfg.get("cache", {}) or {}
+    if cache.get("enabled"):
+        columns.append(cache.get("partition_column", "date"))
+    return [c for c in dict.fromkeys(columns) if c not in TEXT_COLUMNS]
+
+
+def compact_frame(df: pd.DataFrame) -> pd.DataFrame:
+    """Downcast numeric columns of a validated frame in place.
+
+    Integers go to the smallest width that holds them, floats to float32 where that is exact.
+    """
+    for col in df.columns:
+        kind = df[col].dtype.kind
+        if kind in "iu":
+            df[col] = pd.to_numeric(df[col], downcast="integer")
+        elif kind == "f":
+            values = df[col].to_numpy()
+            narrow = values.astype(np.float32)
+            if np.array_equal(narrow.astype(np.float64), values, equal_nan=True):
+                df[col] = narrow
+    return df
+
+
+def frame_bytes(df: pd.DataFrame) -> int:
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+def lazy_column(df: pd.DataFrame, name: str) -> pd.Series:
+    """Column ``name`` of the source ``df`` was read from, for the rows still in ``df``.
+
+    The column is read with the same query; a source indexes the rows of a
+    query the same way every time (and validation keeps the index), so it is
+    aligned by index. Nothing is cached: every call reads the whole column from
+    the source again, so callers needing it twice should keep the result (a
+    pipeline run reads it once, in ``analyze_copy`` or the incremental load).
+    """
+    if not df.attrs.get("source"):
+        raise ValueError(f"cannot load {name!r}: the frame does not record its source")
+    source = open_source(df.attrs["source"], **df.attrs.get("source_args", {}))
+    query = df.attrs.get("query") or {}
+    return source.read([name], **query)[name].astype("category").reindex(df.index)
+
+
+def estimate_memory(path: str, cfg: Dict[str, Any], sample_rows: int = 10_000) -> Dict[str, Any]:
+    """Rows, bytes per row (default parse vs compact) and peak bytes of loading the CSV ``path``, from its first rows.
+
+    A query is not taken into account, so this is an upper bound for filtered runs.
+    """
+    size = os.path.getsize(path)
+    with open(path, "rb") as fh:
+        header = fh.readline()
+        lines = list(itertools.islice(fh, sample_rows))
+    if not lines:
+        return {"rows": 0, "bytes_per_row": {"raw": 0, "compact": 0}, "peak_bytes": 0}
+    sample = header + b"".join(lines)
+    raw = pd.read_csv(io.BytesIO(sample))
+    source = CSVSource(path)
+    columns = [c for c in source.columns() if c in set(needed_columns(cfg))]
+    compact = compact_frame(pd.read_csv(io.BytesIO(sample), **source.options(columns)))
+    n = len(lines)
+    rows = n if len(sample) >= size else round((size - len(header)) * n / (len(sample) - len(header)))
+    per_row = {"raw": round(frame_bytes(raw) / n, 1), "compact": round(frame_bytes(compact) / n, 1)}
+    return {"rows": rows, "bytes_per_row": per_row,
+            "peak_bytes": int(rows * (per_row["compact"] + WORKING_BYTES_PER_ROW))}
+
+
+def plan_memory(cfg: Dict[str, Any], path: str) -> Dict[str, Any]:
+    """``estimate_memory`` plus the load mode that fits ``data.memory_budget_mb``.
+
+    Over budget, the mode is ``streaming`` with a chunk size that keeps one
+    chunk within a quarter of the budget.
+    """
+    budget_mb = (cfg.get("data", {}) or {}).get("memory_budget_mb", DEFAULT_MEMORY_BUDGET_MB)
+    budget = int(float(budget_mb or 0) * (1 << 20))
+    estimate = estimate_memory(path, cfg)
+    plan = {**estimate, "budget_bytes": budget, "mode": "in_memory", "chunksize": 0}
+    if budget and estimate["peak_bytes"] > budget:
+        per_row = estimate["bytes_per_row"]["raw"] + WORKING_BYTES_PER_ROW
+        plan.update(mode="streaming", chunksize=max(1000, int(budget / 4 / per_row)))
+    return plan
@@ -0,0 +1,212 @@
+import math
+from functools import lru_cache
+from operator import itemgetter
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+DEFAULT_LEVEL = 0.95
+# per-segment sums of row-level terms that the intervals need besides the plain totals
+MOMENT_COLUMNS = ["spend_sq", "revenue_sq", "spend_revenue", "clicks_sq_per_impression"]
+
+
+def row_moments(metrics: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+    """Row-level terms whose per-segment sums give the ``MOMENT_COLUMNS``.
+
+    ``metrics`` maps impressions/clicks/spend/revenue to per-row float arrays
+    (NaN already replaced by 0).
+    """
+    spend, revenue = metrics["spend"], metrics["revenue"]
+    clicks, impressions = metrics["clicks"], metrics["impressions"]
+    per_impression = np.zeros(len(clicks))
+    np.divide(clicks * clicks, impressions, out=per_impression, where=impressions > 0)
+    return {
+        "spend_sq": spend * spend,
+        "revenue_sq": revenue * revenue,
+        "spend_revenue": spend * revenue,
+        "clicks_sq_per_impression": per_impression,
+    }
+
+
+def erfc(x) -> np.ndarray:
+    """Complementary error function, elementwise (fractional error < 1.2e-7)."""
+    x = np.asarray(x, dtype="float64")
+    z = np.abs(x)
+    t = 1.0 / (1.0 + 0.5 * z)
+    poly = -z * z - 1.26551223 + t * (1.00002368 + t * (0.37409196 + t * (0.09678418 + t * (
+        -0.18628806 + t * (0.27886807 + t * (-1.13520398 + t * (1.48851587 + t * (
+            -0.82215223 + t * 0.17087277))))))))
+    r = t * np.exp(poly)
+    return np.where(x >= 0, r, 2.0 - r)
+
+
+def two_sided_p(z) -> np.ndarray:
+    """P(|Z| >= |z|) for a standard normal Z; NaN stays NaN."""
+    return np.minimum(erfc(np.abs(np.asarray(z, dtype="float64")) / math.sqrt(2.0)), 1.0)
+
+
+@lru_cache(maxsize=32)
+def z_score(level: float = DEFAULT_LEVEL) -> float:
+    """Two-sided normal quantile for a confidence ``level`` (0.95 -> 1.96)."""
+    if not 0.0 < level < 1.0:
+        raise ValueError(f"confidence level must be in (0, 1), got {level!r}")
+    lo, hi = 0.0, 40.0
+    for _ in range(100):
+        mid = (lo + hi) / 2
+        if two_sided_p(mid) > 1.0 - level:
+            lo = mid
+        else:
+            hi = mid
+    return (lo + hi) / 2
+
+
+def _div(num, den) -> np.ndarray:
+    num = np.asarray(num, dtype="float64")
+    den = np.asarray(den, dtype="float64")
+    out = np.full(np.broadcast(num, den).shape, np.nan)
+    np.divide(num, den, out=out, where=den > 0)
+    return out
+
+
+def wilson_interval(successes, trials, z: float = 1.959963984540054):
+    """Wilson score interval for ``successes / trials``, within [0, 1]; NaN where ``trials`` is 0."""
+    n = np.asarray(trials, dtype="float64")
+    p = np.clip(_div(successes, n), 0.0, 1.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        z2n = z * z / n
+        denom = 1.0 + z2n
+        centre = (p + z2n / 2) / denom
+        half = z * np.sqrt(p * (1 - p) / n + z2n / (4 * n)) / denom
+    # rounding can push a bound just past 0 or 1 (e.g. -3e-21 with no successes)
+    return np.maximum(centre - half, 0.0), np.minimum(centre + half, 1.0)
+
+
+def ratio_se(num, den, num_sq, den_sq, num_den, rows) -> np.ndarray:
+    """Delta-method standard error of the ratio estimator ``sum(y) / sum(x)``.
+
+    Rows are the sampling units: with ``R = Y / X`` the residuals
+    ``y_i - R x_i`` have sum of squares ``Syy - 2 R Sxy + R^2 Sxx`` and
+    ``se(R) = sqrt(n / (n - 1) * SS) / X``. NaN with fewer than two rows or
+    no denominator.
+    """
+    n = np.asarray(rows, dtype="float64")
+    den = np.asarray(den, dtype="float64")
+    r = _div(num, den)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ss = np.maximum(np.asarray(num_sq) - 2 * r * np.asarray(num_den) + r * r * np.asarray(den_sq), 0.0)
+        se = np.sqrt(n / (n - 1) * ss) / den
+    return np.where((n > 1) & (den > 0), se, np.nan)
+
+
+def ctr_dispersion(clicks, impressions, clicks_sq_per_impression, rows) -> np.ndarray:
+    """Quasi-binomial dispersion of per-row clicks around the segment CTR (at least 1).
+
+    Rows sharing one CTR would give Pearson ``X^2 / (n - 1)`` near 1; real
+    rows vary in CTR (a Beta-binomial), which inflates it. With ``p`` the
+    pooled CTR, ``X^2 = (sum(c^2 / m) - 2 p C + p^2 M) / (p (1 - p))``.
+    """
+    n = np.asarray(rows, dtype="float64")
+    m = np.asarray(impressions, dtype="float64")
+    c = np.asarray(clicks, dtype="float64")
+    p = np.clip(_div(c, m), 0.0, 1.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        x2 = (np.asarray(clicks_sq_per_impression) - 2 * p * c + p * p * m) / (p * (1 - p))
+        phi = x2 / (n - 1)
+    return np.where((n > 1) & (p > 0) & (p < 1) & np.isfinite(phi), np.maximum(phi, 1.0), 1.0)
+
+
+def segment_confidence(
+    clicks, impressions, spend, revenue, spend_sq, revenue_sq, spend_revenue, clicks_sq_per_impression, rows,
+    baseline: Dict[str, Any], level: float = DEFAULT_LEVEL,
+) -> Dict[str, np.ndarray]:
+    """Intervals and significance versus the account baseline for many segments at once.
+
+    Every argument is an array with one entry per segment (the per-segment
+    totals and second moments); ``baseline`` holds the same totals for the
+    whole account. Returns arrays:
+
+    * ``ctr_low``/``ctr_high`` - Wilson interval of pooled clicks/impressions,
+      on the effective sample size ``impressions / dispersion``
+    * ``ctr_p`` - two-sided one-sample z-test of that CTR against the account
+      CTR, with the same overdispersion correction
+    * ``roas_low``/``roas_high``/``roas_p`` - the same for revenue/spend, using
+      the delta-method standard error
+    * ``confidence`` - ``1 - p`` of the stronger of the two tests, Bonferroni
+      corrected for testing both; 0 where neither test is defined
+    """
+    z = z_score(level)
+    impressions = np.asarray(impressions, dtype="float64")
+    spend = np.asarray(spend, dtype="float64")
+
+    ctr = np.clip(_div(clicks, impressions), 0.0, 1.0)
+    phi = ctr_dispersion(clicks, impressions, clicks_sq_per_impression, rows)
+    effective = impressions / phi
+    ctr_low, ctr_high = wilson_interval(ctr * effective, effective, z)
+    p0 = _div(baseline.get("clicks", 0.0), baseline.get("impressions", 0.0))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ctr_se0 = np.sqrt(p0 * (1 - p0) / effective)
+        ctr_z = (ctr - p0) / ctr_se0
+    ctr_p = np.where((impressions > 0) & (p0 > 0) & (p0 < 1), two_sided_p(ctr_z), np.nan)
+
+    roas = _div(revenue, spend)
+    se = ratio_se(revenue, spend, revenue_sq, spend_sq, spend_revenue, rows)
+    r0 = _div(baseline.get("revenue", 0.0), baseline.get("spend", 0.0))
+    with np.errstate(invalid="ignore", divide="ignore"):
+        roas_z = np.where(se > 0, (roas - r0) / se, np.where(roas == r0, 0.0, np.inf))
+    roas_p = np.where(np.isfinite(se) & ~np.isnan(r0), two_sided_p(roas_z), np.nan)
+
+    best = np.fmin(ctr_p, roas_p)
+    tests = (~np.isnan(ctr_p)).astype(np.int8) + (~np.isnan(roas_p))
+    confidence = np.where(tests > 0, 1.0 - np.minimum(1.0, best * np.maximum(tests, 1)), 0.0)
+
+    return {
+        "ctr_low": ctr_low,
+        "ctr_high": ctr_high,
+        "ctr_p": ctr_p,
+        "roas_low": np.maximum(roas - z * se, 0.0),
+        "roas_high": roas + z * se,
+        "roas_p": roas_p,
+        "confidence": confidence,
+    }
+
+
+def nan_to_none(values: np.ndarray) -> List[Optional[float]]:
+    """``values.tolist()`` with NaN replaced by ``None`` (JSON has no NaN)."""
+    out = values.astype(object)
+    out[np.isnan(values)] = None
+    return out.tolist()
+
+
+def interval_columns(stats: Dict[str, np.ndarray]) -> Dict[str, List[Any]]:
+    """``segment_confidence`` output as per-field Python lists (NaN -> None, intervals as pairs)."""
+    cols = {k: nan_to_none(v) for k, v in stats.items()}
+    return {
+        "confidence": cols["confidence"],
+        "ctr_ci": [[lo, hi] if lo is not None else None for lo, hi in zip(cols["ctr_low"], cols["ctr_high"])],
+        "ctr_p_value": cols["ctr_p"],
+        "roas_ci": [[lo, hi] if lo is not None else None for lo, hi in zip(cols["roas_low"], cols["roas_high"])],
+        "roas_p_value": cols["roas_p"],
+    }
+
+
+def confidence_fields(stats: Dict[str, np.ndarray]) -> List[Dict[str, Any]]:
+    """Per-segment ``validation`` fields from ``segment_confidence`` output."""
+    cols = interval_columns(stats)
+    names = list(cols)
+    return [dict(zip(names, values)) for values in zip(*cols.values())]
+
+
+AGGREGATE_FIELDS = ["clicks", "impressions", "spend", "revenue"] + MOMENT_COLUMNS + ["sample_size"]
+
+
+def aggregate_table(aggs: List[Dict[str, Any]]) -> np.ndarray:
+    """``AGGREGATE_FIELDS`` of ``SegmentIndex.aggregate``-style dicts as rows of a float64 array."""
+    if not aggs:
+        return np.zeros((len(AGGREGATE_FIELDS), 0))
+    return np.array(list(map(itemgetter(*AGGREGATE_FIELDS), aggs)), dtype="float64").T
+
+
+def from_aggregates(aggs: List[Dict[str, Any]], baseline: Dict[str, Any],
+                    level: float = DEFAULT_LEVEL) -> List[Dict[str, Any]]:
+    """``confidence_fields`` for a list of ``SegmentIndex.aggregate``-style dicts."""
+    return confidence_fields(segment_confidence(*aggregate_table(aggs), baseline, level))
@@ -1,7 +1,32 @@
-import yaml
+import copy
+import threading
 from pathlib import Path
 
+import yaml
+
+# absolute path -> ((mtime_ns, size), parsed config); re-read only when the file changes
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _read(p: Path):
+    st = p.stat()
+    key, stamp = str(p.resolve()), (st.st_mtime_ns, st.st_size)
+    with _cache_lock:
+        hit = _cache.get(key)
+    if hit is not None and hit[0] == stamp:
+        return hit[1]
+    cfg = yaml.safe_load(p.read_text()) or {}
+    with _cache_lock:
+        _cache[key] = (stamp, cfg)
+    return cfg
+
+
 def load_config():
+    """The first config file found, parsed once and cached until its mtime or size changes.
+
+    Callers get their own deep copy, so mutating it never leaks into the cache.
+    """
     candidates = [
         Path("config.yaml"),
         Path("config/config.yaml"),
@@ -11,12 +36,14 @@ def load_config():
     for p in candidates:
         if p.exists():
             try:
-                return yaml.safe_load(p.read_text()) or {}
+                return copy.deepcopy(_read(p))
             except Exception:
                 continue
+    # only what a run cannot start without; every other setting has its default where it is read
     return {
         "data": {"path": "data/synthetic_fb_ads_undergarments.csv"},
         "logging": {"log_dir": "logs", "jsonl_file": "events.log.jsonl"},
         "analysis": {"low_ctr_threshold": 0.01, "min_impressions": 1000, "roas_threshold": 1.0, "min_clicks": 10},
-        "reports": {"output_dir": "reports", "insights_file": "insights.json", "creatives_file": "creatives.json", "report_file": "report.md"},
+        "reports": {"output_dir": "reports", "insights_file": "insights.json", "creatives_file": "creatives.json",
+                    "report_file": "report.md"},
     }
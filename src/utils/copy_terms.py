@@ -0,0 +1,289 @@
+"""Term lift of ad copy: which words and phrases in ``creative_message`` go with higher CTR and ROAS.
+
+Messages repeat across many rows, so text is only ever handled once per
+distinct message:
+
+1. ``CopyStats`` folds rows into metric totals per (campaign, message) pair;
+   like ``SegmentAggregates`` it is updated chunk by chunk and merged.
+2. Each distinct message is tokenized once into words and two-word phrases
+   (``tokenize``), memoized in memory and in a SQLite file keyed by a hash of
+   the message (``TermMemo``), so later runs only tokenize new copy.
+3. Messages x terms is a sparse binary matrix in COO form with hashed term
+   ids. Term totals are the products ``M.T @ totals``, computed with
+   ``np.bincount`` over the nonzeros; nothing is dense in the vocabulary.
+4. The rows of every term are compared with all other rows: CTR and ROAS
+   lift, and a two-proportion z-test on CTR widened by the account's CTR
+   dispersion (as for trends). With thousands of terms tested at once, a term
+   is significant by its Benjamini-Hochberg q-value. Each campaign cites the
+   significant terms of its own copy with the best and worst account-wide lift.
+"""
+import hashlib
+import itertools
+import re
+import sqlite3
+import unicodedata
+import zlib
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.utils.confidence import DEFAULT_LEVEL, ctr_dispersion, nan_to_none, row_moments, two_sided_p
+from src.utils.lru import LRUCache
+
+# bump when tokenize() changes, so memoized terms are not reused
+TOKENIZER_VERSION = 1
+STOPWORDS = frozenset(
+    "a an and are as at be by for from in is it its of on or our so that the this to with you your".split()
+)
+# per-pair totals, in this order
+TOTALS = ("rows", "impressions", "clicks", "spend", "revenue", "clicks_sq_per_impression")
+
+_WORD = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+
+def tokenize(message: str, ngram: int = 2) -> Tuple[str, ...]:
+    """Distinct words and phrases of up to ``ngram`` words (no phrase starts or ends with a stopword)."""
+    text = unicodedata.normalize("NFKC", message).casefold().replace("’", "'")
+    words = _WORD.findall(text)
+    terms = {w for w in words if w not in STOPWORDS and len(w) > 1}
+    for n in range(2, ngram + 1):
+        for i in range(len(words) - n + 1):
+            if words[i] not in STOPWORDS and words[i + n - 1] not in STOPWORDS:
+                terms.add(" ".join(words[i:i + n]))
+    return tuple(sorted(terms))
+
+
+def term_id(term: str, n_features: int) -> int:
+    return zlib.crc32(term.encode("utf-8")) % n_features
+
+
+class TermMemo:
+    """Tokenized messages by message hash: an in-process LRU in front of an optional SQLite file."""
+
+    def __init__(self, path: Optional[str] = None, ngram: int = 2, max_entries: int = 1 << 16):
+        self.path = path
+        self.ngram = ngram
+        self.cache = LRUCache(max_entries=max_entries, max_bytes=256 << 20)
+        self.stats = {"memory": 0, "disk": 0, "tokenized": 0}
+        if path:
+            Path(path).parent.mkdir(parents=True, exist_ok=True)
+            with closing(sqlite3.connect(path)) as con:
+                con.execute("CREATE TABLE IF NOT EXISTS terms (hash TEXT PRIMARY KEY, terms TEXT NOT NULL)")
+                con.commit()
+
+    def key(self, message: str) -> str:
+        raw = f"{TOKENIZER_VERSION}:{self.ngram}:{message}".encode("utf-8")
+        return hashlib.blake2b(raw, digest_size=16).hexdigest()
+
+    def terms(self, messages: Sequence[str]) -> List[Tuple[str, ...]]:
+        """``tokenize`` of every message, reusing memoized results."""
+        keys = [self.key(m) for m in messages]
+        out = [self.cache.get(k) for k in keys]
+        missing = [i for i, t in enumerate(out) if t is None]
+        self.stats["memory"] += len(keys) - len(missing)
+        if missing and self.path:
+            found = {}
+            with closing(sqlite3.connect(self.path)) as con:
+                for a in range(0, len(missing), 500):
+                    batch = [keys[i] for i in missing[a:a + 500]]
+                    rows = con.execute(f"SELECT hash, terms FROM terms WHERE hash IN ({', '.join('?' * len(batch))})",
+                                       batch)
+                    found.update((h, tuple(t.split("\n")) if t else ()) for h, t in rows)
+            for i in missing:
+                terms = found.get(keys[i])
+                if terms is not None:
+                    out[i] = terms
+                    self.cache.put(keys[i], terms)
+            self.stats["disk"] += len(found)
+            missing = [i for i in missing if out[i] is None]
+        fresh: Dict[str, Tuple[str, ...]] = {}
+        for i in missing:
+            if keys[i] not in fresh:
+                fresh[keys[i]] = tokenize(messages[i], self.ngram)
+                self.cache.put(keys[i], fresh[keys[i]])
+            out[i] = fresh[keys[i]]
+        new = [(k, "\n".join(t)) for k, t in fresh.items()]
+        self.stats["tokenized"] += len(new)
+        if new and self.path:
+            with closing(sqlite3.connect(self.path)) as con:
+                con.executemany("INSERT OR REPLACE INTO terms (hash, terms) VALUES (?, ?)", new)
+                con.commit()
+        return out
+
+
+class CopyStats:
+    """Metric totals per (campaign, message) pair, folded in chunk by chunk.
+
+    Campaigns and messages are stored once each; a pair is a row of ``totals``
+    whose campaign and message ids are ``pair_campaign``/``pair_message``.
+    """
+
+    def __init__(self, campaign_column: str = "campaign_name", message_column: str = "creative_message"):
+        self.campaign_column = campaign_column
+        self.message_column = message_column
+        self.campaigns: Dict[str, int] = {}
+        self.messages: Dict[str, int] = {}
+        self.pairs: Dict[int, int] = {}
+        self.pair_campaign = np.zeros(0, dtype=np.int64)
+        self.pair_message = np.zeros(0, dtype=np.int64)
+        self.totals = np.zeros((0, len(TOTALS)))
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, messages: Optional[pd.Series] = None, **kw) -> "CopyStats":
+        return cls(**kw).update(df, messages)
+
+    def update(self, df: pd.DataFrame, messages: Optional[pd.Series] = None) -> "CopyStats":
+        """Fold rows of ``df`` in; ``messages`` overrides the message column (e.g. a lazily loaded one)."""
+        if messages is None:
+            if df is None or self.message_column not in df.columns:
+                return self
+            messages = df[self.message_column]
+        if df.empty or self.campaign_column not in df.columns:
+            return self
+        camp_codes, campaigns = pd.factorize(df[self.campaign_column])
+        msg_codes, texts = pd.factorize(messages)
+        keep = (camp_codes >= 0) & (msg_codes >= 0)
+        if not keep.any():
+            return self
+        # chunk-local codes -> ids shared across chunks
+        camp_ids = self._ids(self.campaigns, campaigns)[camp_codes[keep]]
+        msg_ids = self._ids(self.messages, texts)[msg_codes[keep]]
+        uniques, inverse = np.unique(camp_ids << 32 | msg_ids, return_inverse=True)
+
+        def col(name):
+            return pd.to_numeric(df[name], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)[keep]
+
+        metrics = {c: np.nan_to_num(col(c)) for c in ("impressions", "clicks", "spend", "revenue")}
+        metrics.update(row_moments(metrics))
+        chunk = np.empty((len(uniques), len(TOTALS)))
+        chunk[:, 0] = np.bincount(inverse, minlength=len(uniques))
+        for j, name in enumerate(TOTALS[1:], start=1):
+            chunk[:, j] = np.bincount(inverse, weights=metrics[name], minlength=len(uniques))
+        self._add(uniques, chunk)
+        return self
+
+    def merge(self, other: "CopyStats") -> "CopyStats":
+        camp_ids = self._ids(self.campaigns, list(other.campaigns))
+        msg_ids = self._ids(self.messages, list(other.messages))
+        self._add(camp_ids[other.pair_campaign] << 32 | msg_ids[other.pair_message], other.totals)
+        return self
+
+    @staticmethod
+    def _ids(ids: Dict[str, int], values) -> np.ndarray:
+        return np.fromiter((ids.setdefault(str(v), len(ids)) for v in values), dtype=np.int64, count=len(values))
+
+    def _add(self, codes: np.ndarray, totals: np.ndarray) -> None:
+        start = len(self.pairs)
+        rows = np.fromiter((self.pairs.setdefault(c, len(self.pairs)) for c in codes.tolist()), dtype=np.int64,
+                           count=len(codes))
+        if len(self.pairs) > start:
+            added = codes[rows >= start]
+            self.pair_campaign = np.concatenate([self.pair_campaign, added >> 32])
+            self.pair_message = np.concatenate([self.pair_message, added & 0xFFFFFFFF])
+            self.totals = np.concatenate([self.totals, np.zeros((len(self.pairs) - start, len(TOTALS)))])
+        np.add.at(self.totals, rows, totals)
+
+    def lift(self, memo: Optional[TermMemo] = None, n_features: int = 1 << 22, min_impressions: float = 10000,
+             level: float = DEFAULT_LEVEL, top: int = 2) -> Dict[str, Any]:
+        """Significant terms by account-wide lift, and per campaign the best and worst ``top`` terms of its copy."""
+        memo = memo or TermMemo()
+        if not self.pairs:
+            return {"terms": [], "campaigns": {}, "stats": {"pairs": 0, "messages": 0, "terms": 0}}
+        n_msgs = len(self.messages)
+        by_message = np.column_stack([np.bincount(self.pair_message, weights=self.totals[:, j], minlength=n_msgs)
+                                      for j in range(len(TOTALS))])
+
+        # sparse messages x terms (binary) in COO form; hashed columns compacted to the terms that occur
+        terms = memo.terms(list(self.messages))
+        lengths = np.fromiter((len(t) for t in terms), dtype=np.int64, count=n_msgs)
+        ids: Dict[str, int] = {}
+        for t in itertools.chain.from_iterable(terms):
+            if t not in ids:
+                ids[t] = term_id(t, n_features)
+        hashed = np.fromiter((ids[t] for ts in terms for t in ts), dtype=np.int64, count=int(lengths.sum()))
+        columns, col = np.unique(hashed, return_inverse=True)
+        row = np.repeat(np.arange(n_msgs), lengths)
+        n_terms = len(columns)
+        names: Dict[int, str] = {}
+        for t, h in ids.items():
+            names.setdefault(h, t)  # a hash collision is reported under the first term seen
+
+        # term totals: M.T @ by_message, one bincount per metric
+        inside = np.column_stack([np.bincount(col, weights=by_message[row, j], minlength=n_terms)
+                                  for j in range(len(TOTALS))])
+        account = self.totals.sum(axis=0)
+        outside = account - inside
+        n_messages = np.bincount(col, minlength=n_terms)
+
+        m, c, s, v = inside[:, 1], inside[:, 2], inside[:, 3], inside[:, 4]
+        m_out, c_out, s_out, v_out = outside[:, 1], outside[:, 2], outside[:, 3], outside[:, 4]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ctr, ctr_out = c / m, c_out / m_out
+            roas = v / s
+            ctr_lift, roas_lift = ctr / ctr_out - 1, roas / (v_out / s_out) - 1
+            pooled = account[2] / account[1]
+            phi = ctr_dispersion(account[2], account[1], account[5], account[0])
+            z = (ctr - ctr_out) / np.sqrt(phi * pooled * (1 - pooled) * (1 / m + 1 / m_out))
+        eligible = (m >= min_impressions) & (m_out >= min_impressions) & np.isfinite(z)
+        p_value = np.where(eligible, two_sided_p(np.where(eligible, z, 0.0)), np.nan)
+        q_value = _fdr(p_value)
+        significant = eligible & (q_value < 1 - level)
+
+        def cite(idx):
+            return [{"term": names[h], "ctr_lift": cl, "roas_lift": rl, "p_value": p, "q_value": q}
+                    for h, cl, rl, p, q in zip(columns[idx].tolist(), ctr_lift[idx].tolist(),
+                                               nan_to_none(roas_lift[idx]), p_value[idx].tolist(),
+                                               q_value[idx].tolist())]
+
+        ranked = np.flatnonzero(significant)
+        ranked = ranked[np.argsort(-ctr_lift[ranked], kind="stable")]
+        records = [{**t, "messages": k, "rows": n, "impressions": mi, "clicks": ci, "ctr": r, "roas": ro}
+                   for t, k, n, mi, ci, r, ro in zip(cite(ranked), n_messages[ranked].tolist(),
+                                                     inside[ranked, 0].astype(np.int64).tolist(), m[ranked].tolist(),
+                                                     c[ranked].tolist(), ctr[ranked].tolist(),
+                                                     nan_to_none(roas[ranked]))]
+
+        # per campaign: significant terms of the messages it ran, ranked by account-wide CTR lift
+        hit = significant[col]
+        sig_row, sig_col = row[hit], col[hit]
+        per_message = np.bincount(sig_row, minlength=n_msgs)
+        first = np.concatenate(([0], np.cumsum(per_message)[:-1]))
+        pair_len = per_message[self.pair_message]
+        pair_row = np.repeat(np.arange(len(pair_len)), pair_len)
+        offset = np.arange(len(pair_row)) - np.repeat(np.cumsum(pair_len) - pair_len, pair_len)
+        pair_term = sig_col[np.repeat(first[self.pair_message], pair_len) + offset]
+        used = np.unique(self.pair_campaign[pair_row] * n_terms + pair_term)
+        owner, term = used // n_terms, used % n_terms
+        order = np.lexsort((-ctr_lift[term], owner))
+        owner, term = owner[order], term[order]
+        bounds = np.flatnonzero(np.diff(owner, prepend=-1, append=len(self.campaigns))).tolist()
+
+        campaign_names = list(self.campaigns)
+        by_campaign = {}
+        for a, b in zip(bounds[:-1], bounds[1:]):
+            best = term[a:b][:top]
+            worst = term[a:b][::-1][:top]
+            best, worst = cite(best[ctr_lift[best] > 0]), cite(worst[ctr_lift[worst] < 0])
+            if best or worst:
+                by_campaign[campaign_names[owner[a]]] = {"best": best, "worst": worst}
+
+        return {
+            "terms": records,
+            "campaigns": by_campaign,
+            "stats": {"pairs": len(self.pairs), "messages": n_msgs, "terms": n_terms, "eligible": int(eligible.sum()),
+                      "significant": int(significant.sum()), "memo": dict(memo.stats)},
+        }
+
+
+def _fdr(p_value: np.ndarray) -> np.ndarray:
+    """Benjamini-Hochberg q-values of the finite ``p_value`` entries (NaN elsewhere)."""
+    q = np.full(len(p_value), np.nan)
+    tested = np.flatnonzero(np.isfinite(p_value))
+    if len(tested):
+        order = tested[np.argsort(p_value[tested], kind="stable")]
+        scaled = p_value[order] * len(order) / np.arange(1, len(order) + 1)
+        q[order] = np.minimum(np.minimum.accumulate(scaled[::-1])[::-1], 1.0)
+    return q
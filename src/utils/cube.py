@@ -0,0 +1,201 @@
+from itertools import combinations
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.utils.aggregates import row_ratios
+from src.utils.confidence import MOMENT_COLUMNS, row_moments
+
+# key spaces up to this size are aggregated with dense bincount tables
+DENSE_LIMIT = 1 << 24
+
+
+def grouping_sets(dimensions: Sequence[str], max_depth: int = 2) -> List[Tuple[str, ...]]:
+    """All dimension combinations of size 1..max_depth, coarsest first."""
+    sets = []
+    for depth in range(1, max(1, int(max_depth)) + 1):
+        sets.extend(combinations(dimensions, depth))
+    return sets
+
+
+class _Encoded:
+    """Dimension columns factorized once (sorted codes) plus per-row metrics."""
+
+    def __init__(self, df: pd.DataFrame, dimensions: Sequence[str]):
+        self.n = len(df)
+        self.codes: Dict[str, np.ndarray] = {}
+        self.values: Dict[str, np.ndarray] = {}
+        for d in dimensions:
+            codes, uniques = pd.factorize(df[d], sort=True)
+            self.codes[d] = codes
+            self.values[d] = np.asarray(uniques.tolist(), dtype=object)
+
+        def metric(name):
+            if name not in df.columns:
+                return np.zeros(self.n)
+            v = pd.to_numeric(df[name], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+            return np.where(np.isnan(v), 0.0, v)
+
+        self.impressions = metric("impressions")
+        self.clicks = metric("clicks")
+        self.sums = {"spend": metric("spend"), "revenue": metric("revenue")}
+        self.sums.update(row_moments({"impressions": self.impressions, "clicks": self.clicks, **self.sums}))
+        ratios = row_ratios(df)
+        self.ratio_sum = {k: np.where(np.isnan(v), 0.0, v) for k, v in ratios.items()}
+        self.ratio_present = {k: (~np.isnan(v)).astype(np.float64) for k, v in ratios.items()}
+
+    def cardinality(self, dims: Sequence[str]) -> int:
+        size = 1
+        for d in dims:
+            size *= max(1, len(self.values[d]))
+        return size
+
+    def keys(self, dims: Sequence[str], rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Mixed-radix key per row (all rows when ``rows`` is None); -1 where any dimension is missing."""
+        key = None
+        missing = None
+        for d in dims:
+            c = self.codes[d] if rows is None else self.codes[d][rows]
+            m = c < 0
+            missing = m if missing is None else missing | m
+            key = c.astype(np.int64) if key is None else key * max(1, len(self.values[d])) + c
+        if missing.any():
+            key = np.where(missing, -1, key)
+        return key
+
+    def decode(self, dims: Sequence[str], key: int) -> Tuple[Any, ...]:
+        out = []
+        for d in reversed(dims):
+            radix = max(1, len(self.values[d]))
+            key, c = divmod(int(key), radix)
+            out.append(self.values[d][c])
+        return tuple(reversed(out))
+
+
+class _Survivors:
+    """Keys of segments that passed the iceberg threshold, for one grouping set."""
+
+    def __init__(self, keys: np.ndarray, size: int):
+        self.dense = None
+        self.sorted = None
+        if size <= DENSE_LIMIT:
+            self.dense = np.zeros(size, dtype=bool)
+            self.dense[keys] = True
+        else:
+            self.sorted = np.sort(keys)
+
+    def contains(self, keys: np.ndarray) -> np.ndarray:
+        ok = keys >= 0
+        out = np.zeros(len(keys), dtype=bool)
+        if self.dense is not None:
+            out[ok] = self.dense[keys[ok]]
+        else:
+            out[ok] = np.isin(keys[ok], self.sorted, assume_unique=False)
+        return out
+
+
+def compute_cube(
+    df: pd.DataFrame,
+    dimensions: Sequence[str],
+    max_depth: int = 2,
+    min_impressions: float = 0,
+    sets: Optional[Sequence[Sequence[str]]] = None,
+) -> List[Dict[str, Any]]:
+    """Aggregate every grouping set in one pass per set with iceberg pruning.
+
+    Grouping sets are processed coarsest first. A row only takes part in a
+    set if, for each parent set (one dimension fewer), its parent segment
+    reached ``min_impressions``; impressions are non-negative, so a segment
+    under the threshold can never have a child above it and whole branches
+    are skipped. Each set is aggregated with ``np.bincount`` over a
+    mixed-radix key of the dictionary codes, not with nested loops.
+
+    Returns one dict per surviving segment with ``segment_filter``,
+    ``sample_size``, ``total_impressions``, ``total_clicks``, ``mean_ctr`` and
+    ``mean_roas`` (means of per-row ratios, ``None`` when undefined), plus
+    ``total_spend``, ``total_revenue`` and the moment sums in
+    ``confidence.MOMENT_COLUMNS`` for interval estimates.
+    """
+    dimensions = [d for d in dimensions if d in df.columns]
+    if sets is None:
+        sets = grouping_sets(dimensions, max_depth)
+    sets = [tuple(s) for s in sets if all(d in dimensions for d in s)]
+    sets.sort(key=len)
+    if df.empty or not sets:
+        return []
+
+    enc = _Encoded(df, dimensions)
+    survivors: Dict[Tuple[str, ...], _Survivors] = {}
+    segments: List[Dict[str, Any]] = []
+
+    if enc.impressions.sum() < min_impressions:
+        return []
+
+    for dims in sets:
+        rows = None  # None means every row; avoids gathers for top-level sets
+        for parent in combinations(dims, len(dims) - 1):
+            if not parent or parent not in survivors:
+                continue
+            ok = survivors[parent].contains(enc.keys(parent, rows))
+            rows = np.flatnonzero(ok) if rows is None else rows[ok]
+            if len(rows) == 0:
+                break
+
+        key = enc.keys(dims, rows)
+        valid = key >= 0
+        if not valid.all():
+            rows = np.flatnonzero(valid) if rows is None else rows[valid]
+            key = key[valid]
+        size = enc.cardinality(dims)
+        if len(key) == 0:
+            survivors[dims] = _Survivors(np.empty(0, dtype=np.int64), size)
+            continue
+
+        if size <= DENSE_LIMIT:
+            uniq = None
+            group, n_groups = key, size
+        else:
+            uniq, group = np.unique(key, return_inverse=True)
+            n_groups = len(uniq)
+
+        def total(weights):
+            return np.bincount(group, weights=weights if rows is None else weights[rows], minlength=n_groups)
+
+        imp = total(enc.impressions)
+        count = np.bincount(group, minlength=n_groups)
+        keep = (count > 0) & (imp >= min_impressions)
+        ids = np.flatnonzero(keep)
+        group_keys = ids if uniq is None else uniq[ids]
+        survivors[dims] = _Survivors(group_keys, size)
+        if len(ids) == 0:
+            continue
+
+        # only rows of surviving segments feed the remaining sums
+        sel = keep[group]
+        if not sel.all():
+            rows = np.flatnonzero(sel) if rows is None else rows[sel]
+            group = group[sel]
+
+        clicks = total(enc.clicks)
+        sums = {name: total(v)[ids].tolist() for name, v in enc.sums.items()}
+        ratio = {}
+        for name in ("ctr", "roas"):
+            s = total(enc.ratio_sum[name])[ids]
+            n = total(enc.ratio_present[name])[ids]
+            ratio[name] = [float(a / b) if b else None for a, b in zip(s, n)]
+
+        for j, (gid, k) in enumerate(zip(ids.tolist(), group_keys.tolist())):
+            segments.append({
+                "segment_filter": dict(zip(dims, enc.decode(dims, k))),
+                "sample_size": int(count[gid]),
+                "total_impressions": int(imp[gid]),
+                "total_clicks": int(clicks[gid]),
+                "mean_ctr": ratio["ctr"][j],
+                "mean_roas": ratio["roas"][j],
+                "total_spend": sums["spend"][j],
+                "total_revenue": sums["revenue"][j],
+                **{name: sums[name][j] for name in MOMENT_COLUMNS},
+            })
+
+    return segments
@@ -0,0 +1,299 @@
+import contextvars
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Set
+
+from src.utils.logging_utils import log_event, span
+from src.utils.result_store import ResultStore
+
+# bump when stage semantics change so every stored fingerprint is invalidated
+DAG_VERSION = 2
+
+
+class Stage:
+    """One node of the pipeline graph.
+
+    ``fn`` is called with the stage's ``inputs`` as keyword arguments and
+    returns the value of its single output, or a dict keyed by output name
+    when it has several (the return value is ignored when it has none).
+    ``sources`` are files the stage reads directly and ``artifacts`` files it
+    writes; both feed the skip decision. Outputs listed in ``persist`` are
+    pickled so later runs can reuse them without re-running.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        fn: Callable[..., Any],
+        inputs: Sequence[str] = (),
+        outputs: Sequence[str] = (),
+        sources: Sequence[str] = (),
+        artifacts: Sequence[str] = (),
+        persist: Sequence[str] = (),
+        salt: str = "",
+    ):
+        self.name = name
+        self.fn = fn
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.sources = list(sources)
+        self.artifacts = list(artifacts)
+        self.persist = set(persist)
+        self.salt = salt
+
+
+def _source_fingerprint(path: str) -> List[Any]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return [path, None]
+    return [path, st.st_size, st.st_mtime_ns]
+
+
+class DagExecutor:
+    """Runs a stage graph concurrently, skipping stages whose inputs did not change.
+
+    Every stage gets a fingerprint hashed from its name, ``salt``, the
+    fingerprints of the stages producing its inputs and the size/mtime of its
+    ``sources``, so a change anywhere upstream propagates without hashing
+    data. A stage is skipped when its fingerprint equals the one recorded by
+    the previous successful run and its artifacts are still the files it
+    wrote (same size and mtime). A skipped stage whose output is needed by a
+    stage that does run is re-run unless that output was persisted.
+
+    Ready stages are submitted to a thread pool as soon as their inputs are
+    available, so wall time follows the critical path of the graph rather
+    than the sum of the stages. Each stage runs in a ``stage.<name>`` span
+    under ``plan.execute``; the pool threads get a copy of the caller's
+    context, so spans the stage functions open nest under their stage.
+    """
+
+    def __init__(
+        self,
+        stages: Iterable[Stage],
+        store_dir: str = ".cache/plan",
+        workers: int = 4,
+        salt: str = "",
+        trace_id: str = None,
+        parent_span_id: str = None,
+    ):
+        self.stages: Dict[str, Stage] = {}
+        self.producer: Dict[str, str] = {}
+        for s in stages:
+            self.stages[s.name] = s
+            for out in s.outputs:
+                if out in self.producer:
+                    raise ValueError(f"Output {out!r} is produced by both {self.producer[out]!r} and {s.name!r}")
+                self.producer[out] = s.name
+        self.order = self._topological_order()
+        self.store = ResultStore(store_dir, "dag") if store_dir else None
+        self.state_path = os.path.join(store_dir, "dag", "state.json") if store_dir else None
+        self.workers = max(1, int(workers))
+        self.salt = salt
+        self.trace_id = trace_id
+        self.parent_span_id = parent_span_id
+        self.values: Dict[str, Any] = {}
+        self.timings: Dict[str, Dict[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def _deps(self, stage: Stage) -> Set[str]:
+        deps = set()
+        for name in stage.inputs:
+            if name not in self.producer:
+                raise ValueError(f"Stage {stage.name!r} needs {name!r}, which no stage produces")
+            deps.add(self.producer[name])
+        return deps
+
+    def _topological_order(self) -> List[str]:
+        order, state = [], {}
+
+        def visit(name, path):
+            if state.get(name) == "done":
+                return
+            if state.get(name) == "visiting":
+                raise ValueError("Cycle in stage graph: " + " -> ".join(path + [name]))
+            state[name] = "visiting"
+            for dep in sorted(self._deps(self.stages[name])):
+                visit(dep, path + [name])
+            state[name] = "done"
+            order.append(name)
+
+        for name in self.stages:
+            visit(name, [])
+        return order
+
+    def fingerprints(self) -> Dict[str, str]:
+        fps: Dict[str, str] = {}
+        for name in self.order:
+            s = self.stages[name]
+            blob = json.dumps({
+                "v": DAG_VERSION,
+                "salt": [self.salt, s.salt],
+                "stage": name,
+                "inputs": {i: fps[self.producer[i]] for i in s.inputs},
+                "sources": [_source_fingerprint(p) for p in s.sources],
+                "outputs": s.outputs,
+            }, sort_keys=True, default=str)
+            fps[name] = hashlib.sha1(blob.encode("utf-8")).hexdigest()[:16]
+        return fps
+
+    def _load_state(self) -> Dict[str, Any]:
+        if not self.state_path:
+            return {}
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save_state(self, fps: Dict[str, str]):
+        if not self.state_path:
+            return
+        # a run of selected stages (pipeline targets) keeps what it did not run from earlier runs
+        state = self._load_state()
+        state["stages"] = {**state.get("stages", {}), **fps}
+        state["artifacts"] = {
+            **state.get("artifacts", {}),
+            **{a: _source_fingerprint(a) for s in self.stages.values() for a in s.artifacts},
+        }
+        os.makedirs(os.path.dirname(self.state_path), exist_ok=True)
+        tmp = f"{self.state_path}.tmp{os.getpid()}"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2, sort_keys=True)
+        os.replace(tmp, self.state_path)
+
+    def _restorable(self, output: str, fp: str) -> bool:
+        stage = self.stages[self.producer[output]]
+        return self.store is not None and output in stage.persist and self.store.contains("outputs", output, fp)
+
+    def plan(self, force: bool = False) -> Dict[str, Any]:
+        """Fingerprints plus the set of stages that must run this time."""
+        fps = self.fingerprints()
+        state = {} if force else self._load_state()
+        previous, written = state.get("stages", {}), state.get("artifacts", {})
+        run = {
+            name for name in self.order
+            if previous.get(name) != fps[name]
+            # artifacts must still be the files this stage wrote last time
+            or any(written.get(a) != _source_fingerprint(a) for a in self.stages[name].artifacts)
+        }
+        # a running stage needs every input either produced this run or restorable from the store
+        changed = True
+        while changed:
+            changed = False
+            for name in list(run):
+                for i in self.stages[name].inputs:
+                    p = self.producer[i]
+                    if p not in run and not self._restorable(i, fps[p]):
+                        run.add(p)
+                        changed = True
+        return {"fingerprints": fps, "run": run}
+
+    def _inputs_for(self, stage: Stage, fps: Dict[str, str]) -> Dict[str, Any]:
+        kwargs = {}
+        for i in stage.inputs:
+            with self._lock:
+                have = i in self.values
+                value = self.values.get(i)
+            if not have:
+                value = self.store.get("outputs", i, fps[self.producer[i]])
+                with self._lock:
+                    self.values[i] = value
+            kwargs[i] = value
+        return kwargs
+
+    def _execute(self, stage: Stage, fps: Dict[str, str]):
+        t0 = time.perf_counter()
+        with span(f"stage.{stage.name}", agent="Planner"):
+            result = stage.fn(**self._inputs_for(stage, fps))
+        if len(stage.outputs) == 1:
+            result = {stage.outputs[0]: result}
+        elif not stage.outputs:
+            result = {}
+        for out in stage.outputs:
+            if out not in result:
+                raise ValueError(f"Stage {stage.name!r} did not return output {out!r}")
+            if out in stage.persist and self.store is not None:
+                self.store.put("outputs", out, fps[stage.name], result[out])
+        with self._lock:
+            for out in stage.outputs:
+                self.values[out] = result[out]
+        return time.perf_counter() - t0
+
+    def _critical_path(self, durations: Dict[str, float]) -> float:
+        finish: Dict[str, float] = {}
+        for name in self.order:
+            deps = self._deps(self.stages[name])
+            finish[name] = max((finish[d] for d in deps), default=0.0) + durations.get(name, 0.0)
+        return max(finish.values(), default=0.0)
+
+    def run(self, force: bool = False) -> Dict[str, Any]:
+        """Execute the graph; returns the values produced (or restored) during this run."""
+        with span("plan.execute", agent="Planner", trace_id=self.trace_id, parent=self.parent_span_id):
+            t0 = time.perf_counter()
+            planned = self.plan(force=force)
+            fps, to_run = planned["fingerprints"], planned["run"]
+            skipped = [n for n in self.order if n not in to_run]
+            if skipped:
+                log_event("plan.stages.skipped", {"stages": skipped}, agent="Planner")
+
+            pending = {n: {d for d in self._deps(self.stages[n]) if d in to_run} for n in self.order if n in to_run}
+            durations: Dict[str, float] = {}
+            error: Optional[BaseException] = None
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="stage") as pool:
+                running = {}
+
+                def submit_ready():
+                    for name in [n for n, deps in pending.items() if not deps]:
+                        del pending[name]
+                        ctx = contextvars.copy_context()
+                        running[pool.submit(ctx.run, self._execute, self.stages[name], fps)] = name
+
+                submit_ready()
+                while running:
+                    done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        name = running.pop(fut)
+                        try:
+                            durations[name] = fut.result()
+                        except BaseException as exc:  # stop scheduling, let running stages finish
+                            if error is None:
+                                error = exc
+                                log_event("plan.stage.failed", {"stage": name, "error": repr(exc)}, agent="Planner")
+                            continue
+                        for deps in pending.values():
+                            deps.discard(name)
+                    if error is None:
+                        submit_ready()
+
+            if error is not None:
+                raise error
+
+            # only fingerprints of stages that actually completed (or were validly skipped) are recorded
+            self._save_state(fps)
+            wall = time.perf_counter() - t0
+            self.timings = {n: {"seconds": round(d, 6)} for n, d in durations.items()}
+            log_event(
+                "plan.completed",
+                {
+                    "ran": [n for n in self.order if n in durations],
+                    "skipped": skipped,
+                    "stage_seconds": {n: round(d, 4) for n, d in durations.items()},
+                    "sum_seconds": round(sum(durations.values()), 4),
+                    "critical_path_seconds": round(self._critical_path(durations), 4),
+                    "wall_seconds": round(wall, 4),
+                },
+                agent="Planner",
+            )
+        return dict(self.values)
+
+    def value(self, output: str) -> Any:
+        """An output from this run, loaded from the store if its stage was skipped."""
+        if output not in self.values:
+            fp = self.fingerprints()[self.producer[output]]
+            self.values[output] = self.store.get("outputs", output, fp) if self.store is not None else None
+        return self.values[output]
@@ -0,0 +1,306 @@
+"""One interface over the places the ad dataset can live: CSV, Parquet, SQLite.
+
+``open_source(path).read(columns, start=, end=, where=)`` returns the rows
+dated ``start``..``end`` (inclusive days) whose label columns hold one of the
+``where`` values, with only ``columns``. Each backend pushes as much of that
+down as its format allows:
+
+- SQLite: projection and a parameterized ``WHERE`` (indexed by ``import_csv``),
+  so only matching rows leave the database.
+- Parquet: ``columns`` and ``filters``; row groups whose statistics rule the
+  predicate out are never read (needs pyarrow).
+- CSV: every byte is still scanned, but only projected and predicate columns
+  are parsed, chunk by chunk, and non-matching rows are dropped per chunk. With
+  a valid frame cache only the needed columns are mapped from disk.
+
+Dimension and date columns come back as categoricals. The index of a frame
+identifies each row within its source for the same query (file row number
+for CSV, rowid for SQLite), so ``lazy_column`` can fetch a column later.
+Values in ``where`` are matched as stored in the source, before
+canonicalization.
+"""
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.schema.dataset_schema import DIMENSION_COLUMNS
+from src.utils.frame_cache import DEFAULT_CACHE_DIR, FrameCache
+
+DEFAULT_CHUNKSIZE = 100_000
+FORMATS = {".csv": "csv", ".parquet": "parquet", ".pq": "parquet", ".sqlite": "sqlite", ".sqlite3": "sqlite",
+           ".db": "sqlite"}
+
+
+def clean_frame(df: pd.DataFrame) -> pd.DataFrame:
+    # trim whitespace for text columns (object, or the string dtype newer pandas infers)
+    for col in df.columns:
+        s = df[col]
+        if isinstance(s.dtype, pd.CategoricalDtype):
+            # categoricals are trimmed once per distinct value
+            cats = s.cat.categories
+            if cats.dtype.kind in "OT" or pd.api.types.is_string_dtype(cats.dtype):
+                stripped = cats.astype(str).str.strip()
+                if not stripped.equals(cats):
+                    df[col] = (s.cat.rename_categories(stripped) if stripped.is_unique
+                               else s.map(dict(zip(cats, stripped))).astype("category"))
+        elif s.dtype == "object" or pd.api.types.is_string_dtype(s.dtype):
+            df[col] = s.str.strip() if pd.api.types.is_string_dtype(s.dtype) else s.astype(str).str.strip()
+    return df
+
+
+def _day(value) -> pd.Timestamp:
+    return pd.Timestamp(value).normalize()
+
+
+def make_query(start=None, end=None, where: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """Normalized query: ISO day strings (``end`` inclusive) and ``where`` as column -> list of str."""
+    where = {col: [str(v) for v in ([values] if isinstance(values, (str, int, float)) else values)]
+             for col, values in (where or {}).items()}
+    return {"start": _day(start).strftime("%Y-%m-%d") if start is not None else None,
+            "end": _day(end).strftime("%Y-%m-%d") if end is not None else None,
+            "where": where}
+
+
+def _day_after(day: str) -> str:
+    return (_day(day) + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
+
+
+def query_mask(df: pd.DataFrame, query: Dict[str, Any], date_column: str = "date") -> np.ndarray:
+    """Rows of ``df`` matching ``query``; each predicate is evaluated once per distinct value."""
+    mask = np.ones(len(df), dtype=bool)
+    if query.get("start") or query.get("end"):
+        codes, uniques = pd.factorize(df[date_column])
+        days = pd.to_datetime(pd.Index(uniques).astype(str), errors="coerce")
+        ok = ~days.isna()
+        if query.get("start"):
+            ok &= days >= _day(query["start"])
+        if query.get("end"):
+            ok &= days < _day(_day_after(query["end"]))
+        mask &= (codes >= 0) & np.asarray(ok)[np.maximum(codes, 0)]
+    for col, values in (query.get("where") or {}).items():
+        codes, uniques = pd.factorize(df[col])
+        ok = pd.Index(uniques).astype(str).isin(values)
+        mask &= (codes >= 0) & np.asarray(ok)[np.maximum(codes, 0)]
+    return mask
+
+
+def _slices(df: pd.DataFrame, chunksize: Optional[int]) -> Iterator[pd.DataFrame]:
+    if not chunksize:
+        yield df
+        return
+    for i in range(0, len(df), chunksize):
+        yield df.iloc[i:i + chunksize]
+
+
+class DataSource:
+    """Base class: subclasses yield projected, filtered chunks from ``_chunks``."""
+
+    fmt = ""
+
+    def __init__(self, path: str, date_column: str = "date"):
+        self.path = str(path)
+        self.date_column = date_column
+
+    def columns(self) -> List[str]:
+        raise NotImplementedError
+
+    def _chunks(self, columns: List[str], query: Dict[str, Any], chunksize: Optional[int]) -> Iterator[pd.DataFrame]:
+        raise NotImplementedError
+
+    def _plan(self, columns: Optional[Sequence[str]], query: Dict[str, Any]) -> Tuple[List[str], List[str]]:
+        """(columns to return, columns to read): predicate columns are read even if not returned."""
+        available = self.columns()
+        wanted = available if columns is None else [c for c in available if c in set(columns)]
+        predicate = list(query["where"]) + ([self.date_column] if query["start"] or query["end"] else [])
+        missing = [c for c in predicate if c not in available]
+        if missing:
+            raise ValueError(f"cannot filter on {missing}: not in {self.path}")
+        return wanted, wanted + [c for c in available if c in predicate and c not in wanted]
+
+    def _finish(self, chunk: pd.DataFrame, wanted: List[str], query: Dict[str, Any]) -> pd.DataFrame:
+        chunk = clean_frame(chunk)
+        if query["start"] or query["end"] or query["where"]:
+            chunk = chunk[query_mask(chunk, query, self.date_column)]
+        for col in wanted:
+            if (col in DIMENSION_COLUMNS or col == self.date_column) and not isinstance(
+                    chunk[col].dtype, pd.CategoricalDtype):
+                chunk[col] = chunk[col].astype("category")
+        return chunk[wanted] if list(chunk.columns) != wanted else chunk
+
+    def read(self, columns: Optional[Sequence[str]] = None, start=None, end=None,
+             where: Optional[Dict[str, Any]] = None, chunksize: Optional[int] = None):
+        """Matching rows as one frame, or an iterator of frames of at most ``chunksize`` rows."""
+        query = make_query(start, end, where)
+        wanted, read = self._plan(columns, query)
+
+        def chunks():
+            for chunk in self._chunks(read, query, chunksize):
+                yield self._finish(chunk, wanted, query)
+
+        if chunksize:
+            return chunks()
+        parts = list(chunks())
+        df = pd.concat(parts) if len(parts) > 1 else (parts[0] if parts else pd.DataFrame(columns=wanted))
+        if len(parts) > 1:
+            # categories differ per chunk; union them once instead of falling back to object
+            for col in df.columns:
+                if isinstance(parts[0][col].dtype, pd.CategoricalDtype):
+                    df[col] = df[col].astype("category")
+        df.attrs.update(source=self.path, source_args=self.args(), query=query)
+        return df
+
+    def args(self) -> Dict[str, Any]:
+        """``open_source`` keyword arguments that reopen this source."""
+        return {"fmt": self.fmt, "date_column": self.date_column}
+
+
+class CSVSource(DataSource):
+    fmt = "csv"
+
+    def __init__(self, path: str, date_column: str = "date", cache_dir: Optional[str] = None):
+        super().__init__(path, date_column)
+        self.cache = FrameCache(self.path, cache_dir) if cache_dir else None
+
+    def columns(self) -> List[str]:
+        if self.cache is not None and self.cache.valid():
+            return self.cache.columns()
+        return [str(c) for c in pd.read_csv(self.path, nrows=0).columns]
+
+    def options(self, columns: Sequence[str]) -> Dict[str, Any]:
+        """``pd.read_csv`` arguments that parse only ``columns``, labels as categoricals."""
+        labels = set(DIMENSION_COLUMNS) | {self.date_column}
+        return {"usecols": list(columns), "dtype": {c: "category" for c in columns if c in labels}}
+
+    def _chunks(self, columns, query, chunksize):
+        if self.cache is not None:
+            if not self.cache.valid():
+                self.cache.write(clean_frame(pd.read_csv(self.path)))
+            yield from _slices(self.cache.read(columns), chunksize)
+            return
+        filtered = bool(query["start"] or query["end"] or query["where"])
+        # filtered reads stream so non-matching rows never accumulate
+        size = chunksize or (DEFAULT_CHUNKSIZE if filtered else None)
+        if size is None:
+            yield pd.read_csv(self.path, **self.options(columns))
+            return
+        with pd.read_csv(self.path, chunksize=size, **self.options(columns)) as reader:
+            yield from reader
+
+
+class ParquetSource(DataSource):
+    fmt = "parquet"
+
+    def columns(self) -> List[str]:
+        import pyarrow.parquet as pq
+        return list(pq.read_schema(self.path).names)
+
+    def _chunks(self, columns, query, chunksize):
+        filters = [(col, "in", values) for col, values in query["where"].items()]
+        if query["start"]:
+            filters.append((self.date_column, ">=", query["start"]))
+        if query["end"]:
+            filters.append((self.date_column, "<", _day_after(query["end"])))
+        yield from _slices(pd.read_parquet(self.path, columns=columns, filters=filters or None), chunksize)
+
+
+class SQLiteSource(DataSource):
+    """A table (default ``ads``) in a SQLite file; the index of a frame is ``rowid - 1``."""
+
+    fmt = "sqlite"
+
+    def __init__(self, path: str, date_column: str = "date", table: str = "ads"):
+        super().__init__(path, date_column)
+        self.table = table
+
+    def args(self) -> Dict[str, Any]:
+        return {**super().args(), "table": self.table}
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(f"file:{self.path}?mode=ro", uri=True)
+
+    def columns(self) -> List[str]:
+        with closing(self._connect()) as con:
+            return [row[1] for row in con.execute(f'PRAGMA table_info("{self.table}")')]
+
+    def sql(self, columns: Sequence[str], query: Dict[str, Any]) -> Tuple[str, List[Any]]:
+        """Parameterized ``SELECT`` for ``columns`` and ``query``."""
+        clauses, params = [], []
+        if query["start"]:
+            clauses.append(f'"{self.date_column}" >= ?')
+            params.append(query["start"])
+        if query["end"]:
+            clauses.append(f'"{self.date_column}" < ?')
+            params.append(_day_after(query["end"]))
+        for col, values in query["where"].items():
+            clauses.append(f'"{col}" IN ({", ".join("?" * len(values))})' if values else "0")
+            params.extend(values)
+        select = ", ".join(['rowid - 1 AS "__row"'] + [f'"{c}"' for c in columns])
+        sql = f'SELECT {select} FROM "{self.table}"'
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        return sql + " ORDER BY rowid", params
+
+    def _chunks(self, columns, query, chunksize):
+        sql, params = self.sql(columns, query)
+        con = self._connect()
+        try:
+            frames = pd.read_sql_query(sql, con, params=params, index_col="__row", chunksize=chunksize)
+            for chunk in ([frames] if not chunksize else frames):
+                chunk.index.name = None
+                yield chunk
+        finally:
+            con.close()
+
+    @classmethod
+    def import_csv(cls, csv_path: str, path: str, table: str = "ads", date_column: str = "date",
+                   index_columns: Sequence[str] = ("country", "platform", "campaign_name"),
+                   chunksize: int = DEFAULT_CHUNKSIZE) -> "SQLiteSource":
+        """Copy a CSV export into ``path`` (replacing ``table``), indexed for date and label filters."""
+        with closing(sqlite3.connect(path)) as con:
+            con.execute(f'DROP TABLE IF EXISTS "{table}"')
+            columns = []
+            for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+                chunk.to_sql(table, con, if_exists="append", index=False)
+                columns = list(chunk.columns)
+            if date_column in columns:
+                con.execute(f'CREATE INDEX "{table}_{date_column}" ON "{table}" ("{date_column}")')
+            for col in index_columns:
+                if col in columns:
+                    keys = f'"{col}", "{date_column}"' if date_column in columns else f'"{col}"'
+                    con.execute(f'CREATE INDEX "{table}_{col}" ON "{table}" ({keys})')
+            con.commit()
+        return cls(path, date_column=date_column, table=table)
+
+
+def open_source(path: str, fmt: Optional[str] = None, date_column: str = "date", table: str = "ads",
+                cache_dir: Optional[str] = None) -> DataSource:
+    """The backend for ``path``: ``fmt`` (csv/parquet/sqlite), else by file extension, else CSV."""
+    fmt = fmt or FORMATS.get(Path(path).suffix.lower(), "csv")
+    if fmt == "csv":
+        return CSVSource(path, date_column=date_column, cache_dir=cache_dir)
+    if fmt == "parquet":
+        return ParquetSource(path, date_column=date_column)
+    if fmt == "sqlite":
+        return SQLiteSource(path, date_column=date_column, table=table)
+    raise ValueError(f"Unknown data format {fmt!r}; expected one of csv, parquet, sqlite")
+
+
+def source_from_config(cfg: Dict[str, Any], path: Optional[str] = None, cache: bool = False) -> DataSource:
+    """``open_source`` for the ``data`` section of ``cfg`` (with its frame cache if ``cache``)."""
+    data_cfg = cfg.get("data", {}) or {}
+    trends = (cfg.get("analysis", {}) or {}).get("trends") or {}
+    fmt = data_cfg.get("format")
+    return open_source(path or data_cfg.get("path", "data/synthetic_fb_ads_undergarments.csv"),
+                       fmt=None if fmt in (None, "auto") else fmt,
+                       date_column=trends.get("date_column", "date"), table=data_cfg.get("table", "ads"),
+                       cache_dir=data_cfg.get("frame_cache", DEFAULT_CACHE_DIR) if cache else None)
+
+
+def config_query(cfg: Dict[str, Any]) -> Dict[str, Any]:
+    """``start``/``end``/``where`` keyword arguments from ``data.query``."""
+    query = ((cfg.get("data", {}) or {}).get("query")) or {}
+    return {k: query.get(k) for k in ("start", "end", "where") if query.get(k)}
@@ -1,51 +1,79 @@
+import sqlite3
 import time
 from pathlib import Path
 import pandas as pd
 from pandas.errors import EmptyDataError
 from src.utils.logging_utils import log_event
 from src.utils.config_utils import load_config
+from src.utils.data_source import source_from_config
 import json
 from datetime import datetime
 
 DL_DIR = Path("dead_letter")
-DL_DIR.mkdir(parents=True, exist_ok=True)
 
 def write_dead_letter(name: str, payload: dict):
     ts = datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
     fname = DL_DIR / f"{name}_{ts}.json"
     try:
+        DL_DIR.mkdir(parents=True, exist_ok=True)
         with open(fname, "w", encoding="utf-8") as fh:
-            json.dump(payload, fh, indent=2, ensure_ascii=False)
+            json.dump(payload, fh, indent=2, ensure_ascii=False, default=str)
     except Exception:
         pass
     return str(fname)
 
-def load_dataset(retries: int = 3, delay: float = 1.0) -> pd.DataFrame:
-    cfg = load_config()
-    data_path = cfg.get("data", {}).get("path", "data/synthetic_fb_ads_undergarments.csv")
-    path = Path(data_path)
+
+def iter_dataset(chunksize: int = 100_000, path: str = None, columns: list = None, source=None, **query):
+    """Yield the configured dataset in cleaned chunks of ``chunksize`` rows.
+
+    Use for files that do not fit in memory; fold the chunks into
+    ``SegmentAggregates`` instead of concatenating them. ``columns`` and the
+    ``start``/``end``/``where`` query are pushed down to the data source
+    (``source``, else the configured one).
+    """
+    source = source or source_from_config(load_config(), path=path)
+    rows = 0
+    try:
+        for chunk in source.read(columns, chunksize=chunksize, **query):
+            rows += len(chunk)
+            yield chunk
+    except EmptyDataError:
+        log_event("data.load.success", {"rows": 0, "note": "empty_file"}, agent="DataUtils")
+        return
+    log_event("data.load.success", {"rows": rows, "mode": "streaming", "format": source.fmt}, agent="DataUtils")
+
+def load_dataset(retries: int = 3, delay: float = 1.0, columns: list = None, path: str = None,
+                 source=None, trace_id=None, parent_span_id=None, **query) -> pd.DataFrame:
+    """Load the configured dataset (or ``path``, or ``source``), cleaned.
+
+    Reads go through ``src/utils/data_source.py``: only ``columns`` and the
+    rows matching the ``start``/``end``/``where`` query are read where the
+    format allows it. Without ``source``, CSV files are kept in a columnar
+    cache (``data.frame_cache``) after the first parse; set it to an empty
+    value to always parse the CSV.
+    """
+    if source is None:
+        cfg = load_config()
+        source = source_from_config(cfg, path=path, cache=bool(cfg.get("data", {}).get("frame_cache", True)))
     attempt = 0
     while attempt < retries:
         try:
             try:
-                df = pd.read_csv(path)
+                df = source.read(columns, **query)
             except EmptyDataError:
-                log_event("data.load.success", {"rows": 0, "note": "empty_file"}, agent="DataUtils")
+                log_event("data.load.success", {"rows": 0, "note": "empty_file"}, trace_id=trace_id,
+                          parent_span_id=parent_span_id, agent="DataUtils")
                 return pd.DataFrame()
-            # trim whitespace for object columns
-            for col in df.columns:
-                if df[col].dtype == "object":
-                    df[col] = df[col].astype(str).str.strip()
-            log_event("data.load.success", {"rows": len(df)}, agent="DataUtils")
+            log_event("data.load.success", {"rows": len(df), "format": source.fmt, "columns": len(df.columns),
+                                            "query": df.attrs.get("query")},
+                      trace_id=trace_id, parent_span_id=parent_span_id, agent="DataUtils")
             return df
-        except FileNotFoundError as e:
-            log_event("data.load.error", {"attempt": attempt + 1, "error": str(e)}, agent="DataUtils")
-            attempt += 1
-            time.sleep(delay * attempt)
-        except Exception as e:
-            log_event("data.load.error", {"attempt": attempt + 1, "error": str(e)}, agent="DataUtils")
+        except (OSError, sqlite3.Error, pd.errors.ParserError) as e:
+            log_event("data.load.error", {"attempt": attempt + 1, "error": str(e)}, trace_id=trace_id,
+                      parent_span_id=parent_span_id, agent="DataUtils")
             attempt += 1
             time.sleep(delay * attempt)
-    log_event("data.load.failed", {"path": str(path)}, agent="DataUtils")
-    write_dead_letter("data_load_failed", {"path": str(path)})
+    log_event("data.load.failed", {"path": source.path}, trace_id=trace_id, parent_span_id=parent_span_id,
+              agent="DataUtils")
+    write_dead_letter("data_load_failed", {"path": source.path})
     raise FileNotFoundError(f"Could not load dataset after {retries} retries.")
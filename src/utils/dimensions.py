@@ -0,0 +1,142 @@
+import re
+import threading
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.schema.dataset_schema import DIMENSION_COLUMNS
+
+_SEPARATORS = re.compile(r"[\s_]+")
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=1 << 16)
+def canonical_key(value: str) -> str:
+    """Identity of a dimension value: separators collapsed, trimmed, case-folded."""
+    return _SEPARATORS.sub(" ", value).strip().casefold()
+
+
+def display_label(value: str) -> str:
+    """Spelling shown for a dimension value: trimmed, inner whitespace collapsed, case kept."""
+    return _WHITESPACE.sub(" ", value).strip()
+
+
+class DimensionDictionary:
+    """Shared dictionary of canonical dimension values and their integer codes.
+
+    Raw values are normalized once per distinct value (memoized per column)
+    and matched on their canonical key; each key gets a stable code and is
+    labelled with the first spelling seen for it (see ``display_label``).
+    Codes and labels are append-only, so chunks read in order are labelled as
+    one pass over the whole frame would be, and frames encoded with the same
+    dictionary share codes. Results labelled by another dictionary (another
+    process, a previous run) are brought in line with ``label``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.categories: Dict[str, List[str]] = {}
+        self._by_key: Dict[str, Dict[str, int]] = {}
+        self._memo: Dict[str, Dict[Any, int]] = {}
+
+    def __getstate__(self):
+        # pickled with what it encoded (e.g. inside persisted aggregates); the lock is per process
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _column(self, col: str):
+        if col not in self.categories:
+            self.categories[col] = []
+            self._by_key[col] = {}
+            self._memo[col] = {}
+        return self.categories[col], self._by_key[col], self._memo[col]
+
+    def _code(self, col: str, raw: Any) -> int:
+        categories, by_key, memo = self._column(col)
+        code = memo.get(raw)
+        if code is None:
+            key = canonical_key(str(raw))
+            code = by_key.get(key)
+            if code is None:
+                code = by_key[key] = len(categories)
+                categories.append(display_label(str(raw)))
+            memo[raw] = code
+        return code
+
+    def _codes_for(self, col: str, uniques: List[Any]) -> np.ndarray:
+        out = np.empty(len(uniques), dtype=np.int64)
+        for i, raw in enumerate(uniques):
+            out[i] = self._code(col, raw)
+        return out
+
+    def encode(self, series: pd.Series, stats: Optional[Dict[str, int]] = None) -> pd.Series:
+        """Canonical categorical version of ``series`` (missing values stay missing).
+
+        If ``stats`` is given it receives the distinct-value counts before
+        (``raw``) and after (``canonical``) canonicalization.
+        """
+        col = series.name
+        codes, uniques = pd.factorize(series)
+        with self._lock:
+            lut = self._codes_for(col, uniques.tolist())
+            categories = list(self.categories[col])
+        if stats is not None:
+            stats["raw"] = len(uniques)
+            stats["canonical"] = len(np.unique(lut))
+        mapped = np.where(codes >= 0, lut[np.maximum(codes, 0)] if len(lut) else -1, -1)
+        cat = pd.Categorical.from_codes(mapped, categories=categories)
+        return pd.Series(cat, index=series.index, name=col)
+
+    def label(self, col: str, value: Any) -> Any:
+        """Label of ``value``'s key in ``col``; ``value`` becomes the label of a key not seen yet.
+
+        Non-string values (missing keys) are returned unchanged.
+        """
+        if not isinstance(value, str):
+            return value
+        with self._lock:
+            code = self._code(col, value)
+            return self.categories[col][code]
+
+    def canonical(self, col: str, value: Any) -> Optional[str]:
+        """Label of ``value``'s key in ``col`` if the key is known, else None."""
+        if not isinstance(value, str):
+            return None
+        with self._lock:
+            by_key = self._by_key.get(col)
+            if not by_key:
+                return None
+            code = by_key.get(canonical_key(value))
+            return None if code is None else self.categories[col][code]
+
+
+DIMENSIONS = DimensionDictionary()
+
+
+def canonicalize_dimensions(
+    df: pd.DataFrame,
+    columns: Sequence[str] = DIMENSION_COLUMNS,
+    dictionary: DimensionDictionary = None,
+) -> Tuple[pd.DataFrame, Dict[str, Dict[str, int]]]:
+    """Replace dimension columns with canonical categoricals from ``dictionary``.
+
+    Pipeline runs pass their own ``DimensionDictionary``; without one the
+    process-wide ``DIMENSIONS`` is used, which keeps every label it has seen.
+
+    Returns the frame and, per column, the distinct-value count before and after.
+    """
+    dictionary = dictionary or DIMENSIONS
+    stats = {}
+    for col in columns:
+        if col not in df.columns:
+            continue
+        stats[col] = {}
+        df[col] = dictionary.encode(df[col], stats=stats[col])
+    return df, stats
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+import pandas as pd
+
+try:  # optional: Feather via pyarrow; NumPy .npy per column otherwise
+    import pyarrow.feather as _feather
+except ImportError:  # pragma: no cover - depends on environment
+    _feather = None
+
+# bump when the on-disk layout or the cleaning applied before caching changes
+CACHE_VERSION = 1
+DEFAULT_CACHE_DIR = ".cache/frames"
+
+
+def _file_digest(path: Path, block: int = 1 << 20) -> str:
+    h = hashlib.sha1()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(block), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _source_stat(path: Path) -> Dict[str, int]:
+    st = path.stat()
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+
+class FrameCache:
+    """Columnar on-disk cache of a cleaned dataset, keyed by its source file.
+
+    The first load writes every column once; later loads memory-map the
+    cache and materialize only the requested columns. With pyarrow installed
+    the cache is one uncompressed Feather file, otherwise each numeric column
+    is an ``.npy`` file and each text column is dictionary-encoded as an
+    ``.npy`` code array plus a JSON list of distinct values.
+
+    The cache is valid while the source size and mtime match. If they differ
+    but the content hash is unchanged (e.g. the file was touched or copied),
+    the metadata is refreshed and the cache reused.
+    """
+
+    def __init__(self, source: str, cache_dir: str = DEFAULT_CACHE_DIR, backend: Optional[str] = None):
+        self.source = Path(source)
+        key = hashlib.sha1(str(self.source.resolve()).encode("utf-8")).hexdigest()[:16]
+        self.dir = Path(cache_dir) / key
+        self.meta_path = self.dir / "meta.json"
+        self.backend = backend or ("feather" if _feather is not None else "npy")
+
+    def _read_meta(self) -> Optional[Dict[str, Any]]:
+        try:
+            meta = json.loads(self.meta_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, ValueError):
+            return None
+        if meta.get("version") != CACHE_VERSION:
+            return None
+        if meta.get("backend") == "feather" and _feather is None:
+            return None
+        return meta
+
+    def valid(self) -> bool:
+        meta = self._read_meta()
+        if meta is None or not self.source.exists():
+            return False
+        stat = _source_stat(self.source)
+        if stat == meta["stat"]:
+            return True
+        if stat["size"] != meta["stat"]["size"] or _file_digest(self.source) != meta["sha1"]:
+            return False
+        meta["stat"] = stat
+        self.meta_path.write_text(json.dumps(meta), encoding="utf-8")
+        return True
+
+    def columns(self) -> List[str]:
+        meta = self._read_meta()
+        return list(meta["columns"]) if meta else []
+
+    def write(self, df: pd.DataFrame) -> None:
+        tmp = self.dir.with_name(self.dir.name + f".tmp{os.getpid()}")
+        shutil.rmtree(tmp, ignore_errors=True)
+        tmp.mkdir(parents=True)
+
+        columns: Dict[str, Dict[str, Any]] = {}
+        if self.backend == "feather":
+            _feather.write_feather(df.reset_index(drop=True), tmp / "data.feather", compression="uncompressed")
+            columns = {str(c): {} for c in df.columns}
+        else:
+            for i, col in enumerate(df.columns):
+                s = df[col]
+                name = f"c{i}"
+                if s.dtype.kind in "biuf":
+                    np.save(tmp / f"{name}.npy", s.to_numpy())
+                    columns[str(col)] = {"kind": "numeric", "file": f"{name}.npy"}
+                else:
+                    codes, uniques = pd.factorize(s)
+                    width = np.int32 if len(uniques) < 2 ** 31 else np.int64
+                    np.save(tmp / f"{name}.codes.npy", codes.astype(width))
+                    (tmp / f"{name}.values.json").write_text(
+                        json.dumps([str(u) for u in uniques.tolist()], ensure_ascii=False), encoding="utf-8"
+                    )
+                    columns[str(col)] = {"kind": "dictionary", "file": name}
+
+        meta = {
+            "version": CACHE_VERSION,
+            "backend": self.backend,
+            "source": str(self.source),
+            "stat": _source_stat(self.source),
+            "sha1": _file_digest(self.source),
+            "rows": len(df),
+            "columns": columns,
+        }
+        (tmp / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.dir.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(tmp, self.dir)
+
+    def read(self, columns: Optional[Sequence[str]] = None) -> pd.DataFrame:
+        meta = self._read_meta()
+        if meta is None:
+            raise FileNotFoundError(f"No frame cache for {self.source}")
+        names = list(meta["columns"]) if columns is None else [c for c in columns if c in meta["columns"]]
+
+        if meta["backend"] == "feather":
+            return _feather.read_feather(self.dir / "data.feather", columns=names, memory_map=True)
+
+        data = {}
+        for col in names:
+            info = meta["columns"][col]
+            if info["kind"] == "numeric":
+                data[col] = np.load(self.dir / info["file"], mmap_mode="r").view(np.ndarray)
+            else:
+                codes = np.load(self.dir / f"{info['file']}.codes.npy", mmap_mode="r")
+                values = json.loads((self.dir / f"{info['file']}.values.json").read_text(encoding="utf-8"))
+                lookup = np.array(values + [np.nan], dtype=object)
+                data[col] = pd.Series(lookup[codes])
+        return pd.DataFrame(data, index=pd.RangeIndex(meta["rows"]), columns=names, copy=False)
@@ -0,0 +1,497 @@
+"""Rotation and a trace index for the JSONL event log.
+
+The active log file (``logs/events.log.jsonl``) is one *segment*. When it
+grows past a size or age limit it is renamed, compressed and replaced by a
+fresh segment. Compressed segments are a series of independent gzip members
+of whole lines. They stay readable with ``zcat``, and any block can be
+inflated on its own.
+
+Next to the log sits an SQLite index (``<log>.idx``). It maps every
+``trace_id`` to (segment, byte offset, length) ranges in uncompressed
+coordinates, plus the raw-to-gzip block map of compressed segments.
+Reading one trace is an indexed lookup plus a seek per range, so its cost
+depends on the size of that trace, not the size of the log. The event
+writer indexes each batch as it appends it. ``sync()`` catches up on lines
+it did not index itself, such as older logs or other writers.
+
+Older lines use ``event_type`` where newer ones use ``event``;
+``normalize_event`` maps both shapes to one.
+"""
+import datetime
+import gzip
+import json
+import os
+import sqlite3
+import time
+import zlib
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+BLOCK_BYTES = 256 << 10
+SCAN_BYTES = 4 << 20
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS segments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL,
+    created REAL NOT NULL,
+    inode INTEGER,
+    indexed_to INTEGER NOT NULL DEFAULT 0,
+    archived INTEGER NOT NULL DEFAULT 0,
+    compressed INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS traces (
+    trace_id TEXT NOT NULL,
+    segment INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS traces_by_id ON traces (trace_id, segment, offset);
+CREATE INDEX IF NOT EXISTS traces_by_segment ON traces (segment, offset);
+CREATE TABLE IF NOT EXISTS blocks (
+    segment INTEGER NOT NULL,
+    raw_offset INTEGER NOT NULL,
+    raw_length INTEGER NOT NULL,
+    gz_offset INTEGER NOT NULL,
+    gz_length INTEGER NOT NULL,
+    PRIMARY KEY (segment, raw_offset)
+);
+"""
+
+
+def index_path(log_path: str) -> str:
+    return log_path + ".idx"
+
+
+def _parse_ts(value: Any) -> Optional[float]:
+    if not isinstance(value, str):
+        return None
+    try:
+        ts = datetime.datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=datetime.timezone.utc)
+    return ts.timestamp()
+
+
+def normalize_event(record: Dict[str, Any]) -> Dict[str, Any]:
+    """One shape for both log formats: ``event`` (from ``event_type`` on older lines),
+    ``span_id``/``parent_span_id``/``agent`` always present, ``payload`` always a dict,
+    and ``timestamp`` as ISO-8601 with an explicit ``+00:00`` offset."""
+    out = dict(record)
+    legacy = out.pop("event_type", None)
+    if out.get("event") is None:
+        out["event"] = legacy
+    for key in ("trace_id", "span_id", "parent_span_id", "agent"):
+        out.setdefault(key, None)
+    payload = out.get("payload")
+    out["payload"] = payload if isinstance(payload, dict) else ({} if payload is None else {"value": payload})
+    ts = out.get("timestamp")
+    if isinstance(ts, str) and ts.endswith("Z"):
+        out["timestamp"] = ts[:-1] + "+00:00"
+    return out
+
+
+def _line_trace(line: bytes) -> Optional[str]:
+    try:
+        trace = json.loads(line).get("trace_id")
+    except (ValueError, AttributeError):
+        return None
+    return trace if isinstance(trace, str) else None
+
+
+def trace_ranges(lines: Iterable[Tuple[str, int]], base: int = 0) -> List[Tuple[str, int, int]]:
+    """``(trace_id, offset, length)`` covering each trace's lines in a run of ``(trace_id, line_bytes)``.
+
+    One range per trace: it spans from the trace's first line to its last,
+    and readers skip the other traces' lines in between.
+    """
+    spans: Dict[str, List[int]] = {}
+    pos = base
+    for trace, size in lines:
+        if trace is not None:
+            span = spans.get(trace)
+            if span is None:
+                spans[trace] = [pos, pos + size]
+            else:
+                span[1] = pos + size
+        pos += size
+    return [(trace, lo, hi - lo) for trace, (lo, hi) in spans.items()]
+
+
+class LogIndex:
+    """SQLite sidecar of a log file: segments, per-trace byte ranges and gzip block maps."""
+
+    def __init__(self, log_path: str, timeout: float = 30.0):
+        self.log_path = log_path
+        self.log_dir = os.path.dirname(log_path) or "."
+        self.active_name = os.path.basename(log_path)
+        self.path = index_path(log_path)
+        self.timeout = timeout
+        self._conn: Optional[sqlite3.Connection] = None
+
+    # --- connection -----------------------------------------------------------
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(self.log_dir, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    def _file(self, name: str) -> str:
+        return os.path.join(self.log_dir, name)
+
+    # --- segments -------------------------------------------------------------
+
+    def active_segment(self) -> Tuple[int, float]:
+        """``(id, created)`` of the segment for the current active file, registering it if new.
+
+        A file that was replaced under the same name (different inode, or
+        shorter than what was indexed) gets a fresh segment; the rows of the
+        old one are dropped.
+        """
+        try:
+            st = os.stat(self.log_path)
+            inode, size = st.st_ino, st.st_size
+        except FileNotFoundError:
+            inode, size = None, 0
+        db = self.db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute("SELECT id, created, inode, indexed_to FROM segments WHERE path = ? AND archived = 0",
+                             (self.active_name,)).fetchone()
+            if row is not None and (inode is None or (row[2] in (None, inode) and row[3] <= size)):
+                if row[2] is None and inode is not None:
+                    db.execute("UPDATE segments SET inode = ? WHERE id = ?", (inode, row[0]))
+                db.execute("COMMIT")
+                return row[0], row[1]
+            if row is not None:
+                self._drop(row[0])
+            created = time.time()
+            cur = db.execute("INSERT INTO segments (path, created, inode) VALUES (?, ?, ?)",
+                             (self.active_name, created, inode))
+            db.execute("COMMIT")
+            return cur.lastrowid, created
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def _drop(self, segment: int):
+        self.db.execute("DELETE FROM traces WHERE segment = ?", (segment,))
+        self.db.execute("DELETE FROM blocks WHERE segment = ?", (segment,))
+        self.db.execute("DELETE FROM segments WHERE id = ?", (segment,))
+
+    def add(self, segment: int, ranges: List[Tuple[str, int, int]], start: int, end: int):
+        """Record the trace ranges of a batch the writer appended at ``[start, end)``."""
+        db = self.db
+        db.execute("BEGIN")
+        try:
+            db.executemany("INSERT INTO traces (trace_id, segment, offset, length) VALUES (?, ?, ?, ?)",
+                           [(t, segment, off, length) for t, off, length in ranges])
+            # only a contiguous append moves the mark; gaps (lines from unindexed writers) are left for sync()
+            db.execute("UPDATE segments SET indexed_to = ? WHERE id = ? AND indexed_to >= ? AND indexed_to < ?",
+                       (end, segment, start, end))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+    def sync(self) -> int:
+        """Index lines appended past each raw segment's mark (e.g. by older writers); returns bytes scanned."""
+        if os.path.exists(self.log_path):
+            self.active_segment()
+        scanned = 0
+        for seg, name, indexed_to in self.db.execute(
+                "SELECT id, path, indexed_to FROM segments WHERE compressed = 0").fetchall():
+            path = self._file(name)
+            try:
+                size = os.path.getsize(path)
+            except FileNotFoundError:
+                continue
+            if size > indexed_to:
+                scanned += self._scan(seg, path, indexed_to, size)
+        return scanned
+
+    def _scan(self, segment: int, path: str, start: int, end: int) -> int:
+        pos = start
+        with open(path, "rb") as fh:
+            fh.seek(start)
+            while pos < end:
+                chunk = fh.read(min(SCAN_BYTES, end - pos))
+                if not chunk:
+                    break
+                cut = chunk.rfind(b"\n") + 1
+                if cut == 0:
+                    if pos + len(chunk) < end:
+                        chunk += fh.readline()
+                        cut = len(chunk)
+                    else:
+                        break  # a partial last line; left for the next sync
+                chunk = chunk[:cut]
+                fh.seek(pos + cut)
+                lines = chunk.splitlines(keepends=True)
+                ranges = trace_ranges(((_line_trace(line), len(line)) for line in lines), base=pos)
+                self.add(segment, ranges, pos, pos + cut)
+                pos += cut
+        return pos - start
+
+    def segment_created(self, segment: int) -> float:
+        row = self.db.execute("SELECT created FROM segments WHERE id = ?", (segment,)).fetchone()
+        return row[0] if row else time.time()
+
+    # --- rotation -------------------------------------------------------------
+
+    def rotate(self, segment: int, compress: bool = True, backups: Optional[int] = None) -> Optional[str]:
+        """Archive the active file if it still is ``segment``; returns the archived path.
+
+        The rename happens under the index's write lock, so concurrent
+        writers rotate once; compression runs afterwards and swaps the
+        segment to its ``.gz`` file in one transaction.
+        """
+        db = self.db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            row = db.execute("SELECT created FROM segments WHERE id = ? AND archived = 0 AND path = ?",
+                             (segment, self.active_name)).fetchone()
+            if row is None or not os.path.exists(self.log_path):
+                db.execute("COMMIT")
+                return None
+            stamp = datetime.datetime.fromtimestamp(row[0], datetime.timezone.utc).strftime("%Y%m%dT%H%M%S")
+            stem, ext = os.path.splitext(self.active_name)
+            name = f"{stem}.{stamp}-{segment}{ext}"
+            os.replace(self.log_path, self._file(name))
+            db.execute("UPDATE segments SET path = ?, archived = 1 WHERE id = ?", (name, segment))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+
+        path = self._file(name)
+        size = os.path.getsize(path)
+        indexed_to = db.execute("SELECT indexed_to FROM segments WHERE id = ?", (segment,)).fetchone()[0]
+        if size > indexed_to:
+            self._scan(segment, path, indexed_to, size)
+        if compress:
+            path = self._compress(segment, name)
+        if backups is not None:
+            self.prune(backups)
+        return path
+
+    def _compress(self, segment: int, name: str) -> str:
+        src = self._file(name)
+        gz_name = name + ".gz"
+        tmp = self._file(gz_name + ".tmp")
+        blocks = []
+        with open(src, "rb") as fin, open(tmp, "wb") as fout:
+            raw_offset = 0
+            while True:
+                block = fin.read(BLOCK_BYTES)
+                if not block:
+                    break
+                if not block.endswith(b"\n"):
+                    block += fin.readline()
+                member = gzip.compress(block, compresslevel=6, mtime=0)
+                blocks.append((segment, raw_offset, len(block), fout.tell(), len(member)))
+                fout.write(member)
+                raw_offset += len(block)
+        os.replace(tmp, self._file(gz_name))
+        db = self.db
+        db.execute("BEGIN IMMEDIATE")
+        try:
+            db.executemany("INSERT OR REPLACE INTO blocks VALUES (?, ?, ?, ?, ?)", blocks)
+            db.execute("UPDATE segments SET path = ?, compressed = 1 WHERE id = ?", (gz_name, segment))
+            db.execute("COMMIT")
+        except BaseException:
+            db.execute("ROLLBACK")
+            raise
+        os.remove(src)
+        return self._file(gz_name)
+
+    def prune(self, backups: int):
+        """Delete all but the newest ``backups`` archived segments, with their index rows."""
+        rows = self.db.execute("SELECT id, path FROM segments WHERE archived = 1 ORDER BY id DESC").fetchall()
+        for seg, name in rows[max(0, int(backups)):]:
+            db = self.db
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                self._drop(seg)
+                db.execute("COMMIT")
+            except BaseException:
+                db.execute("ROLLBACK")
+                raise
+            try:
+                os.remove(self._file(name))
+            except FileNotFoundError:
+                pass
+
+    # --- reading --------------------------------------------------------------
+
+    def _read_range(self, name: str, compressed: bool, segment: int, offset: int, length: int) -> bytes:
+        path = self._file(name)
+        if not compressed:
+            with open(path, "rb") as fh:
+                fh.seek(offset)
+                return fh.read(length)
+        blocks = self.db.execute(
+            "SELECT raw_offset, gz_offset, gz_length FROM blocks WHERE segment = ? AND raw_offset < ? "
+            "AND raw_offset + raw_length > ? ORDER BY raw_offset", (segment, offset + length, offset)).fetchall()
+        if not blocks:
+            return b""
+        parts = []
+        with open(path, "rb") as fh:
+            for _, gz_offset, gz_length in blocks:
+                fh.seek(gz_offset)
+                parts.append(zlib.decompress(fh.read(gz_length), wbits=31))
+        data = b"".join(parts)
+        lo = offset - blocks[0][0]
+        return data[lo:lo + length]
+
+    def read_trace(self, trace_id: str) -> List[Dict[str, Any]]:
+        """Every event of ``trace_id``, normalized, in log order."""
+        rows = self.db.execute(
+            "SELECT t.segment, t.offset, t.length, s.path, s.compressed FROM traces t "
+            "JOIN segments s ON s.id = t.segment WHERE t.trace_id = ? ORDER BY t.segment, t.offset",
+            (trace_id,)).fetchall()
+        # merge overlapping ranges so a line indexed twice (writer + sync) is read once
+        merged: List[List[Any]] = []
+        for seg, off, length, name, compressed in rows:
+            last = merged[-1] if merged else None
+            if last is not None and last[0] == seg and off <= last[1] + last[2]:
+                last[2] = max(last[2], off + length - last[1])
+            else:
+                merged.append([seg, off, length, name, compressed])
+        needle = trace_id.encode("utf-8")
+        events = []
+        for seg, off, length, name, compressed in merged:
+            try:
+                data = self._read_range(name, bool(compressed), seg, off, length)
+            except FileNotFoundError:
+                # compressed or pruned while we were reading; look the segment up again
+                row = self.db.execute("SELECT path, compressed FROM segments WHERE id = ?", (seg,)).fetchone()
+                if row is None:
+                    continue
+                data = self._read_range(row[0], bool(row[1]), seg, off, length)
+            for line in data.splitlines():
+                if needle not in line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if record.get("trace_id") == trace_id:
+                    events.append(normalize_event(record))
+        return events
+
+    def recent_traces(self, limit: int = 20) -> List[str]:
+        """The ``limit`` traces whose first indexed line is latest, newest first."""
+        rows = self.db.execute(
+            "SELECT trace_id FROM traces GROUP BY trace_id ORDER BY MIN(segment) DESC, MIN(offset) DESC LIMIT ?",
+            (int(limit),)).fetchall()
+        return [r[0] for r in rows]
+
+    def stats(self) -> Dict[str, Any]:
+        db = self.db
+        return {
+            "segments": db.execute("SELECT COUNT(*) FROM segments").fetchone()[0],
+            "archived": db.execute("SELECT COUNT(*) FROM segments WHERE archived = 1").fetchone()[0],
+            "ranges": db.execute("SELECT COUNT(*) FROM traces").fetchone()[0],
+        }
+
+
+def iter_events(log_path: str) -> Iterator[Dict[str, Any]]:
+    """Every event of a log file (plain or gzip), normalized; a full scan, for tools and tests."""
+    opener = gzip.open if log_path.endswith(".gz") else open
+    with opener(log_path, "rb") as fh:
+        for line in fh:
+            try:
+                yield normalize_event(json.loads(line))
+            except ValueError:
+                continue
+
+
+# --- span trees -----------------------------------------------------------------
+
+
+def build_spans(events: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Span records (as ``logging_utils.record_spans`` produces) from a trace's normalized events.
+
+    Start/end pairs share a ``span_id``. Spans logged with ``start_ns``/``end_ns``
+    keep those clocks; older lines are timed from their timestamps. Other
+    events are attached to their parent span as ``events``.
+    """
+    spans: Dict[str, Dict[str, Any]] = {}
+    loose = []
+    for e in events:
+        name, sid = e.get("event") or "", e.get("span_id")
+        if sid and name.endswith(".start"):
+            s = spans.setdefault(sid, {"span_id": sid, "events": []})
+            s.update(name=name[:-len(".start")], parent_span_id=e.get("parent_span_id"), agent=e.get("agent"),
+                     start_ts=_parse_ts(e.get("timestamp")))
+        elif sid and name.endswith(".end"):
+            s = spans.setdefault(sid, {"span_id": sid, "events": [], "name": name[:-len(".end")],
+                                       "parent_span_id": e.get("parent_span_id"), "agent": e.get("agent")})
+            s["end_ts"] = _parse_ts(e.get("timestamp"))
+            s.update({k: v for k, v in e["payload"].items()
+                      if k in ("start_ns", "end_ns", "duration_ms", "thread_cpu_ms", "mem_alloc_bytes",
+                               "mem_peak_bytes")})
+        else:
+            loose.append(e)
+    for e in loose:
+        parent = spans.get(e.get("parent_span_id"))
+        if parent is not None:
+            parent["events"].append(e)
+    for s in spans.values():
+        if "start_ns" not in s and s.get("start_ts") is not None:
+            s["start_ns"] = int(s["start_ts"] * 1e9)
+            if s.get("end_ts") is not None:
+                s["end_ns"] = int(s["end_ts"] * 1e9)
+        if "duration_ms" not in s and "end_ns" in s:
+            s["duration_ms"] = round((s["end_ns"] - s["start_ns"]) / 1e6, 3)
+    return sorted(spans.values(), key=lambda s: s.get("start_ns", 0))
+
+
+def critical_path(spans: List[Dict[str, Any]]) -> List[str]:
+    """Span ids on the critical path from the root span down.
+
+    At each span, walk back from its end: the child that finished last is on
+    the path, then the latest child that finished before that one started,
+    and so on. Each of those children is followed by its own critical path,
+    in time order. Siblings that ran entirely inside one of them count as its
+    children, since spans opened inside a stage may carry the caller's
+    parent rather than the stage's.
+    """
+    children: Dict[Any, List[Dict[str, Any]]] = {}
+    ids = {s["span_id"] for s in spans}
+    for s in spans:
+        parent = s.get("parent_span_id") if s.get("parent_span_id") in ids else None
+        children.setdefault(parent, []).append(s)
+    timed = [s for s in children.get(None, []) if "end_ns" in s]
+    if not timed:
+        return []
+    path = []
+
+    def walk(span, kids):
+        path.append(span["span_id"])
+        kids = sorted((k for k in kids if "end_ns" in k), key=lambda k: k["end_ns"], reverse=True)
+        chain, bound = [], span["end_ns"]
+        for k in kids:
+            if k["end_ns"] <= bound:
+                chain.append(k)
+                bound = k["start_ns"]
+        for k in reversed(chain):
+            inner = [c for c in kids if c is not k and k["start_ns"] <= c["start_ns"] and c["end_ns"] <= k["end_ns"]]
+            walk(k, children.get(k["span_id"], []) + inner)
+
+    root = max(timed, key=lambda s: s["end_ns"] - s["start_ns"])
+    walk(root, children.get(root["span_id"], []))
+    return path
@@ -1,11 +1,41 @@
+import atexit
+import contextvars
+import functools
+import inspect
 import uuid
 import datetime
 import json
 import os
-from typing import Any, Dict, Tuple, Union
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import tracemalloc
+import zlib
+from typing import Any, Dict, Optional, Tuple, Union
+
+from src.utils.log_index import LogIndex, trace_ranges
 
 LOG_PATH = os.path.join("logs", "events.log.jsonl")
 
+# writer settings; see configure_logging(). Events are only printed when an entry point turns on logging.echo
+ECHO = False
+BATCH_SIZE = 512
+FLUSH_INTERVAL = 0.5
+# rotation (0 disables a limit) and the trace index; see src/utils/log_index.py
+ROTATE_BYTES = 64 << 20
+ROTATE_SECONDS = 0
+BACKUPS = 20
+COMPRESS = True
+INDEX = True
+# filtering; see configure_logging() and event_enabled()
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+LEVEL = LEVELS["info"]
+SAMPLE_RATE = 1.0
+# event name (or dotted prefix) -> level; anything not listed is "info"
+EVENT_LEVELS = {"insights.segment": "debug"}
+
 
 def make_trace_id() -> str:
     return str(uuid.uuid4())
@@ -19,12 +49,276 @@ def _utc_now() -> str:
     return datetime.datetime.utcnow().replace(tzinfo=datetime.timezone.utc).isoformat()
 
 
-def _ensure_logfile():
-    d = os.path.dirname(LOG_PATH)
+def _iso(ts: float) -> str:
+    return datetime.datetime.fromtimestamp(ts, datetime.timezone.utc).isoformat()
+
+
+def _ensure_logfile(path: str = None):
+    path = path or LOG_PATH
+    d = os.path.dirname(path)
     if d and not os.path.exists(d):
         os.makedirs(d, exist_ok=True)
-    if not os.path.exists(LOG_PATH):
-        open(LOG_PATH, "a", encoding="utf-8").close()
+    if not os.path.exists(path):
+        open(path, "a", encoding="utf-8").close()
+
+
+_encode = json.JSONEncoder(default=str, ensure_ascii=False).encode
+
+
+def _line(entry: dict) -> str:
+    """JSON line of a queued entry, around its already encoded payload."""
+    # timestamps are captured as epoch floats and formatted off the caller's thread
+    head = _encode({"timestamp": _iso(entry["timestamp"]), "event": entry["event"], "trace_id": entry["trace_id"],
+                    "parent_span_id": entry["parent_span_id"], "agent": entry["agent"]})
+    tail = f', "span_id": {_encode(entry["span_id"])}' if "span_id" in entry else ""
+    return f'{head[:-1]}, "payload": {entry["payload"]}{tail}}}\n'
+
+
+class _EventWriter:
+    """Background writer that owns the single long-lived log file handle.
+
+    The pipeline thread only encodes the payload and enqueues the entry;
+    formatting, file writes and console echo happen here in batches of
+    ``BATCH_SIZE`` lines or every ``FLUSH_INTERVAL`` seconds, whichever comes
+    first.
+    """
+
+    def __init__(self, path: str, echo: bool, batch_size: int, flush_interval: float, rotate_bytes: int = 0,
+                 rotate_seconds: float = 0, backups: int = None, compress: bool = True, index: bool = True):
+        self.path = path
+        self.echo = echo
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.001, float(flush_interval))
+        self.rotate_bytes = int(rotate_bytes or 0)
+        self.rotate_seconds = float(rotate_seconds or 0)
+        self.backups = backups
+        self.compress = compress
+        self.index = None
+        if index or self.rotate_bytes or self.rotate_seconds:
+            self.index = LogIndex(path)
+        self._segment = None
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._loop, name="event-log-writer", daemon=True)
+        self._thread.start()
+
+    def put(self, entry: dict):
+        # callers may reuse or mutate the payload once log_event returns, so it is encoded now
+        payload = entry["payload"]
+        entry["payload"] = _encode(payload) if payload else "{}"
+        if self.echo:
+            # human-friendly console line (matches prior outputs like "[pipeline.start.start] {}")
+            entry["echo"] = f'[{entry["event"]}] {payload}\n'
+        self._queue.put(entry)
+
+    def flush(self, timeout: float = 10.0):
+        done = threading.Event()
+        self._queue.put(done)
+        done.wait(timeout)
+
+    def close(self, timeout: float = 10.0):
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def _open(self):
+        _ensure_logfile(self.path)
+        fh = open(self.path, "ab", buffering=0)
+        if self.index is not None:
+            try:
+                self._segment = self.index.active_segment()
+            except sqlite3.Error as exc:
+                self._index_failed(exc)
+        return fh
+
+    def _index_failed(self, exc):
+        # the log itself must keep working; lookups fall back to LogIndex.sync() later
+        sys.stderr.write(f"event log index disabled: {exc}\n")
+        self.index = None
+        self._segment = None
+
+    def _reopen_if_rotated(self, fh):
+        # another process may have rotated the file since we opened it
+        try:
+            current = os.stat(self.path).st_ino
+        except FileNotFoundError:
+            current = None
+        if current == os.fstat(fh.fileno()).st_ino:
+            return fh
+        fh.close()
+        return self._open()
+
+    def _write(self, fh, lines, echoes, traces):
+        if lines:
+            if self._segment is not None:
+                fh = self._reopen_if_rotated(fh)
+            encoded = [line.encode("utf-8") for line in lines]
+            data = b"".join(encoded)
+            # one unbuffered append per batch so lines from several processes never interleave
+            fh.write(data)
+            if self._segment is not None:
+                end = fh.tell()
+                start = end - len(data)
+                try:
+                    self.index.add(self._segment[0], trace_ranges(zip(traces, map(len, encoded)), base=start),
+                                   start, end)
+                    if (self.rotate_bytes and end >= self.rotate_bytes) or \
+                            (self.rotate_seconds and time.time() - self._segment[1] >= self.rotate_seconds):
+                        fh.close()
+                        self.index.rotate(self._segment[0], compress=self.compress, backups=self.backups)
+                        fh = self._open()
+                except (sqlite3.Error, OSError) as exc:
+                    self._index_failed(exc)
+                    if fh.closed:
+                        fh = open(self.path, "ab", buffering=0)
+            lines.clear()
+            traces.clear()
+        if echoes:
+            try:
+                sys.stdout.write("".join(echoes))
+                sys.stdout.flush()
+            except Exception:
+                pass
+            echoes.clear()
+        return fh
+
+    def _loop(self):
+        fh = self._open()
+        lines, echoes, traces = [], [], []
+        deadline = time.monotonic() + self.flush_interval
+        try:
+            while True:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+                except queue.Empty:
+                    item = False
+
+                if item is None:
+                    break
+                if isinstance(item, threading.Event):
+                    fh = self._write(fh, lines, echoes, traces)
+                    item.set()
+                    continue
+                if item is not False:
+                    lines.append(_line(item))
+                    traces.append(item["trace_id"])
+                    if self.echo:
+                        echoes.append(item["echo"])
+                    if len(lines) < self.batch_size:
+                        continue
+
+                fh = self._write(fh, lines, echoes, traces)
+                deadline = time.monotonic() + self.flush_interval
+        finally:
+            fh = self._write(fh, lines, echoes, traces)
+            fh.close()
+            if self.index is not None:
+                self.index.close()
+            # release anyone waiting on a flush queued behind the stop marker
+            while True:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if isinstance(item, threading.Event):
+                    item.set()
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def _get_writer() -> _EventWriter:
+    global _writer
+    w = _writer
+    if w is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = _EventWriter(LOG_PATH, ECHO, BATCH_SIZE, FLUSH_INTERVAL, rotate_bytes=ROTATE_BYTES,
+                                       rotate_seconds=ROTATE_SECONDS, backups=BACKUPS, compress=COMPRESS,
+                                       index=INDEX)
+            w = _writer
+    return w
+
+
+def flush_events(timeout: float = 10.0):
+    """Block until every event logged so far is on disk."""
+    if _writer is not None:
+        _writer.flush(timeout)
+
+
+def close_events(timeout: float = 10.0):
+    """Flush and stop the background writer; the next event starts a new one."""
+    global _writer
+    with _writer_lock:
+        w, _writer = _writer, None
+    if w is not None:
+        w.close(timeout)
+
+
+def _level_value(level: Union[str, int]) -> int:
+    if isinstance(level, str):
+        if level.lower() not in LEVELS:
+            raise ValueError(f"Unknown log level {level!r}; expected one of {list(LEVELS)}")
+        return LEVELS[level.lower()]
+    return int(level)
+
+
+def configure_logging(log_path: str = None, echo: bool = None, batch_size: int = None, flush_interval: float = None,
+                      rotate_bytes: int = None, rotate_seconds: float = None, backups: int = None,
+                      compress: bool = None, index: bool = None, level: Union[str, int] = None,
+                      levels: Dict[str, Union[str, int]] = None, sample_rate: float = None):
+    """Change writer settings. Pending events are flushed to the old file first.
+
+    The active file is rotated (renamed, gzip-compressed with ``compress``)
+    once it reaches ``rotate_bytes`` or is ``rotate_seconds`` old; 0 turns a
+    limit off, and only the newest ``backups`` rotated files are kept. With
+    ``index`` every batch is also recorded in the trace index next to the log.
+
+    Events (and spans) below ``level`` are dropped; ``levels`` maps event
+    names or dotted prefixes to their level (replacing ``EVENT_LEVELS``).
+    Debug events are further kept only in the ``sample_rate`` share of traces.
+    """
+    global LOG_PATH, ECHO, BATCH_SIZE, FLUSH_INTERVAL, ROTATE_BYTES, ROTATE_SECONDS, BACKUPS, COMPRESS, INDEX
+    global LEVEL, EVENT_LEVELS, SAMPLE_RATE
+    close_events()
+    if level is not None:
+        LEVEL = _level_value(level)
+    if levels is not None:
+        EVENT_LEVELS = {str(k): v for k, v in levels.items()}
+    if sample_rate is not None:
+        if not 0 <= float(sample_rate) <= 1:
+            raise ValueError(f"sample_rate must be within [0, 1], got {sample_rate!r}")
+        SAMPLE_RATE = float(sample_rate)
+    _event_levels.clear()
+    if log_path is not None:
+        LOG_PATH = log_path
+    if echo is not None:
+        ECHO = bool(echo)
+    if batch_size is not None:
+        BATCH_SIZE = int(batch_size)
+    if flush_interval is not None:
+        FLUSH_INTERVAL = float(flush_interval)
+    if rotate_bytes is not None:
+        ROTATE_BYTES = int(rotate_bytes)
+    if rotate_seconds is not None:
+        ROTATE_SECONDS = float(rotate_seconds)
+    if backups is not None:
+        BACKUPS = int(backups)
+    if compress is not None:
+        COMPRESS = bool(compress)
+    if index is not None:
+        INDEX = bool(index)
+
+
+def _reset_writer_in_child():
+    # the writer thread does not survive fork(); the child starts its own lazily
+    global _writer, _writer_lock
+    _writer = None
+    _writer_lock = threading.Lock()
+
+
+atexit.register(close_events)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_writer_in_child)
 
 
 def _normalize_span(span: Union[dict, tuple, None]) -> Union[dict, None]:
@@ -48,44 +342,253 @@ def _normalize_span(span: Union[dict, tuple, None]) -> Union[dict, None]:
     return None
 
 
-def log_event(event_name: str, payload: Dict[str, Any] = None, trace_id: str = None, parent_span_id: str = None, agent: str = None):
+# the span opened by the innermost ``span()`` block of this thread / asyncio task
+_current: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+# event name -> numeric level, resolved once per name
+_event_levels: Dict[str, int] = {}
+
+
+def current_span() -> Optional[dict]:
+    """The span of the innermost enclosing ``span()`` block, or None."""
+    return _current.get()
+
+
+def span_id_of(span: Union[dict, str, tuple, None]) -> Optional[str]:
+    """The id of ``span`` given as a span dict, a bare span id or a legacy tuple."""
+    if span is None or isinstance(span, str):
+        return span
+    s = _normalize_span(span)
+    return s.get("span_id") if s else None
+
+
+def _event_level(name: str) -> int:
+    level = _event_levels.get(name)
+    if level is None:
+        # the longest matching dotted prefix wins: "insights.segment" covers "insights.segment.validated"
+        level = LEVELS["info"]
+        key = name
+        while key:
+            if key in EVENT_LEVELS:
+                level = _level_value(EVENT_LEVELS[key])
+                break
+            key = key.rpartition(".")[0]
+        _event_levels[name] = level
+    return level
+
+
+def sampled(trace_id: Optional[str]) -> bool:
+    """Head-based sampling: the same answer for every event of a trace, in every process."""
+    if SAMPLE_RATE >= 1.0:
+        return True
+    if not trace_id or SAMPLE_RATE <= 0.0:
+        return False
+    return zlib.crc32(trace_id.encode("utf-8")) < SAMPLE_RATE * 4294967296.0
+
+
+def event_enabled(event_name: str, trace_id: str = None) -> bool:
+    """Whether ``log_event(event_name, ...)`` would write; use it to skip building costly payloads.
+
+    Without ``trace_id`` the trace of the current span decides sampling.
+    """
+    level = _event_levels.get(event_name)
+    if level is None:
+        level = _event_level(event_name)
+    if level < LEVEL:
+        return False
+    if level >= LEVELS["info"] or SAMPLE_RATE >= 1.0:
+        return True
+    if trace_id is None:
+        cur = _current.get()
+        trace_id = cur["trace_id"] if cur is not None else None
+    return sampled(trace_id)
+
+
+def _inherit(trace_id, parent_span_id):
+    # explicit ids win; otherwise the current span (of the same trace) is the parent
+    cur = _current.get()
+    if cur is not None and (trace_id is None or trace_id == cur["trace_id"]):
+        return cur["trace_id"], cur["span_id"] if parent_span_id is None else parent_span_id
+    return trace_id, parent_span_id
+
+
+def log_event(event_name: str, payload: Dict[str, Any] = None, trace_id: str = None, parent_span_id: str = None,
+              agent: str = None, span_id: str = None):
+    level = _event_levels.get(event_name) or _event_level(event_name)
+    if level < LEVEL:
+        return
+    if parent_span_id is None or trace_id is None:
+        trace_id, parent_span_id = _inherit(trace_id, parent_span_id)
+    trace_id = trace_id or make_trace_id()
+    if level < LEVELS["info"] and not sampled(trace_id):
+        return
     p = payload or {}
     entry = {
-        "timestamp": _utc_now(),
+        "timestamp": time.time(),
         "event": event_name,
-        "trace_id": trace_id or make_trace_id(),
+        "trace_id": trace_id,
         "parent_span_id": parent_span_id,
         "agent": agent,
         "payload": p,
     }
-    _ensure_logfile()
-    with open(LOG_PATH, "a", encoding="utf-8") as f:
-        f.write(json.dumps(entry, default=str, ensure_ascii=False) + "\n")
-    # human-friendly console line (matches prior outputs like "[pipeline.start.start] {}")
-    print(f'[{event_name}] {p}')
+    if span_id is not None:
+        entry["span_id"] = span_id
+    _get_writer().put(entry)
+
+
+# spans still open while tracemalloc is tracing; each holds the highest peak seen so far
+_open_spans: Dict[str, dict] = {}
+# list that receives a timing record for every finished span; see record_spans()
+_span_sink = None
+
+
+def record_spans(sink: list = None):
+    """Append a timing record for every span ended from now on to ``sink`` (None stops)."""
+    global _span_sink
+    _span_sink = sink
 
 
-def start_span(name: str, trace_id: str = None, parent_span_id: str = None, agent: str = None) -> dict:
+def _fold_peak():
+    # tracemalloc keeps one global peak; hand it to every open span, then restart it
+    _, peak = tracemalloc.get_traced_memory()
+    for s in list(_open_spans.values()):
+        if peak > s["_mem_peak"]:
+            s["_mem_peak"] = peak
+    tracemalloc.reset_peak()
+
+
+def start_span(name: str, trace_id: str = None, parent_span_id: Union[dict, str, None] = None,
+               agent: str = None) -> dict:
+    """Open a span (``parent_span_id`` may also be the parent span dict); close it with ``end_span``.
+
+    Without ids the span continues the trace of the current ``span()`` block.
+    A span whose name is filtered out (see ``configure_logging``) writes
+    nothing; the returned stand-in carries the parent's id, so whatever is
+    logged under it attaches to the nearest enabled ancestor.
+    """
+    level = _event_levels.get(name) or _event_level(name)
+    if parent_span_id is not None and not isinstance(parent_span_id, str):
+        parent_span_id = span_id_of(parent_span_id)
+    if parent_span_id is None or trace_id is None:
+        trace_id, parent_span_id = _inherit(trace_id, parent_span_id)
+    if level < LEVEL:
+        return {"span_id": parent_span_id, "trace_id": trace_id, "parent_span_id": parent_span_id, "name": name,
+                "disabled": True}
+    trace_id = trace_id or make_trace_id()
+    if level < LEVELS["info"] and not sampled(trace_id):
+        return {"span_id": parent_span_id, "trace_id": trace_id, "parent_span_id": parent_span_id, "name": name,
+                "disabled": True}
     span = {
         "span_id": make_span_id(),
-        "trace_id": trace_id or make_trace_id(),
+        "trace_id": trace_id,
         "parent_span_id": parent_span_id,
         "agent": agent,
         "name": name,
         "start_time": _utc_now(),
     }
-    log_event(f"{name}.start", {}, trace_id=span["trace_id"], parent_span_id=parent_span_id, agent=agent)
+    log_event(f"{name}.start", {}, trace_id=span["trace_id"], parent_span_id=parent_span_id, agent=agent,
+              span_id=span["span_id"])
+    if tracemalloc.is_tracing():
+        _fold_peak()
+        current, _ = tracemalloc.get_traced_memory()
+        span["_mem_start"] = span["_mem_peak"] = current
+        _open_spans[span["span_id"]] = span
+    span["start_ns"] = time.perf_counter_ns()
+    # thread_cpu_ms counts the opening thread only: stages run on a thread pool and a span opens and closes on
+    # one thread, so a parent's figure leaves out its children's threads (and any worker processes)
+    span["cpu_start_ns"] = time.thread_time_ns()
     return span
 
 
-def end_span(span: Union[dict, tuple, None]):
+def end_span(span: Union[dict, tuple, None], error: BaseException = None):
+    end_ns = time.perf_counter_ns()
+    cpu_end_ns = time.thread_time_ns()
     s = _normalize_span(span)
-    if s is None:
+    if s is None or s.get("disabled"):
         return
     entry = {
         "end_time": _utc_now(),
     }
-    log_event(f"{s.get('name')}.end", entry, trace_id=s.get("trace_id"), parent_span_id=s.get("span_id"), agent=s.get("agent"))
+    if error is not None:
+        entry["error"] = repr(error)
+    if "start_ns" in s:
+        entry["start_ns"] = s["start_ns"]
+        entry["end_ns"] = end_ns
+        entry["duration_ms"] = round((end_ns - s["start_ns"]) / 1e6, 3)
+        entry["thread_cpu_ms"] = round((cpu_end_ns - s["cpu_start_ns"]) / 1e6, 3)
+    if s.get("span_id") in _open_spans:
+        if tracemalloc.is_tracing():
+            _fold_peak()
+            current, _ = tracemalloc.get_traced_memory()
+            entry["mem_alloc_bytes"] = current - s["_mem_start"]
+            entry["mem_peak_bytes"] = s["_mem_peak"] - s["_mem_start"]
+        del _open_spans[s["span_id"]]
+    log_event(f"{s.get('name')}.end", entry, trace_id=s.get("trace_id"), parent_span_id=s.get("parent_span_id"),
+              agent=s.get("agent"), span_id=s.get("span_id"))
+    sink = _span_sink
+    if sink is not None:
+        sink.append({"name": s.get("name"), "span_id": s.get("span_id"), "parent_span_id": s.get("parent_span_id"),
+                     "agent": s.get("agent"), **entry})
+
+
+class span:
+    """``with span("stage.load", agent="Planner") as s:`` opens a span that is current inside the block.
+
+    Spans and events started in the block without explicit ids (also in
+    asyncio tasks created there, and in threads running a
+    ``contextvars.copy_context()`` taken there) nest under it. A span below
+    the configured level costs a level lookup: it yields the enclosing span
+    (or None) and leaves the current span unchanged.
+    """
+
+    __slots__ = ("name", "agent", "trace_id", "parent", "record", "_token")
+
+    def __init__(self, name: str, agent: str = None, trace_id: str = None, parent: Union[dict, str, None] = None):
+        self.name = name
+        self.agent = agent
+        self.trace_id = trace_id
+        self.parent = parent
+        self.record = None
+        self._token = None
+
+    def __enter__(self) -> Optional[dict]:
+        level = _event_levels.get(self.name) or _event_level(self.name)
+        if level < LEVEL:
+            return _current.get()
+        self.record = start_span(self.name, trace_id=self.trace_id, parent_span_id=self.parent, agent=self.agent)
+        if "disabled" not in self.record:
+            self._token = _current.set(self.record)
+        return self.record
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._token is not None:
+            _current.reset(self._token)
+            self._token = None
+        if self.record is not None:
+            end_span(self.record, error=exc)
+            self.record = None
+        return False
+
+
+def traced(name: str = None, agent: str = None):
+    """Decorator running each call of a function (or coroutine function) in a ``span``.
+
+    The span is named ``name`` or after the function's module and qualified name.
+    """
+    def decorate(fn):
+        span_name = name or f"{fn.__module__}.{fn.__qualname__}"
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def run_async(*args, **kwargs):
+                with span(span_name, agent=agent):
+                    return await fn(*args, **kwargs)
+            return run_async
+
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            with span(span_name, agent=agent):
+                return fn(*args, **kwargs)
+        return run
+    return decorate
 
 
 # convenience alias names that older modules may import
@@ -0,0 +1,110 @@
+import cProfile
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+from src.utils import logging_utils
+
+
+class PipelineProfiler:
+    """Per-stage timing/memory collection for ``python -m src.run --profile``.
+
+    While active, every span that ends is recorded (wall, thread CPU and, with
+    ``trace_memory``, tracemalloc allocated/peak bytes). Each top-level stage
+    wrapped in ``stage()`` also runs under its own ``cProfile.Profile``; the
+    profile of the slowest stage is kept and written to ``cprofile_path``.
+    When disabled, ``stage()`` is a no-op and nothing is recorded.
+    """
+
+    def __init__(self, enabled: bool = False, trace_memory: bool = True, cprofile_path: Optional[str] = None):
+        self.enabled = enabled
+        self.trace_memory = trace_memory
+        self.cprofile_path = cprofile_path
+        self.records: List[Dict[str, Any]] = []
+        self.slowest: Optional[Dict[str, Any]] = None
+        self._started_tracemalloc = False
+
+    def start(self):
+        if not self.enabled:
+            return self
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        logging_utils.record_spans(self.records)
+        return self
+
+    def stop(self) -> Optional[str]:
+        """Stop recording; returns the path of the dumped cProfile file, if any."""
+        if not self.enabled:
+            return None
+        logging_utils.record_spans(None)
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        if self.slowest is None or not self.cprofile_path:
+            return None
+        d = os.path.dirname(self.cprofile_path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self.slowest["profile"].dump_stats(self.cprofile_path)
+        return self.cprofile_path
+
+    @contextmanager
+    def stage(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        prof = cProfile.Profile()
+        t0 = time.perf_counter()
+        prof.enable()
+        try:
+            yield
+        finally:
+            prof.disable()
+            seconds = time.perf_counter() - t0
+            if self.slowest is None or seconds > self.slowest["seconds"]:
+                self.slowest = {"stage": name, "seconds": seconds, "profile": prof}
+
+    def table(self) -> str:
+        """Recorded spans as an indented text table, in start order."""
+        return format_span_table(self.records)
+
+
+def _depths(records: List[Dict[str, Any]]) -> Dict[str, int]:
+    parents = {r["span_id"]: r.get("parent_span_id") for r in records}
+    depths = {}
+    for sid in parents:
+        depth, cur, seen = 0, parents[sid], set()
+        while cur in parents and cur not in seen:
+            seen.add(cur)
+            depth += 1
+            cur = parents[cur]
+        depths[sid] = depth
+    return depths
+
+
+def _mb(value) -> str:
+    return "" if value is None else f"{value / (1 << 20):.1f}"
+
+
+def format_span_table(records: List[Dict[str, Any]]) -> str:
+    depths = _depths(records)
+    rows = [("stage", "wall ms", "thread cpu ms", "alloc MB", "peak MB")]
+    for r in sorted(records, key=lambda r: r.get("start_ns", 0)):
+        rows.append((
+            "  " * depths.get(r["span_id"], 0) + str(r.get("name")),
+            f"{r.get('duration_ms', 0):.1f}",
+            f"{r.get('thread_cpu_ms', 0):.1f}",
+            _mb(r.get("mem_alloc_bytes")),
+            _mb(r.get("mem_peak_bytes")),
+        ))
+    widths = [max(len(row[i]) for row in rows) for i in range(len(rows[0]))]
+    lines = []
+    for j, row in enumerate(rows):
+        cells = [row[0].ljust(widths[0])] + [c.rjust(w) for c, w in zip(row[1:], widths[1:])]
+        lines.append("  ".join(cells).rstrip())
+        if j == 0:
+            lines.append("-" * len(lines[0]))
+    return "\n".join(lines)
@@ -0,0 +1,167 @@
+import json
+import os
+import queue
+import threading
+from typing import Any, Iterable, List, Optional
+
+FORMATS = ("json", "jsonl")
+# most items the background thread encodes in one json.dumps call
+BATCH_SIZE = 1024
+
+_DONE = object()
+
+
+def report_filename(stem: str, fmt: str = "json") -> str:
+    """``insights`` -> ``insights.json`` / ``insights.jsonl``."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown report format {fmt!r}; expected one of {FORMATS}")
+    return f"{stem}.{fmt}"
+
+
+class ReportWriter:
+    """Streams the items of one report list to disk on a background thread.
+
+    ``fmt="json"`` writes ``{"<key>": [item, ...]}``; with the default pretty
+    encoding the bytes equal ``json.dump(obj, f, indent=2)``, with
+    ``compact=True`` no whitespace is emitted. ``fmt="jsonl"`` writes one
+    compact item per line and no wrapper object.
+
+    Items are encoded and written as they arrive, so neither the full list
+    nor its JSON text has to be held by the writer. Output goes to a temp
+    file next to ``path`` that replaces ``path`` atomically on ``close()``;
+    ``abort()`` (or an exception inside a ``with`` block) discards it.
+    """
+
+    def __init__(self, path: str, key: str, fmt: str = "json", compact: bool = False, background: bool = True):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown report format {fmt!r}; expected one of {FORMATS}")
+        self.path = path
+        self.key = key
+        self.fmt = fmt
+        self.compact = compact
+        self.count = 0
+        d = os.path.dirname(path)
+        if d:
+            os.makedirs(d, exist_ok=True)
+        self._tmp = f"{path}.tmp{os.getpid()}.{threading.get_ident()}"
+        self._fh = open(self._tmp, "w", encoding="utf-8")
+        self._error: Optional[BaseException] = None
+        self._closed = False
+        self._queue = None
+        self._thread = None
+        self._write_header()
+        if background:
+            self._queue = queue.SimpleQueue()
+            self._thread = threading.Thread(target=self._loop, name="report-writer", daemon=True)
+            self._thread.start()
+
+    def _write_header(self):
+        if self.fmt == "json":
+            key = json.dumps(self.key)
+            self._fh.write("{" + key + ":[" if self.compact else "{\n  " + key + ": [")
+
+    def _encode(self, items: List[Any]) -> str:
+        if self.fmt == "jsonl":
+            return "".join(json.dumps(item, ensure_ascii=True, separators=(",", ":")) + "\n" for item in items)
+        if self.compact:
+            text = json.dumps(items, separators=(",", ":"))[1:-1]
+            return text if self.count == 0 else "," + text
+        # encode the batch as a list, then shift it to the depth json.dump(indent=2) gives the key's items
+        text = json.dumps(items, indent=2)[1:-2].replace("\n", "\n  ")
+        return text if self.count == 0 else "," + text
+
+    def _write(self, items: List[Any]):
+        self._fh.write(self._encode(items))
+        self.count += len(items)
+
+    def _loop(self):
+        while True:
+            batch = [self._queue.get()]
+            # drain whatever else is queued so one encode call covers many items
+            while len(batch) < BATCH_SIZE and batch[-1] is not _DONE:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            done = batch[-1] is _DONE
+            if done:
+                batch.pop()
+            if batch and self._error is None:
+                try:
+                    self._write(batch)
+                except BaseException as exc:  # surfaced by close()
+                    self._error = exc
+            if done:
+                return
+
+    def add(self, item: Any):
+        if self._queue is not None:
+            self._queue.put(item)
+        else:
+            self._write([item])
+
+    def extend(self, items: Iterable[Any]):
+        for item in items:
+            self.add(item)
+
+    def _finish_thread(self):
+        if self._thread is not None:
+            self._queue.put(_DONE)
+            self._thread.join()
+            self._thread = None
+
+    def close(self) -> str:
+        """Wait for pending items, finish the document and move it into place."""
+        if self._closed:
+            return self.path
+        self._finish_thread()
+        self._closed = True
+        if self._error is not None:
+            self._discard()
+            raise self._error
+        try:
+            if self.fmt == "json":
+                if self.compact:
+                    self._fh.write("]}")
+                else:
+                    self._fh.write("\n  ]\n}" if self.count else "]\n}")
+            self._fh.close()
+            os.replace(self._tmp, self.path)
+        except BaseException:
+            self._discard()
+            raise
+        return self.path
+
+    def abort(self):
+        """Drop everything written so far; ``path`` is left untouched."""
+        if self._closed:
+            return
+        self._finish_thread()
+        self._closed = True
+        self._discard()
+
+    def _discard(self):
+        try:
+            self._fh.close()
+        finally:
+            try:
+                os.unlink(self._tmp)
+            except FileNotFoundError:
+                pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
+
+
+def write_report(path: str, key: str, items: Iterable[Any], fmt: str = "json", compact: bool = False) -> str:
+    """Write ``{key: items}`` (or JSON Lines) atomically; returns ``path``."""
+    with ReportWriter(path, key, fmt=fmt, compact=compact) as w:
+        w.extend(items)
+    return path
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import pickle
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.utils.aggregates import SegmentAggregates
+from src.utils.logging_utils import log_event
+
+# bump when the stored aggregate layout or its computation changes
+STORE_VERSION = 3
+ALL_PARTITION = "__all__"
+
+
+def config_hash(cfg: Dict[str, Any]) -> str:
+    """Hash of the ``analysis`` config section (plus store version) used to key cached results."""
+    section = (cfg or {}).get("analysis", {}) or {}
+    blob = json.dumps({"v": STORE_VERSION, "analysis": section}, sort_keys=True, default=str)
+    return hashlib.sha1(blob.encode("utf-8")).hexdigest()[:16]
+
+
+def frame_hash(df: pd.DataFrame) -> str:
+    """Content hash of a frame's rows (column names included, index ignored)."""
+    h = hashlib.sha1()
+    h.update("\x1f".join(map(str, df.columns)).encode("utf-8"))
+    h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()[:16]
+
+
+def _safe(name: str) -> str:
+    return "".join(c if c.isalnum() or c in "-_." else "_" for c in str(name))
+
+
+class ResultStore:
+    """Persistent store of per-partition results under ``<root>/<config_hash>/``.
+
+    Entries are pickled objects addressed by (namespace, partition, content
+    hash). Writing a partition with a new content hash removes the entries for
+    its previous content, so the store holds at most one version per partition.
+    """
+
+    def __init__(self, root: str = ".cache/results", cfg_hash: str = ""):
+        self.root = Path(root) / (cfg_hash or "default")
+        self.hits = 0
+        self.misses = 0
+
+    def _path(self, namespace: str, partition: str, content: str) -> Path:
+        return self.root / _safe(namespace) / f"{_safe(partition)}__{content}.pkl"
+
+    def get(self, namespace: str, partition: str, content: str) -> Optional[Any]:
+        p = self._path(namespace, partition, content)
+        try:
+            with open(p, "rb") as fh:
+                value = pickle.load(fh)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return value
+
+    def contains(self, namespace: str, partition: str, content: str) -> bool:
+        return self._path(namespace, partition, content).exists()
+
+    def put(self, namespace: str, partition: str, content: str, value: Any) -> None:
+        p = self._path(namespace, partition, content)
+        p.parent.mkdir(parents=True, exist_ok=True)
+        for stale in p.parent.glob(f"{_safe(partition)}__*.pkl"):
+            if stale != p:
+                stale.unlink(missing_ok=True)
+        tmp = p.with_suffix(f".tmp{os.getpid()}")
+        with open(tmp, "wb") as fh:
+            pickle.dump(value, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, p)
+
+    def reset_stats(self) -> Dict[str, int]:
+        stats = {"hits": self.hits, "misses": self.misses}
+        self.hits = self.misses = 0
+        return stats
+
+
+def partitions(df: pd.DataFrame, column: str = "date") -> Iterable[Tuple[str, pd.DataFrame]]:
+    """Split ``df`` into (partition value, rows) pairs; one ``__all__`` partition if ``column`` is absent."""
+    if column not in df.columns:
+        yield ALL_PARTITION, df
+        return
+    codes, uniques = pd.factorize(df[column].astype(str))
+    order = np.argsort(codes, kind="stable")
+    bounds = np.concatenate(([0], np.cumsum(np.bincount(codes, minlength=len(uniques)))))
+    for i, value in enumerate(uniques.tolist()):
+        yield value, df.iloc[order[bounds[i]:bounds[i + 1]]]
+
+
+def incremental_aggregates(
+    df: pd.DataFrame,
+    store: ResultStore,
+    dims: Sequence[str] = ("campaign_name",),
+    partition_column: str = "date",
+    validate=None,
+    label: Optional[Callable[[str, Any], Any]] = None,
+    trace_id: str = None,
+    parent_span_id: str = None,
+) -> SegmentAggregates:
+    """Merge cached per-partition aggregates, computing only new or changed partitions.
+
+    ``df`` is the raw (unvalidated) frame; ``validate`` is applied to each
+    missed partition before aggregation, so warm partitions skip validation too.
+    Cached partitions keep the labels they were computed with; ``label``
+    (e.g. ``DimensionDictionary.label``) maps them onto this run's labels.
+    """
+    namespace = "aggregates_" + "-".join(dims)
+    total = SegmentAggregates(dims=dims)
+    store.reset_stats()
+    recomputed = 0
+    for value, part in partitions(df, partition_column):
+        content = frame_hash(part)
+        aggs = store.get(namespace, value, content)
+        if aggs is None:
+            rows = part.copy()
+            if validate is not None:
+                rows = validate(rows)
+            aggs = SegmentAggregates.from_frame(rows, dims=dims)
+            store.put(namespace, value, content, aggs)
+            recomputed += len(part)
+        elif label is not None:
+            aggs = aggs.relabel(label)
+        total.merge(aggs)
+    stats = store.reset_stats()
+    log_event(
+        "cache.summary",
+        {"stage": "validate+aggregate", "partitions": stats["hits"] + stats["misses"], **stats,
+         "rows_recomputed": recomputed, "rows_total": len(df)},
+        trace_id=trace_id,
+        parent_span_id=parent_span_id,
+        agent="ResultStore",
+    )
+    return total
@@ -0,0 +1,290 @@
+"""Declarative segment rules compiled to vectorized boolean masks.
+
+Rules live in the ``rules`` section of ``config/config.yaml``. Each one is
+``{"name": ..., "when": <condition>}``; creative rules also carry
+``templates``. A condition is a small Python-like expression over the
+columns of a metrics table (one NumPy array per metric, one entry per
+segment) and the numeric ``analysis`` thresholds:
+
+    mean_ctr < low_ctr_threshold and impressions >= min_impressions
+    comment == 'creative_fatigue'
+    mean_roas < roas_threshold            # NaN (no spend) never matches
+
+Supported are ``and``/``or``/``not``, comparisons (also chained),
+``+ - * /``, unary minus, numbers, strings, ``True``/``False``,
+``x is None``/``x is not None`` (a NaN test) and ``abs()``. Each condition
+is parsed once into a function that returns a mask for every segment at
+once. Classification is then one ``argmax`` over the stacked masks, so
+more rules or more segments never add Python-level loops.
+"""
+import ast
+import json
+import string
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# comment rules: the first matching rule names the segment, else "ok"
+COMMENT_RULES = [
+    {"name": "low_clicks", "when": "impressions > 0 and clicks < min_clicks"},
+    {"name": "low_ctr", "when": "mean_ctr < low_ctr_threshold and impressions >= min_impressions"},
+    {"name": "small_sample", "when": "impressions < min_impressions"},
+]
+
+# creative rules: every matching rule adds its templates, formatted with the segment's fields
+CREATIVE_RULES = [
+    {"name": "weak_hook", "when": "comment == 'low_ctr'", "templates": [
+        "Improve initial hook for **{campaign}**. CTR={mean_ctr:.4f}. Use bolder product visuals, clearer contrast "
+        "background, and a tighter 1-line benefit message.",
+        "Test a short motion-first variant for **{campaign}**. High impressions ({total_impressions}) but weak CTR "
+        "points to a weak hook.",
+    ]},
+    {"name": "creative_fatigue", "when": "comment == 'creative_fatigue'", "templates": [
+        "Creative fatigue on **{series}**: CTR fell {ctr_drop:.0%} week over week ({ctr_previous:.4f} -> "
+        "{ctr_current:.4f}, p={ctr_p_value:.3f}). Rotate in a fresh concept and cap frequency for this audience.",
+    ]},
+    {"name": "improving_trend", "when": "comment == 'improving_trend'", "templates": [
+        "CTR on **{series}** rose {ctr_change:.0%} week over week ({ctr_previous:.4f} -> {ctr_current:.4f}). "
+        "Shift budget towards it and brief variants on the same angle.",
+    ]},
+    {"name": "low_clicks", "when": "comment == 'low_clicks'", "templates": [
+        "Clicks are extremely low on **{campaign}**. Add a stronger CTA ('Swipe for comfort'), simplify visual "
+        "clutter, and highlight a single product benefit.",
+    ]},
+    {"name": "weak_roas", "when": "mean_roas < roas_threshold", "templates": [
+        "ROAS is weak ({mean_roas:.2f}) for **{campaign}**. Try value-focused creatives — price reveal, limited "
+        "time drop style, or bundle messaging.",
+    ]},
+    {"name": "copy_winner",
+     "when": "(comment == 'low_ctr' or comment == 'creative_fatigue') and best_phrase_lift > 0",
+     "templates": [
+         "Lead the next **{campaign}** variant with \"{best_phrase}\": copy using it runs {best_phrase_lift:+.0%} "
+         "CTR against other copy across the account.",
+     ]},
+    {"name": "copy_loser",
+     "when": "(comment == 'low_ctr' or comment == 'creative_fatigue') and worst_phrase_lift < 0",
+     "templates": [
+         "Drop \"{worst_phrase}\" from **{campaign}** copy: it runs {worst_phrase_lift:+.0%} CTR against other "
+         "copy across the account.",
+     ]},
+]
+
+# analysis settings that conditions may use by name
+THRESHOLDS = {"low_ctr_threshold": 0.01, "min_impressions": 1000, "roas_threshold": 1.0, "min_clicks": 10}
+
+_COMPARE = {
+    ast.Lt: np.less, ast.LtE: np.less_equal, ast.Gt: np.greater, ast.GtE: np.greater_equal,
+    ast.Eq: np.equal, ast.NotEq: np.not_equal,
+}
+_ARITH = {ast.Add: np.add, ast.Sub: np.subtract, ast.Mult: np.multiply, ast.Div: np.divide}
+
+Table = Dict[str, np.ndarray]
+
+
+def _isnan(value) -> np.ndarray:
+    arr = np.asarray(value)
+    if arr.dtype.kind not in "fc":
+        return np.zeros(arr.shape, dtype=bool) if arr.dtype != object else np.array([v is None for v in arr.ravel()])
+    return np.isnan(arr)
+
+
+def _compile(node: ast.AST, params: Dict[str, Any], expr: str,
+             names: Optional[set] = None) -> Callable[[Table], Any]:
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float, str, bool)):
+        value = node.value
+        return lambda t: value
+    if isinstance(node, ast.Name):
+        name = node.id
+        if names is not None and name not in params:
+            names.add(name)
+        if name in params:
+            value = params[name]
+            return lambda t: value
+
+        def column(t):
+            try:
+                return t[name]
+            except KeyError:
+                raise ValueError(f"unknown name {name!r} in rule condition {expr!r}") from None
+        return column
+    if isinstance(node, ast.BoolOp):
+        parts = [_compile(v, params, expr, names) for v in node.values]
+        combine = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        return lambda t: combine.reduce([np.asarray(p(t), dtype=bool) for p in parts])
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.Not):
+        inner = _compile(node.operand, params, expr, names)
+        return lambda t: np.logical_not(inner(t))
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, ast.USub):
+        inner = _compile(node.operand, params, expr, names)
+        return lambda t: np.negative(inner(t))
+    if isinstance(node, ast.BinOp) and type(node.op) in _ARITH:
+        op = _ARITH[type(node.op)]
+        left, right = _compile(node.left, params, expr, names), _compile(node.right, params, expr, names)
+        return lambda t: op(left(t), right(t))
+    if isinstance(node, ast.Compare):
+        operands = [_compile(node.left, params, expr, names)]
+        ops = []
+        for op, comparator in zip(node.ops, node.comparators):
+            if isinstance(op, (ast.Is, ast.IsNot)):
+                if not (isinstance(comparator, ast.Constant) and comparator.value is None):
+                    raise ValueError(f"only 'is None' / 'is not None' are supported in {expr!r}")
+                ops.append(op)
+                operands.append(None)
+            elif type(op) in _COMPARE:
+                ops.append(_COMPARE[type(op)])
+                operands.append(_compile(comparator, params, expr, names))
+            else:
+                raise ValueError(f"unsupported comparison in rule condition {expr!r}")
+
+        def compare(t):
+            left = operands[0](t)
+            out = None
+            for op, right_fn in zip(ops, operands[1:]):
+                if isinstance(op, (ast.Is, ast.IsNot)):
+                    res = _isnan(left) if isinstance(op, ast.Is) else np.logical_not(_isnan(left))
+                    right = left
+                else:
+                    right = right_fn(t)
+                    res = op(left, right)
+                out = res if out is None else np.logical_and(out, res)
+                left = right
+            return out
+        return compare
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == "abs" \
+            and len(node.args) == 1 and not node.keywords:
+        inner = _compile(node.args[0], params, expr, names)
+        return lambda t: np.abs(inner(t))
+    raise ValueError(f"unsupported expression {ast.dump(node)} in rule condition {expr!r}")
+
+
+def compile_condition(expr: str, params: Optional[Dict[str, Any]] = None,
+                      columns: Optional[set] = None) -> Callable[[Table, int], np.ndarray]:
+    """``mask(table, n)`` for a condition string; raises ``ValueError`` on syntax it does not support.
+
+    The table columns the condition reads are added to ``columns`` when given.
+    """
+    try:
+        tree = ast.parse(str(expr), mode="eval")
+    except SyntaxError as exc:
+        raise ValueError(f"invalid rule condition {expr!r}: {exc.msg}") from None
+    fn = _compile(tree.body, params or {}, expr, columns)
+
+    def mask(table: Table, n: int) -> np.ndarray:
+        with np.errstate(invalid="ignore", divide="ignore"):
+            out = np.asarray(fn(table), dtype=bool)
+        return np.broadcast_to(out, (n,))
+    return mask
+
+
+def table_length(table: Table) -> int:
+    for values in table.values():
+        return len(values)
+    return 0
+
+
+class RuleSet:
+    """Named conditions evaluated together over a metrics table."""
+
+    def __init__(self, rules: Sequence[Dict[str, Any]], params: Optional[Dict[str, Any]] = None,
+                 default: Optional[str] = "ok"):
+        self.rules = [dict(r) for r in rules]
+        for i, r in enumerate(self.rules):
+            if not r.get("name"):
+                raise ValueError(f"rule #{i} has no name")
+            if "when" not in r:
+                raise ValueError(f"rule {r['name']!r} has no 'when' condition")
+        self.names = [r["name"] for r in self.rules]
+        self.params = dict(params or {})
+        self.default = default
+        # table columns the conditions read, so callers can build only those
+        self.columns: set = set()
+        self._conditions = [compile_condition(r["when"], self.params, self.columns) for r in self.rules]
+        self._labels = np.array(self.names + [default if default is not None else ""], dtype=object)
+
+    def masks(self, table: Table) -> np.ndarray:
+        """Boolean matrix: one row per rule, one column per segment."""
+        n = table_length(table)
+        out = np.zeros((len(self.rules), n), dtype=bool)
+        for i, cond in enumerate(self._conditions):
+            out[i] = cond(table, n)
+        return out
+
+    def classify(self, table: Table) -> np.ndarray:
+        """Name of the first matching rule per segment (``default`` where none match)."""
+        masks = self.masks(table)
+        if not len(self.rules):
+            return np.full(table_length(table), self.default, dtype=object)
+        first = np.where(masks.any(axis=0), masks.argmax(axis=0), len(self.rules))
+        return self._labels[first]
+
+    def matches(self, table: Table) -> List[Tuple[int, List[int]]]:
+        """``(segment index, matching rule indices in rule order)`` for every segment with any match."""
+        masks = self.masks(table)
+        if len(self.rules) > 62:
+            rows, rules = np.nonzero(masks.T)
+            out: Dict[int, List[int]] = {}
+            for row, rule in zip(rows.tolist(), rules.tolist()):
+                out.setdefault(row, []).append(rule)
+            return list(out.items())
+        # each segment's match pattern as a bitmask; the rule lists are built once per distinct pattern
+        codes = (masks.astype(np.int64) << np.arange(len(self.rules), dtype=np.int64)[:, None]).sum(axis=0)
+        rows = np.flatnonzero(codes)
+        codes = codes[rows]
+        patterns = {c: [r for r in range(len(self.rules)) if c >> r & 1] for c in np.unique(codes).tolist()}
+        return [(row, patterns[c]) for row, c in zip(rows.tolist(), codes.tolist())]
+
+
+def compile_template(template: str) -> Tuple[str, List[str]]:
+    """A ``str.format`` template with named fields as ``(positional template, field names)``.
+
+    ``"CTR={mean_ctr:.4f}"`` becomes ``("CTR={0:.4f}", ["mean_ctr"])``, so
+    callers can format many rows with ``text.format(*values)``. Only plain
+    field names are allowed; raises ``ValueError`` otherwise.
+    """
+    out, fields = [], []
+    for literal, field, spec, conversion in string.Formatter().parse(template):
+        out.append(literal.replace("{", "{{").replace("}", "}}"))
+        if field is None:
+            continue
+        if not field.isidentifier():
+            raise ValueError(f"template field {field!r} must be a plain name in {template!r}")
+        if spec and "{" in spec:
+            raise ValueError(f"nested format specs are not supported in {template!r}")
+        conversion = f"!{conversion}" if conversion else ""
+        out.append("{" + str(len(fields)) + conversion + (f":{spec}" if spec else "") + "}")
+        fields.append(field)
+    return "".join(out), fields
+
+
+def thresholds(cfg: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Numeric ``analysis`` settings of ``cfg`` (defaults for the documented thresholds)."""
+    analysis = (cfg or {}).get("analysis", {}) or {}
+    params = dict(THRESHOLDS)
+    params.update({k: v for k, v in analysis.items() if isinstance(v, (int, float)) and not isinstance(v, bool)})
+    return params
+
+
+@lru_cache(maxsize=32)
+def _ruleset(spec: str, default: Optional[str]) -> RuleSet:
+    rules, params = json.loads(spec)
+    return RuleSet(rules, params, default=default)
+
+
+def _from_config(cfg, section: str, builtin, default) -> RuleSet:
+    if cfg is None:
+        from src.utils.config_utils import load_config
+        cfg = load_config()
+    rules = ((cfg.get("rules") or {}).get(section)) or builtin
+    # compiled once per distinct rules + thresholds
+    return _ruleset(json.dumps([rules, thresholds(cfg)], sort_keys=True), default)
+
+
+def comment_rules(cfg: Optional[Dict[str, Any]] = None) -> RuleSet:
+    """Comment rules of ``cfg`` (``load_config()`` when None), compiled."""
+    return _from_config(cfg, "comments", COMMENT_RULES, "ok")
+
+
+def creative_rules(cfg: Optional[Dict[str, Any]] = None) -> RuleSet:
+    """Creative rules of ``cfg`` (``load_config()`` when None), compiled."""
+    return _from_config(cfg, "creatives", CREATIVE_RULES, None)
@@ -0,0 +1,246 @@
+import math
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.utils.confidence import MOMENT_COLUMNS, row_moments
+from src.utils.dimensions import DIMENSIONS, DimensionDictionary
+
+
+METRIC_COLUMNS = ["impressions", "clicks", "spend", "revenue"]
+
+
+class SegmentIndex:
+    """Row-position index over the dimension columns of a dataset.
+
+    Each dimension column is dictionary-encoded once (``pd.factorize``) and
+    turned into postings: for every distinct value, the sorted row positions
+    holding it. A ``segment_filter`` is resolved by intersecting postings, and
+    metric totals are summed from contiguous NumPy arrays, so no DataFrame is
+    copied or rescanned per segment. Postings are built lazily on first use of
+    a column and reused for the lifetime of the index. Filters written
+    against raw spellings are resolved through ``dimensions``, the dictionary
+    that canonicalized the frame.
+    """
+
+    def __init__(self, df: pd.DataFrame, memoize: bool = True, dimensions: Optional[DimensionDictionary] = None):
+        self.df = df
+        self.dimensions = dimensions if dimensions is not None else DIMENSIONS
+        self.memoize = memoize
+        self.n_rows = len(df)
+        self.columns = set(df.columns)
+        self._codes: Dict[str, tuple] = {}
+        self._postings: Dict[str, Dict[Any, np.ndarray]] = {}
+        self._lookup: Dict[str, Dict[Any, int]] = {}
+        self._groupings: Dict[tuple, Tuple[np.ndarray, np.ndarray, np.ndarray, tuple]] = {}
+        self._metrics: Dict[str, Optional[np.ndarray]] = {}
+        self._cache: Dict[tuple, Dict[str, Any]] = {}
+        self._totals: Optional[Dict[str, Any]] = None
+        self._matrix: Optional[np.ndarray] = None
+
+    def codes(self, col: str) -> Tuple[np.ndarray, list]:
+        """Dictionary encoding of ``col``: per-row codes (-1 for missing) and the distinct values."""
+        if col not in self._codes:
+            codes, uniques = pd.factorize(self.df[col])
+            self._codes[col] = (codes, uniques.tolist())
+        return self._codes[col]
+
+    def _column_postings(self, col: str) -> Dict[Any, np.ndarray]:
+        postings = self._postings.get(col)
+        if postings is None:
+            codes, uniques = self.codes(col)
+            order = np.argsort(codes, kind="stable")
+            valid = codes[order] >= 0
+            order = order[valid]
+            counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+            bounds = np.concatenate(([0], np.cumsum(counts)))
+            postings = {
+                value: order[bounds[i]:bounds[i + 1]]
+                for i, value in enumerate(uniques)
+            }
+            self._postings[col] = postings
+        return postings
+
+    def warm(self, columns: List[str]) -> "SegmentIndex":
+        """Build postings and metric arrays up front (e.g. before serving queries)."""
+        for col in columns:
+            if col in self.columns:
+                self._column_postings(col)
+        self.matrix()
+        return self
+
+    def metric(self, col: str) -> Optional[np.ndarray]:
+        if col not in self._metrics:
+            if col in MOMENT_COLUMNS:
+                base = {c: self.metric(c) for c in METRIC_COLUMNS}
+                if any(v is None for v in base.values()):
+                    self._metrics.update(dict.fromkeys(MOMENT_COLUMNS))
+                else:
+                    self._metrics.update(row_moments({c: v.astype("float64") for c, v in base.items()}))
+            elif col not in self.columns:
+                self._metrics[col] = None
+            else:
+                values = self.df[col].to_numpy()
+                if values.dtype.kind == "f":
+                    # compact frames may hold float32; totals are always summed in float64
+                    values = np.where(np.isnan(values), 0.0, values).astype("float64", copy=False)
+                elif values.dtype.kind not in "iub":
+                    values = pd.to_numeric(self.df[col], errors="coerce").fillna(0).to_numpy()
+                self._metrics[col] = values
+        return self._metrics[col]
+
+    def matrix(self) -> np.ndarray:
+        """``METRIC_COLUMNS + MOMENT_COLUMNS`` as rows of one float64 array (zeros where absent).
+
+        One ``take(rows, axis=1)`` gathers every total of a segment; the
+        result is C-ordered, so each row sums pairwise exactly like
+        the column on its own.
+        """
+        if self._matrix is None:
+            cols = METRIC_COLUMNS + MOMENT_COLUMNS
+            m = np.zeros((len(cols), self.n_rows), dtype="float64")
+            for i, col in enumerate(cols):
+                values = self.metric(col)
+                if values is not None:
+                    m[i] = values
+            self._matrix = m
+        return self._matrix
+
+    def missing_columns(self, segment_filter: Dict[str, Any]) -> List[str]:
+        return [c for c in segment_filter.keys() if c not in self.columns]
+
+    def positions(self, segment_filter: Dict[str, Any]) -> np.ndarray:
+        """Sorted row positions matching every ``column == value`` pair."""
+        lists = []
+        for col, value in segment_filter.items():
+            try:
+                postings = self._column_postings(col)
+                rows = postings.get(value)
+                if rows is None:
+                    # filters written against raw spellings still hit canonicalized columns
+                    canon = self.dimensions.canonical(col, value)
+                    rows = postings.get(canon) if canon is not None else None
+            except TypeError:
+                rows = None
+            if rows is None or len(rows) == 0:
+                return np.empty(0, dtype=np.intp)
+            lists.append(rows)
+        lists.sort(key=len)
+        rows = lists[0]
+        for other in lists[1:]:
+            rows = np.intersect1d(rows, other, assume_unique=True)
+            if len(rows) == 0:
+                break
+        return rows
+
+    def _code(self, col: str, value: Any) -> Optional[int]:
+        """Code of ``value`` in ``col`` (canonical spellings resolved as in ``positions``), None if absent."""
+        lookup = self._lookup.get(col)
+        if lookup is None:
+            lookup = self._lookup[col] = {v: i for i, v in enumerate(self.codes(col)[1])}
+        try:
+            code = lookup.get(value)
+            if code is None:
+                canon = self.dimensions.canonical(col, value)
+                code = lookup.get(canon) if canon is not None else None
+        except TypeError:
+            code = None
+        return code
+
+    def _grouping(self, cols: tuple) -> Optional[Tuple[np.ndarray, np.ndarray, np.ndarray, tuple]]:
+        """Rows grouped by their combined code over ``cols``: positions, group codes, run bounds and code shape.
+
+        None if the combined codes would not fit in int64.
+        """
+        if cols not in self._groupings:
+            encoded = [self.codes(c) for c in cols]
+            shape = tuple(max(len(uniques), 1) for _, uniques in encoded)
+            if math.prod(shape) >= 2 ** 63:
+                return None
+            codes = np.stack([c for c, _ in encoded])
+            rows = np.flatnonzero((codes >= 0).all(axis=0))
+            combined = np.ravel_multi_index(codes[:, rows], shape)
+            # stable, so every group lists its rows in ascending order, as intersected postings do
+            order = np.argsort(combined, kind="stable")
+            keys, starts = np.unique(combined[order], return_index=True)
+            self._groupings[cols] = (rows[order], keys, np.append(starts, len(rows)), shape)
+        return self._groupings[cols]
+
+    def aggregate_many(self, segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """``aggregate`` of every segment (all columns must exist), in order.
+
+        Segments filtering the same columns are resolved together: the rows'
+        codes are combined with ``np.ravel_multi_index`` and sorted once, and
+        all the segments' combined codes are looked up with one
+        ``searchsorted``, so each segment's rows are a contiguous run and no
+        postings are intersected. Each run is still summed on its own: one
+        ``np.add.reduceat`` over all runs would add sequentially rather than
+        pairwise and change the low bits of the float totals.
+        """
+        keys = METRIC_COLUMNS + MOMENT_COLUMNS
+        out: List[Optional[Dict[str, Any]]] = [None] * len(segments)
+        todo: Dict[tuple, List[Tuple[int, List[int]]]] = {}
+        for i, seg in enumerate(segments):
+            cols = tuple(sorted(seg))
+            codes = [self._code(col, seg[col]) for col in cols]
+            if not seg or None in codes:
+                out[i] = {"sample_size": 0, **dict.fromkeys(keys, 0)}
+            else:
+                todo.setdefault(cols, []).append((i, codes))
+
+        m = self.matrix()
+        for cols, items in todo.items():
+            grouping = self._grouping(cols)
+            if grouping is None:
+                for i, _ in items:
+                    out[i] = self.aggregate(segments[i])
+                continue
+            rows, groups, starts, shape = grouping
+            wanted = np.ravel_multi_index(np.array([codes for _, codes in items]).T, shape)
+            at = np.minimum(np.searchsorted(groups, wanted), max(len(groups) - 1, 0))
+            found = groups[at] == wanted if len(groups) else np.zeros(len(wanted), dtype=bool)
+            for (i, _), hit, g in zip(items, found.tolist(), at.tolist()):
+                if not hit:
+                    out[i] = {"sample_size": 0, **dict.fromkeys(keys, 0)}
+                    continue
+                run = rows[starts[g]:starts[g + 1]]
+                out[i] = {"sample_size": int(len(run)), **dict(zip(keys, m.take(run, axis=1).sum(axis=1).tolist()))}
+        return out
+
+    def totals(self) -> Dict[str, Any]:
+        """Metric totals over the whole dataset (the account baseline)."""
+        if self._totals is None:
+            totals: Dict[str, Any] = {"sample_size": self.n_rows}
+            for col in METRIC_COLUMNS + MOMENT_COLUMNS:
+                values = self.metric(col)
+                totals[col] = values.sum() if values is not None else 0
+            self._totals = totals
+        return self._totals
+
+    def aggregate(self, segment_filter: Dict[str, Any]) -> Dict[str, Any]:
+        """Row count and metric totals for ``segment_filter``.
+
+        Totals are summed over the matching rows in their original order, so
+        they are bit-identical to ``df[mask][col].sum()``.
+        """
+        key = None
+        if self.memoize:
+            try:
+                key = tuple(sorted(segment_filter.items()))
+                hash(key)
+            except TypeError:
+                key = None
+        if key is not None and key in self._cache:
+            return self._cache[key]
+
+        rows = self.positions(segment_filter)
+        agg: Dict[str, Any] = {"sample_size": int(len(rows))}
+        if len(rows):
+            agg.update(zip(METRIC_COLUMNS + MOMENT_COLUMNS, self.matrix().take(rows, axis=1).sum(axis=1).tolist()))
+        else:
+            agg.update(dict.fromkeys(METRIC_COLUMNS + MOMENT_COLUMNS, 0))
+
+        if key is not None:
+            self._cache[key] = agg
+        return agg
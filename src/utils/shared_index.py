@@ -0,0 +1,144 @@
+"""Segment aggregates for very many filters, computed by worker processes over shared memory.
+
+The metric matrix of a ``SegmentIndex`` and the dictionary codes of every
+dimension the filters use are copied once into ``multiprocessing.shared_memory``;
+workers attach to the blocks by name (zero-copy ``np.ndarray`` views), so the
+DataFrame is never pickled. Filter values are resolved to codes in the parent
+(including canonical spellings) and workers receive shards of code lists; each
+worker builds postings from the shared codes exactly as ``SegmentIndex`` does,
+so every total is summed over the same rows in the same order and is
+bit-identical to ``SegmentIndex.aggregate``.
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from src.utils.segment_index import METRIC_COLUMNS, SegmentIndex
+from src.utils.confidence import MOMENT_COLUMNS
+
+# (shared memory block name, shape, dtype) of one array
+Block = Tuple[str, Tuple[int, ...], str]
+
+# per worker process: attached blocks and postings built from them
+_ATTACHED: Dict[str, Tuple[shared_memory.SharedMemory, np.ndarray]] = {}
+_POSTINGS: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+
+
+def _attach(block: Block) -> np.ndarray:
+    name, shape, dtype = block
+    if name not in _ATTACHED:
+        shm = shared_memory.SharedMemory(name=name)
+        _ATTACHED[name] = (shm, np.ndarray(shape, dtype=dtype, buffer=shm.buf))
+    return _ATTACHED[name][1]
+
+
+def _postings(block: Block) -> Tuple[np.ndarray, np.ndarray]:
+    """Row positions sorted by code, and where each code's run starts (as in ``SegmentIndex``)."""
+    if block[0] not in _POSTINGS:
+        codes = _attach(block)
+        order = np.argsort(codes, kind="stable")
+        valid = codes[order] >= 0
+        counts = np.bincount(codes[codes >= 0], minlength=int(codes.max(initial=-1)) + 1)
+        _POSTINGS[block[0]] = (order[valid], np.concatenate(([0], np.cumsum(counts))))
+    return _POSTINGS[block[0]]
+
+
+def _aggregate_shard(matrix: Block, columns: Dict[str, Block], shard: List[Optional[List[Tuple[str, int]]]]):
+    """Worker: ``[sample_size, *totals]`` per filter of ``shard`` (a filter is a list of column/code pairs)."""
+    m = _attach(matrix)
+    out = []
+    for terms in shard:
+        lists = []
+        for col, code in terms or ():
+            order, bounds = _postings(columns[col])
+            lists.append(order[bounds[code]:bounds[code + 1]])
+        if terms is None or not lists:
+            out.append(None)
+            continue
+        lists.sort(key=len)
+        rows = lists[0]
+        for other in lists[1:]:
+            rows = np.intersect1d(rows, other, assume_unique=True)
+            if len(rows) == 0:
+                break
+        out.append([int(len(rows))] + (m.take(rows, axis=1).sum(axis=1).tolist() if len(rows) else []))
+    return out
+
+
+class SharedSegmentIndex:
+    """``aggregate_many`` over a ``SegmentIndex`` with the segments split across ``workers`` processes.
+
+    Use as a context manager; the shared memory blocks are released on exit.
+    """
+
+    def __init__(self, index: SegmentIndex, workers: Optional[int] = None, shard_size: int = 5000):
+        self.index = index
+        self.workers = workers or os.cpu_count() or 1
+        self.shard_size = max(1, int(shard_size))
+        self._blocks: List[shared_memory.SharedMemory] = []
+        self._columns: Dict[str, Block] = {}
+        self._lookup: Dict[str, Dict[Any, int]] = {}
+        self._matrix = self._share(index.matrix())
+
+    def _share(self, values: np.ndarray) -> Block:
+        shm = shared_memory.SharedMemory(create=True, size=max(values.nbytes, 1))
+        self._blocks.append(shm)
+        np.ndarray(values.shape, dtype=values.dtype, buffer=shm.buf)[...] = values
+        return shm.name, values.shape, values.dtype.str
+
+    def _code(self, col: str, value: Any) -> Optional[int]:
+        if col not in self._columns:
+            codes, uniques = self.index.codes(col)
+            self._columns[col] = self._share(np.ascontiguousarray(codes))
+            self._lookup[col] = {v: i for i, v in enumerate(uniques)}
+        lookup = self._lookup[col]
+        try:
+            code = lookup.get(value)
+            if code is None:
+                # filters written against raw spellings still hit canonicalized columns
+                canon = self.index.dimensions.canonical(col, value)
+                code = lookup.get(canon) if canon is not None else None
+        except TypeError:
+            code = None
+        return code
+
+    def _resolve(self, segment_filter: Dict[str, Any]) -> Optional[List[Tuple[str, int]]]:
+        terms = []
+        for col, value in segment_filter.items():
+            code = self._code(col, value)
+            if code is None:
+                return None
+            terms.append((col, code))
+        return terms
+
+    def aggregate_many(self, segments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """``SegmentIndex.aggregate`` of every segment (all columns must exist), in order."""
+        keys = METRIC_COLUMNS + MOMENT_COLUMNS
+        empty = {"sample_size": 0, **dict.fromkeys(keys, 0)}
+        resolved = [self._resolve(seg) for seg in segments]
+        shards = [resolved[a:a + self.shard_size] for a in range(0, len(resolved), self.shard_size)]
+        out: List[Dict[str, Any]] = []
+        with ProcessPoolExecutor(max_workers=min(self.workers, len(shards)) or 1) as pool:
+            for shard in pool.map(_aggregate_shard, [self._matrix] * len(shards), [self._columns] * len(shards),
+                                  shards):
+                for agg in shard:
+                    if not agg or agg[0] == 0:
+                        out.append(dict(empty))
+                    else:
+                        out.append({"sample_size": agg[0], **dict(zip(keys, agg[1:]))})
+        return out
+
+    def close(self):
+        for shm in self._blocks:
+            shm.close()
+            shm.unlink()
+        self._blocks = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
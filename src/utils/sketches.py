@@ -0,0 +1,199 @@
+"""Mergeable fixed-size sketches for approximate aggregation (see src/utils/approx_aggregates.py).
+
+- ``CountMinSketch``: weighted counts of keys, over-estimated by at most
+  ``error`` (e / width of the total weight) with probability 1 - e^-depth.
+- ``KLLSketch``: quantiles of a stream of floats within ``rank_error`` of
+  the true rank, in O(k) memory.
+- ``HyperLogLog``: number of distinct values within ``relative_error``
+  (one standard error), in 2^p bytes.
+
+Every sketch keeps plain numpy arrays, so it pickles (and travels between
+processes) as is; ``merge`` folds in a sketch built with the same
+parameters from another chunk or process. Keys are hashed with
+``hash64``, which gives the same 64-bit value for the same key in every
+process.
+"""
+import math
+from typing import Iterable, List
+
+import numpy as np
+import pandas as pd
+
+
+def hash64(values) -> np.ndarray:
+    """Deterministic 64-bit hash of each value (missing values hash to 2^64 - 1)."""
+    if isinstance(values, (pd.Series, pd.Index)):
+        return pd.util.hash_pandas_object(pd.Series(values), index=False).to_numpy()
+    return pd.util.hash_array(np.asarray(values, dtype=object))
+
+
+def _bit_length(x: np.ndarray) -> np.ndarray:
+    # exact for uint64: each 32-bit half converts to float64 without rounding
+    hi = (x >> np.uint64(32)).astype("float64")
+    lo = (x & np.uint64(0xFFFFFFFF)).astype("float64")
+    return np.where(hi > 0, 32 + np.frexp(hi)[1], np.frexp(lo)[1])
+
+
+class CountMinSketch:
+    """Weighted counts of 64-bit key hashes in a ``depth`` x ``width`` table."""
+
+    def __init__(self, width: int = 2048, depth: int = 5, seed: int = 0):
+        self.bits = max(1, int(math.ceil(math.log2(max(2, width)))))
+        self.width = 1 << self.bits
+        self.depth = max(1, int(depth))
+        self.seed = seed
+        rng = np.random.default_rng(seed)
+        # multiply-shift hashing: an odd multiplier and an offset per row
+        self._mul = (rng.integers(0, 1 << 62, self.depth, dtype=np.uint64) * np.uint64(2) + np.uint64(1))[:, None]
+        self._add = rng.integers(0, 1 << 62, self.depth, dtype=np.uint64)[:, None]
+        self.table = np.zeros((self.depth, self.width))
+        self.total = 0.0
+
+    def _columns(self, hashes: np.ndarray) -> np.ndarray:
+        h = np.asarray(hashes, dtype=np.uint64)[None, :]
+        return ((self._mul * h + self._add) >> np.uint64(64 - self.bits)).astype(np.intp)
+
+    def add(self, hashes: np.ndarray, weights: np.ndarray = None) -> "CountMinSketch":
+        if len(hashes) == 0:
+            return self
+        weights = np.ones(len(hashes)) if weights is None else np.asarray(weights, dtype="float64")
+        for row, cols in enumerate(self._columns(hashes)):
+            self.table[row] += np.bincount(cols, weights, minlength=self.width)
+        self.total += float(weights.sum())
+        return self
+
+    def estimate(self, hashes: np.ndarray) -> np.ndarray:
+        """Upper estimates of the weight of each key."""
+        if len(hashes) == 0:
+            return np.zeros(0)
+        cols = self._columns(hashes)
+        return self.table[np.arange(self.depth)[:, None], cols].min(axis=0)
+
+    @property
+    def error(self) -> float:
+        """Largest over-count of any estimate, with probability ``1 - e^-depth``."""
+        return math.e / self.width * self.total
+
+    def merge(self, other: "CountMinSketch") -> "CountMinSketch":
+        if (other.width, other.depth, other.seed) != (self.width, self.depth, self.seed):
+            raise ValueError("Cannot merge count-min sketches of different width, depth or seed")
+        self.table += other.table
+        self.total += other.total
+        return self
+
+
+class KLLSketch:
+    """Quantile sketch (Karnin, Lang & Liberty): sorted compactors whose items weigh 2^level.
+
+    A compactor over its capacity sorts its items and promotes every other
+    one (random offset) to the next level; capacities shrink by 2/3 per level
+    below the top, so the sketch holds about 3k items however long the stream.
+    """
+
+    def __init__(self, k: int = 200, seed: int = 0):
+        self.k = max(8, int(k))
+        self.n = 0
+        self.levels: List[np.ndarray] = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def _capacity(self, level: int) -> int:
+        return max(2, int(math.ceil(self.k * (2 / 3) ** (len(self.levels) - 1 - level))))
+
+    def update(self, values) -> "KLLSketch":
+        v = np.asarray(values, dtype="float64")
+        v = v[~np.isnan(v)]
+        if len(v):
+            self.levels[0] = np.concatenate((self.levels[0], v))
+            self.n += len(v)
+            self._compress()
+        return self
+
+    def _compress(self):
+        while True:
+            full = [h for h, items in enumerate(self.levels) if len(items) > self._capacity(h)]
+            if not full:
+                return
+            h = full[0]
+            if h + 1 == len(self.levels):
+                self.levels.append(np.empty(0))
+            items = np.sort(self.levels[h])
+            # an odd item out stays at this level; the pairs promote one of each
+            odd = len(items) % 2
+            self.levels[h] = items[:odd]
+            promoted = items[odd + int(self._rng.integers(2))::2]
+            self.levels[h + 1] = np.concatenate((self.levels[h + 1], promoted))
+
+    def merge(self, other: "KLLSketch") -> "KLLSketch":
+        if other.k != self.k:
+            raise ValueError("Cannot merge KLL sketches of different k")
+        while len(self.levels) < len(other.levels):
+            self.levels.append(np.empty(0))
+        for h, items in enumerate(other.levels):
+            self.levels[h] = np.concatenate((self.levels[h], items))
+        self.n += other.n
+        self._compress()
+        return self
+
+    def quantiles(self, qs: Iterable[float]) -> List[float]:
+        """Values at the given ranks (fractions of ``n``); None for an empty sketch."""
+        qs = list(qs)
+        if self.n == 0:
+            return [None] * len(qs)
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(v), float(1 << h)) for h, v in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        cum = np.cumsum(weights[order])
+        idx = np.searchsorted(cum, np.asarray(qs, dtype="float64") * cum[-1], side="left")
+        return items[order][np.minimum(idx, len(items) - 1)].tolist()
+
+    @property
+    def rank_error(self) -> float:
+        """Normalized rank error of a quantile (~99% confidence; the DataSketches fit 2.296 / k^0.9723)."""
+        if len(self.levels) == 1:
+            return 0.0  # nothing was compacted yet: the quantiles are exact
+        return 2.296 / self.k ** 0.9723
+
+
+class HyperLogLog:
+    """Distinct count of 64-bit hashes in 2^p one-byte registers."""
+
+    def __init__(self, p: int = 12):
+        if not 4 <= p <= 18:
+            raise ValueError(f"HyperLogLog precision must be within [4, 18], got {p!r}")
+        self.p = p
+        self.registers = np.zeros(1 << p, dtype=np.uint8)
+
+    def add(self, hashes: np.ndarray) -> "HyperLogLog":
+        h = np.asarray(hashes, dtype=np.uint64)
+        if len(h) == 0:
+            return self
+        idx = (h >> np.uint64(64 - self.p)).astype(np.intp)
+        rest = h & np.uint64((1 << (64 - self.p)) - 1)
+        rho = (64 - self.p) - _bit_length(rest) + 1
+        np.maximum.at(self.registers, idx, rho.astype(np.uint8))
+        return self
+
+    def update(self, values) -> "HyperLogLog":
+        """Add raw values, skipping missing ones."""
+        values = pd.Series(values) if not isinstance(values, pd.Series) else values
+        return self.add(hash64(values[values.notna()]))
+
+    def merge(self, other: "HyperLogLog") -> "HyperLogLog":
+        if other.p != self.p:
+            raise ValueError("Cannot merge HyperLogLog sketches of different precision")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def estimate(self) -> float:
+        m = float(len(self.registers))
+        raw = 0.7213 / (1 + 1.079 / m) * m * m / float(np.sum(np.exp2(-self.registers.astype("float64"))))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and zeros:
+            # small range: linear counting over the empty registers
+            return m * math.log(m / zeros)
+        return raw
+
+    @property
+    def relative_error(self) -> float:
+        """Standard error of ``estimate`` relative to the true count."""
+        return 1.04 / math.sqrt(len(self.registers))
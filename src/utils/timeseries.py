@@ -0,0 +1,311 @@
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.utils.confidence import DEFAULT_LEVEL, ctr_dispersion, two_sided_p
+
+DEFAULT_KEYS = ("campaign_name", "adset_name", "creative_type")
+METRICS = ("impressions", "clicks", "spend", "revenue")
+
+
+def _day_numbers(col: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """Days since the epoch for a date column, and a mask of rows with a valid date.
+
+    Only the distinct values are parsed, so a year of daily rows costs one
+    ``to_datetime`` over ~365 strings.
+    """
+    codes, uniques = pd.factorize(col)
+    parsed = pd.to_datetime(pd.Index(uniques), errors="coerce")
+    days = parsed.to_numpy().astype("datetime64[D]").astype(np.int64)
+    ok = ~np.asarray(parsed.isna())
+    valid = codes >= 0
+    valid[valid] = ok[codes[valid]]
+    out = np.zeros(len(codes), dtype=np.int64)
+    out[valid] = days[codes[valid]]
+    return out, valid
+
+
+def _codes(col: pd.Series, rows: np.ndarray) -> Tuple[np.ndarray, list]:
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        return col.cat.codes.to_numpy()[rows].astype(np.int64), col.cat.categories.tolist()
+    codes, uniques = pd.factorize(col.to_numpy()[rows])
+    return codes.astype(np.int64), uniques.tolist()
+
+
+def _range_sums(key: np.ndarray, cs: np.ndarray, base: np.ndarray, lo: int, hi: int) -> np.ndarray:
+    """Per-series sums over day offsets ``lo..hi`` (inclusive) from prefix sums ``cs``.
+
+    ``key`` is the sorted ``series * horizon + offset`` of the table and
+    ``cs`` has a leading zero column; ``base`` is ``series * horizon`` for the
+    series to report.
+    """
+    a = np.searchsorted(key, base + lo, side="left")
+    b = np.searchsorted(key, base + hi, side="right")
+    return cs[..., b] - cs[..., a]
+
+
+class TrendState:
+    """Daily per-series totals over a trailing horizon, for rolling-window trend detection.
+
+    A series is one combination of ``keys`` (campaign x adset x creative by
+    default). Rows folded in with ``update`` are summed per (series, day)
+    and only the last ``horizon`` days up to the newest date seen are kept,
+    so memory is bounded by series x horizon whatever the history length,
+    and appending a day costs work proportional to that, not to the history.
+
+    The table is kept sorted by ``series * horizon + day offset``; window
+    totals for every series at once are differences of prefix sums located
+    with ``searchsorted``, with no per-series loop.
+    """
+
+    def __init__(self, keys: Sequence[str] = DEFAULT_KEYS, date_column: str = "date",
+                 window_days: int = 7, slope_days: int = 28):
+        self.keys = tuple(keys)
+        self.date_column = date_column
+        self.window = max(1, int(window_days))
+        self.slope_days = max(2, int(slope_days))
+        self.horizon = max(2 * self.window, self.slope_days)
+        self.series: Dict[tuple, int] = {}
+        self.labels: List[tuple] = []
+        self.as_of: Optional[int] = None
+        self.sid = np.empty(0, dtype=np.int64)
+        self.day = np.empty(0, dtype=np.int64)
+        self.values = np.zeros((len(METRICS), 0))
+
+    @property
+    def as_of_date(self) -> Optional[str]:
+        return str(np.datetime64(self.as_of, "D")) if self.as_of is not None else None
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, **kwargs) -> "TrendState":
+        return cls(**kwargs).update(df)
+
+    def _series_ids(self, df: pd.DataFrame, rows: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        combined = None
+        parts = []
+        for k in self.keys:
+            codes, uniques = _codes(df[k], rows)
+            parts.append((codes, uniques))
+            radix = max(1, len(uniques))
+            combined = codes if combined is None else combined * radix + codes
+        missing = np.zeros(len(rows), dtype=bool)
+        for codes, _ in parts:
+            missing |= codes < 0
+        local, firsts, inverse = np.unique(np.where(missing, -1, combined), return_index=True, return_inverse=True)
+        # map each distinct local key to a stable id across updates
+        columns = [np.asarray(uniques, dtype=object)[np.maximum(codes[firsts], 0)].tolist() for codes, uniques in parts]
+        get = self.series.get
+        ids = []
+        for label, miss in zip(zip(*columns), missing[firsts].tolist()):
+            sid = -1 if miss else get(label)
+            if sid is None:
+                sid = self.series[label] = len(self.labels)
+                self.labels.append(label)
+            ids.append(sid)
+        out = np.asarray(ids, dtype=np.int64)[inverse]
+        return out, out >= 0
+
+    def recent(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Rows of ``df`` that can still affect the state: the last ``horizon`` days up to its newest date.
+
+        Lets callers validate/clean only those rows before ``update``.
+        """
+        if df.empty or self.date_column not in df.columns:
+            return df
+        day, valid = _day_numbers(df[self.date_column])
+        if not valid.any():
+            return df.iloc[:0]
+        newest = int(day[valid].max())
+        as_of = newest if self.as_of is None else max(self.as_of, newest)
+        return df[valid & (day > as_of - self.horizon)]
+
+    def update(self, df: pd.DataFrame) -> "TrendState":
+        """Fold raw rows (any dates, any order) into the state."""
+        if df is None or df.empty or self.date_column not in df.columns \
+                or any(k not in df.columns for k in self.keys):
+            return self
+        day, valid = _day_numbers(df[self.date_column])
+        if not valid.any():
+            return self
+        newest = int(day[valid].max())
+        as_of = newest if self.as_of is None else max(self.as_of, newest)
+        rows = np.flatnonzero(valid & (day > as_of - self.horizon))
+
+        sid, ok = self._series_ids(df, rows)
+        rows, sid = rows[ok], sid[ok]
+        values = np.zeros((len(METRICS), len(rows)))
+        for i, m in enumerate(METRICS):
+            if m in df.columns:
+                v = pd.to_numeric(df[m], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)[rows]
+                values[i] = np.where(np.isnan(v), 0.0, v)
+        self._fold(sid, day[rows], values, as_of)
+        return self
+
+    def merge(self, other: "TrendState") -> "TrendState":
+        """Fold another state (same keys and windows) into this one."""
+        if (other.keys, other.window, other.slope_days) != (self.keys, self.window, self.slope_days):
+            raise ValueError("Cannot merge trend states with different keys or windows")
+        if other.as_of is None:
+            return self
+        remap = np.array([self.series.get(lbl, -1) for lbl in other.labels], dtype=np.int64)
+        for j in np.flatnonzero(remap < 0).tolist():
+            remap[j] = self.series[other.labels[j]] = len(self.labels)
+            self.labels.append(other.labels[j])
+        as_of = other.as_of if self.as_of is None else max(self.as_of, other.as_of)
+        self._fold(remap[other.sid] if len(other.sid) else other.sid, other.day, other.values, as_of)
+        return self
+
+    def _fold(self, sid: np.ndarray, day: np.ndarray, values: np.ndarray, as_of: int):
+        start = as_of - self.horizon + 1
+        H = self.horizon
+        keep = self.day >= start
+        old_key = (self.sid * H + (self.day - start))[keep]
+        new_keep = day >= start
+        new_key = (sid * H + (day - start))[new_keep]
+        order = np.argsort(new_key, kind="stable")
+        # two sorted runs: the stable sort merges them in linear time
+        key = np.concatenate((old_key, new_key[order]))
+        values = np.concatenate((self.values[:, keep], values[:, new_keep][:, order]), axis=1)
+        order = np.argsort(key, kind="stable")
+        key, values = key[order], values[:, order]
+        if len(key):
+            starts = np.flatnonzero(np.concatenate(([True], key[1:] != key[:-1])))
+            key, values = key[starts], np.add.reduceat(values, starts, axis=1)
+        self.sid = key // H
+        self.day = key % H + start
+        self.values = values
+        self.as_of = as_of
+
+    # --- analysis -----------------------------------------------------------
+
+    def _table(self):
+        start = self.as_of - self.horizon + 1
+        key = self.sid * self.horizon + (self.day - start)
+        return key, self.day - start
+
+    def rolling(self, window_days: Optional[int] = None) -> pd.DataFrame:
+        """Trailing-window CTR/ROAS per (series, day) for the days whose whole window is retained.
+
+        Those are the last ``horizon - window_days + 1`` days; earlier rows
+        may already have lost part of their window to pruning.
+        """
+        w = window_days or self.window
+        cols = {k: [] for k in self.keys}
+        if self.as_of is None:
+            return pd.DataFrame({**cols, "date": [], "ctr": [], "roas": []})
+        key, offset = self._table()
+        cs = np.zeros((len(METRICS), len(key) + 1))
+        np.cumsum(self.values, axis=1, out=cs[:, 1:])
+        lo = np.searchsorted(key, self.sid * self.horizon + np.maximum(offset - w + 1, 0), side="left")
+        sums = cs[:, 1:] - cs[:, lo]
+        full = offset >= w - 1
+        imp, clk, spend, rev = sums[:, full]
+        key = key[full]
+        ctr = np.full(len(key), np.nan)
+        np.divide(clk, imp, out=ctr, where=imp > 0)
+        roas = np.full(len(key), np.nan)
+        np.divide(rev, spend, out=roas, where=spend > 0)
+        labels = [self.labels[s] for s in self.sid[full].tolist()]
+        out = pd.DataFrame(labels, columns=list(self.keys)) if labels else pd.DataFrame(cols)
+        out["date"] = self.day[full].astype("datetime64[D]")
+        out["ctr"] = ctr
+        out["roas"] = roas
+        return out
+
+    def trends(self) -> Dict[str, np.ndarray]:
+        """Window totals, week-over-week changes and CTR decay slope per series, as arrays.
+
+        ``series`` indexes ``labels``. The current window is the last
+        ``window_days`` up to ``as_of``, the previous one the ``window_days``
+        before it; ``ctr_slope`` is the least-squares slope of daily CTR over
+        the last ``slope_days``, relative to its mean (per day).
+        ``ctr_p_value`` tests current vs previous CTR (two-proportion z-test
+        with the days' overdispersion).
+        """
+        if self.as_of is None or not len(self.sid):
+            return {"series": np.empty(0, dtype=np.int64)}
+        key, offset = self._table()
+        H, w = self.horizon, self.window
+        imp, clk = self.values[0], self.values[1]
+        has = imp > 0
+        y = np.zeros(len(key))
+        np.divide(clk, imp, out=y, where=has)
+        t = offset.astype("float64")
+        c2m = np.zeros(len(key))
+        np.divide(clk * clk, imp, out=c2m, where=has)
+        stacked = np.vstack((self.values, has, has * t, has * t * t, y, y * t, c2m))
+        cs = np.zeros((len(stacked), len(key) + 1))
+        np.cumsum(stacked, axis=1, out=cs[:, 1:])
+
+        series = np.unique(self.sid)
+        base = series * H
+        cur = _range_sums(key, cs[:4], base, H - w, H - 1)
+        prev = _range_sums(key, cs[:4], base, H - 2 * w, H - w - 1)
+        n, st, stt, sy, sty, _ = _range_sums(key, cs[4:10], base, H - self.slope_days, H - 1)
+        both = _range_sums(key, cs[[0, 1, 4, 9]], base, H - 2 * w, H - 1)
+
+        def ratio(a, b):
+            out = np.full(len(series), np.nan)
+            np.divide(a, b, out=out, where=b > 0)
+            return out
+
+        ctr_cur, ctr_prev = ratio(cur[1], cur[0]), ratio(prev[1], prev[0])
+        roas_cur, roas_prev = ratio(cur[3], cur[2]), ratio(prev[3], prev[2])
+        with np.errstate(invalid="ignore", divide="ignore"):
+            denom = n * stt - st * st
+            slope = np.where((n >= 3) & (denom > 0), (n * sty - st * sy) / denom, np.nan)
+            ctr_slope = slope / (sy / n)
+            pooled = (cur[1] + prev[1]) / (cur[0] + prev[0])
+            phi = ctr_dispersion(both[1], both[0], both[3], both[2])
+            z = (ctr_cur - ctr_prev) / np.sqrt(phi * pooled * (1 - pooled) * (1 / cur[0] + 1 / prev[0]))
+        p = np.where((pooled > 0) & (pooled < 1), two_sided_p(z), np.nan)
+
+        return {
+            "series": series,
+            "impressions_current": cur[0],
+            "impressions_previous": prev[0],
+            "ctr_current": ctr_cur,
+            "ctr_previous": ctr_prev,
+            "ctr_change": ratio(ctr_cur - ctr_prev, ctr_prev),
+            "roas_current": roas_cur,
+            "roas_previous": roas_prev,
+            "roas_change": ratio(roas_cur - roas_prev, roas_prev),
+            "ctr_slope": ctr_slope,
+            "ctr_p_value": p,
+        }
+
+    def hypotheses(self, level: float = DEFAULT_LEVEL, min_change: float = 0.2,
+                   min_impressions: float = 1000) -> List[Dict[str, Any]]:
+        """Fatigue / improving hypotheses for series whose CTR moved significantly week over week.
+
+        ``fatigue``: CTR fell by at least ``min_change`` (relative), the
+        daily CTR slope is negative and the drop is significant at ``level``.
+        ``improving``: CTR rose by at least ``min_change``, significantly.
+        Both windows need ``min_impressions``.
+        """
+        tr = self.trends()
+        if not len(tr["series"]):
+            return []
+        enough = (tr["impressions_current"] >= min_impressions) & (tr["impressions_previous"] >= min_impressions)
+        significant = enough & (tr["ctr_p_value"] <= 1 - level)
+        change, slope = tr["ctr_change"], tr["ctr_slope"]
+        fatigue = significant & (change <= -min_change) & (slope < 0)
+        improving = significant & (change >= min_change)
+        flagged = np.flatnonzero(fatigue | improving)
+
+        as_of = self.as_of_date
+        fields = [k for k in tr if k != "series"]
+        cols = {k: tr[k][flagged].tolist() for k in fields}
+        out = []
+        for j, i in enumerate(flagged.tolist()):
+            label = self.labels[int(tr["series"][i])]
+            trend = {"status": "fatigue" if fatigue[i] else "improving", "as_of": as_of, "window_days": self.window}
+            trend.update({k: (None if cols[k][j] != cols[k][j] else cols[k][j]) for k in fields})
+            out.append({
+                "id": "trend_" + "|".join(str(v) for v in label),
+                "kind": "trend",
+                "segment_filter": dict(zip(self.keys, label)),
+                "trend": trend,
+            })
+        return out
@@ -0,0 +1,29 @@
+import pytest
+
+from src.utils import logging_utils
+
+
+def _redirect(monkeypatch, path):
+    logging_utils.close_events()
+    monkeypatch.setattr(logging_utils, "LOG_PATH", str(path))
+    monkeypatch.setattr(logging_utils, "ECHO", False)
+
+
+@pytest.fixture(scope="session", autouse=True)
+def session_event_log(tmp_path_factory):
+    """Events logged by session- and module-scoped fixtures (e.g. a running service) go to a temporary file."""
+    with pytest.MonkeyPatch.context() as mp:
+        path = tmp_path_factory.mktemp("logs") / "events.log.jsonl"
+        _redirect(mp, path)
+        yield path
+        logging_utils.close_events()
+
+
+@pytest.fixture(autouse=True)
+def event_log(tmp_path, monkeypatch):
+    """Send the events a test logs to its own temporary file instead of the tracked ``logs/``."""
+    path = tmp_path / "logs" / "events.log.jsonl"
+    _redirect(monkeypatch, path)
+    yield path
+    # the writer holds the file open; the next test starts its own
+    logging_utils.close_events()
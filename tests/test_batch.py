@@ -0,0 +1,77 @@
+import json
+from pathlib import Path
+
+import pandas as pd
+
+from src.agents.insight_agent import InsightAgent
+from src.batch import process_file, resolve_inputs, run_batch
+from src.schema.validator import validate_schema
+from src.utils.aggregates import SegmentAggregates
+from src.utils.data_source import SQLiteSource
+from src.utils.dimensions import canonicalize_dimensions
+
+DATA = Path(__file__).resolve().parents[1] / "data" / "synthetic_fb_ads_undergarments.csv"
+
+
+def test_run_batch_merges_rollup_and_isolates_failures(tmp_path):
+    df = pd.read_csv(DATA)
+    inputs = tmp_path / "exports"
+    inputs.mkdir()
+    for i, part in enumerate((df.iloc[:1500], df.iloc[1500:3000], df.iloc[3000:])):
+        part.to_csv(inputs / f"account_{i}.csv", index=False)
+    pd.DataFrame({"foo": [1, 2]}).to_csv(inputs / "broken.csv", index=False)
+
+    files = resolve_inputs(str(inputs))
+    assert len(files) == 4
+
+    out = run_batch(files, output_dir=str(tmp_path / "out"), workers=2)
+
+    assert out["summary"]["ok"] == 3
+    assert out["summary"]["failed"] == 1
+    failed = [r for r in out["files"] if not r["ok"]]
+    assert failed[0]["file"].endswith("broken.csv")
+    assert len({r["trace_id"] for r in out["files"]}) == 4
+
+    # workers canonicalize campaign names, so spelling variants across accounts merge
+    whole = SegmentAggregates.from_frame(canonicalize_dimensions(df.copy())[0])
+    assert out["summary"]["segments"] == len(whole.groups)
+    rollup = json.loads((tmp_path / "out" / "rollup" / "insights.json").read_text(encoding="utf-8"))
+    by_id = {h["id"]: h["validation"] for h in rollup["hypotheses"]}
+    for key in whole.sorted_keys():
+        s = whole.summary(key)
+        assert by_id["hyp_" + key[0]]["total_impressions"] == int(s["impressions"])
+        assert by_id["hyp_" + key[0]]["sample_size"] == s["sample_size"]
+    assert (tmp_path / "out" / "files" / "account_0" / "insights.json").exists()
+    assert (tmp_path / "out" / "rollup" / "rollup.md").exists()
+
+
+def test_process_file_reads_through_the_configured_source(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    df = pd.read_csv(DATA)
+    db = tmp_path / "exports" / "account.sqlite"
+    db.parent.mkdir()
+    SQLiteSource.import_csv(str(DATA), str(db))
+    assert resolve_inputs(str(db.parent)) == [str(db)]
+
+    cfg = {"data": {"query": {"where": {"country": ["US"]}}}, "analysis": {"confidence_level": 0.8}}
+    for chunksize in (None, 700):
+        r = process_file(str(db), str(tmp_path / "out"), chunksize=chunksize, cfg=cfg)
+        assert r["ok"] and r["rows"] == int((df["country"] == "US").sum())
+    insights = json.loads((tmp_path / "out" / "files" / "account" / "insights.json").read_text(encoding="utf-8"))
+    us = canonicalize_dimensions(validate_schema(df[df["country"] == "US"].copy()))[0]
+    agent = InsightAgent(confidence_level=0.8)
+    expected = agent.generate_from_aggregates(SegmentAggregates.from_frame(us), write=False)
+    assert insights["hypotheses"][0]["validation"]["ctr_ci"] == expected["hypotheses"][0]["validation"]["ctr_ci"]
+
+
+def test_process_file_labels_each_file_by_its_own_spellings(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    df = pd.read_csv(DATA).iloc[:200]
+    for name, spelling in (("upper", str.upper), ("lower", str.lower)):
+        df.assign(campaign_name=df["campaign_name"].map(spelling)).to_csv(tmp_path / f"{name}.csv", index=False)
+
+    # the same worker process handles both files, as a reused pool worker would
+    process_file(str(tmp_path / "upper.csv"), str(tmp_path / "out"), cfg={})
+    r = process_file(str(tmp_path / "lower.csv"), str(tmp_path / "out"), cfg={})
+    assert r["ok"]
+    assert all(key[0] == key[0].lower() for key in r["aggregates"].groups)
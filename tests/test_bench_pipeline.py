@@ -0,0 +1,37 @@
+import pandas as pd
+
+from tools.bench_pipeline import compare
+from tools.synth_data import SEED_PATH, generate_frame
+
+
+def test_generator_is_seeded_and_matches_seed_schema():
+    a = generate_frame(20_000, seed=3, chunk_rows=7_000)
+    b = generate_frame(20_000, seed=3, chunk_rows=7_000)
+    seed_df = pd.read_csv(SEED_PATH)
+
+    pd.testing.assert_frame_equal(a, b)
+    assert len(a) == 20_000
+    assert list(a.columns) == list(seed_df.columns)
+    assert (a["impressions"] == 0).any()
+    assert (a["clicks"].fillna(0) <= a["impressions"]).all()
+    for col in ("adset_name", "creative_type", "audience_type", "platform", "country"):
+        assert set(a[col].unique()) <= set(seed_df[col].unique())
+    # re-spelled names add raw variants beyond the seed file's
+    assert a["campaign_name"].nunique() > seed_df["campaign_name"].nunique()
+
+
+def _suite(**stages):
+    return {"results": {"1000": {"stages": {
+        name: {"seconds": s, "peak_bytes": p} for name, (s, p) in stages.items()
+    }}}}
+
+
+def test_compare_flags_only_real_regressions():
+    base = _suite(load=(1.0, 100), validate=(0.01, 100), evaluate=(0.5, 100))
+    cur = _suite(load=(1.5, 100), validate=(0.03, 100), evaluate=(0.5, 200))
+
+    rows = {r["stage"]: r for r in compare(base, cur, threshold=0.2, min_seconds=0.05)}
+
+    assert rows["load"]["regressed"]
+    assert not rows["validate"]["regressed"]  # 3x, but under the noise floor
+    assert rows["evaluate"]["regressed"]  # memory doubled
@@ -0,0 +1,35 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+from src.agents.planner import PlannerAgent
+from src.pipeline import select_stages
+
+ROOT = Path(__file__).resolve().parents[1]
+# summed self time of every module `python -m src.run plan` imports, in microseconds
+PLAN_IMPORT_BUDGET_US = 150_000
+
+
+def test_plan_starts_without_heavy_imports():
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-m", "src.run", "plan"], cwd=ROOT,
+                          capture_output=True, text=True, check=True)
+    plan = json.loads(proc.stdout)
+    assert plan["mode"] == "in_memory" and "generate_insights" in plan["steps"]
+
+    imports = [line.split("|") for line in proc.stderr.splitlines() if line.startswith("import time:")][1:]
+    modules = {name.strip() for _, _, name in imports}
+    assert not {m.split(".")[0] for m in modules} & {"pandas", "numpy"}
+    assert "src.pipeline" not in modules
+    assert sum(int(self_us.split(":")[1]) for self_us, _, _ in imports) < PLAN_IMPORT_BUDGET_US
+
+
+def test_insights_selects_only_the_stages_it_needs():
+    plan = select_stages(PlannerAgent().generate_plan("streaming"), ["write_insights"])
+    assert plan["steps"] == ["aggregate_dataset", "generate_insights", "write_insights"]
+
+
+def test_importing_data_utils_has_no_side_effects(tmp_path):
+    subprocess.run([sys.executable, "-c", "import src.utils.data_utils"], cwd=tmp_path, check=True,
+                   env={"PYTHONPATH": str(ROOT)})
+    assert list(tmp_path.iterdir()) == []
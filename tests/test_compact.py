@@ -0,0 +1,46 @@
+from pathlib import Path
+
+import pandas as pd
+
+from src.schema.validator import validate_schema
+from src.utils.compact import compact_frame, frame_bytes, lazy_column, needed_columns, plan_memory
+from src.utils.data_source import CSVSource
+from src.utils.segment_index import SegmentIndex
+
+DATA = Path(__file__).resolve().parents[1] / "data" / "synthetic_fb_ads_undergarments.csv"
+CFG = {"analysis": {"trends": {"enabled": True}}}
+
+
+def test_compact_frame_is_smaller_and_sums_the_same():
+    raw = validate_schema(pd.read_csv(DATA))
+    df = compact_frame(validate_schema(CSVSource(str(DATA)).read(needed_columns(CFG))))
+
+    assert "creative_message" not in df.columns and "purchases" not in df.columns
+    assert isinstance(df["campaign_name"].dtype, pd.CategoricalDtype)
+    assert df["clicks"].dtype.itemsize < 8
+    assert frame_bytes(df) * 8 < frame_bytes(raw)
+    segment = {"campaign_name": "Men ComfortMax Launch"}
+    assert SegmentIndex(df).totals() == SegmentIndex(raw).totals()
+    assert SegmentIndex(df).aggregate(segment) == SegmentIndex(raw).aggregate(segment)
+
+
+def test_text_columns_load_lazily_for_the_rows_that_survived(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "ads.csv"
+    rows = pd.read_csv(DATA, nrows=20)
+    rows.loc[3, "spend"] = -1.0  # quarantined by validation
+    rows.to_csv(path, index=False)
+    df = validate_schema(CSVSource(str(path)).read(needed_columns(CFG)))
+
+    messages = lazy_column(df, "creative_message")
+    assert len(messages) == 19 and 3 not in messages.index
+    assert messages.astype(str).tolist() == rows.drop(index=3)["creative_message"].tolist()
+
+
+def test_memory_budget_switches_to_streaming():
+    roomy = plan_memory({"data": {"memory_budget_mb": 64}, **CFG}, str(DATA))
+    assert roomy["mode"] == "in_memory" and roomy["rows"] == 4500
+    assert roomy["bytes_per_row"]["compact"] * 8 < roomy["bytes_per_row"]["raw"]
+
+    tight = plan_memory({"data": {"memory_budget_mb": 0.25}, **CFG}, str(DATA))
+    assert tight["mode"] == "streaming" and 1000 <= tight["chunksize"] < 4500
@@ -0,0 +1,94 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.agents.evaluator_agent import EvaluatorAgent
+from src.agents.insight_agent import InsightAgent
+from src.utils.confidence import ctr_dispersion, ratio_se, segment_confidence, wilson_interval, z_score
+from src.utils.segment_index import SegmentIndex
+
+
+def test_z_score_and_wilson_interval():
+    assert z_score(0.95) == pytest.approx(1.959964, abs=1e-5)
+    assert z_score(0.99) == pytest.approx(2.575829, abs=1e-5)
+    lo, hi = wilson_interval(np.array([5, 0, 3]), np.array([10, 20, 0]))
+    assert lo[0] == pytest.approx(0.236593, abs=1e-5) and hi[0] == pytest.approx(0.763407, abs=1e-5)
+    assert lo[1] == 0.0 and 0 < hi[1] < 0.2
+    assert np.isnan(lo[2]) and np.isnan(hi[2])
+
+
+def test_ratio_se_matches_rowwise_delta_method():
+    rng = np.random.default_rng(0)
+    x = rng.uniform(1, 10, 50)
+    y = 2 * x + rng.normal(0, 1, 50)
+    r = y.sum() / x.sum()
+    expected = np.sqrt(len(x) / (len(x) - 1) * ((y - r * x) ** 2).sum()) / x.sum()
+    got = ratio_se(y.sum(), x.sum(), (y * y).sum(), (x * x).sum(), (x * y).sum(), len(x))
+    assert got == pytest.approx(expected, rel=1e-9)
+    assert np.isnan(ratio_se(1.0, 1.0, 1.0, 1.0, 1.0, 1))
+
+
+def test_dispersion_flags_rows_with_different_ctrs():
+    m = np.full(20, 10_000.0)
+    same = np.full(20, 100.0)
+    spread = np.tile([50.0, 150.0], 10)
+    for clicks, expect_high in ((same, False), (spread, True)):
+        phi = ctr_dispersion(clicks.sum(), m.sum(), (clicks ** 2 / m).sum(), len(m))
+        assert (phi > 10) == expect_high and phi >= 1
+
+
+def test_segment_confidence_is_vectorized_and_significance_tracks_evidence():
+    base = {"clicks": 1000.0, "impressions": 100_000.0, "spend": 1000.0, "revenue": 2000.0}
+    clicks = np.array([5.0, 500.0, 1000.0])
+    impressions = np.array([1000.0, 100_000.0, 100_000.0])
+    zeros = np.zeros(3)
+    out = segment_confidence(clicks, impressions, zeros, zeros, zeros, zeros, zeros,
+                             clicks ** 2 / impressions, np.ones(3), base)
+    # same observed CTR (0.5%) is far more certain with 100x the impressions
+    assert out["ctr_p"][1] < out["ctr_p"][0]
+    assert out["ctr_high"][1] - out["ctr_low"][1] < out["ctr_high"][0] - out["ctr_low"][0]
+    # the account's own CTR is no evidence of a difference
+    assert out["ctr_p"][2] == pytest.approx(1.0) and out["confidence"][2] == pytest.approx(0.0, abs=1e-6)
+    assert np.isnan(out["roas_p"]).all()
+
+
+def test_evaluator_reports_intervals_containing_point_estimates():
+    rng = np.random.default_rng(1)
+    n = 400
+    df = pd.DataFrame({
+        "campaign_name": rng.choice(["A", "B", "C"], n),
+        "impressions": rng.integers(1_000, 5_000, n),
+        "spend": rng.uniform(5, 50, n),
+    })
+    df["clicks"] = rng.binomial(df["impressions"], np.where(df["campaign_name"] == "A", 0.03, 0.01))
+    df["revenue"] = df["spend"] * np.where(df["campaign_name"] == "B", 4.0, 1.5) * rng.uniform(0.8, 1.2, n)
+    insights = {"hypotheses": [{"id": c, "segment_filter": {"campaign_name": c}} for c in "ABC"]}
+    out = EvaluatorAgent().evaluate(df, insights)["hypotheses"]
+
+    for h in out:
+        v = h["validation"]
+        assert v["ctr_ci"][0] <= v["mean_ctr"] <= v["ctr_ci"][1]
+        assert v["roas_ci"][0] <= v["mean_roas"] <= v["roas_ci"][1]
+        assert 0.0 <= v["confidence"] <= 1.0
+    assert out[0]["validation"]["confidence"] > 0.99  # A: 3x the CTR of the rest
+
+    single = EvaluatorAgent().validate_segment({"campaign_name": "B"}, SegmentIndex(df))
+    assert single == out[1]["validation"]
+
+
+@pytest.mark.parametrize("cube", [False, True])
+def test_insights_report_point_estimates_inside_their_intervals(cube):
+    df = pd.read_csv("data/synthetic_fb_ads_undergarments.csv")
+    agent = InsightAgent(confidence_level=0.95)
+    if cube:
+        out = agent.generate_cube(df, ["campaign_name", "adset_name", "country"], write=False)
+    else:
+        out = agent.generate(df, write=False)
+
+    assert out["hypotheses"]
+    for h in out["hypotheses"]:
+        v = h["validation"]
+        for metric in ("ctr", "roas"):
+            ci = v[f"{metric}_ci"]
+            if ci is not None:
+                assert ci[0] <= v[f"mean_{metric}"] <= ci[1], h["id"]
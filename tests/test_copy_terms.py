@@ -0,0 +1,82 @@
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.agents.copy_agent import CopyAgent
+from src.agents.creative_agent import CreativeAgent
+from src.schema.validator import validate_schema
+from src.utils.compact import lazy_column, needed_columns
+from src.utils.copy_terms import CopyStats, TermMemo, tokenize
+from src.utils.data_source import CSVSource
+
+DATA = Path(__file__).resolve().parents[1] / "data" / "synthetic_fb_ads_undergarments.csv"
+
+
+def _frame(rows=400, seed=0):
+    # "free shipping" copy gets twice the CTR of the rest
+    rng = np.random.default_rng(seed)
+    messages = np.array(["Free shipping on soft boxers", "Soft boxers for every day", "New colors in soft briefs"])
+    pick = rng.integers(0, 3, rows)
+    impressions = rng.integers(20_000, 40_000, rows)
+    ctr = np.where(pick == 0, 0.02, 0.01) * rng.uniform(0.9, 1.1, rows)
+    return pd.DataFrame({
+        "campaign_name": np.where(np.arange(rows) % 2, "Men Launch", "Men Basics"),
+        "creative_message": messages[pick],
+        "impressions": impressions,
+        "clicks": np.round(impressions * ctr),
+        "spend": rng.uniform(50, 100, rows),
+        "revenue": rng.uniform(100, 300, rows),
+    })
+
+
+def test_tokenize_normalizes_and_keeps_phrases():
+    terms = tokenize("Don’t miss: the NEW ComfortMax bra!")
+    assert terms == tuple(sorted(terms))
+    assert {"don't", "don't miss", "comfortmax bra", "new comfortmax"} <= set(terms)
+    assert "the" not in terms and "miss the" not in terms
+    assert tokenize("New  comfortmax!") == tokenize("new comfortmax")
+
+
+def test_memo_tokenizes_each_message_once(tmp_path):
+    path = str(tmp_path / "memo.sqlite")
+    memo = TermMemo(path)
+    assert memo.terms(["Soft boxers", "Soft boxers", "New briefs"]) == [tokenize("Soft boxers")] * 2 + [
+        tokenize("New briefs")]
+    assert memo.stats["tokenized"] == 2
+    fresh = TermMemo(path)
+    fresh.terms(["New briefs", "Soft boxers"])
+    assert fresh.stats == {"memory": 0, "disk": 2, "tokenized": 0}
+
+
+def test_lift_finds_the_phrase_that_drives_ctr():
+    df = _frame()
+    copy = CopyStats.from_frame(df).lift(min_impressions=1000)
+    terms = {t["term"]: t for t in copy["terms"]}
+    assert terms["free shipping"]["ctr_lift"] > 0.5 and terms["free shipping"]["q_value"] < 0.05
+    assert terms["every day"]["ctr_lift"] < 0
+    assert copy["campaigns"]["Men Launch"]["best"][0]["ctr_lift"] == pytest.approx(terms["free"]["ctr_lift"])
+
+    merged = CopyStats.from_frame(df.iloc[:150]).merge(CopyStats.from_frame(df.iloc[150:])).lift(min_impressions=1000)
+    assert [t["term"] for t in merged["terms"]] == [t["term"] for t in copy["terms"]]
+    assert merged["terms"][0]["impressions"] == copy["terms"][0]["impressions"]
+
+
+def test_lazily_read_messages_match_the_loaded_column(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    source = CSVSource(str(DATA))
+    df = validate_schema(source.read(needed_columns({})))
+    lazy = CopyStats.from_frame(df, lazy_column(df, "creative_message")).lift()
+    loaded = CopyStats.from_frame(validate_schema(source.read(needed_columns({}) + ["creative_message"]))).lift()
+    assert lazy["terms"] == loaded["terms"] and lazy["campaigns"] == loaded["campaigns"]
+
+
+def test_creatives_cite_campaign_phrases(tmp_path):
+    copy = CopyAgent(output_dir=str(tmp_path), min_impressions=1000).generate(_frame(), write=True)
+    assert (tmp_path / "copy.json").exists()
+    evaluated = {"hypotheses": [{"id": "h1", "segment_filter": {"campaign_name": "Men Launch"},
+                                 "validation": {"comment": "low_ctr", "mean_ctr": 0.008}}]}
+    ideas = CreativeAgent().generate(evaluated, copy=copy)["creatives"][0]["creative_recommendations"]
+    assert any('"free shipping"' in i or '"free"' in i for i in ideas)
+    assert any(i.startswith("Drop ") for i in ideas)
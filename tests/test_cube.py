@@ -0,0 +1,72 @@
+from itertools import combinations
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.agents.insight_agent import InsightAgent
+from src.utils.cube import compute_cube
+
+DIMS = ["campaign_name", "platform", "country"]
+
+
+def _frame(n=600, seed=0):
+    rng = np.random.default_rng(seed)
+    impressions = rng.integers(0, 400, n)
+    return pd.DataFrame({
+        "campaign_name": rng.choice(["A", "B", "C", "D"], n),
+        "platform": rng.choice(["Facebook", "Instagram"], n),
+        "country": rng.choice(["US", "IN", "UK", None], n),
+        "impressions": impressions,
+        "clicks": rng.integers(0, 10, n).astype(float),
+        "spend": rng.uniform(0, 50, n),
+        "revenue": rng.uniform(0, 80, n),
+    })
+
+
+def _brute_force(df, min_impressions, max_depth=2):
+    ctr = df["clicks"] / df["impressions"].replace(0, np.nan)
+    roas = df["revenue"].replace(0, np.nan) / df["spend"].replace(0, np.nan)
+    work = df.assign(ctr=ctr, roas=roas)
+    out = {}
+    for depth in range(1, max_depth + 1):
+        for dims in combinations(DIMS, depth):
+            for key, g in work.dropna(subset=list(dims)).groupby(list(dims)):
+                key = key if isinstance(key, tuple) else (key,)
+                values = pd.Series(dict(zip(dims, key)))
+                parents_ok = all(
+                    work.loc[(work[list(p)] == values[list(p)]).all(axis=1), "impressions"].sum() >= min_impressions
+                    for p in combinations(dims, depth - 1) if p
+                )
+                if g["impressions"].sum() >= min_impressions and parents_ok:
+                    out[tuple(sorted(zip(dims, key)))] = (len(g), int(g["impressions"].sum()), g["ctr"].mean())
+    return out
+
+
+def test_cube_matches_groupby_with_iceberg_pruning():
+    df = _frame()
+    segments = compute_cube(df, DIMS, max_depth=2, min_impressions=9000)
+    got = {tuple(sorted(s["segment_filter"].items())): s for s in segments}
+    expected = _brute_force(df, 9000)
+
+    assert set(got) == set(expected)
+    for key, (size, imp, ctr) in expected.items():
+        assert got[key]["sample_size"] == size
+        assert got[key]["total_impressions"] == imp
+        assert got[key]["mean_ctr"] == pytest.approx(ctr)
+    assert all(s["total_impressions"] >= 9000 for s in segments)
+
+
+def test_cube_prunes_children_of_small_parents():
+    df = _frame()
+    df.loc[df["campaign_name"] == "D", "impressions"] = 1
+    segments = compute_cube(df, DIMS, max_depth=2, min_impressions=1000)
+    assert not any(s["segment_filter"].get("campaign_name") == "D" for s in segments)
+
+
+def test_generate_cube_writes_multi_column_hypotheses(tmp_path):
+    agent = InsightAgent(output_dir=str(tmp_path))
+    out = agent.generate_cube(_frame(), DIMS, max_depth=2, min_impressions=1000)
+    filters = [h["segment_filter"] for h in out["hypotheses"]]
+    assert any(len(f) == 2 for f in filters)
+    assert (tmp_path / "insights.json").exists()
@@ -0,0 +1,147 @@
+import json
+import os
+import time
+
+import pytest
+
+from src.agents.planner import PlannerAgent
+from src.pipeline import build_stages
+from src.utils.dag import DagExecutor, Stage
+
+DATA = os.path.join(os.path.dirname(__file__), "..", "data", "synthetic_fb_ads_undergarments.csv")
+
+
+def test_independent_stages_overlap(tmp_path):
+    def slow(value):
+        def fn(**_):
+            time.sleep(0.2)
+            return value
+        return fn
+
+    stages = [
+        Stage("a", slow(1), outputs=["a"]),
+        Stage("b", slow(2), inputs=["a"], outputs=["b"]),
+        Stage("c", slow(3), inputs=["a"], outputs=["c"]),
+        Stage("d", lambda b, c: b + c, inputs=["b", "c"], outputs=["d"]),
+    ]
+    t0 = time.perf_counter()
+    values = DagExecutor(stages, store_dir=None, workers=2).run()
+    wall = time.perf_counter() - t0
+
+    assert values["d"] == 5
+    assert wall < 0.55  # critical path a -> b|c -> d, not the 0.6s sum
+
+
+def test_stages_run_in_spans_under_the_plan():
+    from src.utils import logging_utils
+
+    records = []
+    logging_utils.record_spans(records)
+    try:
+        def traced_stage(**_):
+            span = logging_utils.start_span("work")
+            logging_utils.end_span(span)
+            return span["parent_span_id"]
+
+        values = DagExecutor([Stage("a", traced_stage, outputs=["a"]), Stage("b", traced_stage, outputs=["b"])],
+                             store_dir=None, workers=2).run()
+    finally:
+        logging_utils.record_spans(None)
+
+    spans = {r["span_id"]: r for r in records}
+    plan = next(r for r in records if r["name"] == "plan.execute")
+    for name in ("a", "b"):
+        # spans opened by a stage function nest under its stage span, in whichever pool thread it ran
+        assert spans[values[name]]["name"] == f"stage.{name}"
+        assert spans[values[name]]["parent_span_id"] == plan["span_id"]
+
+
+def test_cycles_and_missing_inputs_are_rejected():
+    with pytest.raises(ValueError, match="Cycle"):
+        DagExecutor([Stage("a", int, inputs=["b"], outputs=["a"]), Stage("b", int, inputs=["a"], outputs=["b"])])
+    with pytest.raises(ValueError, match="no stage produces"):
+        DagExecutor([Stage("a", int, inputs=["x"], outputs=["a"])])
+
+
+def test_unchanged_stages_are_skipped(tmp_path):
+    source = tmp_path / "in.txt"
+    source.write_text("1")
+    artifact = tmp_path / "out.txt"
+    calls = []
+
+    def stages():
+        def read():
+            calls.append("read")
+            return int(source.read_text())
+
+        def double(n):
+            calls.append("double")
+            return n * 2
+
+        def write(doubled):
+            calls.append("write")
+            artifact.write_text(str(doubled))
+
+        return [
+            Stage("read", read, outputs=["n"], sources=[str(source)]),
+            Stage("double", double, inputs=["n"], outputs=["doubled"], persist=["doubled"]),
+            Stage("write", write, inputs=["doubled"], artifacts=[str(artifact)]),
+        ]
+
+    store = str(tmp_path / "state")
+    DagExecutor(stages(), store_dir=store).run()
+    assert calls == ["read", "double", "write"]
+
+    calls.clear()
+    DagExecutor(stages(), store_dir=store).run()
+    assert calls == []
+
+    # a missing artifact re-runs only its writer; its input comes from the store
+    artifact.unlink()
+    DagExecutor(stages(), store_dir=store).run()
+    assert calls == ["write"] and artifact.read_text() == "2"
+
+    calls.clear()
+    source.write_text("21")
+    DagExecutor(stages(), store_dir=store).run()
+    assert calls == ["read", "double", "write"] and artifact.read_text() == "42"
+
+
+def test_running_selected_stages_keeps_the_others_state(tmp_path):
+    calls = []
+
+    def stage(name, **kw):
+        def fn(**_):
+            calls.append(name)
+            return name
+        return Stage(name, fn, **kw)
+
+    full = [stage("a", outputs=["a"]), stage("b", inputs=["a"], outputs=["b"]),
+            stage("c", inputs=["a"], outputs=["c"])]
+    store = str(tmp_path / "state")
+    DagExecutor(full, store_dir=store).run()
+    calls.clear()
+
+    # only a and b (as with pipeline targets); c's fingerprint must survive
+    DagExecutor(full[:2], store_dir=store).run(force=True)
+    assert calls == ["a", "b"]
+    calls.clear()
+    assert DagExecutor(full, store_dir=store).plan()["run"] == set()
+
+
+def test_planned_pipeline_writes_reports_and_skips_rerun(tmp_path):
+    out = tmp_path / "reports"
+    cfg = {"data": {"canonicalize": True}, "analysis": {}}
+    plan = PlannerAgent(output_dir=str(out)).generate_plan("in_memory")
+    store = str(tmp_path / "plan")
+
+    values = DagExecutor(build_stages(plan, cfg, DATA, output_dir=str(out)), store_dir=store).run()
+    insights = json.loads((out / "insights.json").read_text(encoding="utf-8"))
+    assert insights == values["insights"]
+    assert (out / "creatives.json").exists() and (out / "report.md").exists()
+    assert values["summary"]["total_hypotheses"] == len(insights["hypotheses"])
+
+    executor = DagExecutor(build_stages(plan, cfg, DATA, output_dir=str(out)), store_dir=store)
+    assert executor.plan()["run"] == set()
+    assert executor.run() == {}
+    assert executor.value("summary") == values["summary"]
@@ -0,0 +1,72 @@
+import argparse
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from src.run import _apply_query_args
+from src.schema.validator import validate_schema
+from src.utils.compact import lazy_column
+from src.utils.data_source import CSVSource, SQLiteSource, open_source
+
+DATA = Path(__file__).resolve().parents[1] / "data" / "synthetic_fb_ads_undergarments.csv"
+QUERY = {"start": "2025-03-25", "end": "2025-03-31",
+         "where": {"country": ["US"], "platform": ["Facebook", "Instagram"]}}
+COLUMNS = ["campaign_name", "impressions", "clicks"]
+
+
+def _expected():
+    df = pd.read_csv(DATA)
+    keep = (df["date"] >= "2025-03-25") & (df["date"] <= "2025-03-31") & (df["country"] == "US")
+    return df[keep & df["platform"].isin(["Facebook", "Instagram"])]
+
+
+def _check(got):
+    expected = _expected()
+    assert list(got.columns) == COLUMNS and len(got) == len(expected) > 0
+    assert got.index.tolist() == expected.index.tolist()
+    assert got["campaign_name"].astype(str).tolist() == expected["campaign_name"].tolist()
+    pd.testing.assert_series_equal(got["clicks"], expected["clicks"], check_dtype=False)
+
+
+def test_csv_source_filters_and_projects():
+    source = open_source(str(DATA))
+    assert isinstance(source, CSVSource)
+    _check(source.read(COLUMNS, **QUERY))
+    chunks = list(source.read(COLUMNS, chunksize=500, **QUERY))
+    assert all(len(c) <= 500 for c in chunks)
+    _check(pd.concat(chunks))
+
+
+def test_sqlite_source_pushes_the_query_into_sql(tmp_path):
+    source = SQLiteSource.import_csv(str(DATA), str(tmp_path / "ads.sqlite"))
+    sql, params = source.sql(COLUMNS, {"start": "2025-03-25", "end": "2025-03-31", "where": {"country": ["US"]}})
+    assert "WHERE" in sql and params == ["2025-03-25", "2025-04-01", "US"]
+    _check(open_source(str(tmp_path / "ads.sqlite")).read(COLUMNS, **QUERY))
+
+
+def test_parquet_source_filters_and_projects(tmp_path):
+    pytest.importorskip("pyarrow")
+    path = tmp_path / "ads.parquet"
+    pd.read_csv(DATA).to_parquet(path, index=False)
+    got = open_source(str(path)).read(COLUMNS, **QUERY)
+    expected = _expected()
+    pd.testing.assert_series_equal(got["clicks"].reset_index(drop=True), expected["clicks"].reset_index(drop=True))
+
+
+def test_lazy_column_reuses_the_query(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    SQLiteSource.import_csv(str(DATA), str(tmp_path / "ads.sqlite"))
+    df = validate_schema(open_source(str(tmp_path / "ads.sqlite")).read(
+        ["campaign_name", "creative_type", "audience_type", "platform", "country", "impressions", "clicks",
+         "spend", "revenue"], **QUERY))
+    messages = lazy_column(df, "creative_message")
+    assert messages.astype(str).tolist() == _expected()["creative_message"].tolist()
+
+
+def test_cli_flags_fold_into_the_config_query():
+    cfg = {"data": {"query": {"where": {"platform": ["Facebook"]}}}}
+    args = argparse.Namespace(start=None, end="2025-03-31", days=7, where=["country=US, CA"])
+    _apply_query_args(cfg, args)
+    assert cfg["data"]["query"] == {"start": "2025-03-25", "end": "2025-03-31",
+                                    "where": {"platform": ["Facebook"], "country": ["US", "CA"]}}
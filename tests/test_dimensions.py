@@ -0,0 +1,67 @@
+import pandas as pd
+
+from src.agents.evaluator_agent import EvaluatorAgent
+from src.utils.aggregates import SegmentAggregates
+from src.utils.dimensions import DimensionDictionary, canonical_key, canonicalize_dimensions
+
+
+def test_spelling_variants_collapse_to_one_code():
+    d = DimensionDictionary()
+    df = pd.DataFrame({
+        "campaign_name": ["Men Bold Comfort", "men_bold  comfort", " MEN BOLD COMFORT ", "Women Soft", None],
+        "platform": ["Facebook", "facebook", "Instagram", "Instagram", "Facebook"],
+    })
+    out, stats = canonicalize_dimensions(df, dictionary=d)
+
+    assert stats["campaign_name"] == {"raw": 4, "canonical": 2}
+    assert stats["platform"] == {"raw": 3, "canonical": 2}
+    assert isinstance(out["campaign_name"].dtype, pd.CategoricalDtype)
+    # matched case-insensitively, shown with the first spelling seen
+    assert out["campaign_name"].tolist()[:4] == ["Men Bold Comfort"] * 3 + ["Women Soft"]
+    assert pd.isna(out["campaign_name"].iloc[4])
+    assert canonical_key("Men_Bold\tComfort") == "men bold comfort"
+
+
+def test_codes_are_shared_across_frames():
+    d = DimensionDictionary()
+    a, _ = canonicalize_dimensions(pd.DataFrame({"campaign_name": ["A b", "c"]}), dictionary=d)
+    b, _ = canonicalize_dimensions(pd.DataFrame({"campaign_name": ["C", "new", "a_B"]}), dictionary=d)
+
+    assert list(a["campaign_name"].cat.codes) == [0, 1]
+    assert list(b["campaign_name"].cat.codes) == [1, 2, 0]
+    assert d.canonical("campaign_name", "A  B") == "A b"
+    assert d.canonical("campaign_name", "unknown") is None
+
+
+def test_labels_do_not_depend_on_chunking_and_relabel_aligns_other_dictionaries():
+    names = pd.Series([" men  Bold", "Men bold", "OTHER one", "men_bold", "other ONE"], name="campaign_name")
+    whole = DimensionDictionary().encode(names)
+    chunked = DimensionDictionary()
+    parts = pd.concat([chunked.encode(names.iloc[:1]), chunked.encode(names.iloc[1:])])
+    expected = ["men Bold", "men Bold", "OTHER one", "men Bold", "OTHER one"]
+    assert parts.astype(str).tolist() == whole.astype(str).tolist() == expected
+
+    # aggregates canonicalized by another dictionary (another worker, a cached partition) merge on the key
+    frame = pd.DataFrame({"campaign_name": ["MEN BOLD", "Other One"], "impressions": [10.0, 5.0]})
+    other, _ = canonicalize_dimensions(frame, dictionary=DimensionDictionary())
+    aligned = SegmentAggregates.from_frame(other).relabel(chunked.label)
+    assert sorted(aligned.groups) == [("OTHER one",), ("men Bold",)]
+    assert chunked.label("campaign_name", "brand new") == "brand new"
+    assert chunked.label("campaign_name", None) is None
+
+
+def test_evaluator_resolves_raw_spelling_against_canonical_frame():
+    df = pd.DataFrame({
+        "campaign_name": ["Men Bold Comfort", "men_bold comfort", "Other"],
+        "impressions": [100.0, 200.0, 50.0],
+        "clicks": [1.0, 2.0, 1.0],
+        "spend": [10.0, 10.0, 5.0],
+        "revenue": [20.0, 40.0, 5.0],
+    })
+    df, _ = canonicalize_dimensions(df)
+    insights = {"hypotheses": [{"id": "h", "segment_filter": {"campaign_name": "MEN BOLD COMFORT"}}]}
+
+    out = EvaluatorAgent().evaluate(df, insights, trace_id="t", parent_span="p")
+
+    assert out["hypotheses"][0]["validation"]["sample_size"] == 2
+    assert out["hypotheses"][0]["validation"]["total_impressions"] == 300
@@ -29,3 +29,29 @@ def test_evaluator_extreme_values():
     v = out["hypotheses"][0]["validation"]
     assert v["mean_ctr"] == 0.0
     assert v["total_impressions"] == 3000000
+
+
+def test_evaluator_multi_column_segment_with_shared_index():
+    from src.utils.segment_index import SegmentIndex
+
+    df = pd.DataFrame({
+        "campaign_name": ["A", "A", "B", "A"],
+        "platform": ["FB", "IG", "FB", "FB"],
+        "impressions": [1000, 2000, 500, 3000],
+        "clicks": [5.0, None, 1.0, 40.0],
+        "spend": [10.0, 5.0, 1.0, 20.0],
+        "revenue": [5.0, 5.0, 1.0, 30.0],
+    })
+    index = SegmentIndex(df)
+    agent = EvaluatorAgent()
+    insights = {"hypotheses": [
+        {"id": "h1", "segment_filter": {"campaign_name": "A", "platform": "FB"}},
+        {"id": "h2", "segment_filter": {"campaign_name": "B", "platform": "IG"}},
+    ]}
+    out = agent.evaluate(df, insights, index=index)
+    v1 = out["hypotheses"][0]["validation"]
+    assert v1["sample_size"] == 2
+    assert v1["total_impressions"] == 4000
+    assert v1["mean_ctr"] == 45 / 4000
+    assert v1["mean_roas"] == 35.0 / 30.0
+    assert out["hypotheses"][1]["validation"]["comment"] == "no_data"
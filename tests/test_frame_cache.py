@@ -0,0 +1,87 @@
+import os
+
+import pandas as pd
+import pandas.testing as pdt
+import pytest
+
+from src.utils.data_utils import load_dataset
+from src.utils.frame_cache import FrameCache
+
+
+def _write_config(tmp_path, data_path):
+    (tmp_path / "config.yaml").write_text(
+        "data:\n  path: {}\n  frame_cache: {}\n".format(data_path, tmp_path / "frames")
+    )
+
+
+def _csv(tmp_path):
+    f = tmp_path / "ads.csv"
+    pd.DataFrame({
+        "campaign_name": [" A ", "B", None, "A"],
+        "impressions": [10, 20, 30, 40],
+        "clicks": [1.0, None, 3.0, 4.0],
+    }).to_csv(f, index=False)
+    return f
+
+
+def test_load_dataset_reads_from_cache_after_first_parse(tmp_path, monkeypatch):
+    f = _csv(tmp_path)
+    _write_config(tmp_path, f)
+    monkeypatch.chdir(tmp_path)
+
+    first = load_dataset(retries=1)
+    assert list(first["campaign_name"].iloc[:2]) == ["A", "B"]
+
+    def no_parse(*a, **k):
+        raise AssertionError("CSV should not be re-parsed")
+
+    monkeypatch.setattr(pd, "read_csv", no_parse)
+    second = load_dataset(retries=1)
+    pdt.assert_frame_equal(second, first, check_dtype=False)
+
+    projected = load_dataset(retries=1, columns=["clicks"])
+    assert list(projected.columns) == ["clicks"]
+
+
+@pytest.mark.parametrize("backend", ["npy", "feather"])
+def test_frame_cache_invalidated_by_source_change(tmp_path, backend):
+    if backend == "feather":
+        pytest.importorskip("pyarrow")
+    f = _csv(tmp_path)
+    df = pd.read_csv(f)
+    cache = FrameCache(str(f), str(tmp_path / "frames"), backend=backend)
+    assert not cache.valid()
+    cache.write(df)
+    assert cache.valid()
+    pdt.assert_frame_equal(cache.read(), df, check_dtype=False)
+
+    st = os.stat(f)
+    os.utime(f, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert cache.valid()  # touched only: same content hash
+
+    with open(f, "a", encoding="utf-8") as fh:
+        fh.write("C,50,5.0\n")
+    assert not cache.valid()
+
+
+def test_pipeline_load_stage_uses_the_frame_cache(tmp_path, monkeypatch):
+    from src.agents.planner import PlannerAgent
+    from src.pipeline import build_stages
+
+    f = _csv(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    cfg = {"data": {"path": str(f), "frame_cache": str(tmp_path / "frames")}}
+    plan = PlannerAgent(output_dir=str(tmp_path)).generate_plan("in_memory")
+
+    def load():
+        stage = next(s for s in build_stages(plan, cfg, str(f), output_dir=str(tmp_path)) if s.name == "load_dataset")
+        return stage.fn()
+
+    first = load()
+    assert FrameCache(str(f), str(tmp_path / "frames")).valid()
+
+    def no_parse(*a, **k):
+        raise AssertionError("CSV should not be re-parsed")
+
+    monkeypatch.setattr(pd, "read_csv", no_parse)
+    pdt.assert_frame_equal(load(), first, check_dtype=False)
@@ -0,0 +1,85 @@
+import gzip
+import json
+
+from src.utils import logging_utils
+from src.utils.log_index import LogIndex, build_spans, critical_path, iter_events, normalize_event
+from src.utils.logging_utils import configure_logging, close_events, end_span, log_event, start_span
+
+
+def _restore():
+    configure_logging(log_path=logging_utils.os.path.join("logs", "events.log.jsonl"), echo=True, batch_size=512,
+                      flush_interval=0.5, rotate_bytes=64 << 20, rotate_seconds=0, backups=20, compress=True,
+                      index=True)
+
+
+def test_rotated_segments_are_compressed_and_traces_read_back(tmp_path):
+    path = tmp_path / "events.log.jsonl"
+    configure_logging(log_path=str(path), echo=False, batch_size=16, flush_interval=60, rotate_bytes=8 << 10,
+                      backups=100)
+    try:
+        spans = [start_span(f"run{i}", agent="Test") for i in range(3)]
+        for n in range(200):
+            for s in spans:
+                log_event("step", {"n": n}, trace_id=s["trace_id"], parent_span_id=s["span_id"])
+        for s in spans:
+            end_span(s)
+        close_events()
+    finally:
+        _restore()
+
+    archived = sorted(tmp_path.glob("events.log.*.jsonl.gz"))
+    assert len(archived) > 3
+    # every rotated file is a plain gzip stream of whole lines
+    total = sum(1 for a in archived for _ in gzip.open(a)) + len(path.read_bytes().splitlines())
+    assert total == 3 * 202
+
+    index = LogIndex(str(path))
+    assert index.sync() == 0  # the writer indexed everything itself
+    for s in spans:
+        events = index.read_trace(s["trace_id"])
+        assert [e["event"] for e in events] == [f"{s['name']}.start"] + ["step"] * 200 + [f"{s['name']}.end"]
+        assert [e["payload"]["n"] for e in events[1:-1]] == list(range(200))
+    index.close()
+
+
+def test_legacy_lines_are_indexed_and_normalized(tmp_path):
+    path = tmp_path / "events.log.jsonl"
+    legacy = [
+        {"timestamp": "2025-12-02T15:05:07.810371Z", "trace_id": "t1", "span_id": "s1", "parent_span_id": None,
+         "agent": "EvaluatorAgent", "event_type": "insights.evaluate.start", "payload": {}},
+        {"timestamp": "2025-12-02T15:05:07.814384Z", "trace_id": "t1", "span_id": None, "parent_span_id": "s1",
+         "agent": "EvaluatorAgent", "event_type": "insights.evaluated", "payload": {"count": 1}},
+        {"timestamp": "2025-12-02T15:05:07.824384Z", "trace_id": "t1", "span_id": "s1", "parent_span_id": None,
+         "agent": "EvaluatorAgent", "event_type": "insights.evaluate.end", "payload": {}},
+        {"timestamp": "2025-12-02T15:05:08.000000Z", "trace_id": "t2", "event_type": "data.load.failed"},
+    ]
+    path.write_text("".join(json.dumps(r) + "\n" for r in legacy), encoding="utf-8")
+
+    index = LogIndex(str(path))
+    assert index.sync() == path.stat().st_size
+    events = index.read_trace("t1")
+    assert [e["event"] for e in events] == ["insights.evaluate.start", "insights.evaluated", "insights.evaluate.end"]
+    assert all("event_type" not in e and e["timestamp"].endswith("+00:00") for e in events)
+    assert normalize_event(legacy[3])["payload"] == {} and normalize_event(legacy[3])["span_id"] is None
+
+    [span] = build_spans(events)
+    assert span["name"] == "insights.evaluate" and span["duration_ms"] == 14.013
+    assert [e["event"] for e in span["events"]] == ["insights.evaluated"]
+    assert len(list(iter_events(str(path)))) == 4
+    index.close()
+
+
+def test_critical_path_follows_the_longest_chain():
+    def span(sid, parent, start, end):
+        return {"span_id": sid, "parent_span_id": parent, "name": sid, "start_ns": start, "end_ns": end}
+
+    spans = [
+        span("root", None, 0, 100),
+        span("plan", "root", 0, 5),
+        span("load", "root", 5, 30),
+        span("a", "root", 30, 90),   # a and b run in parallel after load
+        span("b", "root", 30, 50),
+        span("a1", "a", 40, 85),
+        span("report", "root", 90, 100),
+    ]
+    assert critical_path(spans) == ["root", "plan", "load", "a", "a1", "report"]
@@ -0,0 +1,225 @@
+import json
+
+from src.utils import logging_utils
+from src.utils.logging_utils import log_event, start_span, end_span, flush_events, configure_logging
+
+
+def test_buffered_writer_flushes_all_events(tmp_path, capsys):
+    path = tmp_path / "logs" / "events.log.jsonl"
+    configure_logging(log_path=str(path), echo=False, batch_size=1000, flush_interval=60)
+    capsys.readouterr()
+    try:
+        span = start_span("unit.test", agent="Test")
+        for i in range(10):
+            log_event("unit.event", {"i": i}, trace_id=span["trace_id"], parent_span_id=span["span_id"])
+        end_span(span)
+        flush_events()
+
+        lines = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+        assert [e["event"] for e in lines] == ["unit.test.start"] + ["unit.event"] * 10 + ["unit.test.end"]
+        assert [e["payload"]["i"] for e in lines[1:-1]] == list(range(10))
+        assert lines[0]["timestamp"].endswith("+00:00")
+        assert capsys.readouterr().out == ""
+    finally:
+        configure_logging(log_path=logging_utils.os.path.join("logs", "events.log.jsonl"), echo=True,
+                          batch_size=512, flush_interval=0.5)
+
+
+def test_payload_is_captured_when_logged(tmp_path, capsys):
+    path = tmp_path / "events.log.jsonl"
+    # a long flush interval keeps the entries queued while the caller mutates its payload
+    configure_logging(log_path=str(path), echo=True, batch_size=1000, flush_interval=60)
+    capsys.readouterr()
+    try:
+        payload = {"rows": 1, "stats": {"a": 1}}
+        log_event("unit.reused", payload, trace_id="t")
+        payload["rows"] = 2
+        payload["stats"]["b"] = 2
+        payload.update({f"k{i}": i for i in range(100)})
+        log_event("unit.reused", payload, trace_id="t")
+        payload.clear()
+        flush_events()
+
+        first, second = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+        assert first["payload"] == {"rows": 1, "stats": {"a": 1}}
+        assert second["payload"]["rows"] == 2 and len(second["payload"]) == 102
+        assert capsys.readouterr().out.splitlines()[0] == "[unit.reused] {'rows': 1, 'stats': {'a': 1}}"
+    finally:
+        configure_logging(log_path=logging_utils.os.path.join("logs", "events.log.jsonl"), echo=True,
+                          batch_size=512, flush_interval=0.5)
+
+
+def test_span_cpu_time_excludes_other_threads(tmp_path):
+    import threading
+    import time
+
+    configure_logging(log_path=str(tmp_path / "events.log.jsonl"), echo=False)
+    records = []
+    logging_utils.record_spans(records)
+    stop = threading.Event()
+
+    def spin():
+        while not stop.is_set():
+            pass
+
+    busy = threading.Thread(target=spin)
+    busy.start()
+    try:
+        idle = start_span("idle", agent="Test")
+        time.sleep(0.2)
+        end_span(idle)
+    finally:
+        stop.set()
+        busy.join()
+        logging_utils.record_spans(None)
+        configure_logging(log_path=logging_utils.os.path.join("logs", "events.log.jsonl"), echo=True)
+    # the sibling thread's work would show up under process-wide CPU time
+    assert records[0]["duration_ms"] >= 150 and records[0]["thread_cpu_ms"] < 50
+
+
+def test_spans_carry_timings_and_nested_memory(tmp_path, capsys):
+    import tracemalloc
+    from src.utils.profiling import format_span_table
+
+    path = tmp_path / "events.log.jsonl"
+    configure_logging(log_path=str(path), echo=False)
+    records = []
+    logging_utils.record_spans(records)
+    tracemalloc.start()
+    try:
+        outer = start_span("outer", agent="Test")
+        inner = start_span("inner", trace_id=outer["trace_id"], parent_span_id=outer["span_id"])
+        block = bytearray(4 << 20)
+        del block
+        end_span(inner)
+        end_span(outer)
+        flush_events()
+    finally:
+        tracemalloc.stop()
+        logging_utils.record_spans(None)
+        configure_logging(log_path=logging_utils.os.path.join("logs", "events.log.jsonl"), echo=True,
+                          batch_size=512, flush_interval=0.5)
+
+    lines = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+    ends = {e["event"]: e for e in lines if e["event"].endswith(".end")}
+    assert ends["inner.end"]["parent_span_id"] == outer["span_id"]
+    assert ends["inner.end"]["span_id"] == inner["span_id"]
+    assert ends["outer.end"]["parent_span_id"] is None
+    for e in ends.values():
+        p = e["payload"]
+        assert p["end_ns"] - p["start_ns"] >= 0
+        assert p["duration_ms"] >= 0 and p["thread_cpu_ms"] >= 0
+    # the inner peak is also the outer peak, even though it was released before the outer span ended
+    assert ends["inner.end"]["payload"]["mem_peak_bytes"] >= 4 << 20
+    assert ends["outer.end"]["payload"]["mem_peak_bytes"] >= 4 << 20
+
+    assert [r["name"] for r in records] == ["inner", "outer"]
+    table = format_span_table(records).splitlines()
+    assert table[2].startswith("outer") and table[3].startswith("  inner")
+
+
+def _events(path):
+    flush_events()
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()] if path.exists() else []
+
+
+def _restore():
+    configure_logging(log_path=logging_utils.os.path.join("logs", "events.log.jsonl"), echo=True, batch_size=512,
+                      flush_interval=0.5, level="info", levels={"insights.segment": "debug"}, sample_rate=1.0)
+
+
+def test_current_span_follows_threads_and_asyncio_tasks(tmp_path):
+    import asyncio
+    import contextvars
+    from concurrent.futures import ThreadPoolExecutor
+    from src.utils.logging_utils import current_span, span, traced
+
+    path = tmp_path / "events.log.jsonl"
+    configure_logging(log_path=str(path), echo=False)
+
+    @traced(agent="Test")
+    async def task(i):
+        await asyncio.sleep(0)
+        log_event("unit.task", {"i": i})
+        return current_span()["span_id"]
+
+    async def tasks():
+        return await asyncio.gather(task(0), task(1))
+
+    try:
+        with span("outer", agent="Test") as outer:
+            inner = start_span("inner")
+            with ThreadPoolExecutor(1) as pool:
+                in_thread = pool.submit(contextvars.copy_context().run, current_span).result()
+            task_spans = asyncio.run(tasks())
+            end_span(inner)
+        assert current_span() is None
+        lines = _events(path)
+    finally:
+        _restore()
+
+    assert in_thread is outer
+    assert {e["trace_id"] for e in lines} == {outer["trace_id"]}
+    starts = {e["span_id"]: e for e in lines if e["event"].endswith(".start")}
+    assert starts[inner["span_id"]]["parent_span_id"] == outer["span_id"]
+    # each task runs in its own span, and its events nest under it
+    assert len(set(task_spans)) == 2
+    assert all(starts[s]["parent_span_id"] == outer["span_id"] for s in task_spans)
+    assert sorted(e["parent_span_id"] for e in lines if e["event"] == "unit.task") == sorted(task_spans)
+
+
+def test_levels_and_head_sampling(tmp_path):
+    import time
+    from src.utils.logging_utils import event_enabled, sampled, span
+
+    path = tmp_path / "events.log.jsonl"
+    try:
+        # below the level nothing is written, nor is the writer even started
+        configure_logging(log_path=str(path), echo=False, level="info", levels={"unit.segment": "debug"})
+        n = 20000
+        t0 = time.perf_counter()
+        for _ in range(n):
+            with span("unit.segment.check"):
+                pass
+        per_span = (time.perf_counter() - t0) / n
+        assert logging_utils._writer is None and not path.exists()
+        assert per_span < 20e-6
+
+        configure_logging(level="debug", sample_rate=0.5)
+        traces = [logging_utils.make_trace_id() for _ in range(200)]
+        kept = [t for t in traces if sampled(t)]
+        assert 50 < len(kept) < 150
+        for t in traces:
+            with span("unit.stage", trace_id=t):
+                log_event("unit.segment.validated", {})
+                assert event_enabled("unit.segment.validated") == (t in kept)
+        lines = _events(path)
+    finally:
+        _restore()
+
+    # stage spans survive sampling; per-segment events only in sampled traces
+    assert sum(e["event"] == "unit.stage.end" for e in lines) == len(traces)
+    assert {e["trace_id"] for e in lines if e["event"] == "unit.segment.validated"} == set(kept)
+
+
+def test_evaluator_links_a_string_parent_span(tmp_path):
+    import pandas as pd
+    from src.agents.evaluator_agent import EvaluatorAgent
+
+    path = tmp_path / "events.log.jsonl"
+    configure_logging(log_path=str(path), echo=False, level="debug")
+    df = pd.DataFrame({"campaign_name": ["A", "B"], "impressions": [1000, 2000], "clicks": [10, 40],
+                       "spend": [10.0, 20.0], "revenue": [20.0, 10.0]})
+    insights = {"hypotheses": [{"id": "h1", "segment_filter": {"campaign_name": "A"}}]}
+    try:
+        root = start_span("unit.root")
+        EvaluatorAgent().evaluate(df, insights, trace_id=root["trace_id"], parent_span=root["span_id"])
+        end_span(root)
+        lines = _events(path)
+    finally:
+        _restore()
+
+    evaluate = next(e for e in lines if e["event"] == "insights.evaluate.start")
+    assert evaluate["parent_span_id"] == root["span_id"]
+    segment = next(e for e in lines if e["event"] == "insights.segment.validated")
+    assert segment["parent_span_id"] == evaluate["span_id"] and segment["payload"]["id"] == "h1"
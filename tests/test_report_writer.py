@@ -0,0 +1,63 @@
+import json
+
+import pytest
+
+from src.agents.creative_agent import CreativeAgent
+from src.agents.insight_agent import InsightAgent
+from src.utils.report_writer import ReportWriter, write_report
+
+ITEMS = [
+    {"id": "hyp_a", "segment_filter": {"campaign_name": "men — soft"}, "validation": {"mean_roas": None, "n": [1, 2]}},
+    {"id": "hyp_b", "segment_filter": {}, "validation": {}},
+]
+
+
+@pytest.mark.parametrize("items", [[], ITEMS[:1], ITEMS])
+def test_json_output_matches_json_dump(tmp_path, items):
+    pretty = write_report(str(tmp_path / "p.json"), "hypotheses", items)
+    compact = write_report(str(tmp_path / "c.json"), "hypotheses", items, compact=True)
+    lines = write_report(str(tmp_path / "l.jsonl"), "hypotheses", items, fmt="jsonl")
+
+    with open(pretty, encoding="utf-8") as f:
+        assert f.read() == json.dumps({"hypotheses": items}, indent=2)
+    with open(compact, encoding="utf-8") as f:
+        assert f.read() == json.dumps({"hypotheses": items}, separators=(",", ":"))
+    with open(lines, encoding="utf-8") as f:
+        assert [json.loads(line) for line in f] == items
+
+
+def test_failed_write_leaves_previous_report_in_place(tmp_path):
+    path = tmp_path / "insights.json"
+    path.write_text("previous", encoding="utf-8")
+
+    with pytest.raises(RuntimeError):
+        with ReportWriter(str(path), "hypotheses") as w:
+            w.add(ITEMS[0])
+            raise RuntimeError("boom")
+
+    assert path.read_text(encoding="utf-8") == "previous"
+    assert [p.name for p in tmp_path.iterdir()] == ["insights.json"]
+
+    with pytest.raises(TypeError):
+        write_report(str(path), "hypotheses", [{"bad": object()}])
+    assert path.read_text(encoding="utf-8") == "previous"
+
+
+def test_agents_stream_jsonl_and_return_same_structures(tmp_path):
+    evaluated = {"hypotheses": [
+        {"id": "h1", "segment_filter": {"campaign_name": "A"},
+         "validation": {"comment": "low_ctr", "mean_ctr": 0.005, "mean_roas": 0.5, "total_impressions": 5000}},
+        {"id": "h2", "segment_filter": {"campaign_name": "B"},
+         "validation": {"comment": "ok", "mean_ctr": 0.02, "mean_roas": 3.0, "total_impressions": 5000}},
+    ]}
+    agent = CreativeAgent(output_dir=str(tmp_path), fmt="jsonl")
+    out = agent.run(evaluated, trace_id="t")
+
+    assert [c["id"] for c in out["creatives"]] == ["h1"]
+    with open(agent.path, encoding="utf-8") as f:
+        assert [json.loads(line) for line in f] == out["creatives"]
+
+    insights = InsightAgent(output_dir=str(tmp_path), fmt="jsonl", compact=True)
+    insights.write_file(evaluated)
+    with open(insights.path, encoding="utf-8") as f:
+        assert [json.loads(line) for line in f] == evaluated["hypotheses"]
@@ -0,0 +1,56 @@
+from pathlib import Path
+
+import pandas as pd
+
+from src.schema.validator import validate_schema
+from src.utils.aggregates import SegmentAggregates
+from src.utils.result_store import ResultStore, config_hash, incremental_aggregates
+
+DATA = Path(__file__).resolve().parents[1] / "data" / "synthetic_fb_ads_undergarments.csv"
+
+CFG = {"analysis": {"low_ctr_threshold": 0.01, "min_impressions": 1000}}
+
+
+def _sample():
+    df = pd.read_csv(DATA)
+    return df[df["date"].isin(sorted(df["date"].unique())[:10])]
+
+
+def test_incremental_run_recomputes_only_new_partitions(tmp_path):
+    df = _sample()
+    dates = sorted(df["date"].unique())
+    history, latest = df[df["date"] != dates[-1]], df
+
+    store = ResultStore(str(tmp_path), config_hash(CFG))
+    incremental_aggregates(history, store, validate=validate_schema)
+
+    calls = []
+
+    def validate(part):
+        calls.append(len(part))
+        return validate_schema(part)
+
+    aggs = incremental_aggregates(latest, store, validate=validate)
+    assert calls == [int((df["date"] == dates[-1]).sum())]
+
+    expected = SegmentAggregates.from_frame(validate_schema(df.copy()))
+    assert aggs.sorted_keys() == expected.sorted_keys()
+    for key in expected.sorted_keys():
+        assert aggs.summary(key) == expected.summary(key)
+
+
+def test_changed_partition_or_config_invalidates(tmp_path):
+    df = _sample()
+    store = ResultStore(str(tmp_path), config_hash(CFG))
+    incremental_aggregates(df, store, validate=validate_schema)
+
+    changed = df.copy()
+    changed.loc[changed.index[0], "clicks"] = 1.0
+    seen = []
+    incremental_aggregates(changed, store, validate=lambda p: seen.append(p["date"].iloc[0]) or p)
+    assert seen == [df["date"].iloc[0]]
+
+    other = ResultStore(str(tmp_path), config_hash({"analysis": {"min_impressions": 5}}))
+    seen.clear()
+    incremental_aggregates(df, other, validate=lambda p: seen.append(1) or p)
+    assert len(seen) == df["date"].nunique()
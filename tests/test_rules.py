@@ -0,0 +1,81 @@
+import os
+
+import numpy as np
+import pytest
+
+from src.agents.creative_agent import CreativeAgent
+from src.utils.config_utils import load_config
+from src.utils.rules import THRESHOLDS, RuleSet, comment_rules, compile_condition, creative_rules
+
+
+def _table():
+    return {
+        "impressions": np.array([0.0, 5000.0, 5000.0, 200.0, 5000.0]),
+        "clicks": np.array([0.0, 4.0, 30.0, 20.0, 300.0]),
+        "mean_ctr": np.array([np.nan, 0.0008, 0.006, 0.1, 0.06]),
+    }
+
+
+def test_comment_rules_classify_first_match():
+    comments = comment_rules({"analysis": {"low_ctr_threshold": 0.01, "min_impressions": 1000, "min_clicks": 10}})
+    assert comments.classify(_table()).tolist() == ["small_sample", "low_clicks", "low_ctr", "small_sample", "ok"]
+
+
+def test_thresholds_and_rules_come_from_config():
+    cfg = {"analysis": {"low_ctr_threshold": 0.1, "min_impressions": 1000, "min_clicks": 1},
+           "rules": {"comments": [{"name": "low_ctr", "when": "mean_ctr < low_ctr_threshold"}]}}
+    assert comment_rules(cfg).classify(_table()).tolist() == ["ok", "low_ctr", "low_ctr", "ok", "low_ctr"]
+
+
+def test_conditions_treat_nan_as_missing():
+    mask = compile_condition("mean_roas is None or mean_roas < 1", columns=set())
+    assert mask({"mean_roas": np.array([np.nan, 0.5, 2.0])}, 3).tolist() == [True, True, False]
+    # a comparison with NaN is False, like in pandas
+    assert not compile_condition("mean_roas < 1")({"mean_roas": np.array([np.nan])}, 1).any()
+
+
+@pytest.mark.parametrize("expr", ["__import__('os')", "mean_ctr.real > 0", "mean_ctr <", "undefined_fn(mean_ctr)"])
+def test_bad_conditions_raise_value_error(expr):
+    with pytest.raises(ValueError):
+        RuleSet([{"name": "bad", "when": expr}])
+
+
+def test_creative_rule_from_config_formats_templates(tmp_path):
+    cfg = {"rules": {"creatives": [{"name": "hot", "when": "mean_ctr > 0.05",
+                                    "templates": ["Scale **{campaign}** (CTR {mean_ctr:.2%})"]}]}}
+    hyps = [{"id": i, "segment_filter": {"campaign_name": f"C{i}"}, "validation": {"mean_ctr": ctr, "comment": "ok"}}
+            for i, ctr in enumerate([0.01, 0.08])]
+    out = CreativeAgent(output_dir=str(tmp_path), rules=creative_rules(cfg)).generate({"hypotheses": hyps})
+    assert out["creatives"] == [{"id": 1, "campaign": "C1", "issues": "ok",
+                                 "creative_recommendations": ["Scale **C1** (CTR 8.00%)"], "confidence": 0.0}]
+
+    bad = {"rules": {"creatives": [{"name": "x", "when": "True", "templates": ["{nope}"]}]}}
+    with pytest.raises(ValueError):
+        CreativeAgent(output_dir=str(tmp_path), rules=creative_rules(bad)).generate({"hypotheses": hyps})
+
+
+def test_load_config_is_cached_until_the_file_changes(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    path = tmp_path / "config.yaml"
+    path.write_text("analysis:\n  min_clicks: 10\n")
+    first = load_config()
+    first["analysis"]["min_clicks"] = 99  # callers get a copy
+    assert load_config()["analysis"]["min_clicks"] == 10
+
+    path.write_text("analysis:\n  min_clicks: 250\n")
+    os.utime(path, ns=(path.stat().st_atime_ns, path.stat().st_mtime_ns + 10**9))
+    assert load_config()["analysis"]["min_clicks"] == 250
+
+
+def test_fallback_config_leaves_defaults_to_the_callers(tmp_path, monkeypatch):
+    from src.agents.planner import pipeline_mode
+    from src.utils.compact import needed_columns
+
+    configured = load_config()
+    monkeypatch.chdir(tmp_path)
+    fallback = load_config()
+    assert set(fallback) < set(configured)
+    assert pipeline_mode(fallback) == pipeline_mode(configured) == "in_memory"
+    assert needed_columns(fallback) == needed_columns(configured)
+    ours, theirs = comment_rules(fallback).params, comment_rules(configured).params
+    assert all(ours[k] == theirs[k] for k in THRESHOLDS)
@@ -0,0 +1,124 @@
+import http.client
+import json
+import threading
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from src.agents.evaluator_agent import EvaluatorAgent
+from src.service import AnalyticsService, make_server
+from src.utils.lru import LRUCache
+
+DATA = Path(__file__).resolve().parents[1] / "data" / "synthetic_fb_ads_undergarments.csv"
+
+
+def test_lru_cache_bounds_entries_and_bytes():
+    cache = LRUCache(max_entries=3, max_bytes=10)
+    cache.put("a", b"1234")
+    cache.put("b", b"1234")
+    assert cache.get("a") == b"1234"  # "a" is now most recent
+    cache.put("c", b"1234")  # 12 bytes > 10: evicts "b"
+    assert cache.get("b") is None and cache.get("a") == b"1234"
+    cache.put("big", b"x" * 11)  # larger than the whole budget: not cached
+    assert cache.get("big") is None
+    assert cache.bytes <= 10 and len(cache) <= 3
+
+
+@pytest.fixture(scope="module")
+def server():
+    service = AnalyticsService(str(DATA))
+    srv = make_server(service, port=0)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    yield service, srv.server_address[1]
+    srv.shutdown()
+    srv.server_close()
+
+
+def _request(port, method, path, body=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    conn.request(method, path, body=json.dumps(body) if body is not None else None)
+    resp = conn.getresponse()
+    data = json.loads(resp.read())
+    conn.close()
+    return resp.status, resp.getheader("X-Cache"), data
+
+
+def test_evaluate_matches_evaluator_and_is_cached(server):
+    service, port = server
+    seg = {"campaign_name": "Men ComfortMax Launch", "platform": "Facebook"}
+
+    status, cache, first = _request(port, "POST", "/evaluate", {"segment_filter": seg})
+    assert status == 200 and cache == "miss"
+    _, cache, again = _request(port, "POST", "/evaluate", {"segment_filter": seg})
+    assert cache == "hit" and again == first
+
+    expected = EvaluatorAgent().evaluate(service.df, {"hypotheses": [{"id": "h", "segment_filter": seg}]})
+    assert first["validation"] == expected["hypotheses"][0]["validation"]
+    assert first["validation"]["sample_size"] > 0
+
+
+def test_segments_rank_and_errors(server):
+    _, port = server
+    status, _, top = _request(port, "GET", "/segments?metric=mean_roas&order=top&limit=5&min_impressions=1000")
+    roas = [s["validation"]["mean_roas"] for s in top["segments"]]
+    assert status == 200 and len(roas) == 5 and roas == sorted(roas, reverse=True)
+
+    assert _request(port, "GET", "/segments?metric=nope")[0] == 400
+    assert _request(port, "GET", "/nowhere")[0] == 404
+    status, _, creatives = _request(port, "POST", "/creatives", {})
+    assert status == 200 and "creatives" in creatives
+
+
+def test_reload_during_queries_never_caches_the_old_dataset(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    full, part = tmp_path / "full.csv", tmp_path / "part.csv"
+    df = pd.read_csv(DATA)
+    df.to_csv(full, index=False)
+    df.iloc[:1500].to_csv(part, index=False)
+    service = AnalyticsService(str(full))
+    params = {"dimension": "campaign_name", "metric": "sample_size", "limit": 1000}
+
+    def answer(svc):
+        return json.loads(svc.handle("GET", "/segments", dict(params))[0])
+
+    # a reload lands while a query is ranking the old dataset
+    validate, calls = service.evaluator.validate_segments, []
+
+    def reload_midway(*a, **k):
+        if not calls:
+            calls.append(1)
+            service.df_path = str(part)
+            service.load()
+        return validate(*a, **k)
+
+    monkeypatch.setattr(service.evaluator, "validate_segments", reload_midway)
+    dimensions = service.index.dimensions
+    stale = answer(service)
+    # each load canonicalizes with its own dictionary, so replaced datasets leave nothing behind
+    assert service.index.dimensions is not dimensions
+    assert sum(s["validation"]["sample_size"] for s in stale["segments"]) == len(df)
+    body, cached = service.handle("GET", "/segments", dict(params))
+    assert not cached and json.loads(body) == answer(AnalyticsService(str(part)))
+
+    # queries racing repeated reloads settle on the last dataset loaded
+    stop = threading.Event()
+
+    def query():
+        while not stop.is_set():
+            answer(service)
+            service.handle("POST", "/evaluate", {"segment_filter": {"platform": "Facebook"}})
+
+    threads = [threading.Thread(target=query) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for path in (full, part, full):
+        service.df_path = str(path)
+        service.load()
+    stop.set()
+    for t in threads:
+        t.join()
+    fresh = AnalyticsService(str(full))
+    assert answer(service) == answer(fresh)
+    seg = {"segment_filter": {"platform": "Facebook"}}
+    assert service.handle("POST", "/evaluate", seg)[0] == fresh.handle("POST", "/evaluate", seg)[0]
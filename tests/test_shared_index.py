@@ -0,0 +1,44 @@
+import json
+from pathlib import Path
+
+import pandas as pd
+
+from src.agents.evaluator_agent import EvaluatorAgent
+from src.schema.validator import validate_schema
+from src.utils.segment_index import SegmentIndex
+from src.utils.shared_index import SharedSegmentIndex
+
+DATA = Path(__file__).resolve().parents[1] / "data" / "synthetic_fb_ads_undergarments.csv"
+
+
+def _segments(df):
+    segments = [{"campaign_name": c, "platform": p} for c, p in
+                df[["campaign_name", "platform"]].drop_duplicates().itertuples(index=False)]
+    segments += [{"country": c} for c in df["country"].dropna().unique()]
+    return segments + [{"campaign_name": "No Such Campaign"}, {"platform": ["unhashable"]}, {}, {"bogus": 1}]
+
+
+def test_shared_aggregates_match_the_index():
+    df = validate_schema(pd.read_csv(DATA))
+    segments = _segments(df)[:-2]
+    index = SegmentIndex(df)
+    with SharedSegmentIndex(index, workers=2, shard_size=50) as shared:
+        assert shared.aggregate_many(segments) == [index.aggregate(s) for s in segments]
+
+
+def test_batched_aggregates_match_single_lookups():
+    df = validate_schema(pd.read_csv(DATA))
+    segments = _segments(df)[:-2]
+    segments += [{"platform": p, "campaign_name": c} for c, p in
+                 df[["campaign_name", "platform"]].drop_duplicates().head(20).itertuples(index=False)]
+    segments += [{"campaign_name": "No Such Campaign", "platform": "FB"}]
+    index = SegmentIndex(df)
+    assert index.aggregate_many(segments) == [SegmentIndex(df).aggregate(s) for s in segments]
+
+
+def test_parallel_evaluation_is_byte_identical():
+    df = validate_schema(pd.read_csv(DATA))
+    insights = {"hypotheses": [{"id": f"h{i}", "segment_filter": s} for i, s in enumerate(_segments(df))]}
+    serial = EvaluatorAgent().evaluate(df, insights)
+    parallel = EvaluatorAgent(workers=2, shard_size=50).evaluate(df, insights)
+    assert json.dumps(parallel) == json.dumps(serial)
@@ -0,0 +1,112 @@
+import pickle
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.agents.evaluator_agent import EvaluatorAgent
+from src.agents.insight_agent import InsightAgent
+from src.agents.planner import PlannerAgent, pipeline_mode
+from src.schema.validator import validate_schema
+from src.utils.approx_aggregates import ApproxAggregates
+from src.utils.dimensions import canonicalize_dimensions
+from src.utils.segment_index import SegmentIndex
+from src.utils.sketches import CountMinSketch, HyperLogLog, KLLSketch, hash64
+
+DATA = Path(__file__).resolve().parents[1] / "data" / "synthetic_fb_ads_undergarments.csv"
+
+
+def _dataset(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return canonicalize_dimensions(validate_schema(pd.read_csv(DATA)))[0]
+
+
+def test_sketches_stay_within_their_bounds_after_merging():
+    rng = np.random.default_rng(7)
+    values = rng.lognormal(size=200_000)
+    keys = rng.zipf(1.5, size=200_000).astype(str)
+
+    halves = [(KLLSketch(200).update(v), HyperLogLog(12).update(k), CountMinSketch(1024, 4).add(hash64(k)))
+              for v, k in ((values[:100_000], keys[:100_000]), (values[100_000:], keys[100_000:]))]
+    # the second half travels as bytes, as it would from another process
+    kll, hll, cm = halves[0]
+    other = pickle.loads(pickle.dumps(halves[1]))
+    kll.merge(other[0])
+    hll.merge(other[1])
+    cm.merge(other[2])
+
+    ordered = np.sort(values)
+    for q, v in zip((0.1, 0.5, 0.99), kll.quantiles((0.1, 0.5, 0.99))):
+        assert abs(np.searchsorted(ordered, v) / len(values) - q) <= kll.rank_error
+    assert sum(len(level) for level in kll.levels) < 4 * kll.k
+
+    distinct = len(set(keys))
+    assert abs(hll.estimate() - distinct) <= 4 * hll.relative_error * distinct
+    assert HyperLogLog(12).update(["a", "b", "a", None]).estimate() == pytest.approx(2.0, rel=1e-3)
+
+    uniq, counts = np.unique(keys, return_counts=True)
+    est = cm.estimate(hash64(uniq))
+    assert (est >= counts).all() and (est - counts).max() <= cm.error
+
+
+def test_merged_chunks_match_one_pass_and_memory_is_fixed(tmp_path, monkeypatch):
+    df = _dataset(tmp_path, monkeypatch)
+    whole = ApproxAggregates.from_frame(df, sample_rows=20)
+    parts = [pickle.loads(pickle.dumps(ApproxAggregates.from_chunks([c], sample_rows=20)))
+             for c in (df.iloc[:1500], df.iloc[1500:3000], df.iloc[3000:])]
+    merged = parts[0].merge(parts[1]).merge(parts[2])
+
+    assert merged.rows == whole.rows == len(df)
+    key = whole.sorted_keys()[-1]
+    assert merged.summary(key)["impressions"] == pytest.approx(whole.summary(key)["impressions"], rel=1e-12)
+    # bottom-k samples and HyperLogLog registers do not depend on how the rows were split
+    assert merged.sample.equals(whole.sample)
+    assert (merged.groups[key]["distinct"]["adset_name"].registers ==
+            whole.groups[key]["distinct"]["adset_name"].registers).all()
+
+    # four times the rows, the same state (up to a KLL level or two)
+    bigger = ApproxAggregates.from_chunks([df] * 4, sample_rows=20)
+    assert len(pickle.dumps(bigger)) < 1.1 * len(pickle.dumps(whole))
+
+
+def test_sampled_filters_come_with_error_bounds(tmp_path, monkeypatch):
+    df = _dataset(tmp_path, monkeypatch)
+    exact = SegmentIndex(df)
+    seg = {"adset_name": df["adset_name"].iloc[0], "platform": df["platform"].iloc[0]}
+
+    # a sample holding every row is exact
+    full = ApproxAggregates.from_frame(df, sample_rows=len(df)).aggregate(seg)
+    assert full["sample_size"] == exact.aggregate(seg)["sample_size"]
+    assert full["approximate"]["error_bounds"]["impressions"] == 0
+
+    sampled = ApproxAggregates.from_frame(df, sample_rows=8)
+    agg = sampled.aggregate(seg)
+    bounds = agg["approximate"]["error_bounds"]
+    assert 0 < agg["approximate"]["sampled_rows"] < exact.aggregate(seg)["sample_size"]
+    assert abs(agg["impressions"] - exact.aggregate(seg)["impressions"]) <= 1.5 * bounds["impressions"]
+    assert sampled.missing_columns({"creative_message": "x"}) == ["creative_message"]
+
+
+def test_approximate_mode_feeds_insights_and_evaluator(tmp_path, monkeypatch):
+    df = _dataset(tmp_path, monkeypatch)
+    cfg = {"analysis": {"approximate": {"enabled": True}}, "data": {"chunksize": 100}}
+    assert pipeline_mode(cfg) == "approximate"
+    assert PlannerAgent().generate_plan("approximate")["steps"][0] == "aggregate_dataset"
+
+    aggs = ApproxAggregates.from_chunks([df.iloc[:2000], df.iloc[2000:]], distinct=("adset_name", "creative_type"))
+    insights = InsightAgent().generate_from_aggregates(aggs, write=False)
+    top = max(insights["hypotheses"], key=lambda h: h["validation"]["sample_size"])
+    approx = top["validation"]["approximate"]
+    assert approx["ctr_quantiles"]["p10"] <= approx["ctr_quantiles"]["p50"] <= approx["ctr_quantiles"]["p90"]
+    campaign = df[df["campaign_name"] == top["segment_filter"]["campaign_name"]]
+    distinct = approx["distinct"]["creative_type"]["estimate"]
+    assert distinct == pytest.approx(campaign["creative_type"].nunique(), rel=0.05)
+    heaviest = campaign.groupby("adset_name", observed=True)["impressions"].sum().idxmax()
+    assert approx["top_adset_name"][0]["adset_name"] == heaviest
+
+    # finer filters than the aggregates' dims are answered from the sample instead of "segment_not_found"
+    trend = {"hypotheses": [{"id": "t", "segment_filter": {**top["segment_filter"], "adset_name": heaviest}}]}
+    evaluated = EvaluatorAgent().evaluate(None, {"hypotheses": []}, index=aggs, trends=trend)
+    validation = evaluated["trends"][0]["validation"]
+    assert validation["sample_size"] > 0 and "error_bounds" in validation["approximate"]
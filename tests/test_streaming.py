@@ -0,0 +1,56 @@
+from pathlib import Path
+
+import pandas as pd
+import pytest
+
+from src.agents.evaluator_agent import EvaluatorAgent
+from src.agents.insight_agent import InsightAgent
+from src.schema.validator import validate_schema
+from src.utils.aggregates import SegmentAggregates
+from src.utils.data_utils import iter_dataset
+
+DATA = Path(__file__).resolve().parents[1] / "data" / "synthetic_fb_ads_undergarments.csv"
+
+
+def test_streaming_and_in_memory_insights_are_identical(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+
+    df = validate_schema(pd.read_csv(DATA))
+    InsightAgent().generate(df)
+    in_memory = (tmp_path / "reports" / "insights.json").read_bytes()
+
+    aggs = SegmentAggregates.from_chunks(validate_schema(c) for c in pd.read_csv(DATA, chunksize=97))
+    InsightAgent().generate_from_aggregates(aggs)
+    streamed = (tmp_path / "reports" / "insights.json").read_bytes()
+
+    assert streamed == in_memory
+
+
+def test_aggregates_merge_across_partitions_and_feed_evaluator():
+    df = pd.read_csv(DATA)
+    whole = SegmentAggregates.from_frame(df)
+    left = SegmentAggregates.from_frame(df.iloc[:1000])
+    right = SegmentAggregates.from_frame(df.iloc[1000:])
+    merged = left.merge(right)
+
+    for key in whole.sorted_keys():
+        assert merged.summary(key) == whole.summary(key)
+
+    campaign = whole.sorted_keys()[0][0]
+    insights = {"hypotheses": [
+        {"id": "h1", "segment_filter": {"campaign_name": campaign}},
+        {"id": "h2", "segment_filter": {"platform": "Facebook"}},
+    ]}
+    from_aggs = EvaluatorAgent().evaluate(None, insights, index=merged)["hypotheses"]
+    from_frame = EvaluatorAgent().evaluate(df, insights)["hypotheses"]
+
+    a, b = from_aggs[0]["validation"], from_frame[0]["validation"]
+    assert a["sample_size"] == b["sample_size"]
+    assert a["total_impressions"] == b["total_impressions"]
+    assert a["mean_ctr"] == pytest.approx(b["mean_ctr"])
+    assert from_aggs[1]["validation"]["comment"] == "segment_not_found"
+
+
+def test_iter_dataset_yields_bounded_chunks():
+    sizes = [len(c) for c in iter_dataset(chunksize=1000, path=str(DATA))]
+    assert sizes == [1000, 1000, 1000, 1000, 500]
@@ -0,0 +1,75 @@
+import numpy as np
+import pandas as pd
+
+from src.agents.creative_agent import CreativeAgent
+from src.agents.evaluator_agent import EvaluatorAgent
+from src.agents.trend_agent import TrendAgent
+from src.utils.timeseries import TrendState
+
+KEYS = ("campaign_name", "creative_type")
+
+
+def _daily(days=35, seed=0):
+    rng = np.random.default_rng(seed)
+    dates = pd.date_range("2025-01-01", periods=days, freq="D")
+    rows = []
+    for name, decay in (("Fading", 0.05), ("Steady", 0.0)):
+        for i, d in enumerate(dates):
+            impressions = 20000
+            ctr = 0.02 * (1 - decay) ** i
+            rows.append({
+                "campaign_name": name, "creative_type": "Image", "date": d.strftime("%Y-%m-%d"),
+                "impressions": impressions, "clicks": rng.binomial(impressions, ctr),
+                "spend": 100.0, "revenue": 300.0 * (1 - decay) ** i, "platform": "Facebook",
+            })
+    return pd.DataFrame(rows)
+
+
+def test_rolling_matches_pandas_window_sums():
+    df = _daily()
+    state = TrendState.from_frame(df, keys=KEYS, window_days=7, slope_days=28)
+    got = state.rolling().sort_values(["campaign_name", "date"]).reset_index(drop=True)
+
+    frame = df.assign(date=pd.to_datetime(df["date"])).sort_values(["campaign_name", "date"])
+    sums = (frame.set_index("date").groupby("campaign_name")[["clicks", "impressions"]]
+            .rolling("7D").sum().reset_index())
+    sums = sums[sums["date"].isin(got["date"])].reset_index(drop=True)
+    np.testing.assert_allclose(got["ctr"], sums["clicks"] / sums["impressions"])
+
+
+def test_decaying_series_is_flagged_and_flat_series_is_not():
+    hyps = TrendState.from_frame(_daily(), keys=KEYS).hypotheses()
+    flagged = {h["segment_filter"]["campaign_name"]: h["trend"]["status"] for h in hyps}
+    assert flagged == {"Fading": "fatigue"}
+    trend = hyps[0]["trend"]
+    assert trend["ctr_change"] < -0.2 and trend["ctr_slope"] < 0 and trend["ctr_p_value"] < 0.05
+    assert trend["as_of"] == "2025-02-04"
+
+
+def test_incremental_updates_match_a_full_build():
+    df = _daily()
+    full = TrendState.from_frame(df, keys=KEYS)
+
+    state = TrendState(keys=KEYS)
+    for _, day in df.groupby("date", sort=True):
+        state.update(day)
+    left = TrendState.from_frame(df[df["campaign_name"] == "Fading"], keys=KEYS)
+    merged = left.merge(TrendState.from_frame(df[df["campaign_name"] == "Steady"], keys=KEYS))
+
+    expected = full.rolling().sort_values(["campaign_name", "date"]).reset_index(drop=True)
+    for other in (state, merged):
+        got = other.rolling().sort_values(["campaign_name", "date"]).reset_index(drop=True)
+        pd.testing.assert_frame_equal(got, expected)
+        assert other.hypotheses() == full.hypotheses()
+
+
+def test_trends_flow_into_evaluation_and_creatives(tmp_path):
+    df = _daily()
+    trends = TrendAgent(output_dir=str(tmp_path), keys=KEYS).generate(df)
+    evaluated = EvaluatorAgent().evaluate(df, {"hypotheses": []}, trends=trends)
+
+    assert [t["validation"]["comment"] for t in evaluated["trends"]] == ["creative_fatigue"]
+    ideas = CreativeAgent(output_dir=str(tmp_path)).generate(evaluated)
+    [idea] = ideas["creatives"]
+    assert idea["campaign"] == "Fading" and idea["issues"] == "creative_fatigue"
+    assert "Creative fatigue on **Fading / Image**" in idea["creative_recommendations"][0]
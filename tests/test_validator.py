@@ -0,0 +1,57 @@
+import json
+
+import pandas as pd
+import pytest
+
+from src.schema.validator import validate_schema
+
+
+def _frame(**overrides):
+    data = {
+        "campaign_name": ["A", "A", "B", "B"],
+        "creative_type": ["X"] * 4,
+        "audience_type": ["Y"] * 4,
+        "platform": ["FB"] * 4,
+        "country": ["IN"] * 4,
+        "impressions": [1000, 0, 500, 200],
+        "clicks": [10, 0, 5, None],
+        "spend": [10.0, 5.0, 0.0, 4.0],
+        "revenue": [20.0, 0.0, 3.0, None],
+    }
+    data.update(overrides)
+    return pd.DataFrame(data)
+
+
+def test_validate_schema_derives_metrics_without_row_loop():
+    df = validate_schema(_frame())
+    assert list(df["ctr"]) == [0.01, 0.0, 0.01, 0.0]
+    assert list(df["roas"]) == [2.0, 0.0, 0.0, 0.0]
+    assert str(df["impressions"].dtype) == "int64"
+    assert str(df["clicks"].dtype) == "int64"
+
+
+def test_validate_schema_missing_columns():
+    with pytest.raises(ValueError):
+        validate_schema(pd.DataFrame({"campaign_name": ["A"]}))
+
+
+def test_validate_schema_quarantines_bad_rows(tmp_path, monkeypatch):
+    monkeypatch.setattr("src.utils.data_utils.DL_DIR", tmp_path)
+    df = _frame(
+        impressions=[1000, 10, 500, 200],
+        clicks=[10, 50, 5, "oops"],
+        spend=[10.0, 5.0, -1.0, 4.0],
+    )
+    out = validate_schema(df)
+
+    assert list(out["campaign_name"]) == ["A"]
+    files = list(tmp_path.glob("schema_quarantine_*.json"))
+    assert len(files) == 1
+    payload = json.loads(files[0].read_text(encoding="utf-8"))
+    assert payload["count"] == 3
+    assert payload["reasons"] == {
+        "non_numeric_clicks": 1,
+        "negative_spend": 1,
+        "clicks_gt_impressions": 1,
+    }
+    assert payload["rows"][-1]["clicks"] == "oops"
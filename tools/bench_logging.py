@@ -0,0 +1,65 @@
+"""Micro-benchmark: events/sec on the pipeline thread for log_event.
+
+Compares the previous synchronous writer (exists checks + open/write/close +
+print per event) with the buffered background writer.
+
+    python -m tools.bench_logging --events 50000
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import tempfile
+import time
+
+from src.utils import logging_utils
+
+
+def _legacy_log_event(path, event_name, payload=None, trace_id=None, parent_span_id=None, agent=None):
+    p = payload or {}
+    entry = {
+        "timestamp": logging_utils._utc_now(),
+        "event": event_name,
+        "trace_id": trace_id or logging_utils.make_trace_id(),
+        "parent_span_id": parent_span_id,
+        "agent": agent,
+        "payload": p,
+    }
+    logging_utils._ensure_logfile(path)
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(entry, default=str, ensure_ascii=False) + "\n")
+    print(f'[{event_name}] {p}')
+
+
+def _rate(n, fn):
+    payload = {"rows": 4500, "note": "bench"}
+    with contextlib.redirect_stdout(io.StringIO()):
+        t0 = time.perf_counter()
+        for i in range(n):
+            fn("bench.event", payload, trace_id="t", parent_span_id="s", agent="Bench")
+        enqueue = time.perf_counter() - t0
+        logging_utils.flush_events()
+        total = time.perf_counter() - t0
+    return n / enqueue, n / total
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--events", type=int, default=50000)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as d:
+        legacy_path = os.path.join(d, "legacy.jsonl")
+        legacy, _ = _rate(args.events, lambda *a, **k: _legacy_log_event(legacy_path, *a, **k))
+        print(f"legacy synchronous           : {legacy:12,.0f} events/s")
+
+        for echo in (True, False):
+            logging_utils.configure_logging(log_path=os.path.join(d, f"buffered_{echo}.jsonl"), echo=echo)
+            caller, drained = _rate(args.events, logging_utils.log_event)
+            print(f"buffered echo={echo!s:5} caller : {caller:12,.0f} events/s (incl. drain {drained:,.0f}/s)")
+        logging_utils.close_events()
+
+
+if __name__ == "__main__":
+    main()
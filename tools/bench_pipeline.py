@@ -0,0 +1,234 @@
+"""Pipeline benchmark suite: per-stage wall time and peak memory at several scales.
+
+Each scale gets a seeded synthetic dataset (see ``tools/synth_data.py``,
+cached under ``.cache/bench``). The stages are timed separately:
+load (CSV parse), validate (schema validation + dimension canonicalization),
+and then InsightAgent, EvaluatorAgent, CreativeAgent and ReportAgent. Timing
+passes run without tracemalloc; one extra pass measures each stage's
+tracemalloc peak.
+
+    python -m tools.bench_pipeline run --rows 10000 1000000 10000000 --out reports/bench/current.json
+    python -m tools.bench_pipeline compare reports/bench/baseline.json reports/bench/current.json --threshold 0.2
+
+``compare`` exits with status 1 when a stage got slower (or used more
+memory) than the baseline by more than the threshold.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from typing import Any, Callable, Dict, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.utils import logging_utils
+from tools.synth_data import write_csv
+
+DATA_DIR = os.path.join(".cache", "bench")
+STAGES = ("load", "validate", "insights", "evaluate", "creatives", "report")
+
+
+def dataset_path(rows: int, seed: int, data_dir: str = DATA_DIR) -> str:
+    path = os.path.join(data_dir, f"synthetic_{rows}_s{seed}.csv")
+    if not os.path.exists(path):
+        write_csv(path, rows, seed=seed)
+    return path
+
+
+def _stages(path: str, workdir: str) -> List[Tuple[str, Callable[[dict], None]]]:
+    from src.schema.validator import validate_schema
+    from src.utils.dimensions import canonicalize_dimensions
+    from src.agents.insight_agent import InsightAgent
+    from src.agents.evaluator_agent import EvaluatorAgent
+    from src.agents.creative_agent import CreativeAgent
+    from src.agents.report_agent import ReportAgent
+
+    def load(st):
+        st["df"] = pd.read_csv(path)
+
+    def validate(st):
+        st["df"] = canonicalize_dimensions(validate_schema(st["df"]))[0]
+
+    def insights(st):
+        st["insights"] = InsightAgent(output_dir=os.path.join(workdir, "reports")).run(st["df"], trace_id="bench")
+
+    def evaluate(st):
+        st["evaluated"] = EvaluatorAgent().evaluate(st["df"], st["insights"], trace_id="bench", parent_span=None)
+
+    def creatives(st):
+        st["creatives"] = CreativeAgent().run(st["evaluated"], trace_id="bench")
+
+    def report(st):
+        ReportAgent().run(st["evaluated"], st["creatives"], trace_id="bench")
+
+    return [("load", load), ("validate", validate), ("insights", insights), ("evaluate", evaluate),
+            ("creatives", creatives), ("report", report)]
+
+
+def _pass(stages, memory: bool) -> Dict[str, float]:
+    out = {}
+    state: Dict[str, Any] = {}
+    for name, fn in stages:
+        if memory:
+            tracemalloc.reset_peak()
+            base, _ = tracemalloc.get_traced_memory()
+            fn(state)
+            out[name] = tracemalloc.get_traced_memory()[1] - base
+        else:
+            t0 = time.perf_counter()
+            fn(state)
+            out[name] = time.perf_counter() - t0
+    return out
+
+
+def bench_scale(rows: int, seed: int = 0, repeat: int = 3, memory: bool = True,
+                data_dir: str = DATA_DIR) -> Dict[str, Any]:
+    path = dataset_path(rows, seed, data_dir)
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory() as workdir, contextlib.redirect_stdout(io.StringIO()):
+        logging_utils.configure_logging(log_path=os.path.join(workdir, "events.log.jsonl"), echo=False)
+        os.chdir(workdir)  # CreativeAgent/ReportAgent write to ./reports
+        try:
+            stages = _stages(os.path.join(cwd, path), workdir)
+            runs = [_pass(stages, memory=False) for _ in range(max(1, repeat))]
+            peaks = None
+            if memory:
+                tracemalloc.start()
+                try:
+                    peaks = _pass(stages, memory=True)
+                finally:
+                    tracemalloc.stop()
+        finally:
+            os.chdir(cwd)
+            logging_utils.close_events()
+
+    result = {"rows": rows, "file_bytes": os.path.getsize(path), "stages": {}}
+    for name in STAGES:
+        times = [r[name] for r in runs]
+        result["stages"][name] = {
+            "seconds": min(times),
+            "median_seconds": statistics.median(times),
+            "runs": times,
+            "peak_bytes": None if peaks is None else int(peaks[name]),
+        }
+    return result
+
+
+def run_suite(rows: List[int], seed: int = 0, repeat: int = 3, memory: bool = True,
+              data_dir: str = DATA_DIR) -> Dict[str, Any]:
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "seed": seed,
+            "repeat": repeat,
+        },
+        "results": {str(n): bench_scale(n, seed=seed, repeat=repeat, memory=memory, data_dir=data_dir) for n in rows},
+    }
+
+
+def compare(baseline: Dict[str, Any], current: Dict[str, Any], threshold: float = 0.2,
+            min_seconds: float = 0.05, memory_threshold: float = None) -> List[Dict[str, Any]]:
+    """Per (scale, stage) comparison rows; ``regressed`` marks those past the threshold.
+
+    A time regression must exceed both ``threshold`` (relative) and
+    ``min_seconds`` (absolute) so sub-noise stages do not flap. Memory is
+    compared with ``memory_threshold`` (defaults to ``threshold``).
+    """
+    memory_threshold = threshold if memory_threshold is None else memory_threshold
+    rows = []
+    for scale, cur in current.get("results", {}).items():
+        base = baseline.get("results", {}).get(scale)
+        if base is None:
+            continue
+        for stage, c in cur["stages"].items():
+            b = base["stages"].get(stage)
+            if b is None:
+                continue
+            ratio = c["seconds"] / b["seconds"] if b["seconds"] else float("inf")
+            slow = ratio > 1 + threshold and c["seconds"] - b["seconds"] > min_seconds
+            mem_ratio = None
+            heavy = False
+            if c.get("peak_bytes") is not None and b.get("peak_bytes"):
+                mem_ratio = c["peak_bytes"] / b["peak_bytes"]
+                heavy = mem_ratio > 1 + memory_threshold
+            rows.append({
+                "rows": int(scale), "stage": stage,
+                "baseline_seconds": b["seconds"], "current_seconds": c["seconds"], "ratio": ratio,
+                "memory_ratio": mem_ratio, "regressed": slow or heavy,
+            })
+    return rows
+
+
+def _print_results(suite: Dict[str, Any]):
+    for scale, res in suite["results"].items():
+        print(f"rows={int(scale):,}")
+        for stage, s in res["stages"].items():
+            peak = "" if s["peak_bytes"] is None else f"  peak {s['peak_bytes'] / (1 << 20):9.1f} MB"
+            print(f"  {stage:10s} {s['seconds']:9.3f}s{peak}")
+
+
+def _print_compare(rows: List[Dict[str, Any]]):
+    for r in rows:
+        mem = "" if r["memory_ratio"] is None else f"  mem x{r['memory_ratio']:.2f}"
+        flag = "  REGRESSION" if r["regressed"] else ""
+        print(f"rows={r['rows']:<10,} {r['stage']:10s} {r['baseline_seconds']:9.3f}s -> "
+              f"{r['current_seconds']:9.3f}s  x{r['ratio']:.2f}{mem}{flag}")
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser()
+    sub = ap.add_subparsers(dest="cmd", required=True)
+
+    r = sub.add_parser("run", help="benchmark the pipeline stages")
+    r.add_argument("--rows", type=int, nargs="+", default=[10_000, 1_000_000, 10_000_000])
+    r.add_argument("--seed", type=int, default=0)
+    r.add_argument("--repeat", type=int, default=3)
+    r.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    r.add_argument("--out", default=os.path.join("reports", "bench", "current.json"))
+
+    c = sub.add_parser("compare", help="fail if CURRENT regressed against BASELINE")
+    c.add_argument("baseline")
+    c.add_argument("current")
+    c.add_argument("--threshold", type=float, default=0.2, help="allowed relative slowdown (0.2 = 20%%)")
+    c.add_argument("--min-seconds", type=float, default=0.05, help="ignore slowdowns smaller than this")
+    c.add_argument("--memory-threshold", type=float, default=None)
+
+    args = ap.parse_args(argv)
+    if args.cmd == "run":
+        suite = run_suite(args.rows, seed=args.seed, repeat=args.repeat, memory=not args.no_memory)
+        os.makedirs(os.path.dirname(args.out) or ".", exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(suite, f, indent=2)
+        _print_results(suite)
+        print(f"results written to {args.out}")
+        return 0
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    rows = compare(baseline, current, threshold=args.threshold, min_seconds=args.min_seconds,
+                   memory_threshold=args.memory_threshold)
+    _print_compare(rows)
+    regressed = [r for r in rows if r["regressed"]]
+    if regressed:
+        print(f"{len(regressed)} stage(s) regressed")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
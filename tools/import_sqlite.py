@@ -0,0 +1,30 @@
+"""Copy a CSV export into an indexed SQLite file for filtered pipeline runs.
+
+The table gets indexes on the date and on (country|platform|campaign_name,
+date), so ``data.query`` filters read only the matching rows:
+
+    python -m tools.import_sqlite data/synthetic_fb_ads_undergarments.csv data/ads.sqlite
+    python -m src.run --days 7 --end 2025-03-31 --where country=US   # with data.path: data/ads.sqlite
+"""
+import argparse
+import time
+
+from src.utils.data_source import SQLiteSource
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Import a CSV export into an indexed SQLite table.")
+    ap.add_argument("csv")
+    ap.add_argument("sqlite")
+    ap.add_argument("--table", default="ads")
+    ap.add_argument("--date-column", default="date")
+    args = ap.parse_args(argv)
+
+    t0 = time.perf_counter()
+    source = SQLiteSource.import_csv(args.csv, args.sqlite, table=args.table, date_column=args.date_column)
+    print(f"{args.sqlite}: table {source.table!r} with {len(source.columns())} columns "
+          f"in {time.perf_counter() - t0:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
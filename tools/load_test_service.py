@@ -0,0 +1,128 @@
+"""Load test for the resident analytics service (``src/service.py``).
+
+Without ``--url`` an in-process service is started on a free local port.
+Each client thread keeps one HTTP/1.1 connection open and sends
+``/evaluate`` queries for segment filters drawn from the dataset (single
+campaigns plus campaign x platform/country pairs); ``--repeat-share``
+controls how many requests reuse a small hot set, so both cache hits and
+misses are exercised.
+
+    python -m tools.load_test_service --requests 20000 --clients 8
+    python -m tools.load_test_service --url http://127.0.0.1:8765 --requests 5000
+"""
+import argparse
+import http.client
+import json
+import random
+import statistics
+import threading
+import time
+from urllib.parse import urlsplit
+
+import pandas as pd
+
+from src.utils.config_utils import load_config
+
+
+def _filters(df_path: str, limit: int = 2000):
+    df = pd.read_csv(df_path, usecols=["campaign_name", "platform", "country"])
+    out = [{"campaign_name": c} for c in df["campaign_name"].unique()]
+    for col in ("platform", "country"):
+        pairs = df[["campaign_name", col]].drop_duplicates()
+        out.extend({"campaign_name": c, col: v} for c, v in pairs.itertuples(index=False))
+    return out[:limit]
+
+
+def _percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    i = min(len(sorted_values) - 1, max(0, int(round(q / 100 * len(sorted_values))) - 1))
+    return sorted_values[i]
+
+
+def run_load(url: str, filters, requests: int, clients: int, repeat_share: float, seed: int = 0):
+    parts = urlsplit(url)
+    hot = filters[: max(1, len(filters) // 20)]
+    latencies, errors, hits = [], [0], [0]
+    lock = threading.Lock()
+    per_client = max(1, requests // clients)
+
+    def client(n, rng):
+        conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=30)
+        local, local_hits, local_errors = [], 0, 0
+        for _ in range(n):
+            seg = rng.choice(hot) if rng.random() < repeat_share else rng.choice(filters)
+            body = json.dumps({"segment_filter": seg})
+            t0 = time.perf_counter()
+            conn.request("POST", "/evaluate", body=body, headers={"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            resp.read()
+            local.append((time.perf_counter() - t0) * 1000)
+            if resp.status != 200:
+                local_errors += 1
+            if resp.getheader("X-Cache") == "hit":
+                local_hits += 1
+        conn.close()
+        with lock:
+            latencies.extend(local)
+            hits[0] += local_hits
+            errors[0] += local_errors
+
+    threads = [threading.Thread(target=client, args=(per_client, random.Random(seed + i))) for i in range(clients)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "clients": clients,
+        "seconds": round(wall, 3),
+        "rps": round(len(latencies) / wall, 1) if wall else None,
+        "cache_hit_rate": round(hits[0] / len(latencies), 3) if latencies else 0.0,
+        "errors": errors[0],
+        "p50_ms": round(_percentile(latencies, 50), 3),
+        "p95_ms": round(_percentile(latencies, 95), 3),
+        "p99_ms": round(_percentile(latencies, 99), 3),
+        "max_ms": round(latencies[-1], 3) if latencies else 0.0,
+        "mean_ms": round(statistics.fmean(latencies), 3) if latencies else 0.0,
+    }
+
+
+def main(argv=None):
+    cfg = load_config()
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--url", default=None, help="target service; default starts one in-process")
+    ap.add_argument("--data", default=cfg.get("data", {}).get("path", "data/synthetic_fb_ads_undergarments.csv"))
+    ap.add_argument("--requests", type=int, default=20000)
+    ap.add_argument("--clients", type=int, default=8)
+    ap.add_argument("--repeat-share", type=float, default=0.5)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    server = None
+    url = args.url
+    if url is None:
+        from src.utils.logging_utils import configure_logging
+        from src.service import AnalyticsService, make_server
+
+        configure_logging(echo=False)
+        server = make_server(AnalyticsService(args.data, cfg), port=0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    try:
+        result = run_load(url, _filters(args.data), args.requests, args.clients, args.repeat_share, args.seed)
+    finally:
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+    print(json.dumps(result, indent=2))
+    return result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,122 @@
+"""Seeded generator of synthetic ad data shaped like the bundled dataset.
+
+Rows are bootstrapped from ``data/synthetic_fb_ads_undergarments.csv``, so the
+dimension columns keep their joint distribution and cardinalities (campaign,
+adset, creative, audience, platform, country, message, date) and the missing
+values of the seed file carry over. Metrics are jittered with log-normal
+noise and re-derived (ctr, roas) so they stay internally consistent. On top
+of that a share of campaign names is re-spelled (case, underscores, doubled
+spaces) and a share of rows has zero impressions.
+
+    python -m tools.synth_data --rows 1000000 --out .cache/bench/synthetic_1m.csv
+"""
+import argparse
+import os
+from pathlib import Path
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+SEED_PATH = Path(__file__).resolve().parents[1] / "data" / "synthetic_fb_ads_undergarments.csv"
+
+DIRTY_RATE = 0.05
+ZERO_IMPRESSION_RATE = 0.002
+NOISE_SIGMA = 0.15
+
+_SPELLINGS = (
+    lambda s: s.str.upper(),
+    lambda s: s.str.lower(),
+    lambda s: s.str.replace(" ", "_", regex=False),
+    lambda s: s.str.replace(" ", "  ", regex=False),
+    lambda s: " " + s + " ",
+)
+
+
+def _load_seed(path: Optional[str] = None) -> pd.DataFrame:
+    return pd.read_csv(path or SEED_PATH)
+
+
+def _chunk(seed_df: pd.DataFrame, rows: int, rng: np.random.Generator,
+           dirty_rate: float, zero_rate: float) -> pd.DataFrame:
+    df = seed_df.iloc[rng.integers(0, len(seed_df), size=rows)].reset_index(drop=True)
+
+    def jitter():
+        return rng.lognormal(0.0, NOISE_SIGMA, size=rows)
+
+    impressions = np.round(df["impressions"].to_numpy(dtype="float64") * jitter())
+    ctr = df["ctr"].to_numpy(dtype="float64") * jitter()
+    clicks = np.minimum(np.round(impressions * ctr), impressions)
+    clicks[df["clicks"].isna().to_numpy()] = np.nan
+    spend = np.round(df["spend"].to_numpy(dtype="float64") * jitter(), 2)
+    revenue = np.round(df["revenue"].to_numpy(dtype="float64") * jitter(), 2)
+    purchases = np.round(df["purchases"].to_numpy(dtype="float64") * jitter())
+
+    zero = rng.random(rows) < zero_rate
+    impressions[zero] = 0
+    clicks[zero & ~np.isnan(clicks)] = 0
+    purchases[zero] = 0
+    revenue[zero & ~np.isnan(revenue)] = 0.0
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        df["ctr"] = np.round(np.where(impressions > 0, np.nan_to_num(clicks) / impressions, 0.0), 4)
+        df["roas"] = np.round(np.where(spend > 0, revenue / spend, np.nan), 2)
+    df["impressions"] = impressions.astype(np.int64)
+    df["clicks"] = clicks
+    df["spend"] = spend
+    df["revenue"] = revenue
+    df["purchases"] = purchases.astype(np.int64)
+
+    dirty = np.flatnonzero(rng.random(rows) < dirty_rate)
+    if len(dirty):
+        names = df["campaign_name"].to_numpy(dtype=object)
+        style = rng.integers(0, len(_SPELLINGS), size=len(dirty))
+        for k, spell in enumerate(_SPELLINGS):
+            pos = dirty[style == k]
+            if len(pos):
+                names[pos] = spell(pd.Series(names[pos], dtype=object)).to_numpy(dtype=object)
+        df["campaign_name"] = names
+    return df[seed_df.columns]
+
+
+def iter_synthetic(rows: int, seed: int = 0, chunk_rows: int = 500_000, seed_path: Optional[str] = None,
+                   dirty_rate: float = DIRTY_RATE, zero_rate: float = ZERO_IMPRESSION_RATE) -> Iterator[pd.DataFrame]:
+    """Yield ``rows`` synthetic rows in chunks; output depends only on the arguments."""
+    seed_df = _load_seed(seed_path)
+    rng = np.random.default_rng(seed)
+    done = 0
+    while done < rows:
+        n = min(chunk_rows, rows - done)
+        yield _chunk(seed_df, n, rng, dirty_rate, zero_rate)
+        done += n
+
+
+def generate_frame(rows: int, seed: int = 0, **kwargs) -> pd.DataFrame:
+    parts = list(iter_synthetic(rows, seed=seed, **kwargs))
+    return pd.concat(parts, ignore_index=True) if parts else _load_seed(kwargs.get("seed_path")).iloc[:0]
+
+
+def write_csv(path: str, rows: int, seed: int = 0, **kwargs) -> str:
+    """Write a synthetic CSV chunk by chunk (atomically); returns ``path``."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.tmp{os.getpid()}"
+    header = True
+    with open(tmp, "w", encoding="utf-8", newline="") as fh:
+        for part in iter_synthetic(rows, seed=seed, **kwargs):
+            part.to_csv(fh, index=False, header=header)
+            header = False
+    os.replace(tmp, path)
+    return path
+
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--rows", type=int, required=True)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", required=True)
+    args = ap.parse_args()
+    print(write_csv(args.out, args.rows, seed=args.seed))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Reconstruct one run from the event log: span tree, timings and critical path.
+
+Looks the trace up in the sidecar index (``src/utils/log_index.py``) and
+reads only its byte ranges, across rotated and compressed segments; lines
+not yet indexed (older logs, other writers) are indexed first.
+
+    python -m tools.trace list
+    python -m tools.trace show latest
+    python -m tools.trace show 3fa459e923bd45e0931c05800b985b18 --json
+    python -m tools.trace reindex
+    python -m tools.trace rotate
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+from src.utils.config_utils import load_config
+from src.utils.log_index import LogIndex, build_spans, critical_path
+from src.utils.profiling import format_span_table
+
+
+def show(index: LogIndex, trace_id: str, as_json: bool = False) -> dict:
+    if trace_id == "latest":
+        recent = index.recent_traces(1)
+        if not recent:
+            raise SystemExit("no traces in the log")
+        trace_id = recent[0]
+    t0 = time.perf_counter()
+    events = index.read_trace(trace_id)
+    seconds = time.perf_counter() - t0
+    if not events:
+        raise SystemExit(f"trace {trace_id} not found")
+    spans = build_spans(events)
+    path = critical_path(spans)
+    result = {"trace_id": trace_id, "events": len(events), "lookup_ms": round(seconds * 1000, 3),
+              "critical_path": path, "spans": spans}
+    if as_json:
+        print(json.dumps(result, default=str, indent=2))
+        return result
+
+    on_path = set(path)
+    by_id = {s["span_id"]: s for s in spans}
+    print(f"trace {trace_id}: {len(events)} events, {len(spans)} spans (read in {result['lookup_ms']} ms)")
+    # format_span_table lists spans in start order, as build_spans returns them
+    marks = ["  ", "--"] + ["* " if s["span_id"] in on_path else "  " for s in spans]
+    print("\n".join(m + line for m, line in zip(marks, format_span_table(spans).splitlines())))
+    if path:
+        names = " > ".join(str(by_id[sid].get("name")) for sid in path)
+        print(f"critical path (*): {names}")
+    return result
+
+
+def main(argv=None):
+    log_cfg = load_config().get("logging", {})
+    default_log = os.path.join(log_cfg.get("log_dir", "logs"), log_cfg.get("jsonl_file", "events.log.jsonl"))
+    ap = argparse.ArgumentParser(description="Look up runs in the event log by trace id.")
+    ap.add_argument("--log", default=default_log, help="active event log file")
+    sub = ap.add_subparsers(dest="command", required=True)
+    p_show = sub.add_parser("show", help="span tree and critical path of one trace ('latest' for the newest)")
+    p_show.add_argument("trace_id")
+    p_show.add_argument("--json", action="store_true")
+    p_list = sub.add_parser("list", help="newest trace ids")
+    p_list.add_argument("--limit", type=int, default=20)
+    sub.add_parser("reindex", help="index lines the writer did not index itself")
+    sub.add_parser("rotate", help="rotate and compress the active file now")
+    args = ap.parse_args(argv)
+
+    index = LogIndex(args.log)
+    try:
+        scanned = index.sync()
+        if args.command == "show":
+            show(index, args.trace_id, as_json=args.json)
+        elif args.command == "list":
+            for trace_id in index.recent_traces(args.limit):
+                print(trace_id)
+        elif args.command == "reindex":
+            print(json.dumps({"scanned_bytes": scanned, **index.stats()}))
+        elif args.command == "rotate":
+            segment, _ = index.active_segment()
+            rotated = index.rotate(segment, compress=log_cfg.get("compress", True), backups=log_cfg.get("backups"))
+            print(rotated or "nothing to rotate", file=sys.stdout)
+    finally:
+        index.close()
+
+
+if __name__ == "__main__":
+    main()